@@ -0,0 +1,127 @@
+"""
+Announcement targeting and view tracking.
+
+Login used to load every active announcement and call
+``Announcement.should_show_to_user()`` on each one, running a view lookup per
+announcement (twice in ``unviewed``). ``visible_to()`` builds the same
+selection as one queryset: expiry is filtered in SQL, already viewed
+announcements are excluded with ``NOT EXISTS`` on UserAnnouncementView, and
+user type / grade level targeting is matched through AnnouncementTarget, a
+normalized copy of ``target_user_types``/``target_grade_levels``.
+
+AnnouncementTarget rows follow the Announcement signals (see api/signals.py)
+and can be recreated with ``rebuild_targets()`` after bulk writes.
+"""
+from django.db import transaction
+from django.db.models import CharField, Exists, F, OuterRef, Q, Value
+from django.utils import timezone
+
+
+def _models(apps=None):
+    if apps is not None:
+        return apps.get_model('api', 'Announcement'), apps.get_model('api', 'AnnouncementTarget')
+    from .models import Announcement, AnnouncementTarget
+    return Announcement, AnnouncementTarget
+
+
+def target_values(target_user_types, target_grade_levels):
+    """{(kind, value)} of an announcement's targeting lists"""
+    values = {('user_type', str(value)) for value in target_user_types or [] if value}
+    values |= {('grade_level', str(value).lower()) for value in target_grade_levels or [] if value}
+    return {(kind, value[:100]) for kind, value in values}
+
+
+# ---------------------------------------------------------------------------
+# Maintenance
+# ---------------------------------------------------------------------------
+
+def sync_targets(announcement, apps=None):
+    """Make the AnnouncementTarget rows of an announcement match its targeting lists"""
+    _, AnnouncementTarget = _models(apps)
+    wanted = target_values(announcement.target_user_types, announcement.target_grade_levels)
+    with transaction.atomic():
+        stored = {
+            (kind, value): pk
+            for pk, kind, value in AnnouncementTarget.objects.filter(announcement=announcement).values_list('id', 'kind', 'value')
+        }
+        stale = [pk for key, pk in stored.items() if key not in wanted]
+        if stale:
+            AnnouncementTarget.objects.filter(pk__in=stale).delete()
+        AnnouncementTarget.objects.bulk_create([
+            AnnouncementTarget(announcement=announcement, kind=kind, value=value)
+            for kind, value in sorted(wanted - set(stored))
+        ], ignore_conflicts=True)
+
+
+def update_on_save(sender, instance, raw=False, **kwargs):
+    """post_save: mirror the targeting lists of a saved announcement"""
+    sync_targets(instance)
+
+
+def rebuild_targets(apps=None, batch_size=1000):
+    """Recreate the targets of every announcement; returns the number of rows written"""
+    Announcement, AnnouncementTarget = _models(apps)
+    rows = [
+        AnnouncementTarget(announcement_id=pk, kind=kind, value=value)
+        for pk, user_types, grade_levels in Announcement.objects.values_list('id', 'target_user_types', 'target_grade_levels')
+        for kind, value in sorted(target_values(user_types, grade_levels))
+    ]
+    with transaction.atomic():
+        AnnouncementTarget.objects.all().delete()
+        AnnouncementTarget.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+# ---------------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------------
+
+def targeting(user):
+    """Q matching the announcements targeted at a user"""
+    _, AnnouncementTarget = _models()
+    matches = Q(kind='user_type', value=user.user_type or '')
+    targets = AnnouncementTarget.objects.filter(announcement=OuterRef('pk'))
+    if user.grade_level:
+        # A targeted grade level matches when it appears in the user's grade level
+        targets = targets.annotate(user_grade_level=Value(user.grade_level.lower(), output_field=CharField()))
+        matches |= Q(kind='grade_level', user_grade_level__contains=F('value'))
+    return Q(target_all_users=True) | Exists(targets.filter(matches))
+
+
+def unviewed_by(user):
+    """Q excluding the announcements a user has already viewed"""
+    from .models import UserAnnouncementView
+    return ~Exists(UserAnnouncementView.objects.filter(user=user, announcement=OuterRef('pk')))
+
+
+def visible_to(user, queryset=None):
+    """Active, unexpired announcements targeted at a user that they have not viewed yet"""
+    Announcement, _ = _models()
+    queryset = Announcement.objects.all() if queryset is None else queryset
+    now = timezone.now()
+    return queryset.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gte=now),
+        targeting(user),
+        unviewed_by(user),
+        is_active=True,
+    )
+
+
+def mark_viewed(user, announcement_ids):
+    """
+    Record views of the given announcements that are visible to the user;
+    returns (newly viewed ids, already viewed ids).
+    """
+    Announcement, _ = _models()
+    from .models import UserAnnouncementView
+    announcement_ids = set(announcement_ids)
+    already_viewed = set(
+        UserAnnouncementView.objects.filter(user=user, announcement_id__in=announcement_ids)
+        .values_list('announcement_id', flat=True)
+    )
+    new_ids = set(visible_to(user, Announcement.objects.filter(pk__in=announcement_ids)).values_list('id', flat=True))
+    # Concurrent acknowledgements of the same announcement are already recorded
+    UserAnnouncementView.objects.bulk_create([
+        UserAnnouncementView(user=user, announcement_id=pk) for pk in sorted(new_ids)
+    ], ignore_conflicts=True)
+    return sorted(new_ids), sorted(already_viewed)
@@ -9,6 +9,7 @@ class ApiConfig(AppConfig):
         """
         This method is called when Django starts.
         We can use it to register signals or perform other initialization.
-        Note: Do not import models here to avoid circular imports.
+        Note: Do not import models at module level to avoid circular imports.
         """
-        pass
+        from . import signals  # noqa: F401
+        from . import certificates, semester_rollover, waitlist  # noqa: F401  (registers background job handlers)
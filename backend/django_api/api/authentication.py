@@ -0,0 +1,176 @@
+"""
+JWT authentication resolving the request user from a short-lived cache.
+
+``JWTAuthentication`` loads the CustomUser row on every request, and most
+views then read ``user.staff_details`` and ``get_current_patient_profile()``,
+two to four more queries before any real work. ``CachedJWTAuthentication``
+keeps the loaded user (with its staff details and the id of its profile for
+the current school year and semester) in the Django cache for
+``AUTH_USER_CACHE_TTL`` seconds.
+
+Entries are keyed by user id and the user's token version, a random value
+stored in the cache next to them. Saving or deleting the user (profile
+edits, block/unblock, password changes), its StaffDetails or one of its
+Patient profiles replaces the version (see api/signals.py), so the next
+request loads the user again; an entry written by a request that read the
+old row is left under the old version and never read.
+
+The versions only invalidate across workers when they live in a shared
+cache: with a per-process backend (Django's default LocMemCache) a user
+blocked or deactivated through one worker would stay active in the others
+until their entries expire. Caching is therefore on by default (30 seconds)
+only when the default ``CACHES`` backend is shared (database, Redis,
+memcached); setting ``AUTH_USER_CACHE_TTL`` explicitly opts in with any
+backend, and 0 turns it off.
+
+Hits, misses and invalidations are counted in ``cache_stats()``.
+"""
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+DEFAULT_TTL = 30
+# Backends whose entries are not seen by other workers
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+VERSION_KEY = 'auth-user-version:%s'
+ENTRY_KEY = 'auth-user:%s:%s'
+# get_current_patient_profile() has to query when this is returned
+NOT_CACHED = object()
+
+_stats = Counter()
+
+
+def _ttl():
+    ttl = getattr(settings, 'AUTH_USER_CACHE_TTL', None)
+    if ttl is not None:
+        return ttl
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    return 0 if backend in PROCESS_LOCAL_BACKENDS else DEFAULT_TTL
+
+
+def _version(user_id):
+    key = VERSION_KEY % user_id
+    version = cache.get(key)
+    if version is None:
+        # Random rather than a counter: a version evicted from the cache and
+        # created again never matches entries written under the old one
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def _load(user_model, user_id, version):
+    from .school_year_cache import current_school_year, current_semester
+    # select_related() also caches a missing StaffDetails, so hasattr() checks don't query
+    user = user_model.objects.select_related('staff_details').get(**{api_settings.USER_ID_FIELD: user_id})
+    school_year, semester = current_school_year(), current_semester()
+    profiles = user.current_patient_profiles()
+    user._current_profile_key = (
+        version, school_year.pk if school_year else None, semester,
+        profiles.values_list('id', flat=True).first() if profiles is not None else None,
+    )
+    return user
+
+
+def resolve_user(user_model, user_id):
+    """The user with the given id, from the cache when an entry is current"""
+    ttl = _ttl()
+    if not ttl:
+        return user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+    version = _version(user_id)
+    key = ENTRY_KEY % (user_id, version)
+    user = cache.get(key)
+    if user is not None:
+        _stats['hits'] += 1
+        return user
+    _stats['misses'] += 1
+    user = _load(user_model, user_id, version)
+    cache.set(key, user, ttl)
+    return user
+
+
+def cached_profile_id(user):
+    """
+    Id of the user's profile for the current school year and semester as
+    resolved at authentication (None when it has none), or NOT_CACHED when
+    the user was not resolved here or was invalidated (e.g. a profile was
+    created during this request) or the current term changed since.
+    """
+    key = getattr(user, '_current_profile_key', None)
+    if key is None:
+        return NOT_CACHED
+    from .school_year_cache import current_school_year, current_semester
+    version, school_year_id, semester, profile_id = key
+    if cache.get(VERSION_KEY % user.pk) != version:
+        return NOT_CACHED
+    school_year = current_school_year()
+    if (school_year.pk if school_year else None, current_semester()) != (school_year_id, semester):
+        return NOT_CACHED
+    return profile_id
+
+
+def invalidate(user_ids):
+    """Make the cached entries of the given users unreachable"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    cache.set_many({VERSION_KEY % user_id: uuid.uuid4().hex for user_id in user_ids}, None)
+    _stats['invalidations'] += len(user_ids)
+
+
+def _changed_user_id(sender, instance):
+    from .models import CustomUser
+    return instance.pk if sender is CustomUser else instance.user_id
+
+
+def invalidate_on_change(sender, instance, **kwargs):
+    """post_save/post_delete of CustomUser, StaffDetails and Patient"""
+    user_ids = [_changed_user_id(sender, instance)]
+    invalidate(user_ids)
+    # A request that read the old rows before this transaction commits must
+    # not keep them cached afterwards
+    transaction.on_commit(lambda: invalidate(user_ids))
+
+
+def cache_stats():
+    """Counters of cache hits, misses and invalidated users"""
+    return {key: _stats[key] for key in ('hits', 'misses', 'invalidations')}
+
+
+def reset_cache_stats():
+    _stats.clear()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication with the user resolved through resolve_user()"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = resolve_user(self.user_model, user_id)
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,755 @@
+"""
+Performance benchmarks for the hot API paths.
+
+Each benchmark seeds synthetic data, measures wall time and query count of
+the code path under test and returns a list of result rows. Benchmarks are
+executed by the ``run_benchmarks`` management command inside a transaction
+that is always rolled back, so they never leave data behind.
+"""
+import statistics
+import time
+from datetime import date, time as dt_time, timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+BENCHMARKS = {}
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def benchmark(name, description):
+    """Register a benchmark function under `name`"""
+    def decorator(func):
+        BENCHMARKS[name] = {'func': func, 'description': description}
+        return func
+    return decorator
+
+
+def measure(func, repeat=3):
+    """Run func `repeat` times and return median milliseconds and query count of the last run"""
+    timings = []
+    query_count = 0
+    result = None
+    for _ in range(repeat):
+        # The query log is a bounded deque; a full one would hide this run's queries
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            result = func()
+            timings.append((time.perf_counter() - started) * 1000)
+        query_count = len(ctx.captured_queries)
+    return {
+        'ms': round(statistics.median(timings), 2),
+        'queries': query_count,
+        'result': result,
+    }
+
+
+class Seeder:
+    """Bulk-creates synthetic users, patients and appointments for benchmarks"""
+
+    USER_TYPES = ['College', 'Employee', 'Elementary', 'High School', 'Senior High School',
+                  'Kindergarten', 'Incoming Freshman', 'Grade 11', 'Faculty']
+    STATUSES = ['pending', 'confirmed', 'cancelled', 'completed', 'scheduled']
+    BATCH_SIZE = 2000
+
+    def __init__(self, prefix='bench'):
+        self.prefix = prefix
+        self.created_users = 0
+        self.school_year = None
+
+    def get_school_year(self):
+        from .models import AcademicSchoolYear
+        if self.school_year is None:
+            self.school_year = AcademicSchoolYear.objects.create(
+                academic_year=f'{self.prefix}-2099',
+                start_date=date(2099, 8, 1),
+                end_date=date(2100, 7, 31),
+                status='upcoming',
+            )
+        return self.school_year
+
+    def users(self, count):
+        from .models import CustomUser
+        users = []
+        for i in range(self.created_users, self.created_users + count):
+            users.append(CustomUser(
+                username=f'{self.prefix}_user_{i}',
+                email=f'{self.prefix}_user_{i}@bench.local',
+                password='!',
+                user_type='student',
+                is_email_verified=i % 3 != 0,
+            ))
+        self.created_users += count
+        return CustomUser.objects.bulk_create(users, batch_size=self.BATCH_SIZE)
+
+    def patients(self, count, versions=1):
+        """Create `count` users with `versions` patient profiles each"""
+        from .models import Patient
+        school_year = self.get_school_year()
+        patients = []
+        for user in self.users(count):
+            index = user.pk or 0
+            for version in range(versions):
+                patients.append(Patient(
+                    user=user,
+                    student_id=f'B{index}',
+                    name=f'Bench Patient {index}',
+                    first_name='Bench',
+                    email=user.email,
+                    user_type=self.USER_TYPES[index % len(self.USER_TYPES)],
+                    year_level=f'{index % 4 + 1} Year',
+                    course=['BSCS', 'BSIT', 'BSN'][index % 3],
+                    department='Bench Department',
+                    school_year=school_year,
+                    semester=['1st_semester', '2nd_semester'][version % 2],
+                ))
+        return Patient.objects.bulk_create(patients, batch_size=self.BATCH_SIZE)
+
+    def appointments(self, patients, per_patient=1, start=None):
+        from .models import Appointment
+        start = start or date.today()
+        school_year = self.get_school_year()
+        appointments = []
+        for i, patient in enumerate(patients):
+            for j in range(per_patient):
+                n = i * per_patient + j
+                appointments.append(Appointment(
+                    patient=patient,
+                    appointment_date=start - timedelta(days=n % 180),
+                    appointment_time=dt_time(8 + n % 8, (n % 3) * 20),
+                    purpose='Benchmark',
+                    type='medical' if n % 2 == 0 else 'dental',
+                    status=self.STATUSES[n % len(self.STATUSES)],
+                    campus=['a', 'b', 'c'][n % 3],
+                    school_year=school_year,
+                ))
+        return Appointment.objects.bulk_create(appointments, batch_size=self.BATCH_SIZE)
+
+
+@benchmark('dashboard_statistics', 'Admin dashboard statistics at growing patient/appointment volumes')
+def bench_dashboard_statistics(sizes, repeat):
+    from .dashboard_stats import build_dashboard_statistics
+    from .stats_snapshots import rebuild_snapshots
+
+    seeder = Seeder('dash')
+    rows = []
+    seeded = 0
+    for size in sizes:
+        patients = seeder.patients(size - seeded)
+        seeder.appointments(patients, per_patient=2)
+        seeded = size
+        # bulk_create bypasses the counter signals
+        rebuild_snapshots()
+        stats = measure(build_dashboard_statistics, repeat)
+        rows.append({'size': size, 'ms': stats['ms'], 'queries': stats['queries']})
+    return rows
+
+
+@benchmark('patient_dedupe', 'Latest patient profile per email: grouped subquery vs is_latest_profile flag')
+def bench_patient_dedupe(sizes, repeat):
+    from .models import Patient
+    from .patient_profiles import latest_per_email, rebuild_latest_profiles
+
+    # Each person gets several profile versions, as edits do in production
+    versions = 4
+    seeder = Seeder('dedupe')
+    rows = []
+    seeded = 0
+    for size in sizes:
+        seeder.patients(max(size - seeded, 0) // versions, versions=versions)
+        seeded = size
+        # bulk_create bypasses the flag signals
+        rebuild_latest_profiles()
+
+        base = Patient.objects.select_related('user', 'school_year')
+        approaches = {
+            'subquery': lambda: latest_per_email(base),
+            'flag': lambda: base.filter(is_latest_profile=True),
+        }
+        for approach, queryset in approaches.items():
+            def first_page():
+                qs = queryset()
+                return qs.count(), list(qs.order_by('-created_at', '-id')[:50])
+            stats = measure(first_page, repeat)
+            rows.append({
+                'size': size,
+                'approach': approach,
+                'ms': stats['ms'],
+                'queries': stats['queries'],
+                'profiles': stats['result'][0],
+            })
+    return rows
+
+
+@benchmark('pdf_generation', 'Medical certificate PDF: styles and images rebuilt per PDF vs cached registry')
+def bench_pdf_generation(sizes, repeat):
+    try:
+        from . import pdf_utils
+    except ImportError as e:
+        return [{'skipped': f'PDF dependencies missing ({e})'}]
+    from .models import CustomUser, MedicalDocument, StaffDetails
+
+    # Per-PDF cost does not depend on data volume
+    generations = 1000
+    seeder = Seeder('pdf')
+    patient = seeder.patients(1)[0]
+    staff = CustomUser.objects.create(
+        username='pdf_staff', email='pdf_staff@bench.local', password='!', user_type='staff', is_staff=True,
+    )
+    StaffDetails.objects.create(user=staff, full_name='Bench Physician', position='University Physician',
+                                license_number='0000000', ptr_number='0000000')
+    document = MedicalDocument.objects.create(
+        patient=patient, status='issued', reviewed_by=staff, certificate_issued_at=timezone.now(),
+    )
+
+    rows = []
+    for approach, reset in (('rebuilt', True), ('cached', False)):
+        pdf_utils.reset_pdf_registry()
+        timings = []
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(generations):
+                if reset:
+                    # What every call paid before the registry existed
+                    pdf_utils.reset_pdf_registry()
+                started = time.perf_counter()
+                size = len(pdf_utils.generate_medical_certificate_pdf(document).getvalue())
+                timings.append((time.perf_counter() - started) * 1000)
+        rows.append({
+            'generations': generations,
+            'approach': approach,
+            'ms_per_pdf': round(statistics.mean(timings), 2),
+            'ms_median': round(statistics.median(timings), 2),
+            'total_s': round(sum(timings) / 1000, 2),
+            'queries_per_pdf': len(ctx.captured_queries) // generations,
+            'bytes': size,
+        })
+    return rows
+
+
+@benchmark('staff_calendar', '30-day staff availability: schedule JSON parsed per request vs compiled calendar')
+def bench_staff_calendar(sizes, repeat):
+    from . import scheduling
+    from .models import CustomUser, StaffDetails
+    from .slot_occupancy import SLOT_TIMES
+
+    positions = scheduling.MEDICAL_POSITIONS + scheduling.DENTAL_POSITIONS
+    weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+    start = date(2099, 9, 1)
+    days = [start + timedelta(days=offset) for offset in range(30)]
+
+    def availability(compiled):
+        return sum(
+            len(compiled.free_slots(campus, type_, day, SLOT_TIMES, {}))
+            for campus in ('a', 'b', 'c') for type_ in ('medical', 'dental') for day in days
+        )
+
+    rows = []
+    created = 0
+    for size in sizes:
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'sched_staff_{i}', email=f'sched_staff_{i}@bench.local', password='!', user_type='staff')
+            for i in range(created, size)
+        ])
+        StaffDetails.objects.bulk_create([
+            StaffDetails(
+                user=user, full_name=f'Bench Staff {i}', position=positions[i % len(positions)],
+                assigned_campuses=['a', 'a,b', 'b,c', 'a,b,c'][i % 4],
+                available_days=weekdays[i % 5:] + weekdays[:i % 3],
+                time_slots=['08:00-10:00', '10:00-12:00', '13:00-15:00', '15:00-17:00'][i % 4:] or ['08:00-17:00'],
+                blocked_dates=[(start + timedelta(days=i % 30)).isoformat()],
+            )
+            for i, user in zip(range(created, size), users)
+        ])
+        created = size
+        scheduling.invalidate()
+        approaches = {
+            'parsed per request': lambda: availability(scheduling.compile_calendar()),
+            'compiled': lambda: availability(scheduling.get_calendar()),
+        }
+        for approach, func in approaches.items():
+            stats = measure(func, repeat)
+            rows.append({
+                'staff': size,
+                'approach': approach,
+                'ms': stats['ms'],
+                'queries': stats['queries'],
+                'open_slots': stats['result'],
+            })
+    scheduling.invalidate()
+    return rows
+
+
+@benchmark('day_closure', 'Moving the appointments of closed days: per-appointment reschedule vs bulk day closure')
+def bench_day_closure(sizes, repeat):
+    from django.db import transaction
+    from . import booking, day_closure, scheduling, slot_occupancy
+    from .models import Appointment
+    from .slot_occupancy import MAX_APPOINTMENTS_PER_DAY, SLOT_TIMES
+    from .waitlist import bookable_slots
+
+    seeder = Seeder(prefix='closure')
+    campus = 'c'
+    first = date(2099, 9, 7)  # a Monday
+    weekdays = [day for day in (first + timedelta(days=offset) for offset in range(400)) if day.weekday() < 5]
+
+    def rolled_back(func):
+        def run():
+            with transaction.atomic():
+                result = func()
+                transaction.set_rollback(True)
+            return result
+        return run
+
+    rows = []
+    for size in sizes:
+        closed = weekdays[:-(-size // MAX_APPOINTMENTS_PER_DAY)]
+        window_start = closed[-1] + timedelta(days=1)
+        window_end = window_start + timedelta(days=len(closed) * 3 + 6)
+        patients = seeder.patients(size)
+        appointments = Appointment.objects.bulk_create([
+            Appointment(
+                patient=patient, appointment_date=closed[i // MAX_APPOINTMENTS_PER_DAY],
+                appointment_time=SLOT_TIMES[i % MAX_APPOINTMENTS_PER_DAY], purpose='Benchmark',
+                type='medical' if i % 2 == 0 else 'dental', status='confirmed', campus=campus,
+                school_year=seeder.school_year,
+            )
+            for i, patient in enumerate(patients)
+        ])
+        # bulk_create() bypasses the signals maintaining the slot indexes
+        booking.rebuild_reservations()
+        slot_occupancy.rebuild_occupancy()
+        scheduling.invalidate()
+
+        def one_by_one():
+            user = seeder.users(1)[0]
+            moved = 0
+            for appointment in Appointment.objects.filter(pk__in=[a.pk for a in appointments]).order_by('appointment_date', 'appointment_time'):
+                day = window_start
+                while day <= window_end:
+                    placed = False
+                    open_day = scheduling.get_calendar().is_open(campus, day)
+                    for slot_time in bookable_slots(campus, day, appointment.type) if open_day else []:
+                        try:
+                            with booking.enforce_limits():
+                                appointment.reschedule_appointment(day, slot_time, user, 'Campus closed')
+                        except booking.SlotUnavailable:
+                            continue
+                        placed = True
+                        break
+                    if placed:
+                        moved += 1
+                        break
+                    day += timedelta(days=1)
+            return moved
+
+        def bulk():
+            result = day_closure.close_days(campus, closed, window_start, window_end, reason='Benchmark')
+            return len(result['moved'])
+
+        for approach, func in (('per appointment', one_by_one), ('bulk closure', bulk)):
+            stats = measure(rolled_back(func), repeat)
+            rows.append({
+                'appointments': size,
+                'closed_days': len(closed),
+                'approach': approach,
+                'ms': stats['ms'],
+                'queries': stats['queries'],
+                'moved': stats['result'],
+            })
+        Appointment.objects.filter(pk__in=[a.pk for a in appointments]).delete()
+    scheduling.invalidate()
+    return rows
+
+
+@benchmark('patient_search', 'Patient search: ORed leading-wildcard icontains vs the token index')
+def bench_patient_search(sizes, repeat):
+    from django.db.models import Q
+    from .models import Patient
+    from .search import rebuild_index, search_queryset
+
+    seeder = Seeder(prefix='search')
+    rows = []
+    created = 0
+    for size in sizes:
+        seeder.patients(size - created)
+        created = size
+        # bulk_create() bypasses the signals maintaining the index
+        rebuild_index()
+        # A typical admin search: a few words of one patient's name
+        text = Patient.objects.filter(student_id__startswith='B').order_by('id').values_list('name', flat=True)[size // 2]
+        approaches = {
+            'icontains': lambda: len(Patient.objects.filter(
+                Q(name__icontains=text) | Q(email__icontains=text) | Q(user__email__icontains=text)
+                | Q(student_id__icontains=text) | Q(department__icontains=text)
+            ).order_by('-created_at')[:50]),
+            'token index': lambda: len(search_queryset(Patient.objects.order_by('-created_at'), text)[:50]),
+        }
+        for approach, func in approaches.items():
+            stats = measure(func, repeat)
+            rows.append({
+                'patients': size,
+                'approach': approach,
+                'ms': stats['ms'],
+                'queries': stats['queries'],
+                'matches': stats['result'],
+            })
+    return rows
+
+
+@benchmark('semester_export', 'Semester profile export: list of dicts in one response vs streamed CSV/XLSX chunks')
+def bench_semester_export(sizes, repeat):
+    import tracemalloc
+    from rest_framework.renderers import JSONRenderer
+    from .exports import csv_stream, export_chunks, semester_profile_columns, xlsx_stream
+    from .models import Patient
+
+    def in_memory():
+        # The former export_data: one instance and school year query per row, rendered at once
+        data = [{
+            'student_id': patient.student_id,
+            'name': patient.name,
+            'email': patient.email,
+            'semester': patient.get_semester_display(),
+            'school_year': patient.school_year.academic_year if patient.school_year else 'N/A',
+            'gender': patient.gender,
+            'department': patient.department,
+            'contact_number': patient.contact_number,
+            'created_at': patient.created_at.isoformat(),
+        } for patient in Patient.objects.order_by('-created_at')]
+        return len(JSONRenderer().render(data))
+
+    def streamed(writer):
+        columns = semester_profile_columns()
+        return lambda: sum(len(part) for part in writer(columns, export_chunks(Patient.objects.order_by('-created_at'), columns)))
+
+    seeder = Seeder(prefix='export')
+    rows = []
+    created = 0
+    for size in sizes:
+        seeder.patients(size - created)
+        created = size
+        approaches = {'list + json': in_memory, 'stream csv': streamed(csv_stream), 'stream xlsx': streamed(xlsx_stream)}
+        for approach, func in approaches.items():
+            tracemalloc.start()
+            stats = measure(func, repeat)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            rows.append({
+                'patients': size,
+                'approach': approach,
+                'ms': stats['ms'],
+                'queries': stats['queries'],
+                'peak_mb': round(peak / 2 ** 20, 1),
+                'bytes': stats['result'],
+            })
+    return rows
+
+
+@benchmark('medicine_usage_report', 'Yearly dental inventory usage: used_medicines JSON parsed per form vs grouped line-item query')
+def bench_medicine_usage_report(sizes, repeat):
+    from collections import defaultdict
+    from .medicine_usage import backfill, parse, usage_report
+    from .models import DentalFormData
+
+    medicines = ['Lidocaine', 'Articaine', 'Gauze', 'Cotton Roll', 'Fluoride Varnish', 'Amoxicillin']
+    start, end = date.today() - timedelta(days=365), date.today()
+
+    def in_python():
+        # The former report: every form of the range loaded and its JSON aggregated in Python
+        usage = defaultdict(lambda: [0, 0.0, 0])
+        forms = DentalFormData.objects.filter(date__range=[start, end], used_medicines__isnull=False)
+        for form in forms:
+            for name, quantity, unit, cost, supply_id in parse(form.used_medicines):
+                usage[name][0] += quantity
+                usage[name][1] += float(cost)
+                usage[name][2] += 1
+        return len(usage)
+
+    seeder = Seeder(prefix='usage')
+    rows = []
+    created = 0
+    for size in sizes:
+        patients = seeder.patients(size - created)
+        created = size
+        DentalFormData.objects.bulk_create([
+            DentalFormData(
+                patient=appointment.patient, appointment=appointment, date=appointment.appointment_date,
+                used_medicines=[
+                    {'name': medicines[(appointment.pk + offset) % len(medicines)], 'quantity': 1 + offset,
+                     'unit': 'pcs', 'cost': 2.5, 'notes': 'Benchmark line item'}
+                    for offset in range(3)
+                ],
+            )
+            for appointment in seeder.appointments(patients)
+        ], batch_size=Seeder.BATCH_SIZE)
+        # bulk_create() bypasses the signals writing the line items
+        backfill()
+        approaches = {
+            'json in python': in_python,
+            'grouped sql': lambda: len(usage_report(start, end, 'monthly')[0]),
+        }
+        for approach, func in approaches.items():
+            stats = measure(func, repeat)
+            rows.append({
+                'forms': size,
+                'approach': approach,
+                'ms': stats['ms'],
+                'queries': stats['queries'],
+                'items': stats['result'],
+            })
+    return rows
+
+
+@benchmark('semester_backfill', 'Appointment semester backfill: determine_semester() and save() per row vs chunked set-based updates')
+def bench_semester_backfill(sizes, repeat):
+    from .models import AcademicSchoolYear, Appointment
+    from .semester_assignment import backfill_appointment_semesters
+
+    def per_row():
+        # The former update_appointment_semesters loop
+        updated = 0
+        for appointment in Appointment.objects.filter(semester__isnull=True):
+            semester = appointment.determine_semester()
+            if semester:
+                appointment.semester = semester
+                appointment.save(update_fields=['semester'])
+                updated += 1
+        return updated
+
+    def set_based():
+        result = backfill_appointment_semesters()
+        return result['processed'] - result['missing'] - result['outside']
+
+    seeder = Seeder(prefix='semesters')
+    today = date.today()
+    AcademicSchoolYear.objects.filter(pk=seeder.get_school_year().pk).update(
+        first_sem_start=today - timedelta(days=200), first_sem_end=today - timedelta(days=100),
+        second_sem_start=today - timedelta(days=99), second_sem_end=today,
+    )
+    rows = []
+    created = 0
+    for size in sizes:
+        seeder.appointments(seeder.patients(size - created))
+        created = size
+        for approach, func in {'per row': per_row, 'set based': set_based}.items():
+            timings = []
+            for _ in range(repeat):
+                Appointment.objects.update(semester=None)
+                timings.append(measure(func, 1))
+            rows.append({
+                'appointments': size,
+                'approach': approach,
+                'ms': statistics.median(stats['ms'] for stats in timings),
+                'queries': timings[-1]['queries'],
+                'updated': timings[-1]['result'],
+            })
+    return rows
+
+
+@benchmark('semester_rollover', "New term profiles: per-user copy and save() vs bulk rollover in user-id chunks")
+def bench_semester_rollover(sizes, repeat):
+    from .models import Patient
+    from .semester_rollover import eligible_users, rollover_users
+
+    def per_user(school_year_id):
+        # What each student's first visit of the term did, for everyone at once
+        created = 0
+        for user in eligible_users().order_by('pk'):
+            if Patient.objects.filter(user=user, school_year_id=school_year_id, semester='summer').exists():
+                continue
+            profile = Patient.objects.filter(user=user).order_by('-id').first()
+            if profile is None:
+                continue
+            profile.pk = profile.id = None
+            profile.school_year_id, profile.semester = school_year_id, 'summer'
+            profile.save()
+            created += 1
+        return created
+
+    def bulk(school_year_id):
+        return rollover_users(school_year_id, 'summer')['created']
+
+    seeder = Seeder(prefix='rollover')
+    school_year_id = seeder.get_school_year().pk
+    rows = []
+    created = 0
+    for size in sizes:
+        seeder.patients(size - created, versions=2)
+        created = size
+        for approach, func in {'per user': per_user, 'bulk': bulk}.items():
+            timings = []
+            for _ in range(repeat):
+                Patient.objects.filter(semester='summer').delete()
+                timings.append(measure(lambda: func(school_year_id), 1))
+            rows.append({
+                'students': size,
+                'approach': approach,
+                'ms': statistics.median(stats['ms'] for stats in timings),
+                'queries': timings[-1]['queries'],
+                'created': timings[-1]['result'],
+            })
+    Patient.objects.filter(semester='summer').delete()
+    return rows
+
+
+@benchmark('request_auth', 'Queries per authenticated request on the main endpoints: user lookup per request vs cached JWT user')
+def bench_request_auth(sizes, repeat):
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from .models import AcademicSchoolYear, CustomUser, StaffDetails
+
+    seeder = Seeder(prefix='auth')
+    school_year = seeder.get_school_year()
+    AcademicSchoolYear.objects.filter(is_current=True).update(is_current=False)
+    AcademicSchoolYear.objects.filter(pk=school_year.pk).update(is_current=True)
+    patients = seeder.patients(max(sizes))
+    seeder.appointments(patients, per_patient=2)
+    student = CustomUser.objects.get(pk=patients[0].user_id)
+    staff = CustomUser.objects.create_user(
+        username='auth_bench_staff', email='auth_bench_staff@bench.local', password='!', user_type='staff',
+        is_staff=True,
+    )
+    StaffDetails.objects.create(user=staff, full_name='Bench Staff', position='Nurse')
+    endpoints = [
+        (student, '/api/users/me/'),
+        (student, '/api/appointments/'),
+        (student, '/api/medical-documents/'),
+        (staff, '/api/users/me/'),
+        (staff, '/api/appointments/?page_size=20'),
+        (staff, '/api/user-management/?page_size=20'),
+    ]
+    client = APIClient()
+
+    rows = []
+    for size in sizes:
+        for user, path in endpoints:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+            for approach, ttl in {'uncached': 0, 'cached': 30}.items():
+                def requests():
+                    for _ in range(size):
+                        response = client.get(path)
+                    return response.status_code
+
+                with override_settings(AUTH_USER_CACHE_TTL=ttl):
+                    client.get(path)  # warm the cache
+                    stats = measure(requests, repeat)
+                rows.append({
+                    'requests': size,
+                    'user': user.user_type,
+                    'endpoint': path,
+                    'approach': approach,
+                    'ms_per_request': round(stats['ms'] / size, 2),
+                    'queries_per_request': round(stats['queries'] / size, 1),
+                    'status': stats['result'],
+                })
+    return rows
+
+
+@benchmark('sparse_fieldsets', 'Admin list payloads: full serializers vs ?view=summary and ?fields= (response size and latency)')
+def bench_sparse_fieldsets(sizes, repeat):
+    from rest_framework.test import APIClient
+    from .models import CustomUser, Patient
+
+    seeder = Seeder(prefix='fieldsets')
+    staff = CustomUser.objects.create_user(
+        username='fieldsets_bench_staff', email='fieldsets_bench_staff@bench.local', password='!', user_type='staff',
+        is_staff=True,
+    )
+    client = APIClient()
+    client.force_authenticate(user=staff)
+    variants = {
+        'full': '',
+        'summary': '&view=summary',
+        'fields': '&fields=id,name,student_id,user_type,department',
+    }
+
+    rows = []
+    created = 0
+    for size in sizes:
+        patients = seeder.patients(size - created)
+        created = size
+        # Profiles filled in the way the profile form writes them
+        Patient.objects.filter(pk__in=[patient.pk for patient in patients]).update(
+            comorbid_illnesses=['Asthma', 'Hypertension'],
+            vaccination_history={'covid': {'status': 'fully_vaccinated', 'doses': 3}, 'hepatitis_b': 'complete'},
+            family_medical_history=['Diabetes', 'Heart Disease', 'Cancer'],
+            past_medical_history=['Chickenpox', 'Measles'],
+            maintenance_medications=[{'drug': 'Salbutamol', 'dose': '2 puffs'}],
+        )
+        seeder.appointments(patients)
+        for endpoint in ('/api/patients/', '/api/appointments/'):
+            for variant, params in variants.items():
+                if endpoint == '/api/appointments/' and variant == 'fields':
+                    params = '&fields=id,patient_name,appointment_date,appointment_time,status'
+                path = f'{endpoint}?page_size=500{params}'
+                stats = measure(lambda: client.get(path), repeat)
+                response = stats['result']
+                rows.append({
+                    'patients': size,
+                    'endpoint': endpoint,
+                    'variant': variant,
+                    'ms': stats['ms'],
+                    'queries': stats['queries'],
+                    'kb': round(len(response.content) / 1024, 1),
+                    'status': response.status_code,
+                })
+    return rows
+
+
+@benchmark('response_encoding', 'Admin payloads: JSONRenderer vs orjson CPU time, then identity/gzip/brotli bytes on the wire')
+def bench_response_encoding(sizes, repeat):
+    from rest_framework.renderers import JSONRenderer
+    from .compression import COMPRESSORS, compress, get_config
+    from .dashboard_stats import build_dashboard_statistics
+    from .models import Appointment, Patient
+    from .renderers import FastJSONRenderer, orjson
+    from .serializers import AppointmentSerializer, PatientSerializer
+    from .stats_snapshots import rebuild_snapshots
+
+    def cpu_ms(func):
+        timings = []
+        for _ in range(repeat):
+            started = time.process_time()
+            result = func()
+            timings.append((time.process_time() - started) * 1000)
+        return round(statistics.median(timings), 2), result
+
+    renderers = {'json': JSONRenderer()}
+    if orjson is not None:
+        renderers['orjson'] = FastJSONRenderer()
+    config = get_config()
+    seeder = Seeder(prefix='encoding')
+    rows = []
+    created = 0
+    for size in sizes:
+        seeder.appointments(seeder.patients(size - created))
+        created = size
+        rebuild_snapshots()
+        payloads = {
+            'patients': PatientSerializer(
+                Patient.objects.select_related('user', 'school_year').order_by('-id')[:size], many=True,
+            ).data,
+            'appointments': AppointmentSerializer(
+                Appointment.objects.select_related('patient', 'doctor', 'rescheduled_by', 'school_year')
+                .order_by('-id')[:size], many=True,
+            ).data,
+            'dashboard': build_dashboard_statistics(),
+        }
+        for payload, data in payloads.items():
+            body = None
+            for renderer, instance in renderers.items():
+                ms, body = cpu_ms(lambda: instance.render(data))
+                rows.append({
+                    'rows': size, 'payload': payload, 'step': f'render:{renderer}', 'cpu_ms': ms, 'bytes': len(body),
+                })
+            for encoding in COMPRESSORS:
+                ms, compressed = cpu_ms(lambda: compress(body, encoding, config))
+                rows.append({
+                    'rows': size, 'payload': payload, 'step': f'compress:{encoding}', 'cpu_ms': ms,
+                    'bytes': len(compressed),
+                })
+    return rows
@@ -0,0 +1,265 @@
+"""
+Race-free appointment booking.
+
+Booking used to count the day's appointments and look for one in the
+requested slot before inserting, so concurrent requests could all pass the
+checks and double book a slot or overrun the daily limit. Now every active
+appointment holds a SlotReservation row, unique per (campus, date, time,
+type), and a DailyBookingCounter row per campus and day counts the active
+appointments. Both are written in the same transaction as the appointment:
+the reservation insert fails when the slot is taken, and the counter is
+incremented with an UPDATE that only matches while the day is under its
+limit. The database decides which of two competing requests wins; nothing is
+serialized in the application.
+
+The rows follow the Appointment signals (see api/signals.py). Saves inside
+``enforce_limits()`` raise SlotUnavailable when the slot is taken, the day
+is full or the campus is closed that day, which rolls the block back. Other saves (staff edits through the
+older endpoints) are recorded without enforcing the limits. Freed slots are
+announced with the ``slot_released`` signal. The ``rebuild_slot_occupancy``
+command rebuilds reservations and counters.
+"""
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .slot_occupancy import ACTIVE_STATUSES, MAX_APPOINTMENTS_PER_DAY, TRACKED_FIELDS, as_date, as_time
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Daily limit enforced for appointments saved in the current context, None when not enforcing
+_daily_limit = ContextVar('booking_daily_limit', default=None)
+
+# Sent with campus, date, time and type when an appointment gives up its slot
+slot_released = Signal()
+
+
+class SlotUnavailable(Exception):
+    """The requested slot is already reserved or its day is fully booked"""
+
+
+class DayFull(SlotUnavailable):
+    """The day of the requested slot already has the maximum number of appointments"""
+
+
+class DayClosed(SlotUnavailable):
+    """The campus is closed on the day of the requested slot"""
+
+
+@contextmanager
+def enforce_limits(daily_limit=MAX_APPOINTMENTS_PER_DAY):
+    """
+    Appointments saved inside the block must get their slot and fit under the
+    daily limit; otherwise SlotUnavailable is raised and the block is rolled back.
+    """
+    token = _daily_limit.set(daily_limit)
+    try:
+        with transaction.atomic():
+            yield
+    finally:
+        _daily_limit.reset(token)
+
+
+def _models(apps=None):
+    if apps is not None:
+        return (apps.get_model('api', 'Appointment'), apps.get_model('api', 'SlotReservation'),
+                apps.get_model('api', 'DailyBookingCounter'))
+    from .models import Appointment, DailyBookingCounter, SlotReservation
+    return Appointment, SlotReservation, DailyBookingCounter
+
+
+def _state(instance):
+    """Tracked field values of an appointment, or None when some are deferred"""
+    values = tuple(instance.__dict__.get(field, _MISSING) for field in TRACKED_FIELDS)
+    return None if _MISSING in values else values
+
+
+def _slot(state):
+    """(campus, date, time, type) held by an appointment state, or None"""
+    if state is None:
+        return None
+    campus, appointment_date, type_, appointment_time, status = state
+    appointment_date, appointment_time = as_date(appointment_date), as_time(appointment_time)
+    if status not in ACTIVE_STATUSES or not appointment_date or appointment_time is None:
+        return None
+    return campus or '', appointment_date, appointment_time, type_ or ''
+
+
+def _increment_day(campus, day, daily_limit=None):
+    """Count one more appointment on a day; False when the day is already full"""
+    _, _, DailyBookingCounter = _models()
+    counter = DailyBookingCounter.objects.filter(campus=campus, date=day)
+    bounded = counter if daily_limit is None else counter.filter(booked__lt=daily_limit)
+    if bounded.update(booked=F('booked') + 1, updated_at=timezone.now()):
+        return True
+    if counter.exists():
+        return False
+    try:
+        with transaction.atomic():
+            DailyBookingCounter.objects.create(campus=campus, date=day, booked=1)
+        return True
+    except IntegrityError:
+        # First booking of the day made concurrently; count against that row
+        return bool(bounded.update(booked=F('booked') + 1, updated_at=timezone.now()))
+
+
+def _check_open(campus, day):
+    """
+    Raise DayClosed when a CampusClosure covers the day. The compiled calendar
+    of this worker can predate a closure made in another process, so the row
+    is read here with a locking read, which also sees closures committed
+    after this transaction started and makes a concurrent closure wait for
+    the booking (close_days() then moves it).
+    """
+    from .models import CampusClosure
+    if CampusClosure.objects.select_for_update().filter(campus=campus, date=day).exists():
+        raise DayClosed(f"The clinic is closed on {day} at this campus.")
+
+
+def hold(appointment_id, slot, daily_limit=None):
+    """Reserve a slot for an appointment and count it on its day"""
+    _, SlotReservation, _ = _models()
+    campus, day, slot_time, type_ = slot
+    if daily_limit is not None:
+        _check_open(campus, day)
+    # Reserve first: a taken slot fails before the busy day counter row is locked
+    try:
+        with transaction.atomic():
+            SlotReservation.objects.create(
+                appointment_id=appointment_id, campus=campus, date=day, time=slot_time, type=type_
+            )
+    except IntegrityError:
+        if daily_limit is not None:
+            raise SlotUnavailable(f"Time slot {slot_time.strftime('%H:%M')} is already booked for {day}.")
+        logger.info('Appointment %s shares the already reserved slot %s', appointment_id, slot)
+    if not _increment_day(campus, day, daily_limit):
+        raise DayFull(f"Maximum {daily_limit} appointments per day has been reached for {day}.")
+
+
+def release(appointment_id, slot):
+    """Give up an appointment's reservation and uncount it from its day"""
+    _, SlotReservation, DailyBookingCounter = _models()
+    SlotReservation.objects.filter(appointment_id=appointment_id).delete()
+    DailyBookingCounter.objects.filter(campus=slot[0], date=slot[1]).update(
+        booked=F('booked') - 1, updated_at=timezone.now()
+    )
+    _send_released(slot)
+
+
+def _send_released(slot):
+    campus, day, slot_time, type_ = slot
+    slot_released.send(sender=None, campus=campus, date=day, time=slot_time, type=type_)
+
+
+# ---------------------------------------------------------------------------
+# Signal handlers
+# ---------------------------------------------------------------------------
+
+def track_initial_state(sender, instance, **kwargs):
+    """post_init: remember the slot the appointment was loaded with"""
+    instance._booking_state = _state(instance) if instance.pk else None
+
+
+def capture_previous_state(sender, instance, raw=False, **kwargs):
+    """pre_save: load the stored values when the appointment was loaded with deferred fields"""
+    if instance.pk and not instance._state.adding and getattr(instance, '_booking_state', None) is None:
+        row = sender._base_manager.filter(pk=instance.pk).values_list(*TRACKED_FIELDS).first()
+        instance._booking_state = tuple(row) if row else None
+
+
+def update_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """post_save: move the reservation when the appointment was booked, moved or cancelled"""
+    old_state = None if created else getattr(instance, '_booking_state', None)
+    if not created and old_state is None:
+        logger.debug('Skipping reservation update for appointment %s: unknown previous state', instance.pk)
+        return
+    if created:
+        new_state = _state(instance)
+    else:
+        # Only columns written by this save can have changed
+        new_state = tuple(
+            instance.__dict__.get(field, old_value)
+            if update_fields is None or field in update_fields
+            else old_value
+            for field, old_value in zip(TRACKED_FIELDS, old_state)
+        )
+    old_slot, new_slot = _slot(old_state), _slot(new_state)
+    if old_slot != new_slot:
+        if old_slot is not None:
+            release(instance.pk, old_slot)
+        if new_slot is not None:
+            hold(instance.pk, new_slot, _daily_limit.get())
+    instance._booking_state = new_state
+
+
+def update_on_delete(sender, instance, **kwargs):
+    """post_delete: uncount a deleted appointment (its reservation is deleted by cascade)"""
+    slot = _slot(getattr(instance, '_booking_state', None) or _state(instance))
+    if slot is not None:
+        _, _, DailyBookingCounter = _models()
+        DailyBookingCounter.objects.filter(campus=slot[0], date=slot[1]).update(
+            booked=F('booked') - 1, updated_at=timezone.now()
+        )
+        _send_released(slot)
+
+
+# ---------------------------------------------------------------------------
+# Rebuild / drift check
+# ---------------------------------------------------------------------------
+
+def _expected(apps=None):
+    """Reservations and day counts recomputed from the active appointments"""
+    Appointment, SlotReservation, _ = _models(apps)
+    reservations = {}
+    counts = Counter()
+    rows = (
+        Appointment.objects.filter(status__in=ACTIVE_STATUSES)
+        .values_list('id', 'campus', 'appointment_date', 'appointment_time', 'type')
+        .order_by('id')
+    )
+    for pk, campus, day, slot_time, type_ in rows.iterator():
+        counts[(campus or '', day)] += 1
+        # A slot booked twice before reservations existed stays with the first booking
+        reservations.setdefault((campus or '', day, slot_time, type_ or ''), pk)
+    return reservations, counts
+
+
+def find_counter_drift(apps=None):
+    """Return {(campus, date): (stored, expected)} for every day counter that disagrees with the appointments"""
+    _, _, DailyBookingCounter = _models(apps)
+    expected = _expected(apps)[1]
+    stored = Counter({
+        (campus, day): booked
+        for campus, day, booked in DailyBookingCounter.objects.values_list('campus', 'date', 'booked')
+    })
+    return {
+        key: (stored.get(key, 0), expected.get(key, 0))
+        for key in set(expected) | set(stored)
+        if stored.get(key, 0) != expected.get(key, 0)
+    }
+
+
+def rebuild_reservations(apps=None, batch_size=1000):
+    """Recreate all reservations and day counters; returns (reservations, counters) written"""
+    _, SlotReservation, DailyBookingCounter = _models(apps)
+    reservations, counts = _expected(apps)
+    with transaction.atomic():
+        SlotReservation.objects.all().delete()
+        DailyBookingCounter.objects.all().delete()
+        SlotReservation.objects.bulk_create([
+            SlotReservation(appointment_id=pk, campus=campus, date=day, time=slot_time, type=type_)
+            for (campus, day, slot_time, type_), pk in reservations.items()
+        ], batch_size=batch_size)
+        DailyBookingCounter.objects.bulk_create([
+            DailyBookingCounter(campus=campus, date=day, booked=booked)
+            for (campus, day), booked in counts.items()
+        ], batch_size=batch_size)
+    return len(reservations), len(counts)
@@ -0,0 +1,106 @@
+"""
+Medical certificate issuance as background jobs.
+
+Issuing a certificate renders a ReportLab PDF with the WMSU logo and the
+issuing staff member's signature, which is too slow to do while the admin
+waits. ``queue_certificate()`` moves the MedicalDocument to ``issuing`` and
+queues an ``issue_certificate`` job; the run_jobs worker renders the PDF and
+moves the document to ``issued``. If the job gives up, the document goes back
+to ``verified`` so it can be issued again.
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import enqueue_job, enqueue_jobs, job_handler
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = 'issue_certificate'
+
+
+def latest_certificate_job(document):
+    from .models import BackgroundJob
+    return BackgroundJob.objects.filter(kind=JOB_KIND, object_id=document.pk).order_by('-id').first()
+
+
+def backfill_object_ids(apps=None, batch_size=1000):
+    """Set object_id on certificate jobs queued before the column existed"""
+    if apps is not None:
+        BackgroundJob = apps.get_model('api', 'BackgroundJob')
+    else:
+        from .models import BackgroundJob
+    jobs = BackgroundJob.objects.filter(kind=JOB_KIND, object_id__isnull=True).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(jobs.filter(pk__gt=last_pk).only('pk', 'payload')[:batch_size])
+        if not batch:
+            return
+        for job in batch:
+            job.object_id = (job.payload or {}).get('document_id')
+        BackgroundJob.objects.bulk_update(batch, ['object_id'])
+        last_pk = batch[-1].pk
+
+
+def queue_certificate(document, user):
+    """Move a verified document to 'issuing' and queue its PDF job; returns the job"""
+    with transaction.atomic():
+        document.status = 'issuing'
+        document.save(update_fields=['status', 'updated_at'])
+        return enqueue_job(JOB_KIND, {'document_id': document.pk, 'issued_by': user.pk}, user=user, object_id=document.pk)
+
+
+def queue_certificates(documents, user):
+    """
+    Bulk variant of queue_certificate() for many verified documents; all jobs
+    share one batch id that can be polled with jobs.batch_progress().
+    """
+    from .models import MedicalDocument
+    from .stats_snapshots import apply_deltas, document_status_deltas
+
+    with transaction.atomic():
+        rows = list(
+            MedicalDocument.objects.select_for_update().filter(pk__in=[doc.pk for doc in documents], status='verified')
+            .values_list('pk', 'patient_id', 'academic_year_id', 'status', 'uploaded_at')
+        )
+        ids = [row[0] for row in rows]
+        if not ids:
+            return None, 0
+        MedicalDocument.objects.filter(pk__in=ids).update(status='issuing', updated_at=timezone.now())
+        # update() bypasses the statistics signals
+        apply_deltas(document_status_deltas([row[1:] for row in rows], 'issuing'))
+        batch_id = enqueue_jobs(
+            JOB_KIND, [{'document_id': pk, 'issued_by': user.pk} for pk in ids], user=user, object_key='document_id',
+        )
+    return batch_id, len(ids)
+
+
+def _restore_verified(job):
+    """on_failure: give the document back to staff so issuance can be retried"""
+    from .models import MedicalDocument
+    document = MedicalDocument.objects.filter(pk=job.payload.get('document_id'), status='issuing').first()
+    if document is not None:
+        document.status = 'verified'
+        document.save(update_fields=['status', 'updated_at'])
+
+
+@job_handler(JOB_KIND, on_failure=_restore_verified)
+def issue_certificate(job):
+    from .models import CustomUser, MedicalDocument
+    from .pdf_utils import save_medical_certificate_pdf
+
+    document = MedicalDocument.objects.select_related('patient', 'patient__user').get(pk=job.payload['document_id'])
+    if document.status == 'issued':
+        return {'document_id': document.pk, 'skipped': 'already issued'}
+
+    document.status = 'issued'
+    document.certificate_issued_at = timezone.now()
+    issued_by = CustomUser.objects.filter(pk=job.payload.get('issued_by')).first()
+    if issued_by is not None:
+        # Signature of the issuing staff member on the certificate
+        document._issuing_user = issued_by
+    # Renders the PDF and saves the document together with the file
+    save_medical_certificate_pdf(document, save_to_model=True)
+    logger.info('Issued medical certificate for document %s', document.pk)
+    return {'document_id': document.pk, 'file': document.medical_certificate.name}
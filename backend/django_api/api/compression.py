@@ -0,0 +1,128 @@
+"""
+Response compression for the API.
+
+Admin payloads (patient and appointment lists, dashboard statistics) are
+hundreds of kilobytes of repetitive JSON sent uncompressed.
+``CompressionMiddleware`` compresses responses with brotli when the client
+accepts it and the ``brotli`` package (or ``brotlicffi``) is installed, and
+with gzip otherwise. It is configured by the ``RESPONSE_COMPRESSION`` entry
+of the ``REST_FRAMEWORK`` setting:
+
+    'RESPONSE_COMPRESSION': {
+        'ENABLED': True,
+        'MIN_SIZE': 1024,          # bytes; smaller bodies are sent as they are
+        'ENCODINGS': ['br', 'gzip'],  # server preference order
+        'GZIP_LEVEL': 6,
+        'BROTLI_QUALITY': 5,
+    }
+
+Streaming responses (exports), responses that already have a
+Content-Encoding and content types that do not compress (images, PDFs,
+archives) are left alone. Like Django's GZipMiddleware, strong ETags are
+made weak, so conditional requests still match.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+    'ENCODINGS': ['br', 'gzip'],
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+COMPRESSIBLE_TYPES = re.compile(r'^(text/|application/(json|javascript|xml|[\w.+-]+\+(json|xml))\b)')
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'REST_FRAMEWORK', {}).get('RESPONSE_COMPRESSION', {}))
+    return config
+
+
+def _compress_gzip(content, config):
+    # mtime=0 keeps the output (and any ETag computed from it) deterministic
+    return gzip.compress(content, compresslevel=config['GZIP_LEVEL'], mtime=0)
+
+
+def _compress_brotli(content, config):
+    return brotli.compress(content, quality=config['BROTLI_QUALITY'])
+
+
+COMPRESSORS = {'gzip': _compress_gzip}
+if brotli is not None:
+    COMPRESSORS['br'] = _compress_brotli
+
+
+def accepted_encodings(header):
+    """Content codings of an Accept-Encoding header with a non-zero quality"""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                continue
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def choose_encoding(header, config):
+    """First configured encoding the client accepts and that is available, or None"""
+    accepted = accepted_encodings(header)
+    for encoding in config['ENCODINGS']:
+        if encoding in COMPRESSORS and (encoding in accepted or '*' in accepted):
+            return encoding
+    return None
+
+
+def compress(content, encoding, config=None):
+    return COMPRESSORS[encoding](content, config or get_config())
+
+
+class CompressionMiddleware:
+    """Compresses large text responses with brotli or gzip (see module docstring)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        config = get_config()
+        if not config['ENABLED'] or response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if not COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')):
+            return response
+        # Whether the body is compressed depends on the request's Accept-Encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < config['MIN_SIZE']:
+            return response
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), config)
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding, config)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
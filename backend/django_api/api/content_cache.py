@@ -0,0 +1,150 @@
+"""
+Rendered payload cache of the public website content endpoints.
+
+``get_content`` and ``post_login_options`` are hit by every landing page
+visit and used to load the ContentManagement singleton and serialize its
+large JSON columns on each call. The rendered JSON is now kept per process,
+keyed by ``ContentManagement.last_updated``: a request only reads that one
+column to check that the cached payload is current, so edits made through
+any worker are picked up on the next request. The filtered post-login
+options are rendered once per grade level and version.
+
+Responses carry an ``ETag`` and ``Last-Modified`` header and conditional
+requests are answered with 304 Not Modified. The entry is dropped when the
+content is saved in this process (see api/signals.py).
+"""
+import hashlib
+import logging
+import threading
+from collections import Counter
+
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+# Distinct grade levels kept per version; older ones are rendered again when needed
+MAX_GRADE_LEVELS = 256
+
+_lock = threading.Lock()
+_entry = None
+_stats = Counter()
+
+
+class _Rendered:
+    """A rendered JSON payload with its validators"""
+
+    def __init__(self, data, last_modified):
+        self.body = JSONRenderer().render(data)
+        self.etag = f'"{hashlib.md5(self.body).hexdigest()}"'
+        self.last_modified = last_modified
+
+    def response(self, request, cache_control):
+        """200 response with the payload, or 304 when the client's copy is current"""
+        last_modified = int(self.last_modified.timestamp()) if self.last_modified else None
+        response = get_conditional_response(request, etag=self.etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(self.body, content_type='application/json')
+        else:
+            _stats['not_modified'] += 1
+        response.headers['ETag'] = self.etag
+        if last_modified is not None:
+            response.headers['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True, **cache_control)
+        return response
+
+
+def filter_post_login_options(options, grade_level):
+    """Enabled options shown to everyone or to a user of the (lower-cased) grade level"""
+    filtered_options = []
+    for option in options:
+        # Skip disabled options
+        if not option.get('enabled', True):
+            continue
+        # Check if option should be shown for all users
+        if option.get('show_for_all', False):
+            filtered_options.append(option)
+        # Check grade level restrictions
+        elif 'show_for_grade_levels' in option and grade_level:
+            allowed_levels = [level.lower() for level in option['show_for_grade_levels']]
+            if any(level in grade_level for level in allowed_levels):
+                filtered_options.append(option)
+    return filtered_options
+
+
+class _Entry:
+    """Rendered payloads of one content version"""
+
+    def __init__(self, content, serializer_class, context):
+        self.version = content.last_updated
+        self.options = list(content.post_login_options or [])
+        self.content = _Rendered(serializer_class(content, context=context).data, content.last_updated)
+        self.post_login = {}
+        self.lock = threading.Lock()
+
+    def post_login_options(self, grade_level):
+        rendered = self.post_login.get(grade_level)
+        if rendered is not None:
+            return rendered
+        options = filter_post_login_options(self.options, (grade_level or '').lower())
+        rendered = _Rendered({'options': options, 'user_grade_level': grade_level}, self.version)
+        with self.lock:
+            if len(self.post_login) >= MAX_GRADE_LEVELS:
+                self.post_login.clear()
+            self.post_login[grade_level] = rendered
+        return rendered
+
+
+def _current_entry(serializer_class, context):
+    """Entry of the stored content version, rendering it when missing or outdated"""
+    global _entry
+    from .models import ContentManagement
+    version = ContentManagement.objects.filter(pk=1).values_list('last_updated', flat=True).first()
+    entry = _entry
+    if entry is not None and version is not None and entry.version == version:
+        _stats['hits'] += 1
+        return entry
+
+    _stats['misses'] += 1
+    entry = _Entry(ContentManagement.get_content(), serializer_class, context)
+    with _lock:
+        _entry = entry
+    logger.debug('Content cache miss: rendered version %s', entry.version)
+    return entry
+
+
+def content_response(request, serializer_class, context):
+    """Cached get_content response"""
+    return _current_entry(serializer_class, context).content.response(request, {'public': True})
+
+
+def post_login_options_response(request, serializer_class, context):
+    """Cached post_login_options response for the requesting user's grade level"""
+    user = request.user
+    grade_level = getattr(user, 'grade_level', None) if user.is_authenticated else None
+    rendered = _current_entry(serializer_class, context).post_login_options(grade_level)
+    response = rendered.response(request, {'private': True})
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def invalidate():
+    """Drop the rendered payloads of this process"""
+    global _entry
+    with _lock:
+        _entry = None
+    _stats['invalidations'] += 1
+
+
+def invalidate_on_change(sender, **kwargs):
+    """post_save/post_delete of ContentManagement"""
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def cache_stats():
+    """Counters of cache hits, misses, 304 responses and invalidations"""
+    return {key: _stats[key] for key in ('hits', 'misses', 'not_modified', 'invalidations')}
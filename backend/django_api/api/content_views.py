@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny
 from rest_framework.exceptions import PermissionDenied
+from . import content_cache
 from .models import ContentManagement
 from .serializers import ContentManagementSerializer
 
@@ -24,10 +25,8 @@ class ContentManagementViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def get_content(self, request):
-        """Get the current website content (public endpoint)"""
-        content = ContentManagement.get_content()
-        serializer = self.get_serializer(content)
-        return Response(serializer.data)
+        """Get the current website content (public endpoint, cached with ETag/Last-Modified)"""
+        return content_cache.content_response(request, self.get_serializer_class(), self.get_serializer_context())
     
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated, permissions.IsAdminUser])
     def update_content(self, request):
@@ -50,33 +49,7 @@ class ContentManagementViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def post_login_options(self, request):
-        """Get post-login modal options filtered by user's grade level"""
-        content = ContentManagement.get_content()
-        
-        # Get user's grade level if user is authenticated
-        grade_level = ''
-        if request.user.is_authenticated and hasattr(request.user, 'grade_level') and request.user.grade_level:
-            grade_level = request.user.grade_level.lower()
-        
-        # Filter options based on user
-        all_options = content.post_login_options
-        filtered_options = []
-        
-        for option in all_options:
-            # Skip disabled options
-            if not option.get('enabled', True):
-                continue
-            
-            # Check if option should be shown for all users
-            if option.get('show_for_all', False):
-                filtered_options.append(option)
-            # Check grade level restrictions
-            elif 'show_for_grade_levels' in option and grade_level:
-                allowed_levels = [level.lower() for level in option['show_for_grade_levels']]
-                if any(level in grade_level for level in allowed_levels):
-                    filtered_options.append(option)
-        
-        return Response({
-            'options': filtered_options,
-            'user_grade_level': request.user.grade_level if request.user.is_authenticated and hasattr(request.user, 'grade_level') else None
-        })
+        """Get post-login modal options filtered by user's grade level (cached per grade level)"""
+        return content_cache.post_login_options_response(
+            request, self.get_serializer_class(), self.get_serializer_context()
+        )
@@ -0,0 +1,386 @@
+"""
+Dashboard statistics aggregation.
+
+Builds the admin dashboard payload with a fixed number of grouped queries
+instead of one COUNT(*) per (user type x type x status) combination.
+Appointment and document counters are read from the StatsSnapshot tables;
+patient demographics use grouped conditional aggregation. The number of
+queries does not depend on how many user types, patients or appointments exist.
+"""
+from datetime import datetime, timedelta
+
+from django.db.models import Count, Q
+
+from .models import Patient
+from .school_year_cache import current_school_year
+from .stats_snapshots import snapshot_totals
+
+
+# Define all possible user types that should be tracked
+ALL_USER_TYPES = [
+    'Kindergarten',
+    'Elementary',
+    'High School',
+    'Senior High School',
+    'College',
+    'Incoming Freshman',
+    'Employee'
+]
+
+# Map legacy/sub user types stored on Patient rows to the standardized types
+USER_TYPE_REMAPPING = {
+    'Faculty': 'Employee',
+    'Postgraduate': 'College',
+    'Undergraduate': 'College',
+    'Doctoral': 'College',
+    'Graduate': 'College',
+    'Grade 1': 'Elementary',
+    'Grade 2': 'Elementary',
+    'Grade 3': 'Elementary',
+    'Grade 4': 'Elementary',
+    'Grade 5': 'Elementary',
+    'Grade 6': 'Elementary',
+    'Grade 7': 'High School',
+    'Grade 8': 'High School',
+    'Grade 9': 'High School',
+    'Grade 10': 'High School',
+    'Grade 11': 'Senior High School',
+    'Grade 12': 'Senior High School',
+}
+
+TEACHING_KEYWORDS = ['teacher', 'instructor', 'professor', 'faculty', 'lecturer', 'aide']
+
+APPOINTMENT_STATUS_KEYS = {'completed': 'completed', 'pending': 'pending', 'cancelled': 'rejected'}
+DOCUMENT_STATUS_KEYS = {'issued': 'issued', 'pending': 'pending'}
+
+
+def _is_valid(value):
+    """Only count values that carry real data (not None, blank or 'Unknown')"""
+    return bool(value and value.strip() and value.lower() not in ['unknown', 'none', ''])
+
+
+def _bump(bucket, key, amount):
+    bucket[key] = bucket.get(key, 0) + amount
+
+
+def _appointment_stats(row, prefix):
+    return {
+        'total': row[f'{prefix}_total'],
+        'completed': row[f'{prefix}_completed'],
+        'pending': row[f'{prefix}_pending'],
+        'rejected': row[f'{prefix}_rejected'],
+    }
+
+
+def _empty_details(user_type):
+    if user_type == 'College':
+        return {'by_year_level': {}, 'by_course': {}, 'by_department': {}, 'by_year_and_course': {}}
+    if user_type in ['High School', 'Senior High School']:
+        return {'by_grade_level': {}, 'by_strand': {}, 'by_department': {}}
+    if user_type == 'Elementary':
+        return {'by_grade_level': {}, 'by_department': {}}
+    if user_type == 'Kindergarten':
+        return {'by_section': {}, 'by_department': {}}
+    if user_type == 'Employee':
+        return {
+            'by_position_type': {},
+            'by_department': {},
+            'by_teaching_status': {'Teaching Staff': 0, 'Non-Teaching Staff': 0},
+            'by_position_and_department': {}
+        }
+    if user_type == 'Incoming Freshman':
+        return {'by_intended_course': {}, 'by_department': {}}
+    return {}
+
+
+def _fold_demographic_group(user_type, details, row, n):
+    """Apply one grouped demographic row (counted n times) to the details dict"""
+    if user_type == 'College':
+        year_level = row['year_level']
+        if not year_level:
+            education_year = row['user__education_year']
+            year_level = f"{education_year} Year" if education_year else None
+        course = row['course'] or row['user__education_program']
+        department = row['department'] or row['user__department_college']
+
+        if _is_valid(year_level):
+            _bump(details['by_year_level'], year_level, n)
+        if _is_valid(course):
+            _bump(details['by_course'], course, n)
+        if _is_valid(department):
+            _bump(details['by_department'], department, n)
+        if _is_valid(year_level) and _is_valid(course):
+            _bump(details['by_year_and_course'], f"{year_level} - {course}", n)
+
+    elif user_type in ['High School', 'Senior High School']:
+        grade_level = row['year_level'] or row['user__grade_level']
+        if _is_valid(grade_level):
+            _bump(details['by_grade_level'], grade_level, n)
+        if _is_valid(row['strand']):
+            _bump(details['by_strand'], row['strand'], n)
+        if _is_valid(row['department']):
+            _bump(details['by_department'], row['department'], n)
+
+    elif user_type == 'Elementary':
+        grade_level = row['year_level'] or row['user__grade_level']
+        if _is_valid(grade_level):
+            _bump(details['by_grade_level'], grade_level, n)
+        if _is_valid(row['department']):
+            _bump(details['by_department'], row['department'], n)
+
+    elif user_type == 'Kindergarten':
+        # year_level holds the section for kindergarten pupils
+        if _is_valid(row['year_level']):
+            _bump(details['by_section'], row['year_level'], n)
+        if _is_valid(row['department']):
+            _bump(details['by_department'], row['department'], n)
+
+    elif user_type == 'Employee':
+        position_type = row['position_type'] or row['user__employee_position']
+        department = row['department'] or row['user__department_college']
+        is_teaching = bool(position_type) and any(
+            keyword in position_type.lower() for keyword in TEACHING_KEYWORDS
+        )
+
+        if _is_valid(position_type):
+            _bump(details['by_position_type'], position_type, n)
+        if _is_valid(department):
+            _bump(details['by_department'], department, n)
+        if is_teaching:
+            details['by_teaching_status']['Teaching Staff'] += n
+        else:
+            details['by_teaching_status']['Non-Teaching Staff'] += n
+        if _is_valid(position_type) and _is_valid(department):
+            _bump(details['by_position_and_department'], f"{position_type} - {department}", n)
+
+    elif user_type == 'Incoming Freshman':
+        intended_course = row['course'] or 'Unknown'
+        if intended_course == 'Unknown':
+            # Related user columns are NULL when the profile has no account
+            intended_course = row['user__education_program'] or 'Unknown'
+        _bump(details['by_intended_course'], intended_course, n)
+        _bump(details['by_department'], row['department'] or 'Unknown', n)
+
+
+def get_detailed_demographics():
+    """Detailed breakdown of patient demographics per user type (one grouped query)"""
+    rows = (
+        Patient.objects
+        .filter(user_type__in=ALL_USER_TYPES)
+        .values(
+            'user_type', 'year_level', 'course', 'department', 'strand', 'position_type',
+            'user__education_year', 'user__education_program',
+            'user__department_college', 'user__grade_level', 'user__employee_position',
+        )
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+
+    detailed_demographics = {}
+    for row in rows:
+        user_type = row['user_type']
+        breakdown = detailed_demographics.get(user_type)
+        if breakdown is None:
+            breakdown = {'total': 0, 'details': _empty_details(user_type)}
+            detailed_demographics[user_type] = breakdown
+        breakdown['total'] += row['n']
+        _fold_demographic_group(user_type, breakdown['details'], row, row['n'])
+
+    # Keep the canonical user type ordering of the response
+    return {
+        user_type: detailed_demographics[user_type]
+        for user_type in ALL_USER_TYPES
+        if user_type in detailed_demographics
+    }
+
+
+def _empty_appointment_row():
+    return {
+        f'{prefix}_{key}': 0
+        for prefix in ('medical', 'dental')
+        for key in ('total', 'completed', 'pending', 'rejected')
+    }
+
+
+def _empty_document_row():
+    return {'total': 0, 'issued': 0, 'pending': 0}
+
+
+def _appointment_rows_by_user_type():
+    """Appointment counters per patient user type, read from the snapshot table"""
+    rows = {}
+    for snapshot in snapshot_totals('appointment', group_by=('user_type', 'category', 'status')):
+        prefix = snapshot['category']
+        if prefix not in ('medical', 'dental'):
+            continue
+        row = rows.setdefault(snapshot['user_type'], _empty_appointment_row())
+        row[f'{prefix}_total'] += snapshot['total']
+        status_key = APPOINTMENT_STATUS_KEYS.get(snapshot['status'])
+        if status_key:
+            row[f'{prefix}_{status_key}'] += snapshot['total']
+    return rows
+
+
+def _document_rows_by_user_type():
+    """Medical document counters per patient user type, read from the snapshot table"""
+    rows = {}
+    for snapshot in snapshot_totals('document', group_by=('user_type', 'status')):
+        row = rows.setdefault(snapshot['user_type'], _empty_document_row())
+        row['total'] += snapshot['total']
+        status_key = DOCUMENT_STATUS_KEYS.get(snapshot['status'])
+        if status_key:
+            row[status_key] += snapshot['total']
+    return rows
+
+
+def get_user_type_breakdown():
+    """
+    Appointment, document and patient counts per standardized user type.
+    Returns (breakdown, totals) where totals are the global appointment and
+    document counters derived from the same grouped rows.
+    """
+    breakdown = {
+        user_type: {
+            'medical': {'total': 0, 'completed': 0, 'pending': 0, 'rejected': 0},
+            'dental': {'total': 0, 'completed': 0, 'pending': 0, 'rejected': 0},
+            'documents': {'total': 0, 'issued': 0, 'pending': 0},
+            'patients': {'total': 0, 'verified': 0, 'unverified': 0},
+            'detailed_breakdown': {}
+        }
+        for user_type in ALL_USER_TYPES
+    }
+
+    appointment_rows = _appointment_rows_by_user_type()
+    document_rows = _document_rows_by_user_type()
+    patient_rows = (
+        Patient.objects
+        .exclude(user_type__isnull=True)
+        .exclude(user_type='')
+        .values('user_type')
+        .annotate(
+            total=Count('id'),
+            verified=Count('id', filter=Q(user__is_email_verified=True)),
+        )
+        .order_by('user_type')
+    )
+
+    # Global counters include rows whose patient has no user type
+    totals = {
+        'medical': {'total': 0, 'completed': 0, 'pending': 0, 'rejected': 0},
+        'dental': {'total': 0, 'completed': 0, 'pending': 0, 'rejected': 0},
+        'documents': {'total': 0, 'issued': 0, 'pending': 0},
+    }
+    for row in appointment_rows.values():
+        for prefix in ('medical', 'dental'):
+            for key, value in _appointment_stats(row, prefix).items():
+                totals[prefix][key] += value
+    for row in document_rows.values():
+        for key in ('total', 'issued', 'pending'):
+            totals['documents'][key] += row[key]
+
+    empty_appointments = _empty_appointment_row()
+    empty_documents = _empty_document_row()
+
+    for row in patient_rows:
+        existing_type = row['user_type']
+        standardized_type = USER_TYPE_REMAPPING.get(existing_type, existing_type)
+        # If the standardized type is not tracked, count it as College by default
+        if standardized_type not in ALL_USER_TYPES:
+            standardized_type = 'College'
+
+        appointment_row = appointment_rows.get(existing_type, empty_appointments)
+        document_row = document_rows.get(existing_type, empty_documents)
+        medical_stats = _appointment_stats(appointment_row, 'medical')
+        dental_stats = _appointment_stats(appointment_row, 'dental')
+        documents_stats = {key: document_row[key] for key in ('total', 'issued', 'pending')}
+
+        target = breakdown[standardized_type]
+        for key, value in medical_stats.items():
+            target['medical'][key] += value
+        for key, value in dental_stats.items():
+            target['dental'][key] += value
+        for key, value in documents_stats.items():
+            target['documents'][key] += value
+        target['patients']['total'] += row['total']
+        target['patients']['verified'] += row['verified']
+        target['patients']['unverified'] += row['total'] - row['verified']
+
+        target['detailed_breakdown'].setdefault('sub_types', {})[existing_type] = {
+            'total': row['total'],
+            'medical': medical_stats,
+            'dental': dental_stats,
+            'documents': documents_stats
+        }
+
+    return breakdown, totals
+
+
+def get_monthly_trends(months=6, now=None):
+    """Medical, dental and document counts for the last `months` months"""
+    current_date = now or datetime.now()
+    month_dates = [current_date - timedelta(days=30 * i) for i in range(months - 1, -1, -1)]
+
+    first = month_dates[0]
+    range_start = f'{first.year:04d}-{first.month:02d}'
+
+    appointment_counts = {}
+    for row in snapshot_totals('appointment', group_by=('period', 'category'), period__gte=range_start):
+        appointment_counts[(row['period'], row['category'])] = row['total']
+
+    document_counts = {}
+    for row in snapshot_totals('document', group_by=('period',), period__gte=range_start):
+        document_counts[row['period']] = row['total']
+
+    return [
+        {
+            'month': month_date.strftime('%b'),
+            'medical': appointment_counts.get((month_date.strftime('%Y-%m'), 'medical'), 0),
+            'dental': appointment_counts.get((month_date.strftime('%Y-%m'), 'dental'), 0),
+            'documents': document_counts.get(month_date.strftime('%Y-%m'), 0),
+        }
+        for month_date in month_dates
+    ]
+
+
+def build_dashboard_statistics():
+    """Assemble the full dashboard statistics payload"""
+    current_semester = current_school_year()
+
+    user_type_breakdown, totals = get_user_type_breakdown()
+    medical = totals['medical']
+    dental = totals['dental']
+    documents = totals['documents']
+
+    # Patient statistics (student accounts)
+    patients = {'total': 0, 'verified': 0, 'unverified': 0}
+    for row in snapshot_totals('user', group_by=('status',), category='student'):
+        patients['total'] += row['total']
+        patients['verified' if 'v1' in row['status'] else 'unverified'] += row['total']
+
+    # Calculate completion rates
+    medical_rate = (medical['completed'] / medical['total'] * 100) if medical['total'] > 0 else 0
+    dental_rate = (dental['completed'] / dental['total'] * 100) if dental['total'] > 0 else 0
+    documents_rate = (documents['issued'] / documents['total'] * 100) if documents['total'] > 0 else 0
+    overall_total = medical['total'] + dental['total'] + documents['total']
+    overall_rate = ((medical['completed'] + dental['completed'] + documents['issued']) /
+                    overall_total * 100) if overall_total > 0 else 0
+
+    return {
+        'semester': {
+            'id': current_semester.id if current_semester else None,
+            'name': current_semester.academic_year if current_semester else 'Not Set'
+        },
+        'medical': medical,
+        'dental': dental,
+        'documents': documents,
+        'patients': patients,
+        'user_type_breakdown': user_type_breakdown,
+        'detailed_demographics': get_detailed_demographics(),
+        'monthly_trends': get_monthly_trends(),
+        'completion_rates': {
+            'medical': round(medical_rate, 1),
+            'dental': round(dental_rate, 1),
+            'documents': round(documents_rate, 1),
+            'overall': round(overall_rate, 1)
+        }
+    }
@@ -0,0 +1,295 @@
+"""
+Closing a campus for whole days and moving their appointments.
+
+When a clinic has to close unexpectedly, ``close_days()`` records a
+CampusClosure per day (closed days are no longer bookable, see
+api/scheduling.py) and moves every active appointment of those days to the
+earliest free slot of a target window, in the order they were booked.
+
+Free slots come from the slot occupancy index, the day counters and the
+compiled staff calendar, all read once: placing an appointment only updates
+the in-memory copies, so the cost does not grow with the number of slots
+searched. Everything is written in one transaction with bulk operations
+(``bulk_update`` of the appointments, reservations, day counters, occupancy,
+statistics counters) and the patients' notification emails are queued with
+one ``enqueue_emails()`` call. Appointments that do not fit in the window
+stay on their day and are reported as unplaced for staff to handle.
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import scheduling, slot_occupancy, stats_snapshots
+from .email_outbox import enqueue_emails
+from .slot_occupancy import ACTIVE_STATUSES, MAX_APPOINTMENTS_PER_DAY, SLOT_TIMES
+
+logger = logging.getLogger(__name__)
+
+# Per-appointment fields of a move; bulk_update() cost grows with every field listed
+MOVED_FIELDS = ['appointment_date', 'appointment_time', 'notes']
+
+
+def _days(start, end):
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def _lock_counters(campus, days):
+    """{date: DailyBookingCounter} locked for the given days, creating missing rows"""
+    from .models import DailyBookingCounter
+    DailyBookingCounter.objects.bulk_create(
+        [DailyBookingCounter(campus=campus, date=day, booked=0) for day in days], ignore_conflicts=True,
+    )
+    return {
+        counter.date: counter
+        for counter in DailyBookingCounter.objects.select_for_update().filter(campus=campus, date__in=days)
+    }
+
+
+class _FreeSlots:
+    """
+    In-memory view of the free slots of a window. Each appointment type keeps
+    a cursor past the slots that can no longer take it (taken slots, full
+    days, no staff capacity left), so successive searches resume there.
+    """
+
+    def __init__(self, campus, days, counters, daily_limit):
+        self.campus = campus
+        self.daily_limit = daily_limit
+        self.calendar = scheduling.get_calendar()
+        self.booked = {day: counters[day].booked for day in days}
+        self.counts = defaultdict(lambda: [0] * len(SLOT_TIMES))
+        for (day, type_), counts in self._occupancy(campus, days).items():
+            self.counts[(day, type_)] = counts
+        self.load = scheduling.staff_load(days[0], days[-1]) if days else {}
+        self.grid = [
+            (day, index, slot_time)
+            for day in days if self.calendar.is_open(campus, day)
+            for index, slot_time in enumerate(SLOT_TIMES) if self.calendar.is_open(campus, day, slot_time)
+        ]
+        self.cursors = Counter()
+
+    @staticmethod
+    def _occupancy(campus, days):
+        from .models import SlotOccupancy
+        rows = SlotOccupancy.objects.filter(campus=campus, date__in=days).values_list('date', 'type', 'slots')
+        return {(day, type_): slot_occupancy._grid(slots) for day, type_, slots in rows}
+
+    def _staff(self, type, day, slot_time, prefer):
+        """Staff member to assign, None when the type is not staffed, False when nobody can take it"""
+        if not self.calendar.is_staffed(self.campus, type):
+            return None
+        candidates = self.calendar.with_capacity(self.campus, type, day, slot_time, self.load.get(day, {}))
+        if not candidates:
+            return False
+        return prefer if prefer in candidates else candidates[0]
+
+    def take(self, type, prefer=None, skip_days=()):
+        """
+        Book the earliest free slot of the type, skipping `skip_days`; returns
+        (date, time, staff user id or None) or None when the window is full.
+        """
+        advance = True
+        for position in range(self.cursors[type], len(self.grid)):
+            day, index, slot_time = self.grid[position]
+            counts = self.counts[(day, type)]
+            doctor_id = None
+            if counts[index] <= 0 and self.booked[day] < self.daily_limit:
+                doctor_id = self._staff(type, day, slot_time, prefer)
+            if counts[index] > 0 or self.booked[day] >= self.daily_limit or doctor_id is False:
+                if advance:
+                    self.cursors[type] = position + 1
+                continue
+            if day in skip_days:
+                # Free for others; the cursor must not move past it
+                advance = False
+                continue
+            counts[index] += 1
+            self.booked[day] += 1
+            if doctor_id is not None:
+                day_load = self.load.setdefault(day, {})
+                day_load[doctor_id] = day_load.get(doctor_id, 0) + 1
+            if advance:
+                self.cursors[type] = position + 1
+            return day, slot_time, doctor_id
+        return None
+
+
+def _closure_note(by_name, old_date, old_time, reason):
+    note = f"Appointment rescheduled by {by_name} on {timezone.now().strftime('%Y-%m-%d %H:%M')}"
+    note += f" from {old_date} at {old_time}"
+    if reason:
+        note += f". Reason: {reason}"
+    return note
+
+
+def _notification(appointment, old_date):
+    patient = appointment.patient
+    email = patient.email or (patient.user.email if patient.user_id else '')
+    if not email:
+        return None
+    return {
+        'idempotency_key': f'appointment-closure:{appointment.pk}:{old_date}',
+        'subject': 'Your appointment has been moved',
+        'message': (
+            f'The clinic at {appointment.get_campus_display()} is closed on {old_date}, so your '
+            f'{appointment.type} appointment has been moved to {appointment.appointment_date} at '
+            f"{appointment.appointment_time.strftime('%I:%M %p')}.\n\n"
+            'Please log in to the WMSU Health Services portal to view, reschedule or cancel it.'
+        ),
+        'recipient_list': [email],
+    }
+
+
+def close_days(campus, dates, window_start, window_end, user=None, reason='',
+               daily_limit=MAX_APPOINTMENTS_PER_DAY, dry_run=False):
+    """
+    Close a campus on `dates` and move their active appointments to the
+    earliest free slots between window_start and window_end.
+
+    Returns {'closed': [dates], 'moved': [{id, from_date, from_time, to_date,
+    to_time}], 'unplaced': [appointment ids]}. With dry_run nothing is saved.
+    """
+    from .models import Appointment, CampusClosure, DailyBookingCounter, SlotReservation, WaitlistEntry
+
+    dates = sorted(set(dates))
+    window = [day for day in _days(window_start, window_end) if day not in dates]
+    reason = reason or 'Campus closed'
+    by_name = user.get_full_name() if user is not None else 'Health Services'
+    now = timezone.now()
+
+    try:
+        with transaction.atomic():
+            closures = {}
+            for day in dates:
+                closures[day], _ = CampusClosure.objects.update_or_create(
+                    campus=campus, date=day, defaults={'reason': reason, 'closed_by': user},
+                )
+
+            # Lock the appointments alone (MariaDB has no SELECT ... FOR UPDATE OF), then load them with their patients
+            locked = list(
+                Appointment.objects.select_for_update()
+                .filter(campus=campus, appointment_date__in=dates, status__in=ACTIVE_STATUSES)
+                .values_list('id', flat=True)
+            )
+            appointments = list(
+                Appointment.objects.select_related('patient__user', 'school_year')
+                .filter(pk__in=locked).order_by('appointment_date', 'appointment_time', 'id')
+            )
+            counters = _lock_counters(campus, dates + window)
+            free = _FreeSlots(campus, window, counters, daily_limit)
+
+            # Days each patient already has an appointment of a type on, within the window
+            busy = defaultdict(set)
+            rows = Appointment.objects.filter(
+                patient_id__in={appointment.patient_id for appointment in appointments},
+                campus=campus, appointment_date__in=window, status__in=ACTIVE_STATUSES,
+            ).values_list('patient_id', 'type', 'appointment_date')
+            for patient_id, type_, day in rows:
+                busy[(patient_id, type_)].add(day)
+
+            moved, unplaced, emails = [], [], []
+            changed_fields = set()
+            occupancy_deltas, stats_moves = {}, []
+            for appointment in appointments:
+                taken = busy[(appointment.patient_id, appointment.type)]
+                placement = free.take(appointment.type, prefer=appointment.doctor_id, skip_days=taken)
+                if placement is None:
+                    unplaced.append(appointment.pk)
+                    continue
+                new_date, new_time, doctor_id = placement
+                taken.add(new_date)
+
+                old_slot_state = tuple(getattr(appointment, field) for field in slot_occupancy.TRACKED_FIELDS)
+                old_stats_state = tuple(getattr(appointment, field) for field in stats_snapshots.TRACKED_FIELDS['Appointment'])
+                old_date, old_time = appointment.appointment_date, appointment.appointment_time
+
+                if not appointment.is_rescheduled:
+                    appointment.original_date = old_date
+                    appointment.original_time = old_time
+                appointment.appointment_date = new_date
+                appointment.appointment_time = new_time
+                if doctor_id is not None and doctor_id != appointment.doctor_id:
+                    appointment.doctor_id = doctor_id
+                    changed_fields.add('doctor')
+                if not appointment.semester and appointment.school_year_id:
+                    appointment.semester = appointment.determine_semester()
+                    changed_fields.add('semester')
+                appointment.is_rescheduled = True
+                appointment.rescheduled_by = user
+                appointment.rescheduled_at = now
+                appointment.reschedule_reason = reason
+                note = _closure_note(by_name, old_date, old_time, reason)
+                appointment.notes = f"{appointment.notes}\n{note}" if appointment.notes else note
+                appointment.updated_at = now
+
+                for key, changes in slot_occupancy.moves(
+                    old_slot_state, tuple(getattr(appointment, field) for field in slot_occupancy.TRACKED_FIELDS)
+                ).items():
+                    occupancy_deltas.setdefault(key, Counter()).update(changes)
+                stats_moves.append((
+                    old_stats_state,
+                    tuple(getattr(appointment, field) for field in stats_snapshots.TRACKED_FIELDS['Appointment']),
+                ))
+                counters[old_date].booked -= 1
+                counters[new_date].booked += 1
+                moved.append({
+                    'id': appointment.pk,
+                    'from_date': old_date,
+                    'from_time': old_time,
+                    'to_date': new_date,
+                    'to_time': new_time,
+                })
+                message = _notification(appointment, old_date)
+                if message is not None:
+                    emails.append(message)
+
+            # bulk_update() bypasses the Appointment signals: write what they would have
+            moved_ids = [row['id'] for row in moved]
+            by_id = {appointment.pk: appointment for appointment in appointments}
+            # reschedule_appointment() fields shared by every move are set with plain updates
+            Appointment.objects.filter(pk__in=moved_ids, is_rescheduled=False).update(
+                original_date=F('appointment_date'), original_time=F('appointment_time'),
+            )
+            Appointment.objects.filter(pk__in=moved_ids).update(
+                is_rescheduled=True, rescheduled_by=user, rescheduled_at=now, reschedule_reason=reason, updated_at=now,
+            )
+            Appointment.objects.bulk_update(
+                [by_id[pk] for pk in moved_ids], MOVED_FIELDS + sorted(changed_fields), batch_size=500,
+            )
+            SlotReservation.objects.filter(appointment_id__in=moved_ids).delete()
+            SlotReservation.objects.bulk_create([
+                SlotReservation(appointment_id=row['id'], campus=campus, date=row['to_date'], time=row['to_time'],
+                                type=by_id[row['id']].type)
+                for row in moved
+            ], batch_size=500)
+            for counter in counters.values():
+                counter.updated_at = now
+            DailyBookingCounter.objects.bulk_update(list(counters.values()), ['booked', 'updated_at'])
+            slot_occupancy.apply_deltas(occupancy_deltas)
+            stats_snapshots.apply_deltas(stats_snapshots.appointment_state_deltas(stats_moves))
+
+            WaitlistEntry.objects.filter(campus=campus, date__in=dates, status='waiting').update(
+                status='expired', note=f'The campus is closed on this day: {reason}'[:255],
+            )
+            for day, closure in closures.items():
+                closure.moved_appointments = sum(1 for row in moved if row['from_date'] == day)
+                closure.unplaced_appointments = sum(1 for pk in unplaced if by_id[pk].appointment_date == day)
+            CampusClosure.objects.bulk_update(list(closures.values()), ['moved_appointments', 'unplaced_appointments'])
+            enqueue_emails(emails)
+
+            if dry_run:
+                transaction.set_rollback(True)
+    finally:
+        # The closures written above were compiled into the calendar by
+        # _FreeSlots; drop it whether the transaction committed or not
+        scheduling.invalidate()
+
+    logger.info(
+        'Closed campus %s on %s: moved %d appointments, %d unplaced%s',
+        campus, ', '.join(str(day) for day in dates), len(moved), len(unplaced), ' (dry run)' if dry_run else '',
+    )
+    return {'closed': dates, 'moved': moved, 'unplaced': unplaced}
@@ -0,0 +1,202 @@
+"""
+Database-backed outbound email queue.
+
+The request path only calls ``enqueue_email()``, which writes an EmailOutbox
+row inside the caller's transaction (a rolled back signup never sends its
+verification email). The ``process_email_outbox`` management command claims
+due messages in batches and delivers each batch over one SMTP connection.
+Failed messages are retried with exponential backoff until ``max_attempts``
+is reached.
+
+Each message has an idempotency key. While a message with the same key is
+still queued, enqueueing again returns the queued message instead of
+creating a duplicate; once it was delivered (or gave up), the key is queued
+again with the new content.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 60
+MAX_BACKOFF_SECONDS = 6 * 60 * 60
+# A message claimed longer ago than this belongs to a worker that died
+LOCK_TIMEOUT = timedelta(minutes=10)
+
+
+def _message_fields(subject, message, recipient_list, from_email=None, html_message=None):
+    return {
+        'subject': subject[:255],
+        'body': message,
+        'html_body': html_message or '',
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+        'recipients': list(recipient_list),
+    }
+
+
+def _requeue(existing, fields):
+    """Queue a delivered (or given up) message again with new content"""
+    for name, value in fields.items():
+        setattr(existing, name, value)
+    existing.status = 'pending'
+    existing.attempts = 0
+    existing.next_attempt_at = timezone.now()
+    existing.locked_at = None
+    existing.last_error = ''
+    existing.sent_at = None
+    existing.save()
+    return existing
+
+
+def enqueue_email(idempotency_key, subject, message, recipient_list, from_email=None, html_message=None):
+    """Queue an email for the outbox worker; returns the EmailOutbox row"""
+    from .models import EmailOutbox
+    fields = _message_fields(subject, message, recipient_list, from_email, html_message)
+    with transaction.atomic():
+        existing = EmailOutbox.objects.select_for_update().filter(idempotency_key=idempotency_key).first()
+        if existing is None:
+            try:
+                with transaction.atomic():
+                    return EmailOutbox.objects.create(idempotency_key=idempotency_key, max_attempts=MAX_ATTEMPTS, **fields)
+            except IntegrityError:
+                # Enqueued concurrently with the same key
+                return EmailOutbox.objects.get(idempotency_key=idempotency_key)
+
+        if existing.status in ('pending', 'sending'):
+            logger.debug('Email %s already queued', idempotency_key)
+            return existing
+
+        return _requeue(existing, fields)
+
+
+def enqueue_emails(messages):
+    """
+    Bulk variant of enqueue_email() for many messages at once; each message is
+    a dict of enqueue_email() arguments. New keys are inserted with one
+    bulk_create. Returns the number of messages queued, an upper bound: a new
+    key inserted by a concurrent request between the lookup and the
+    bulk_create is skipped but still counted (MariaDB does not report which
+    rows an INSERT IGNORE left out).
+    """
+    from .models import EmailOutbox
+    messages = {message['idempotency_key']: message for message in messages}
+    if not messages:
+        return 0
+    with transaction.atomic():
+        existing = {
+            row.idempotency_key: row
+            for row in EmailOutbox.objects.select_for_update().filter(idempotency_key__in=list(messages))
+        }
+        new_rows = []
+        queued = 0
+        for key, message in messages.items():
+            fields = _message_fields(**{name: value for name, value in message.items() if name != 'idempotency_key'})
+            row = existing.get(key)
+            if row is None:
+                new_rows.append(EmailOutbox(idempotency_key=key, max_attempts=MAX_ATTEMPTS, **fields))
+            elif row.status not in ('pending', 'sending'):
+                _requeue(row, fields)
+                queued += 1
+        # Keys enqueued concurrently stay as they are
+        EmailOutbox.objects.bulk_create(new_rows, batch_size=500, ignore_conflicts=True)
+    return queued + len(new_rows)
+
+
+def backoff_delay(attempts):
+    """Delay before the next attempt after `attempts` failed ones"""
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** max(attempts - 1, 0), MAX_BACKOFF_SECONDS))
+
+
+def claim_batch(batch_size=BATCH_SIZE, now=None):
+    """Mark up to `batch_size` due messages as sending and return them"""
+    from .models import EmailOutbox
+    now = now or timezone.now()
+    due = Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', locked_at__lt=now - LOCK_TIMEOUT)
+    with transaction.atomic():
+        ids = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True).filter(due)
+            .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        EmailOutbox.objects.filter(id__in=ids).update(status='sending', locked_at=now)
+    return list(EmailOutbox.objects.filter(id__in=ids).order_by('next_attempt_at', 'id'))
+
+
+def _record_failure(row, error, now):
+    row.attempts += 1
+    row.last_error = str(error)[:2000]
+    row.locked_at = None
+    if row.attempts >= row.max_attempts:
+        row.status = 'failed'
+        logger.error('Giving up on email %s after %s attempts: %s', row.idempotency_key, row.attempts, error)
+    else:
+        row.status = 'pending'
+        row.next_attempt_at = now + backoff_delay(row.attempts)
+        logger.warning('Email %s failed (attempt %s), retrying at %s: %s', row.idempotency_key, row.attempts, row.next_attempt_at, error)
+    row.save(update_fields=['attempts', 'last_error', 'locked_at', 'status', 'next_attempt_at'])
+
+
+def send_batch(rows, connection=None):
+    """Deliver claimed messages over one connection; returns (sent, failed)"""
+    if not rows:
+        return 0, 0
+    now = timezone.now()
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        for row in rows:
+            _record_failure(row, e, now)
+        return 0, len(rows)
+
+    sent = failed = 0
+    try:
+        for row in rows:
+            message = EmailMultiAlternatives(
+                subject=row.subject,
+                body=row.body,
+                from_email=row.from_email,
+                to=row.recipients,
+                connection=connection,
+            )
+            if row.html_body:
+                message.attach_alternative(row.html_body, 'text/html')
+            try:
+                message.send(fail_silently=False)
+            except Exception as e:
+                _record_failure(row, e, now)
+                failed += 1
+                continue
+            row.status = 'sent'
+            row.attempts += 1
+            row.sent_at = timezone.now()
+            row.locked_at = None
+            row.last_error = ''
+            row.save(update_fields=['status', 'attempts', 'sent_at', 'locked_at', 'last_error'])
+            sent += 1
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def process_outbox(batch_size=BATCH_SIZE, max_batches=None):
+    """Send due messages batch by batch until none are left; returns (sent, failed)"""
+    total_sent = total_failed = batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = claim_batch(batch_size)
+        if not rows:
+            break
+        sent, failed = send_batch(rows)
+        total_sent += sent
+        total_failed += failed
+        batches += 1
+    return total_sent, total_failed
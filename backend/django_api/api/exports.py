@@ -0,0 +1,321 @@
+"""
+Streaming CSV, XLSX and JSON exports of the admin lists.
+
+Exports used to load every row as a model instance (and its relations, one
+query per row) into a list before rendering one response, so the memory of a
+worker grew with the size of a school year. An export is now a
+StreamingHttpResponse fed by ``export_chunks()``: rows are read in chunks of
+CHUNK_SIZE with only the exported columns (``values_list``), each chunk is
+written and handed to the server before the next one is read, and memory
+stays flat whatever the number of rows.
+
+Chunks are selected with the keyset filter of the admin lists (see
+api/pagination.py) rather than ``.iterator()``: PyMySQL reads a whole result
+set into memory even for an iterator, a LIMITed seek query does not.
+
+An export is described by a list of Column: the key used in JSON, the CSV/XLSX
+header, the ORM lookup of the value and an optional formatter. Column sets of
+the semester profile, appointment, medical document and user exports are
+defined below.
+"""
+import csv
+import io
+import re
+import zipfile
+from collections import namedtuple
+from xml.sax.saxutils import escape
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .pagination import KeysetPagination
+
+CHUNK_SIZE = 2000
+FORMAT_QUERY_PARAM = 'file_format'
+
+Column = namedtuple('Column', ['key', 'header', 'lookup', 'format'], defaults=[None])
+
+
+# ---------------------------------------------------------------------------
+# Rows
+# ---------------------------------------------------------------------------
+
+def export_chunks(queryset, columns, chunk_size=CHUNK_SIZE):
+    """
+    Formatted rows of the queryset in its own ordering, as lists of at most
+    `chunk_size` tuples; one query per chunk.
+    """
+    ordering = KeysetPagination().get_ordering(queryset)
+    keys = [field.lstrip('-') for field in ordering]
+    queryset = queryset.order_by(*ordering).values_list(*keys, *(column.lookup for column in columns))
+    formats = [(index + len(keys), column.format) for index, column in enumerate(columns)]
+    values = None
+    while True:
+        page = queryset if values is None else queryset.filter(KeysetPagination._seek_filter(ordering, values))
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        yield [
+            tuple(value(row[index]) if value else row[index] for index, value in formats)
+            for row in rows
+        ]
+        if len(rows) < chunk_size:
+            return
+        values = rows[-1][:len(keys)]
+
+
+# ---------------------------------------------------------------------------
+# Writers: each yields bytes per chunk
+# ---------------------------------------------------------------------------
+
+def _text(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def csv_stream(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel reads the file as UTF-8
+    buffer.write('\ufeff')
+    writer.writerow([column.header for column in columns])
+    for chunk in chunks:
+        writer.writerows([_text(value) for value in row] for row in chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def json_stream(columns, chunks):
+    keys = [column.key for column in columns]
+    encoder = DjangoJSONEncoder()
+    separator = ''
+    yield b'['
+    for chunk in chunks:
+        parts = []
+        for row in chunk:
+            parts.append(separator + encoder.encode(dict(zip(keys, row))))
+            separator = ','
+        yield ''.join(parts).encode('utf-8')
+    yield b']'
+
+
+# Characters XML 1.0 does not allow, even escaped
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+class _Drain(io.RawIOBase):
+    """Unseekable file collecting what zipfile writes until it is taken"""
+
+    def __init__(self):
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _xlsx_cell(value):
+    if isinstance(value, bool) or value is None:
+        value = _text(value) if value is None else ('Yes' if value else 'No')
+    elif isinstance(value, (int, float)):
+        return f'<c t="n"><v>{value}</v></c>'
+    text = escape(_XML_INVALID.sub('', _text(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def xlsx_stream(columns, chunks):
+    """
+    A one-sheet workbook of inline-string cells, written with zipfile to an
+    unseekable stream (sizes go in data descriptors) so no row is kept once
+    its chunk is sent.
+    """
+    drain = _Drain()
+    with zipfile.ZipFile(drain, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row(column.header for column in columns)
+            ).encode('utf-8'))
+            for chunk in chunks:
+                sheet.write(''.join(_xlsx_row(row) for row in chunk).encode('utf-8'))
+                yield drain.take()
+            sheet.write(b'</sheetData></worksheet>')
+    yield drain.take()
+
+
+FORMATS = {
+    'csv': (csv_stream, 'text/csv; charset=utf-8'),
+    'xlsx': (xlsx_stream, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'json': (json_stream, 'application/json'),
+}
+
+
+def export_response(request, queryset, columns, filename, default_format='csv'):
+    """
+    StreamingHttpResponse of the queryset in the format of the ``file_format``
+    query parameter (csv, xlsx or json). ``format`` is left to DRF's renderer
+    selection.
+    """
+    file_format = (request.query_params.get(FORMAT_QUERY_PARAM) or default_format).lower()
+    if file_format not in FORMATS:
+        raise ValidationError({FORMAT_QUERY_PARAM: f"Unsupported export format. Choose one of: {', '.join(FORMATS)}"})
+    writer, content_type = FORMATS[file_format]
+    response = StreamingHttpResponse(writer(columns, export_chunks(queryset, columns)), content_type=content_type)
+    if file_format != 'json':
+        stamp = timezone.localtime().strftime('%Y%m%d_%H%M')
+        response['Content-Disposition'] = f'attachment; filename="{filename}_{stamp}.{file_format}"'
+    # Keep proxies from buffering the whole file
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Column sets
+# ---------------------------------------------------------------------------
+
+def _choices(model_name, field):
+    """Formatter showing the display value of a choice field"""
+    from . import models
+    labels = dict(getattr(models, model_name)._meta.get_field(field).flatchoices)
+    return lambda value: labels.get(value, value)
+
+
+def _semester(model_name):
+    """Formatter showing a semester like get_semester_display(): 'Unassigned' when empty or unknown"""
+    from . import models
+    labels = dict(getattr(models, model_name)._meta.get_field('semester').flatchoices)
+    return lambda value: labels.get(value, 'Unassigned')
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _or_na(value):
+    return value if value else 'N/A'
+
+
+def semester_profile_columns():
+    return [
+        Column('student_id', 'Student ID', 'student_id'),
+        Column('name', 'Name', 'name'),
+        Column('email', 'Email', 'email'),
+        Column('semester', 'Semester', 'semester', _semester('Patient')),
+        Column('school_year', 'School Year', 'school_year__academic_year', _or_na),
+        Column('gender', 'Gender', 'gender'),
+        Column('department', 'Department', 'department'),
+        Column('contact_number', 'Contact Number', 'contact_number'),
+        Column('created_at', 'Created At', 'created_at', _isoformat),
+    ]
+
+
+def appointment_columns():
+    return [
+        Column('id', 'Appointment ID', 'id'),
+        Column('patient_name', 'Patient', 'patient__name'),
+        Column('student_id', 'Student ID', 'patient__student_id'),
+        Column('type', 'Type', 'type', _choices('Appointment', 'type')),
+        Column('appointment_date', 'Date', 'appointment_date'),
+        Column('appointment_time', 'Time', 'appointment_time'),
+        Column('status', 'Status', 'status', _choices('Appointment', 'status')),
+        Column('campus', 'Campus', 'campus', _choices('Appointment', 'campus')),
+        Column('purpose', 'Purpose', 'purpose'),
+        Column('doctor_username', 'Staff', 'doctor__username'),
+        Column('school_year', 'School Year', 'school_year__academic_year', _or_na),
+        Column('semester', 'Semester', 'semester', _semester('Appointment')),
+        Column('is_rescheduled', 'Rescheduled', 'is_rescheduled'),
+        Column('created_at', 'Created At', 'created_at', _isoformat),
+    ]
+
+
+def medical_document_columns():
+    return [
+        Column('id', 'Document ID', 'id'),
+        Column('patient_name', 'Patient', 'patient__name'),
+        Column('student_id', 'Student ID', 'patient__student_id'),
+        Column('academic_year', 'School Year', 'academic_year__academic_year', _or_na),
+        Column('status', 'Status', 'status', _choices('MedicalDocument', 'status')),
+        Column('submitted_for_review', 'Submitted for Review', 'submitted_for_review'),
+        Column('reviewed_by_username', 'Reviewed By', 'reviewed_by__username'),
+        Column('reviewed_at', 'Reviewed At', 'reviewed_at', _isoformat),
+        Column('certificate_issued_at', 'Certificate Issued At', 'certificate_issued_at', _isoformat),
+        Column('uploaded_at', 'Uploaded At', 'uploaded_at', _isoformat),
+        Column('updated_at', 'Updated At', 'updated_at', _isoformat),
+    ]
+
+
+def user_columns():
+    return [
+        Column('id', 'User ID', 'id'),
+        Column('username', 'Username', 'username'),
+        Column('email', 'Email', 'email'),
+        Column('first_name', 'First Name', 'first_name'),
+        Column('middle_name', 'Middle Name', 'middle_name'),
+        Column('last_name', 'Last Name', 'last_name'),
+        Column('user_type', 'User Type', 'user_type', _choices('CustomUser', 'user_type')),
+        Column('grade_level', 'Grade Level', 'grade_level'),
+        Column('is_active', 'Active', 'is_active'),
+        Column('is_email_verified', 'Email Verified', 'is_email_verified'),
+        Column('is_blocked', 'Blocked', 'is_blocked'),
+        Column('date_joined', 'Date Joined', 'date_joined', _isoformat),
+        Column('last_login', 'Last Login', 'last_login', _isoformat),
+    ]
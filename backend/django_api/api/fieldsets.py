@@ -0,0 +1,151 @@
+"""
+Sparse fieldsets for the large list endpoints.
+
+``PatientSerializer`` renders about 80 fields, a dozen of them large JSON
+columns, and ``AppointmentSerializer`` every model column plus computed
+fields, for each row of a list. Admin tables only show a handful of them.
+
+- ``?fields=a,b`` keeps only the named fields and ``?omit=a,b`` drops fields
+  (``SparseFieldsetMixin`` on the serializer). Unknown names are a 400.
+- ``?view=summary`` on a list selects the view's ``summary_serializer_class``,
+  the columns the admin tables display.
+- ``SparseFieldsetViewMixin`` also narrows the SQL of reads to the columns
+  the remaining fields need: ``select_related()`` is limited to the
+  relations they traverse and ``only()`` to their columns.
+
+Only GET/HEAD/OPTIONS responses are trimmed; writes always validate and
+return the full serializer. Without the parameters responses are unchanged.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+VIEW_PARAM = 'view'
+SUMMARY_VIEW = 'summary'
+
+
+def _names(request, param):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def requested_fieldset(request):
+    """(fields to keep or None, fields to drop) of a read request; (None, []) otherwise"""
+    if request is None or request.method not in SAFE_METHODS:
+        return None, []
+    return _names(request, FIELDS_PARAM), _names(request, OMIT_PARAM) or []
+
+
+class SparseFieldsetMixin:
+    """
+    ModelSerializer mixin applying ?fields= and ?omit= of the request in the
+    serializer context.
+
+    ``Meta.field_sources`` maps fields whose source is not a model column
+    path (SerializerMethodFields, model methods) to the column paths they
+    read, e.g. ``{'user_name': ['user__first_name', 'user__last_name']}``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep, omit = requested_fieldset(self.context.get('request'))
+        if keep is None and not omit:
+            return
+        unknown = sorted(set(keep or []).union(omit) - set(self.fields))
+        if unknown:
+            raise ValidationError({FIELDS_PARAM if keep else OMIT_PARAM: [f"Unknown field(s): {', '.join(unknown)}"]})
+        drop = set(omit)
+        if keep is not None:
+            drop.update(name for name in self.fields if name not in keep)
+        for name in drop:
+            self.fields.pop(name)
+
+
+def _source_paths(model, attrs):
+    """Column paths of a dotted field source, or None when they cannot be told"""
+    prefix = ''
+    for index, attr in enumerate(attrs):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            if index == 0:
+                # A property or method of the model itself
+                return None
+            # A method of a related object: load all of its columns
+            return {prefix + related.attname for related in model._meta.concrete_fields}
+        if field.is_relation and not (field.many_to_one or (field.one_to_one and field.concrete)):
+            # Reverse and many-to-many relations are not loaded through columns
+            return None
+        if index == len(attrs) - 1:
+            return {prefix + (field.name if field.is_relation else field.attname)}
+        if not field.is_relation:
+            return None
+        prefix += f'{attr}__'
+        model = field.related_model
+    return None
+
+
+def serializer_columns(serializer):
+    """
+    Column paths ('name', 'patient__name', ...) a model serializer's fields
+    read, always including the primary and foreign keys; None when a field
+    cannot be mapped.
+    """
+    model = serializer.Meta.model
+    extra = getattr(serializer.Meta, 'field_sources', {})
+    paths = {model._meta.pk.name}
+    paths.update(field.name for field in model._meta.concrete_fields if field.many_to_one)
+    for name, field in serializer.fields.items():
+        if name in extra:
+            paths.update(extra[name])
+            continue
+        if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+            return None
+        source_paths = _source_paths(model, field.source_attrs)
+        if source_paths is None:
+            return None
+        paths.update(source_paths)
+    return paths
+
+
+def trim_queryset(queryset, serializer):
+    """Restrict a queryset to the columns and relations a serializer renders"""
+    paths = serializer_columns(serializer)
+    if paths is None:
+        return queryset
+    # Keyset pagination reads the ordering columns of the last row
+    paths.update(
+        field.lstrip('-') for field in queryset.query.order_by
+        if isinstance(field, str) and '__' not in field and field.lstrip('-') != 'pk'
+    )
+    relations = {path.rsplit('__', 1)[0] for path in paths if '__' in path}
+    return queryset.select_related(None).select_related(*relations).only(*paths)
+
+
+class SparseFieldsetViewMixin:
+    """
+    ViewSet mixin: ?view=summary lists with ``summary_serializer_class`` and
+    reads only load the columns of the fields that are rendered.
+    """
+    summary_serializer_class = None
+
+    def get_serializer_class(self):
+        if (self.action == 'list' and self.summary_serializer_class is not None
+                and self.request.query_params.get(VIEW_PARAM) == SUMMARY_VIEW):
+            return self.summary_serializer_class
+        return super().get_serializer_class()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS or self.action not in ('list', 'retrieve'):
+            return queryset
+        keep, omit = requested_fieldset(self.request)
+        if keep is None and not omit and self.get_serializer_class() is self.serializer_class:
+            # The full serializer reads (nearly) every column anyway
+            return queryset
+        return trim_queryset(queryset, self.get_serializer_class()(context=self.get_serializer_context()))
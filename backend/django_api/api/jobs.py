@@ -0,0 +1,199 @@
+"""
+Lightweight database-backed background jobs.
+
+Slow work (certificate PDF generation) is queued as a BackgroundJob row and
+executed by the ``run_jobs`` management command. Each worker process claims
+jobs with SELECT ... FOR UPDATE SKIP LOCKED and runs them on a thread pool,
+so several worker processes can drain the same queue in parallel.
+
+Job handlers are registered with ``@job_handler('kind')`` and receive the job
+row; whatever they return is stored in ``job.result``. A handler that raises
+is retried with backoff until ``max_attempts``; its ``on_failure`` callback
+(if registered) runs once the job gives up.
+"""
+import logging
+import os
+import socket
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = timedelta(seconds=30)
+# A job claimed longer ago than this belongs to a worker that died
+LOCK_TIMEOUT = timedelta(minutes=15)
+
+
+def job_handler(kind, on_failure=None):
+    """Register func as the handler for jobs of `kind`"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = {'func': func, 'on_failure': on_failure}
+        return func
+    return decorator
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def enqueue_job(kind, payload, user=None, batch_id=None, max_attempts=MAX_ATTEMPTS, object_id=None):
+    """
+    Queue a job; workers pick it up once the surrounding transaction commits.
+    `object_id` is the id of the object the job works on, indexed with the
+    kind so the latest job of an object can be found without reading payloads.
+    """
+    from .models import BackgroundJob
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'No handler registered for job kind {kind!r}')
+    return BackgroundJob.objects.create(
+        kind=kind,
+        payload=payload,
+        created_by=user if user is not None and user.is_authenticated else None,
+        batch_id=batch_id,
+        max_attempts=max_attempts,
+        object_id=object_id,
+    )
+
+
+def enqueue_jobs(kind, payloads, user=None, max_attempts=MAX_ATTEMPTS, object_key=None):
+    """
+    Queue one job per payload under a shared batch id; returns the batch id.
+    `object_key` names the payload entry stored as each job's object_id.
+    """
+    from .models import BackgroundJob
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'No handler registered for job kind {kind!r}')
+    batch_id = uuid.uuid4()
+    created_by = user if user is not None and user.is_authenticated else None
+    BackgroundJob.objects.bulk_create([
+        BackgroundJob(
+            kind=kind, payload=payload, created_by=created_by, batch_id=batch_id, max_attempts=max_attempts,
+            object_id=payload.get(object_key) if object_key else None,
+        )
+        for payload in payloads
+    ], batch_size=500)
+    return batch_id
+
+
+def claim_jobs(limit, worker=None, now=None):
+    """Mark up to `limit` due jobs as running for this worker and return them"""
+    from .models import BackgroundJob
+    now = now or timezone.now()
+    worker = worker or worker_name()
+    due = Q(status='queued', run_after__lte=now) | Q(status='running', locked_at__lt=now - LOCK_TIMEOUT)
+    with transaction.atomic():
+        ids = list(
+            BackgroundJob.objects.select_for_update(skip_locked=True).filter(due)
+            .order_by('run_after', 'id').values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        BackgroundJob.objects.filter(id__in=ids).update(status='running', locked_at=now, locked_by=worker)
+    return list(BackgroundJob.objects.filter(id__in=ids).order_by('run_after', 'id'))
+
+
+def run_job(job):
+    """Execute one claimed job and record its outcome"""
+    handler = JOB_HANDLERS.get(job.kind)
+    job.attempts += 1
+    job.started_at = timezone.now()
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job kind {job.kind!r}')
+        result = handler['func'](job)
+    except Exception as e:
+        job.error = f'{type(e).__name__}: {e}'[:2000]
+        job.locked_at = None
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = timezone.now() + RETRY_DELAY * job.attempts
+            logger.warning('Job %s (%s) failed, attempt %s: %s', job.pk, job.kind, job.attempts, e)
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+            logger.error('Job %s (%s) failed permanently: %s', job.pk, job.kind, e)
+            if handler and handler['on_failure']:
+                try:
+                    handler['on_failure'](job)
+                except Exception:
+                    logger.exception('on_failure callback of job %s failed', job.pk)
+        job.save()
+        return False
+
+    job.status = 'done'
+    job.result = result if result is not None else {}
+    job.error = ''
+    job.locked_at = None
+    job.finished_at = timezone.now()
+    job.save()
+    return True
+
+
+def _run_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        # Worker threads open their own connections; don't leak them
+        connections.close_all()
+
+
+def run_pending_jobs(threads=4, limit=None, worker=None):
+    """
+    Claim and run due jobs until the queue is empty (or `limit` jobs ran).
+    threads=0 runs the jobs inline in the calling thread.
+    Returns (succeeded, failed).
+    """
+    succeeded = failed = 0
+    batch_size = max(threads, 1) * 2
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='job') if threads else None
+    try:
+        while limit is None or succeeded + failed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - succeeded - failed)
+            jobs = claim_jobs(size, worker=worker)
+            if not jobs:
+                break
+            if executor:
+                outcomes = list(executor.map(_run_in_thread, jobs))
+            else:
+                outcomes = [run_job(job) for job in jobs]
+            succeeded += sum(1 for ok in outcomes if ok)
+            failed += sum(1 for ok in outcomes if not ok)
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+    return succeeded, failed
+
+
+def batch_progress(batch_id):
+    """Job counts per status for a batch created by enqueue_jobs()"""
+    from .models import BackgroundJob
+    counts = dict(
+        BackgroundJob.objects.filter(batch_id=batch_id).values_list('status').annotate(n=Count('id')).order_by()
+    )
+    progress = {status: counts.get(status, 0) for status in ('queued', 'running', 'done', 'failed')}
+    progress['total'] = sum(counts.values())
+    progress['finished'] = progress['total'] > 0 and progress['queued'] + progress['running'] == 0
+    return progress
+
+
+def job_summary(job):
+    if job is None:
+        return None
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'error': job.error or None,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+        'result': job.result,
+    }
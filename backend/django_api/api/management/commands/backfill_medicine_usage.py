@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.medicine_usage import backfill
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the dental medicine usage line items (DentalMedicineUsage) from the used_medicines JSON of every dental form'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Dental forms processed per batch (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('💊 Medicine Usage Backfill'))
+        self.stdout.write('=' * 50)
+        forms, written = backfill(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Wrote {written} line items for {forms} dental forms'))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from api.waitlist import backfill, expire_past_entries, queue_backfill, waiting_days
+
+
+class Command(BaseCommand):
+    help = 'Book waiting patients into free slots of every waitlisted day and expire entries of past days'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Maximum number of entries to promote per day (default: until the day is full)',
+        )
+        parser.add_argument(
+            '--queue',
+            action='store_true',
+            help='Queue one backfill job per day for the run_jobs worker instead of promoting inline',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('📋 Waitlist Backfill'))
+        self.stdout.write('=' * 50)
+
+        expired = expire_past_entries()
+        if expired:
+            self.stdout.write(self.style.WARNING(f'⚠️  Expired {expired} entries of past days'))
+
+        days = waiting_days()
+        if not days:
+            self.stdout.write(self.style.SUCCESS('✅ Nobody is waiting'))
+            return
+
+        if options['queue']:
+            queued = sum(1 for campus, day, type_ in days if queue_backfill(campus, day, type_) is not None)
+            self.stdout.write(self.style.SUCCESS(f'✅ Queued {queued} backfill jobs for {len(days)} waitlisted days'))
+            return
+
+        total = 0
+        for campus, day, type_ in days:
+            promoted = backfill(campus, day, type_, limit=options['limit'])
+            if promoted:
+                self.stdout.write(f'   campus={campus} date={day} type={type_}: promoted {promoted}')
+            total += promoted
+        self.stdout.write(self.style.SUCCESS(f'✅ Promoted {total} waiting patients over {len(days)} waitlisted days'))
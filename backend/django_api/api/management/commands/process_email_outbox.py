@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.email_outbox import BATCH_SIZE, process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbound emails (EmailOutbox) in batches over one SMTP connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Messages claimed and sent per SMTP connection (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and poll for new messages instead of exiting when the queue is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls with --loop (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('📧 Processing Email Outbox'))
+        self.stdout.write('=' * 50)
+        while True:
+            sent, failed = process_outbox(batch_size=options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'✅ Sent {sent} email(s), {failed} failed')
+            if not options['loop']:
+                if not (sent or failed):
+                    self.stdout.write('📭 No emails due')
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.patient_profiles import rebuild_latest_profiles
+
+
+class Command(BaseCommand):
+    help = 'Recompute Patient.is_latest_profile (newest profile version per email) for all patients'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('🔄 Rebuilding Latest Patient Profiles'))
+        self.stdout.write('=' * 50)
+        latest = rebuild_latest_profiles()
+        self.stdout.write(self.style.SUCCESS(f'✅ {latest} latest profile(s) flagged'))
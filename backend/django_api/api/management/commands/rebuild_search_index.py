@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the patient and user search index (SearchToken) from scratch, e.g. after bulk imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows indexed per batch (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('🔄 Rebuilding Search Index'))
+        self.stdout.write('=' * 50)
+        written = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Wrote {written} search tokens'))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.booking import find_counter_drift, rebuild_reservations
+from api.slot_occupancy import find_drift, rebuild_occupancy
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the appointment slot occupancy index and the slot reservations / daily '
+        'booking counters from scratch, or check them for drift'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only compare the stored rows with a fresh recount; exits with an error on drift',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Maximum number of drifted days to print (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS('🔍 Checking Slot Occupancy'))
+            self.stdout.write('=' * 50)
+            drift = find_drift()
+            counter_drift = find_counter_drift()
+            if not drift and not counter_drift:
+                self.stdout.write(self.style.SUCCESS('✅ All days match the appointments'))
+                return
+
+            for (campus, day, type_), (stored, expected) in sorted(drift.items())[:options['limit']]:
+                self.stdout.write(self.style.WARNING(
+                    f'⚠️  campus={campus} date={day} type={type_}: stored {stored} booked, expected {expected}'
+                ))
+            for (campus, day), (stored, expected) in sorted(counter_drift.items())[:options['limit']]:
+                self.stdout.write(self.style.WARNING(
+                    f'⚠️  booking counter campus={campus} date={day}: stored {stored}, expected {expected}'
+                ))
+            raise CommandError(
+                f'{len(drift)} occupancy day(s) and {len(counter_drift)} booking counter(s) drifted; '
+                'run without --check to rebuild'
+            )
+
+        self.stdout.write(self.style.SUCCESS('🔄 Rebuilding Slot Occupancy'))
+        self.stdout.write('=' * 50)
+        rows = rebuild_occupancy()
+        self.stdout.write(self.style.SUCCESS(f'✅ Wrote {rows} occupancy rows'))
+        reservations, counters = rebuild_reservations()
+        self.stdout.write(self.style.SUCCESS(f'✅ Wrote {reservations} slot reservations and {counters} booking counters'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.stats_snapshots import KEY_FIELDS, find_drift, rebuild_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the statistics snapshot counters from scratch or check them for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only compare the stored counters with a fresh recount; exits with an error on drift',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Maximum number of drifted counters to print (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS('🔍 Checking Statistics Snapshots'))
+            self.stdout.write('=' * 50)
+            drift = find_drift()
+            if not drift:
+                self.stdout.write(self.style.SUCCESS('✅ All counters match the source tables'))
+                return
+
+            for key, (stored, expected) in sorted(drift.items())[:options['limit']]:
+                dimensions = ', '.join(f'{field}={value!r}' for field, value in zip(KEY_FIELDS, key) if value not in ('', 0))
+                self.stdout.write(self.style.WARNING(f'⚠️  {dimensions}: stored {stored}, expected {expected}'))
+            raise CommandError(f'{len(drift)} counter(s) drifted; run without --check to rebuild')
+
+        self.stdout.write(self.style.SUCCESS('🔄 Rebuilding Statistics Snapshots'))
+        self.stdout.write('=' * 50)
+        rows = rebuild_snapshots()
+        self.stdout.write(self.style.SUCCESS(f'✅ Wrote {rows} counter rows'))
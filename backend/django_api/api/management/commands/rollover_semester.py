@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import AcademicSchoolYear
+from api.school_year_cache import current_school_year, current_semester
+from api.semester_rollover import CHUNK_SIZE, RANGE_SIZE, SEMESTERS, queue_rollover, rollover_users
+
+
+class Command(BaseCommand):
+    help = "Create the patient profiles of a term for every active student from their latest profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--school-year',
+            type=int,
+            help='AcademicSchoolYear id (default: the current school year)',
+        )
+        parser.add_argument(
+            '--semester',
+            choices=SEMESTERS,
+            help='Semester to create profiles for (default: the current semester)',
+        )
+        parser.add_argument(
+            '--from-user',
+            type=int,
+            help='First user id of the range to process',
+        )
+        parser.add_argument(
+            '--to-user',
+            type=int,
+            help='Last user id of the range to process',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Users processed per transaction (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--queue',
+            action='store_true',
+            help='Queue one background job per user id range instead of running now (processed by run_jobs)',
+        )
+        parser.add_argument(
+            '--range-size',
+            type=int,
+            default=RANGE_SIZE,
+            help='User ids per queued job (default: %(default)s)',
+        )
+
+    def progress(self, totals, elapsed):
+        rate = totals['users'] / elapsed if elapsed else 0
+        self.stdout.write(f'   ⏳ {totals["users"]} users processed, {totals["created"]} profiles created ({rate:.0f}/s)')
+
+    def handle(self, *args, **options):
+        if options['school_year']:
+            try:
+                school_year = AcademicSchoolYear.objects.get(pk=options['school_year'])
+            except AcademicSchoolYear.DoesNotExist:
+                raise CommandError(f'School year {options["school_year"]} does not exist')
+        else:
+            school_year = current_school_year()
+            if school_year is None:
+                raise CommandError('No current school year is set; pass --school-year')
+        semester = options['semester'] or current_semester()
+        if not semester:
+            raise CommandError('The current date is in no semester; pass --semester')
+
+        self.stdout.write(self.style.SUCCESS(f'🔄 Semester Rollover: {school_year.academic_year} {semester}'))
+        self.stdout.write('=' * 50)
+
+        if options['queue']:
+            batch_id, jobs = queue_rollover(school_year.pk, semester, range_size=options['range_size'])
+            self.stdout.write(self.style.SUCCESS(f'✅ Queued {jobs} jobs as batch {batch_id}'))
+            return
+
+        totals = rollover_users(
+            school_year.pk, semester, options['from_user'], options['to_user'],
+            chunk_size=options['chunk_size'], progress=self.progress,
+        )
+        self.stdout.write('')
+        self.stdout.write('📈 Summary:')
+        self.stdout.write(f'   Users processed: {totals["users"]}')
+        self.stdout.write(f'   Profiles created: {totals["created"]}')
+        self.stdout.write(f'   Already had a profile: {totals["existing"]}')
+        self.stdout.write(f'   No profile to copy: {totals["without_profile"]}')
+        self.stdout.write(self.style.SUCCESS('✅ Semester rollover complete!'))
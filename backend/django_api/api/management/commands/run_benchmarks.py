@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.benchmarks import BENCHMARKS, DEFAULT_SIZES
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks against synthetic data (all data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help='Benchmarks to run (default: all)',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='List available benchmarks and exit',
+        )
+        parser.add_argument(
+            '--sizes',
+            type=str,
+            default=','.join(str(size) for size in DEFAULT_SIZES),
+            help='Comma separated data volumes to benchmark (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Number of timed runs per measurement; the median is reported',
+        )
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name, entry in BENCHMARKS.items():
+                self.stdout.write(f'{name:30} {entry["description"]}')
+            return
+
+        names = options['names'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f'Unknown benchmark(s): {", ".join(unknown)}')
+
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(',') if size.strip())
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of integers')
+
+        for name in names:
+            self.stdout.write(self.style.SUCCESS(f'⏱️  {name}: {BENCHMARKS[name]["description"]}'))
+            self.stdout.write('=' * 50)
+            rows = []
+            try:
+                with transaction.atomic():
+                    rows = BENCHMARKS[name]['func'](sizes=sizes, repeat=options['repeat'])
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+            for row in rows:
+                self.stdout.write('   ' + '  '.join(f'{key}={value}' for key, value in row.items()))
+            self.stdout.write('')
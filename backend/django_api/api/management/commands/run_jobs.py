@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.jobs import run_pending_jobs, worker_name
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (certificate generation, ...) on a thread pool; start several to work in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=4,
+            help='Jobs executed concurrently by this process (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and poll for new jobs instead of exiting when the queue is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls with --loop (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'⚙️  Running Background Jobs ({worker_name()})'))
+        self.stdout.write('=' * 50)
+        while True:
+            succeeded, failed = run_pending_jobs(threads=options['threads'])
+            if succeeded or failed:
+                self.stdout.write(f'✅ {succeeded} job(s) done, {failed} failed')
+            if not options['loop']:
+                if not (succeeded or failed):
+                    self.stdout.write('📭 No jobs due')
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
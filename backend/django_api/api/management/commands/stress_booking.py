@@ -0,0 +1,144 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.db.models import Count
+
+from api import booking
+from api.benchmarks import Seeder
+from api.slot_occupancy import ACTIVE_STATUSES, MAX_APPOINTMENTS_PER_DAY, SLOT_TIMES
+
+STRESS_CAMPUS = 'stress'
+FIRST_DAY = date(2099, 9, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Book appointments from many threads at once and verify that no slot is booked twice '
+        'and no day goes over the daily limit. Uses its own campus and removes its data afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=10000, help='Booking attempts (default: %(default)s)')
+        parser.add_argument('--threads', type=int, default=32, help='Concurrent booking threads (default: %(default)s)')
+        parser.add_argument('--days', type=int, default=5, help='Number of days the attempts compete for (default: %(default)s)')
+        parser.add_argument('--patients', type=int, default=200, help='Synthetic patients booking (default: %(default)s)')
+        parser.add_argument(
+            '--daily-limit',
+            type=int,
+            default=MAX_APPOINTMENTS_PER_DAY,
+            help='Maximum active appointments per day (default: %(default)s)',
+        )
+        parser.add_argument('--retries', type=int, default=50, help='Retries of an attempt on lock errors (default: %(default)s)')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible runs')
+        parser.add_argument('--keep', action='store_true', help='Keep the booked appointments instead of removing them')
+
+    def handle(self, *args, **options):
+        from api.models import Appointment, AcademicSchoolYear, CustomUser, DailyBookingCounter, SlotOccupancy
+
+        if Appointment.objects.filter(campus=STRESS_CAMPUS).exists():
+            raise CommandError(f'Appointments for campus {STRESS_CAMPUS!r} already exist; remove them first')
+
+        self.stdout.write(self.style.SUCCESS('🧪 Booking Stress Test'))
+        self.stdout.write('=' * 50)
+
+        seeder = Seeder(prefix='stress')
+        patients = seeder.patients(options['patients'])
+        days = [FIRST_DAY + timedelta(days=offset) for offset in range(options['days'])]
+        daily_limit = options['daily_limit']
+        rng = random.Random(options['seed'])
+        attempts = [
+            (rng.choice(patients).pk, rng.choice(days), rng.choice(SLOT_TIMES), rng.choice(('medical', 'dental')))
+            for _ in range(options['attempts'])
+        ]
+        outcomes = Counter()
+        outcomes_lock = threading.Lock()
+
+        def book(attempt):
+            patient_id, day, slot_time, type_ = attempt
+            for retry in range(options['retries'] + 1):
+                try:
+                    with booking.enforce_limits(daily_limit):
+                        Appointment.objects.create(
+                            patient_id=patient_id,
+                            appointment_date=day,
+                            appointment_time=slot_time,
+                            type=type_,
+                            campus=STRESS_CAMPUS,
+                            purpose='Booking stress test',
+                            school_year=seeder.school_year,
+                        )
+                    outcome = 'booked'
+                except booking.SlotUnavailable:
+                    outcome = 'rejected'
+                except OperationalError:
+                    # Lock timeout or deadlock victim; the transaction was rolled back
+                    time.sleep(rng.random() * 0.01 * (retry + 1))
+                    continue
+                break
+            else:
+                outcome = 'gave up'
+            with outcomes_lock:
+                outcomes[outcome] += 1
+
+        def run(chunk):
+            try:
+                for attempt in chunk:
+                    book(attempt)
+            finally:
+                connections.close_all()
+
+        threads = max(options['threads'], 1)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='booking') as executor:
+            list(executor.map(run, [attempts[i::threads] for i in range(threads)]))
+        elapsed = time.perf_counter() - started
+
+        active = Appointment.objects.filter(campus=STRESS_CAMPUS, status__in=ACTIVE_STATUSES)
+        double_booked = list(
+            active.values('appointment_date', 'appointment_time', 'type')
+            .annotate(n=Count('id')).filter(n__gt=1).order_by()
+        )
+        per_day = dict(active.values_list('appointment_date').annotate(n=Count('id')).order_by())
+        over_limit = {day: n for day, n in per_day.items() if n > daily_limit}
+        counters = dict(DailyBookingCounter.objects.filter(campus=STRESS_CAMPUS).values_list('date', 'booked'))
+        counter_drift = {
+            day: (counters.get(day, 0), per_day.get(day, 0))
+            for day in set(counters) | set(per_day)
+            if counters.get(day, 0) != per_day.get(day, 0)
+        }
+
+        self.stdout.write(f'Attempts:       {len(attempts)} from {threads} threads over {len(days)} day(s)')
+        self.stdout.write(f'Booked:         {outcomes["booked"]} (capacity {len(days) * daily_limit})')
+        self.stdout.write(f'Rejected:       {outcomes["rejected"]}')
+        self.stdout.write(f'Gave up:        {outcomes["gave up"]}')
+        self.stdout.write(f'Elapsed:        {elapsed:.2f}s ({len(attempts) / elapsed:.0f} attempts/s)')
+
+        if not options['keep']:
+            Appointment.objects.filter(campus=STRESS_CAMPUS).delete()
+            DailyBookingCounter.objects.filter(campus=STRESS_CAMPUS).delete()
+            SlotOccupancy.objects.filter(campus=STRESS_CAMPUS).delete()
+            CustomUser.objects.filter(pk__in=[patient.user_id for patient in patients]).delete()
+            AcademicSchoolYear.objects.filter(pk=seeder.school_year.pk).delete()
+
+        for row in double_booked[:10]:
+            self.stdout.write(self.style.ERROR(
+                f'❌ {row["appointment_date"]} {row["appointment_time"]} {row["type"]}: booked {row["n"]} times'
+            ))
+        for day, n in sorted(over_limit.items())[:10]:
+            self.stdout.write(self.style.ERROR(f'❌ {day}: {n} appointments (limit {daily_limit})'))
+        for day, (stored, expected) in sorted(counter_drift.items())[:10]:
+            self.stdout.write(self.style.ERROR(f'❌ {day}: counter {stored}, appointments {expected}'))
+        if double_booked or over_limit or counter_drift:
+            raise CommandError(
+                f'{len(double_booked)} double booked slot(s), {len(over_limit)} day(s) over the limit, '
+                f'{len(counter_drift)} drifted counter(s)'
+            )
+        if outcomes['booked'] != sum(per_day.values()):
+            raise CommandError(f'{outcomes["booked"]} bookings reported but {sum(per_day.values())} stored')
+        self.stdout.write(self.style.SUCCESS('✅ No slot booked twice and no day over the limit'))
@@ -0,0 +1,204 @@
+"""
+Line items of the medicines and supplies used in dental consultations.
+
+``DentalFormData.used_medicines`` is a JSON list written by the dental form;
+the inventory usage report used to load every form of the period and parse
+that JSON in Python. Each entry is now also stored as a DentalMedicineUsage
+row (name, quantity, unit, cost, matched DentalMedicineSupply, form date),
+rewritten when a form is saved with different medicines or date, so the
+report is one grouped query bucketed by week, month or year in the database.
+
+Forms written with bulk_create()/update() and the forms stored before the
+table existed are picked up by the ``backfill_medicine_usage`` command.
+"""
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek, TruncYear
+
+# Period each report type is bucketed by
+BUCKETS = {
+    'daily': TruncDay,
+    'weekly': TruncWeek,
+    'monthly': TruncMonth,
+    'yearly': TruncYear,
+}
+TRACKED_FIELDS = ('used_medicines', 'date')
+
+_MISSING = object()
+
+
+def _models(apps=None):
+    if apps is not None:
+        return (apps.get_model('api', 'DentalFormData'), apps.get_model('api', 'DentalMedicineUsage'),
+                apps.get_model('api', 'DentalMedicineSupply'))
+    from .models import DentalFormData, DentalMedicineSupply, DentalMedicineUsage
+    return DentalFormData, DentalMedicineUsage, DentalMedicineSupply
+
+
+def parse(used_medicines):
+    """
+    (name, quantity, unit, cost, supply id) of each usable entry of a
+    used_medicines value; malformed entries are skipped.
+    """
+    medicines = used_medicines
+    if isinstance(medicines, str):
+        try:
+            medicines = json.loads(medicines) if medicines else []
+        except json.JSONDecodeError:
+            return []
+    if not isinstance(medicines, list):
+        return []
+
+    lines = []
+    for medicine in medicines:
+        # Handle different JSON structures
+        if isinstance(medicine, dict):
+            name = medicine.get('name', medicine.get('medicine_name', 'Unknown'))
+            quantity = medicine.get('quantity', medicine.get('quantity_used', 1))
+            unit = medicine.get('unit', 'pcs')
+            cost = medicine.get('cost', medicine.get('total_cost', 0))
+            supply_id = medicine.get('id')
+        elif isinstance(medicine, str):
+            # Simple string format
+            name, quantity, unit, cost, supply_id = medicine, 1, 'pcs', 0, None
+        else:
+            continue
+        try:
+            quantity = int(quantity) if quantity else 1
+            cost = Decimal(str(cost)).quantize(Decimal('0.01')) if cost else Decimal('0')
+        except (ValueError, TypeError, InvalidOperation):
+            continue
+        try:
+            supply_id = int(supply_id) if supply_id not in (None, '') else None
+        except (ValueError, TypeError):
+            supply_id = None
+        lines.append((str(name or '')[:100], quantity, str(unit or '')[:20], cost, supply_id))
+    return lines
+
+
+def _write(forms, apps=None, batch_size=1000):
+    """Replace the line items of (form id, date, used_medicines) rows; returns lines written"""
+    _, DentalMedicineUsage, DentalMedicineSupply = _models(apps)
+    forms = list(forms)
+    parsed = [(pk, day, parse(used_medicines)) for pk, day, used_medicines in forms]
+    supply_ids = {line[4] for _, _, lines in parsed for line in lines if line[4] is not None}
+    known = set(DentalMedicineSupply.objects.filter(pk__in=supply_ids).values_list('pk', flat=True)) if supply_ids else set()
+    usages = [
+        DentalMedicineUsage(
+            dental_form_id=pk, date=day, name=name, quantity=quantity, unit=unit, cost=cost,
+            supply_id=supply_id if supply_id in known else None,
+        )
+        for pk, day, lines in parsed
+        for name, quantity, unit, cost, supply_id in lines
+    ]
+    with transaction.atomic():
+        DentalMedicineUsage.objects.filter(dental_form_id__in=[pk for pk, _, _ in forms]).delete()
+        DentalMedicineUsage.objects.bulk_create(usages, batch_size=batch_size)
+    return len(usages)
+
+
+def sync_forms(forms):
+    """Rewrite the line items of saved DentalFormData instances"""
+    return _write((form.pk, form.date, form.used_medicines) for form in forms)
+
+
+def backfill(apps=None, batch_size=500):
+    """Rewrite the line items of every dental form; returns (forms, lines written)"""
+    DentalFormData, _, _ = _models(apps)
+    forms = written = 0
+    last_id = 0
+    while True:
+        batch = list(
+            DentalFormData.objects.filter(pk__gt=last_id).order_by('pk')
+            .values_list('id', 'date', 'used_medicines')[:batch_size]
+        )
+        if not batch:
+            return forms, written
+        written += _write(batch, apps)
+        forms += len(batch)
+        last_id = batch[-1][0]
+
+
+# ---------------------------------------------------------------------------
+# Signal handlers
+# ---------------------------------------------------------------------------
+
+def _state(instance):
+    values = [instance.__dict__.get(field, _MISSING) for field in TRACKED_FIELDS]
+    if _MISSING in values:
+        return None
+    used_medicines, day = values
+    # Serialized, so in-place edits of the loaded list count as changes
+    return json.dumps(used_medicines, sort_keys=True, default=str), day
+
+
+def track_initial_state(sender, instance, **kwargs):
+    """post_init: remember the medicines and date the form was loaded with"""
+    instance._medicine_usage_state = _state(instance) if instance.pk else None
+
+
+def update_on_save(sender, instance, created, raw=False, **kwargs):
+    """post_save: rewrite the line items when the medicines or the date changed"""
+    if raw:
+        return
+    new_state = _state(instance)
+    old_state = None if created else getattr(instance, '_medicine_usage_state', None)
+    if old_state is not None and old_state == new_state:
+        return
+    if new_state is None:
+        # Saved with deferred fields: read them back
+        instance.refresh_from_db(fields=TRACKED_FIELDS)
+        new_state = _state(instance)
+    sync_forms([instance])
+    instance._medicine_usage_state = new_state
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def usage_report(start, end, bucket='monthly'):
+    """
+    Usage between two dates (inclusive) from one grouped query.
+
+    Returns (items, periods): per item name its quantity, cost and number of
+    uses over the whole range sorted by quantity, and the same per period of
+    the bucket (a key of BUCKETS) in date order.
+    """
+    _, DentalMedicineUsage, _ = _models()
+    trunc = BUCKETS.get(bucket, TruncMonth)
+    rows = (
+        DentalMedicineUsage.objects.filter(date__range=[start, end])
+        .annotate(period=trunc('date'))
+        .values('period', 'name')
+        .annotate(quantity_used=Sum('quantity'), total_cost=Sum('cost'), usage_count=Count('id'), item_unit=Min('unit'))
+        .order_by('period', 'name')
+    )
+
+    items, periods = {}, []
+    for row in rows:
+        quantity, cost, count = row['quantity_used'] or 0, float(row['total_cost'] or 0), row['usage_count']
+        item = items.setdefault(row['name'], {
+            'item_name': row['name'],
+            'quantity_used': 0,
+            'unit': row['item_unit'],
+            'total_cost': 0,
+            'usage_count': 0,
+        })
+        item['quantity_used'] += quantity
+        item['total_cost'] += cost
+        item['usage_count'] += count
+        periods.append({
+            'period': row['period'].isoformat() if row['period'] else None,
+            'item_name': row['name'],
+            'quantity_used': quantity,
+            'total_cost': round(cost, 2),
+            'usage_count': count,
+        })
+    items = sorted(items.values(), key=lambda item: item['quantity_used'], reverse=True)
+    for item in items:
+        item['total_cost'] = round(item['total_cost'], 2)
+    return items, periods
@@ -0,0 +1,28 @@
+"""
+Middleware for the api app.
+"""
+import contextvars
+
+_request_cache = contextvars.ContextVar('api_request_cache', default=None)
+
+
+def get_request_cache():
+    """
+    Dict that lives for the duration of the current request, or None outside
+    of a request (management commands, shell, signal handlers run by workers).
+    """
+    return _request_cache.get()
+
+
+class RequestCacheMiddleware:
+    """Gives every request a fresh memo dict for values looked up repeatedly while serving it"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _request_cache.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            _request_cache.reset(token)
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:41
+
+from django.db import migrations, models
+
+
+def build_snapshots(apps, schema_editor):
+    from api.stats_snapshots import rebuild_snapshots
+    rebuild_snapshots(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_add_religion_specify'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('appointment', 'Appointment'), ('document', 'Medical Document'), ('patient', 'Patient Profile'), ('user', 'User Account')], max_length=20)),
+                ('school_year_key', models.IntegerField(default=0, help_text='AcademicSchoolYear id (0 when not assigned)')),
+                ('semester', models.CharField(blank=True, default='', max_length=20)),
+                ('campus', models.CharField(blank=True, default='', max_length=20)),
+                ('category', models.CharField(blank=True, default='', help_text='Appointment type, or account user type for user counters', max_length=20)),
+                ('user_type', models.CharField(blank=True, default='', help_text='Patient user type (Employee, College, etc.)', max_length=50)),
+                ('status', models.CharField(blank=True, default='', help_text='Record status, or account flags (a1b0v1) for user counters', max_length=20)),
+                ('period', models.CharField(blank=True, default='', help_text='YYYY-MM of the appointment date / upload date', max_length=7)),
+                ('count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['metric', 'school_year_key'], name='api_statssn_metric_d3a67e_idx')],
+                'constraints': [models.UniqueConstraint(fields=('metric', 'school_year_key', 'semester', 'campus', 'category', 'user_type', 'status', 'period'), name='unique_stats_snapshot_dimensions')],
+            },
+        ),
+        migrations.RunPython(build_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:50
+
+from django.db import migrations, models
+
+
+def flag_latest_profiles(apps, schema_editor):
+    from api.patient_profiles import rebuild_latest_profiles
+    rebuild_latest_profiles(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='is_latest_profile',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['is_latest_profile', 'created_at'], name='api_patient_is_late_a241a2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['email'], name='api_patient_email_b6d297_idx'),
+        ),
+        migrations.RunPython(flag_latest_profiles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:15
+
+from django.db import migrations, models
+
+
+def build_slot_occupancy(apps, schema_editor):
+    from api.slot_occupancy import rebuild_occupancy
+    rebuild_occupancy(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0030_background_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campus', models.CharField(max_length=20)),
+                ('date', models.DateField()),
+                ('type', models.CharField(max_length=10)),
+                ('slots', models.JSONField(default=list, help_text='Active appointment count per slot of the day grid')),
+                ('off_grid', models.IntegerField(default=0, help_text='Active appointments at times outside the slot grid')),
+                ('booked', models.IntegerField(default=0, help_text='Total active appointments of the day')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('campus', 'date', 'type'), name='unique_slot_occupancy_day')],
+            },
+        ),
+        migrations.RunPython(build_slot_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_slot_reservations(apps, schema_editor):
+    from api.booking import rebuild_reservations
+    rebuild_reservations(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0031_slot_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookingCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campus', models.CharField(max_length=20)),
+                ('date', models.DateField()),
+                ('booked', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('campus', 'date'), name='unique_daily_booking_counter')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SlotReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campus', models.CharField(max_length=20)),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('type', models.CharField(max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='slot_reservation', to='api.appointment')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('campus', 'date', 'time', 'type'), name='unique_slot_reservation')],
+            },
+        ),
+        migrations.RunPython(build_slot_reservations, migrations.RunPython.noop),
+    ]
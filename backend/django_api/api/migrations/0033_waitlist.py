@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0032_slot_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campus', models.CharField(choices=[('a', 'Campus A'), ('b', 'Campus B'), ('c', 'Campus C')], default='a', max_length=20)),
+                ('date', models.DateField()),
+                ('type', models.CharField(choices=[('medical', 'Medical'), ('dental', 'Dental')], default='medical', max_length=10)),
+                ('purpose', models.CharField(blank=True, default='', max_length=255)),
+                ('concern', models.TextField(blank=True, null=True)),
+                ('priority', models.IntegerField(default=0, help_text='Higher priorities are promoted first; equal priorities in joining order')),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('promoted', 'Promoted'), ('expired', 'Expired'), ('withdrawn', 'Withdrawn')], default='waiting', max_length=10)),
+                ('note', models.CharField(blank=True, default='', help_text='Why the entry was expired', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('promoted_at', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entry', to='api.appointment')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entries_created', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='api.patient')),
+            ],
+            options={
+                'ordering': ['date', '-priority', 'created_at', 'id'],
+                'indexes': [models.Index(fields=['campus', 'date', 'type', 'status', '-priority', 'created_at'], name='waitlist_queue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0033_waitlist'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampusClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campus', models.CharField(choices=[('a', 'Campus A'), ('b', 'Campus B'), ('c', 'Campus C')], max_length=20)),
+                ('date', models.DateField()),
+                ('reason', models.CharField(blank=True, default='', max_length=255)),
+                ('moved_appointments', models.PositiveIntegerField(default=0)),
+                ('unplaced_appointments', models.PositiveIntegerField(default=0, help_text='Appointments no free slot was found for')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('closed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='campus_closures', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date', 'campus'],
+                'constraints': [models.UniqueConstraint(fields=('campus', 'date'), name='unique_campus_closure')],
+            },
+        ),
+    ]
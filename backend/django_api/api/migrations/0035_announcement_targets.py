@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_announcement_targets(apps, schema_editor):
+    from api.announcements import rebuild_targets
+    rebuild_targets(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_campus_closure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnouncementTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user_type', 'User Type'), ('grade_level', 'Grade Level')], max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('announcement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='targets', to='api.announcement')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'value'], name='api_announc_kind_4879f5_idx')],
+                'constraints': [models.UniqueConstraint(fields=('announcement', 'kind', 'value'), name='unique_announcement_target')],
+            },
+        ),
+        migrations.RunPython(build_announcement_targets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+
+def build_search_index(apps, schema_editor):
+    from api.search import rebuild_index
+    rebuild_index(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0035_announcement_targets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('patient', 'Patient'), ('user', 'User')], max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('token', models.CharField(max_length=100)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'token', 'object_id'], name='search_token_lookup_idx'), models.Index(fields=['kind', 'object_id', 'token'], name='search_token_object_idx')],
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
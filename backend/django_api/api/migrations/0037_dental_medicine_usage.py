@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_medicine_usage(apps, schema_editor):
+    from api.medicine_usage import backfill
+    backfill(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0036_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DentalMedicineUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('quantity', models.IntegerField(default=1)),
+                ('unit', models.CharField(default='pcs', max_length=20)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('dental_form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='medicine_usages', to='api.dentalformdata')),
+                ('supply', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usages', to='api.dentalmedicinesupply')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'name'], name='medicine_usage_date_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_medicine_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:40
+
+from django.db import migrations, models
+
+
+def backfill_object_ids(apps, schema_editor):
+    from api.certificates import backfill_object_ids
+    backfill_object_ids(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0037_dental_medicine_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='object_id',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Id of the object the job works on, looked up with kind', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='backgroundjob',
+            index=models.Index(fields=['kind', 'object_id'], name='background_job_object_idx'),
+        ),
+        migrations.RunPython(backfill_object_ids, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,5 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
@@ -39,11 +38,16 @@ class CustomUser(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
     
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['date_joined']),  # For keyset pagination of lists
+        ]
+    
     def __str__(self):
         return self.email
     
     def send_verification_email(self):
-        """Send email verification link to user"""
+        """Queue the email verification link for the user"""
         subject = 'Verify Your Email - WMSU Health Services'
         
         # Create verification URL (corrected to frontend port 3000)
@@ -58,24 +62,21 @@ class CustomUser(AbstractUser):
         # Plain text message
         plain_message = strip_tags(html_message)
         
-        try:
-            # Send email
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[self.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            
-            # Update sent timestamp
-            self.email_verification_sent_at = timezone.now()
-            self.save(update_fields=['email_verification_sent_at'])
-            
-        except Exception as e:
-            # In production, you might want to log this error
-            raise e
+        # Queued for the process_email_outbox worker; a slow SMTP server no
+        # longer holds up signup requests
+        from .email_outbox import enqueue_email
+        enqueue_email(
+            idempotency_key=f'email-verification:{self.pk}',
+            subject=subject,
+            message=plain_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[self.email],
+            html_message=html_message,
+        )
+        
+        # Update sent timestamp
+        self.email_verification_sent_at = timezone.now()
+        self.save(update_fields=['email_verification_sent_at'])
     
     def verify_email(self, token):
         """Verify email with token"""
@@ -85,32 +86,53 @@ class CustomUser(AbstractUser):
             return True
         return False
     
-    def get_current_patient_profile(self):
-        """Get the patient profile for the current active school year and semester"""
+    def current_patient_profiles(self):
+        """Profiles of the current active school year and semester, or None without a current school year"""
         try:
-            current_school_year = AcademicSchoolYear.objects.get(is_current=True)
-            current_semester = current_school_year.get_current_semester()
+            from .school_year_cache import current_semester as cached_current_semester
+            current_school_year = AcademicSchoolYear.get_current()
+            current_semester = cached_current_semester()
             if current_semester:
                 return self.patient_profiles.filter(
                     school_year=current_school_year,
                     semester=current_semester
-                ).first()
+                )
             else:
                 # If no current semester, get the most recent profile for current year
-                return self.patient_profiles.filter(school_year=current_school_year).first()
+                return self.patient_profiles.filter(school_year=current_school_year)
         except AcademicSchoolYear.DoesNotExist:
             return None
+
+    def get_current_patient_profile(self):
+        """Get the patient profile for the current active school year and semester"""
+        # Users authenticated by CachedJWTAuthentication carry the profile id
+        from .authentication import NOT_CACHED, cached_profile_id
+        profile_id = cached_profile_id(self)
+        if profile_id is None:
+            return None
+        if profile_id is not NOT_CACHED:
+            # Views often ask twice per request; the check above already revalidated the id
+            memo = self.__dict__.get('_current_patient_profile')
+            if memo is None or memo[0] != profile_id:
+                memo = self._current_patient_profile = (profile_id, self.patient_profiles.filter(pk=profile_id).first())
+            return memo[1]
+        profiles = self.current_patient_profiles()
+        return profiles.first() if profiles is not None else None
     
     def get_or_create_patient_profile(self, school_year=None, semester=None):
         """Get or create a patient profile for the specified school year and semester"""
         if school_year is None:
             try:
-                school_year = AcademicSchoolYear.objects.get(is_current=True)
+                school_year = AcademicSchoolYear.get_current()
             except AcademicSchoolYear.DoesNotExist:
                 return None, False
         
         if semester is None and school_year:
-            semester = school_year.get_current_semester()
+            if school_year.is_current:
+                from .school_year_cache import current_semester
+                semester = current_semester()
+            else:
+                semester = school_year.get_current_semester()
         
         profile, created = self.patient_profiles.get_or_create(
             school_year=school_year,
@@ -285,6 +307,8 @@ class Patient(models.Model):
     record_completion_status = models.CharField(max_length=20, default='incomplete')
     staff_notes = models.TextField(blank=True, null=True)
     semester_id = models.IntegerField(blank=True, null=True)
+    # Newest profile version per email; maintained by api.patient_profiles
+    is_latest_profile = models.BooleanField(default=True, editable=False)
     
     class Meta:
         # Removed unique_together constraint to support profile versioning
@@ -292,6 +316,9 @@ class Patient(models.Model):
         indexes = [
             models.Index(fields=['user', 'school_year', 'semester']),
             models.Index(fields=['user', 'created_at']),  # For efficient version retrieval
+            models.Index(fields=['created_at']),  # For keyset pagination of lists
+            models.Index(fields=['is_latest_profile', 'created_at']),  # Admin list of latest profiles
+            models.Index(fields=['email']),  # Latest profile maintenance
         ]
     
     def __str__(self):
@@ -437,6 +464,11 @@ class Appointment(models.Model):
     original_time = models.TimeField(null=True, blank=True, help_text='Original appointment time before reschedule')
     reschedule_reason = models.TextField(blank=True, null=True, help_text='Reason for rescheduling')
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['appointment_date', 'appointment_time']),  # For keyset pagination of lists
+        ]
+    
     def __str__(self):
         semester_display = f" ({self.get_semester_display()})" if self.semester else ""
         return f"{self.patient.name}'s appointment on {self.appointment_date} at {self.appointment_time}{semester_display}"
@@ -640,6 +672,7 @@ class MedicalDocument(models.Model):
         ('for_consultation', 'For Consultation'),
         ('verified', 'Verified'),
         ('rejected', 'Rejected'),
+        ('issuing', 'Issuing Certificate'),
         ('issued', 'Certificate Issued'),
     ]
     
@@ -894,7 +927,7 @@ class DentalFormData(models.Model):
             else:
                 # Try to get current academic year as fallback
                 try:
-                    self.academic_year = AcademicSchoolYear.objects.get(is_current=True)
+                    self.academic_year = AcademicSchoolYear.get_current()
                 except AcademicSchoolYear.DoesNotExist:
                     pass
         
@@ -1036,7 +1069,7 @@ class MedicalFormData(models.Model):
             else:
                 # Try to get current academic year as fallback
                 try:
-                    self.academic_year = AcademicSchoolYear.objects.get(is_current=True)
+                    self.academic_year = AcademicSchoolYear.get_current()
                 except AcademicSchoolYear.DoesNotExist:
                     pass
         
@@ -1285,11 +1318,23 @@ class AcademicSchoolYear(models.Model):
         else:
             return None, None
 
+    @classmethod
+    def get_current(cls):
+        """
+        Cached equivalent of objects.get(is_current=True); see api.school_year_cache.
+        Raises DoesNotExist when no school year is current.
+        """
+        from .school_year_cache import current_school_year
+        school_year = current_school_year()
+        if school_year is None:
+            raise cls.DoesNotExist('No current school year is set.')
+        return school_year
+    
     @classmethod
     def get_current_school_year(cls):
         """Get the current active school year"""
         try:
-            return cls.objects.get(is_current=True)
+            return cls.get_current()
         except cls.DoesNotExist:
             # Try to find the most recent active school year
             school_year = cls.objects.filter(status='active').first()
@@ -1641,6 +1686,30 @@ class DentalMedicineSupply(models.Model):
         return f"{self.name} ({self.get_type_display()})"
 
 
+class DentalMedicineUsage(models.Model):
+    """
+    One medicine or supply line of DentalFormData.used_medicines, kept in sync
+    with the JSON when the form is saved so usage reports aggregate in SQL
+    (see api/medicine_usage.py).
+    """
+    dental_form = models.ForeignKey(DentalFormData, on_delete=models.CASCADE, related_name='medicine_usages')
+    supply = models.ForeignKey(DentalMedicineSupply, on_delete=models.SET_NULL, null=True, blank=True, related_name='usages')
+    name = models.CharField(max_length=100)
+    quantity = models.IntegerField(default=1)
+    unit = models.CharField(max_length=20, default='pcs')
+    cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Copy of the form date, so reports filter and bucket without a join
+    date = models.DateField(blank=True, null=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'name'], name='medicine_usage_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} x{self.quantity} {self.unit}"
+
+
 class UserTypeInformation(models.Model):
     """
     Model to store user type configurations for profile setup
@@ -1979,3 +2048,296 @@ class UserAnnouncementView(models.Model):
     
     def __str__(self):
         return f"{self.user.email} viewed {self.announcement.title}"
+
+
+class AnnouncementTarget(models.Model):
+    """
+    One targeted user type or grade level of an announcement, mirrored from
+    target_user_types/target_grade_levels so targeting is matched in SQL
+    (see api/announcements.py). Grade levels are stored lower-cased.
+    """
+    KIND_CHOICES = [
+        ('user_type', 'User Type'),
+        ('grade_level', 'Grade Level'),
+    ]
+    
+    announcement = models.ForeignKey(Announcement, on_delete=models.CASCADE, related_name='targets')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    value = models.CharField(max_length=100)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['announcement', 'kind', 'value'], name='unique_announcement_target')
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'value']),
+        ]
+    
+    def __str__(self):
+        return f"{self.announcement_id} -> {self.kind}={self.value}"
+
+
+class StatsSnapshot(models.Model):
+    """
+    Materialized counters for the statistics endpoints.
+    One row per combination of dimensions; kept in sync incrementally by the
+    signal handlers in api/stats_snapshots.py and rebuilt/checked with the
+    rebuild_stats_snapshots management command.
+    """
+    METRIC_CHOICES = [
+        ('appointment', 'Appointment'),
+        ('document', 'Medical Document'),
+        ('patient', 'Patient Profile'),
+        ('user', 'User Account'),
+    ]
+    
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    school_year_key = models.IntegerField(default=0, help_text='AcademicSchoolYear id (0 when not assigned)')
+    semester = models.CharField(max_length=20, blank=True, default='')
+    campus = models.CharField(max_length=20, blank=True, default='')
+    category = models.CharField(max_length=20, blank=True, default='', help_text='Appointment type, or account user type for user counters')
+    user_type = models.CharField(max_length=50, blank=True, default='', help_text='Patient user type (Employee, College, etc.)')
+    status = models.CharField(max_length=20, blank=True, default='', help_text='Record status, or account flags (a1b0v1) for user counters')
+    period = models.CharField(max_length=7, blank=True, default='', help_text='YYYY-MM of the appointment date / upload date')
+    count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['metric', 'school_year_key', 'semester', 'campus', 'category', 'user_type', 'status', 'period'],
+                name='unique_stats_snapshot_dimensions'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['metric', 'school_year_key']),
+        ]
+    
+    def __str__(self):
+        return f"{self.metric} [{self.school_year_key}/{self.semester}/{self.campus}/{self.category}/{self.user_type}/{self.status}/{self.period}] = {self.count}"
+
+
+class EmailOutbox(models.Model):
+    """
+    Outbound email queued by the request path and delivered by the
+    process_email_outbox worker (see api/email_outbox.py).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    idempotency_key = models.CharField(max_length=200, unique=True, help_text='At most one queued message per key')
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, default='')
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True, help_text='When a worker claimed the message')
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+
+class BackgroundJob(models.Model):
+    """
+    Unit of work executed outside the request by the run_jobs worker
+    (see api/jobs.py).
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    batch_id = models.UUIDField(null=True, blank=True, db_index=True, help_text='Groups jobs queued together by a bulk action')
+    object_id = models.PositiveBigIntegerField(null=True, blank=True, help_text='Id of the object the job works on, looked up with kind')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True, default='', help_text='host:pid of the worker running the job')
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='background_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['kind', 'object_id'], name='background_job_object_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class SlotOccupancy(models.Model):
+    """
+    Active appointments per 20-minute slot of one campus, date and appointment
+    type. Kept in sync from the Appointment signals by api/slot_occupancy.py;
+    the availability endpoints read these rows instead of the appointments.
+    """
+    campus = models.CharField(max_length=20)
+    date = models.DateField()
+    type = models.CharField(max_length=10)
+    slots = models.JSONField(default=list, help_text='Active appointment count per slot of the day grid')
+    off_grid = models.IntegerField(default=0, help_text='Active appointments at times outside the slot grid')
+    booked = models.IntegerField(default=0, help_text='Total active appointments of the day')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campus', 'date', 'type'], name='unique_slot_occupancy_day')
+        ]
+    
+    def __str__(self):
+        return f"{self.campus} {self.date} {self.type}: {self.booked} booked"
+
+
+class SlotReservation(models.Model):
+    """
+    The time slot held by an active appointment. The unique constraint makes
+    a second booking of the same slot fail at insert time (see api/booking.py).
+    """
+    appointment = models.OneToOneField(Appointment, on_delete=models.CASCADE, related_name='slot_reservation')
+    campus = models.CharField(max_length=20)
+    date = models.DateField()
+    time = models.TimeField()
+    type = models.CharField(max_length=10)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campus', 'date', 'time', 'type'], name='unique_slot_reservation')
+        ]
+    
+    def __str__(self):
+        return f"{self.campus} {self.date} {self.time} {self.type} -> appointment {self.appointment_id}"
+
+
+class DailyBookingCounter(models.Model):
+    """
+    Active appointments of one campus and day. Bookings increment it with a
+    conditional UPDATE that only succeeds while the day is under its limit.
+    """
+    campus = models.CharField(max_length=20)
+    date = models.DateField()
+    booked = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campus', 'date'], name='unique_daily_booking_counter')
+        ]
+    
+    def __str__(self):
+        return f"{self.campus} {self.date}: {self.booked} booked"
+
+
+class WaitlistEntry(models.Model):
+    """
+    A patient waiting for a slot on a fully booked campus day. When an
+    appointment of that day is cancelled the backfill worker books the next
+    waiting entry (highest priority first, then first come first served);
+    see api/waitlist.py.
+    """
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('promoted', 'Promoted'),
+        ('expired', 'Expired'),
+        ('withdrawn', 'Withdrawn'),
+    ]
+    
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='waitlist_entries')
+    campus = models.CharField(max_length=20, choices=Appointment.CAMPUS_CHOICES, default='a')
+    date = models.DateField()
+    type = models.CharField(max_length=10, choices=Appointment.TYPE_CHOICES, default='medical')
+    purpose = models.CharField(max_length=255, blank=True, default='')
+    concern = models.TextField(blank=True, null=True)
+    priority = models.IntegerField(default=0, help_text='Higher priorities are promoted first; equal priorities in joining order')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='waiting')
+    appointment = models.OneToOneField(Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_entry')
+    note = models.CharField(max_length=255, blank=True, default='', help_text='Why the entry was expired')
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_entries_created')
+    created_at = models.DateTimeField(auto_now_add=True)
+    promoted_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['date', '-priority', 'created_at', 'id']
+        indexes = [
+            models.Index(fields=['campus', 'date', 'type', 'status', '-priority', 'created_at'], name='waitlist_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.patient.name} waiting for {self.campus} {self.date} {self.type} ({self.status})"
+
+
+class CampusClosure(models.Model):
+    """
+    A day a campus clinic is unexpectedly closed. Closed days are not
+    bookable (see api/scheduling.py); closing a day moves its appointments
+    to other days (see api/day_closure.py).
+    """
+    campus = models.CharField(max_length=20, choices=Appointment.CAMPUS_CHOICES)
+    date = models.DateField()
+    reason = models.CharField(max_length=255, blank=True, default='')
+    closed_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='campus_closures')
+    moved_appointments = models.PositiveIntegerField(default=0)
+    unplaced_appointments = models.PositiveIntegerField(default=0, help_text='Appointments no free slot was found for')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-date', 'campus']
+        constraints = [
+            models.UniqueConstraint(fields=['campus', 'date'], name='unique_campus_closure')
+        ]
+    
+    def __str__(self):
+        return f"{self.get_campus_display()} closed on {self.date}"
+
+
+class SearchToken(models.Model):
+    """
+    One searchable token of a patient profile or user account, with the
+    weight of the field it came from. Searches match tokens by prefix through
+    the (kind, token) index instead of scanning the tables (see api/search.py).
+    """
+    KIND_CHOICES = [
+        ('patient', 'Patient'),
+        ('user', 'User'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    token = models.CharField(max_length=100)
+    weight = models.PositiveSmallIntegerField(default=1)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'token', 'object_id'], name='search_token_lookup_idx'),
+            models.Index(fields=['kind', 'object_id', 'token'], name='search_token_object_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.token} ({self.weight})"
@@ -0,0 +1,193 @@
+"""
+Keyset (seek) pagination for the large admin lists.
+
+Pagination is opt-in per request: it only kicks in when the client sends
+``page_size`` or ``cursor``; without them the views keep returning the full
+list so the frontend can migrate screen by screen.
+
+Pages are selected with a WHERE clause on the ordering columns of the last
+row seen (``(date, time, id) < (...)``) instead of OFFSET, so fetching page
+1000 costs the same as page 1. The queryset's own ordering is used, with the
+primary key appended as a tie-breaker, which keeps the existing filters and
+``ordering`` parameters working. Cursors are opaque base64 tokens.
+"""
+import base64
+import datetime
+import decimal
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        """Ordering of the queryset with the primary key appended as a unique tie-breaker"""
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        if not ordering:
+            ordering = list(queryset.model._meta.ordering) or ['-pk']
+        pk_names = {'pk', 'id', queryset.model._meta.pk.name}
+        if not any(field.lstrip('-') in pk_names for field in ordering):
+            ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+        return ordering
+
+    # -- cursor encoding ---------------------------------------------------
+
+    @staticmethod
+    def _signature(ordering):
+        return ','.join(ordering)
+
+    def encode_cursor(self, ordering, values, reverse=False):
+        payload = {'o': self._signature(ordering), 'v': [_to_json(value) for value in values]}
+        if reverse:
+            payload['r'] = 1
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, ordering):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            values = payload['v']
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if payload.get('o') != self._signature(ordering) or len(values) != len(ordering):
+            # The cursor belongs to a different ordering of this list
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    # -- queryset ----------------------------------------------------------
+
+    @staticmethod
+    def _seek_filter(ordering, values):
+        """
+        Rows strictly after `values` in `ordering`:
+        (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        # Leading bound lets the database range-scan the index on the first column
+        first = ordering[0]
+        bound = {f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]}
+        return Q(**bound) & condition
+
+    @staticmethod
+    def _invert(ordering):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+    @staticmethod
+    def _row_values(row, ordering):
+        values = []
+        for field in ordering:
+            value = row
+            for attr in field.lstrip('-').split('__'):
+                value = getattr(value, attr, None)
+                if value is None:
+                    break
+            values.append(value)
+        return values
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        values, reverse = self.decode_cursor(request, self.ordering)
+        self.has_cursor = values is not None
+
+        seek_ordering = self._invert(self.ordering) if reverse else self.ordering
+        if values is not None:
+            queryset = queryset.filter(self._seek_filter(seek_ordering, values))
+        rows = list(queryset.order_by(*seek_ordering)[:self.page_size_value + 1])
+
+        has_more = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+        if reverse:
+            rows.reverse()
+
+        # Moving forward there is a next page when the extra row exists and a
+        # previous page whenever we came from a cursor; backwards it is mirrored.
+        self.has_next = has_more if not reverse else self.has_cursor
+        self.has_previous = self.has_cursor if not reverse else has_more
+        self.first_values = self._row_values(rows[0], self.ordering) if rows else None
+        self.last_values = self._row_values(rows[-1], self.ordering) if rows else None
+        return rows
+
+    # -- response ----------------------------------------------------------
+
+    def _page_link(self, values, reverse):
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size_value)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.ordering, values, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or self.last_values is None:
+            return None
+        return self._page_link(self.last_values, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first_values is None:
+            url = self.request.build_absolute_uri()
+            return remove_query_param(url, self.cursor_query_param)
+        return self._page_link(self.first_values, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('page_size', self.page_size_value),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'page_size': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+
+
+def _to_json(value):
+    """Cursor values are stored in a form the ORM accepts back as a lookup value"""
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
@@ -0,0 +1,152 @@
+"""
+Latest patient profile tracking (Patient.is_latest_profile).
+
+Every edit of a patient profile creates a new Patient row, so the admin lists
+only show the newest version per person. A person is identified by the
+profile email, falling back to the account email
+(``Coalesce('email', 'user__email', '')``), and the newest version is the one
+with the highest id.
+
+Instead of grouping the whole table on every request, the newest row of each
+group carries ``is_latest_profile=True``. The flag is maintained from the
+Patient signals (see api/signals.py) and can be recomputed with
+``rebuild_latest_profiles()`` after bulk writes.
+"""
+from django.db import transaction
+from django.db.models import Max, Q, Value
+from django.db.models.functions import Coalesce
+
+_UNKNOWN = object()
+
+
+def _model(apps=None):
+    if apps is not None:
+        return apps.get_model('api', 'Patient')
+    from .models import Patient
+    return Patient
+
+
+def _email_state(instance):
+    """(email, user_id) as loaded; _UNKNOWN when the email column was deferred"""
+    email = instance.__dict__.get('email', _UNKNOWN)
+    if email is _UNKNOWN:
+        return _UNKNOWN
+    return email, instance.user_id
+
+
+def profile_email(instance):
+    """Deduplication key of a patient profile, matching the SQL Coalesce"""
+    user = instance._state.fields_cache.get('user')
+    return _key(instance.email, instance.user_id, user)
+
+
+def _key(email, user_id, user=None):
+    if email is not None:
+        return email
+    if user_id is None:
+        return ''
+    if user is not None and user.pk == user_id:
+        return user.email or ''
+    from .models import CustomUser
+    return CustomUser.objects.filter(pk=user_id).values_list('email', flat=True).first() or ''
+
+
+def _profile_email_filter(key):
+    """Rows whose deduplication key equals `key`"""
+    fallback = Q(email__isnull=True, user__email=key)
+    if key == '':
+        fallback |= Q(email__isnull=True, user__isnull=True)
+    return Q(email=key) | fallback
+
+
+def latest_per_email(queryset):
+    """
+    Restrict `queryset` to the newest profile per person *within* the queryset.
+
+    This is the grouped query the flag replaces; it is still used when the list
+    is narrowed to a school year, where the newest profile of that year is
+    wanted rather than the overall newest one.
+    """
+    queryset = queryset.annotate(dedupe_email=Coalesce('email', 'user__email', Value('')))
+    latest_ids = queryset.values('dedupe_email').annotate(latest_id=Max('id')).values_list('latest_id', flat=True)
+    return queryset.filter(id__in=latest_ids)
+
+
+def refresh_latest_profiles(keys):
+    """Recompute the flag for the given deduplication keys; returns the latest id per key"""
+    Patient = _model()
+    latest = {}
+    with transaction.atomic():
+        for key in keys:
+            rows = dict(
+                Patient.objects.select_for_update().filter(_profile_email_filter(key))
+                .values_list('id', 'is_latest_profile')
+            )
+            if not rows:
+                continue
+            latest_id = max(rows)
+            latest[key] = latest_id
+            stale = [pk for pk, flagged in rows.items() if flagged and pk != latest_id]
+            if stale:
+                Patient.objects.filter(pk__in=stale).update(is_latest_profile=False)
+            if not rows[latest_id]:
+                Patient.objects.filter(pk=latest_id).update(is_latest_profile=True)
+    return latest
+
+
+def rebuild_latest_profiles(apps=None, batch_size=1000):
+    """Recompute the flag for the whole table; returns the number of latest profiles"""
+    Patient = _model(apps)
+    latest_ids = set(
+        Patient.objects.annotate(dedupe_email=Coalesce('email', 'user__email', Value('')))
+        .values('dedupe_email').annotate(latest_id=Max('id')).order_by()
+        .values_list('latest_id', flat=True)
+    )
+    flagged_ids = set(Patient.objects.filter(is_latest_profile=True).values_list('id', flat=True))
+
+    # Update by primary key in batches; MySQL cannot update a table it selects from
+    with transaction.atomic():
+        for flag, ids in ((False, flagged_ids - latest_ids), (True, latest_ids - flagged_ids)):
+            ids = sorted(ids)
+            for start in range(0, len(ids), batch_size):
+                Patient.objects.filter(pk__in=ids[start:start + batch_size]).update(is_latest_profile=flag)
+    return len(latest_ids)
+
+
+# ---------------------------------------------------------------------------
+# Signal handlers
+# ---------------------------------------------------------------------------
+
+def track_profile_email(sender, instance, **kwargs):
+    """post_init: remember the email the profile was loaded with"""
+    instance._profile_email_state = _email_state(instance) if instance.pk else None
+
+
+def update_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """post_save: move the flag when a profile is added or its email changes"""
+    old_state = getattr(instance, '_profile_email_state', None)
+    new_state = _email_state(instance)
+    instance._profile_email_state = new_state
+    if not created:
+        if update_fields is not None and not {'email', 'user'} & set(update_fields):
+            return
+        if old_state == new_state:
+            return
+
+    keys = {profile_email(instance)}
+    if not created and old_state not in (None, _UNKNOWN):
+        keys.add(_key(*old_state))
+    # With an unknown previous email only the new group is refreshed; the
+    # rebuild_latest_profiles command repairs the group the profile left
+    _refresh_instance(instance, keys)
+
+
+def update_on_delete(sender, instance, **kwargs):
+    """post_delete: promote the previous version when the latest one is removed"""
+    if instance.__dict__.get('is_latest_profile', True):
+        refresh_latest_profiles({profile_email(instance)})
+
+
+def _refresh_instance(instance, keys):
+    latest = refresh_latest_profiles(keys)
+    instance.is_latest_profile = latest.get(profile_email(instance)) == instance.pk
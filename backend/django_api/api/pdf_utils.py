@@ -5,33 +5,52 @@ PDF generation utilities for medical certificates
 import io
 import os
 import json
+import threading
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.colors import black, red, blue
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, HRFlowable
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, HRFlowable, Flowable
 from reportlab.graphics.shapes import Drawing, Line
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_RIGHT, TA_LEFT
 from reportlab.pdfgen import canvas
+from reportlab.lib.utils import ImageReader
+from reportlab import rl_config
+from PIL import Image as PILImage
 from django.core.files.base import ContentFile
 from django.utils import timezone
 
 
-def generate_dental_form_pdf(dental_form_data):
-    """
-    Generate a dental examination form PDF for the given dental form data.
-    Returns a BytesIO buffer containing the PDF data.
-    """
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, 
-                          rightMargin=36, leftMargin=36,
-                          topMargin=36, bottomMargin=36)
-    
-    # Get styles
+# ---------------------------------------------------------------------------
+# Style and asset registry
+# ---------------------------------------------------------------------------
+# Paragraph styles, table styles and decoded images are built once per
+# process and shared by every generated PDF. Flowables only read them, so
+# sharing is safe across threads. Staff signatures are cached per StaffDetails
+# row and reloaded when the row's updated_at changes.
+
+LOGO_PATH = os.path.join(os.path.dirname(__file__), 'logo.png')
+LOGO_SIZE = (1*inch, 1*inch)
+SIGNATURE_SIZE = (1.5*inch, 0.6*inch)
+# Images are kept at this print resolution; larger uploads only make every
+# PDF bigger and slower to write
+IMAGE_DPI = 300
+
+# Write image streams as binary. The ASCII85 default is only needed for 7-bit
+# transports, inflates images by a quarter and its encoder dominated the
+# generation time of a certificate.
+rl_config.useA85 = 0
+
+_registry_lock = threading.Lock()
+_registry = {}
+_signatures = {}
+
+
+def _build_form_styles():
+    """Paragraph styles of the dental and medical examination forms"""
     styles = getSampleStyleSheet()
     
-    # Define custom styles
     title_style = ParagraphStyle(
         'CustomTitle',
         parent=styles['Heading1'],
@@ -85,6 +104,348 @@ def generate_dental_form_pdf(dental_form_data):
         fontName='Helvetica'
     )
     
+    return {
+        'title': title_style,
+        'subtitle': subtitle_style,
+        'form_title': form_title_style,
+        'section': section_style,
+        'body': body_style,
+    }
+
+
+def _build_certificate_styles():
+    """Paragraph styles of the medical certificate"""
+    styles = getSampleStyleSheet()
+    
+    header_style = ParagraphStyle(
+        'HeaderStyle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=2,
+        spaceBefore=0,
+        alignment=TA_CENTER,
+        textColor=colors.red,
+        fontName='Helvetica-Bold'
+    )
+    
+    subheader_style = ParagraphStyle(
+        'SubHeaderStyle',
+        parent=styles['Normal'],
+        fontSize=12,
+        spaceAfter=2,
+        spaceBefore=0,
+        alignment=TA_CENTER,
+        textColor=colors.black
+    )
+    
+    department_style = ParagraphStyle(
+        'DepartmentStyle',
+        parent=styles['Normal'],
+        fontSize=10,
+        spaceAfter=4,
+        spaceBefore=0,
+        alignment=TA_CENTER,
+        textColor=colors.black,
+        fontName='Helvetica-Bold'
+    )
+    
+    cert_title_style = ParagraphStyle(
+        'CertTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=20,
+        spaceBefore=16,
+        alignment=TA_CENTER,
+        textColor=colors.black,
+        fontName='Helvetica-Bold'
+    )
+    
+    body_style = ParagraphStyle(
+        'BodyText',
+        parent=styles['Normal'],
+        fontSize=11,
+        spaceAfter=12,
+        alignment=TA_JUSTIFY,
+        textColor=colors.black,
+        leading=18,
+        leftIndent=0,
+        rightIndent=0
+    )
+    
+    signature_name_style = ParagraphStyle(
+        'SignatureName',
+        parent=styles['Normal'],
+        fontSize=9,
+        alignment=TA_CENTER,
+        textColor=colors.blue,
+        fontName='Helvetica-Bold'
+    )
+    
+    signature_details_style = ParagraphStyle(
+        'SignatureDetails',
+        parent=styles['Normal'],
+        fontSize=8,
+        alignment=TA_CENTER,
+        textColor=colors.black
+    )
+    
+    # Special style for "To Whom It May Concern"
+    opening_style = ParagraphStyle(
+        'OpeningStyle',
+        parent=styles['Normal'],
+        fontSize=11,
+        spaceAfter=16,
+        alignment=TA_LEFT,
+        textColor=colors.black,
+        leading=18,
+        fontName='Helvetica'
+    )
+    
+    return {
+        'header': header_style,
+        'subheader': subheader_style,
+        'department': department_style,
+        'cert_title': cert_title_style,
+        'body': body_style,
+        'signature_name': signature_name_style,
+        'signature_details': signature_details_style,
+        'opening': opening_style,
+    }
+
+
+def _build_table_styles():
+    return {
+        'info_grid': TableStyle([
+            # Header styling
+            ('SPAN', (0, 0), (1, 0)),  # Span patient info header
+            ('SPAN', (2, 0), (3, 0)),  # Span assessment header
+            ('BACKGROUND', (0, 0), (3, 0), '#f0f0f0'),
+            ('ALIGN', (0, 0), (3, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (3, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (3, 0), 10),
+
+            # Data styling
+            ('ALIGN', (0, 1), (3, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (3, -1), 'TOP'),
+            ('FONTSIZE', (0, 1), (3, -1), 9),
+            ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),  # Left column labels
+            ('FONTNAME', (2, 1), (2, -1), 'Helvetica-Bold'),  # Right column labels
+            ('BOTTOMPADDING', (0, 0), (3, -1), 3),
+            ('TOPPADDING', (0, 0), (3, -1), 3),
+            ('GRID', (0, 0), (3, -1), 0.5, black),
+        ]),
+        'label_grid': TableStyle([
+            ('ALIGN', (0, 0), (3, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (3, -1), 'TOP'),
+            ('FONTSIZE', (0, 0), (3, -1), 9),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (3, -1), 3),
+            ('TOPPADDING', (0, 0), (3, -1), 3),
+            ('GRID', (0, 0), (3, -1), 0.5, black),
+        ]),
+        'teeth_grid': TableStyle([
+            ('ALIGN', (0, 0), (3, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (3, -1), 'TOP'),
+            ('FONTSIZE', (0, 0), (3, -1), 8),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (3, -1), 2),
+            ('TOPPADDING', (0, 0), (3, -1), 2),
+            ('GRID', (0, 0), (3, -1), 0.5, black),
+        ]),
+        'medicine_grid': TableStyle([
+            ('ALIGN', (0, 0), (3, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (3, -1), 'TOP'),
+            ('FONTSIZE', (0, 0), (3, -1), 9),
+            ('FONTNAME', (0, 0), (3, 0), 'Helvetica-Bold'),  # Header row
+            ('BACKGROUND', (0, 0), (3, 0), '#f0f0f0'),
+            ('BOTTOMPADDING', (0, 0), (3, -1), 3),
+            ('TOPPADDING', (0, 0), (3, -1), 3),
+            ('GRID', (0, 0), (3, -1), 0.5, black),
+        ]),
+        'notice_cell': TableStyle([
+            ('ALIGN', (0, 0), (0, 0), 'CENTER'),
+            ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
+            ('FONTSIZE', (0, 0), (0, 0), 9),
+            ('BOTTOMPADDING', (0, 0), (0, 0), 3),
+            ('TOPPADDING', (0, 0), (0, 0), 3),
+            ('GRID', (0, 0), (0, 0), 0.5, black),
+        ]),
+        'text_grid': TableStyle([
+            ('ALIGN', (0, 0), (1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (1, -1), 'TOP'),
+            ('BOTTOMPADDING', (0, 0), (1, -1), 3),
+            ('TOPPADDING', (0, 0), (1, -1), 3),
+            ('GRID', (0, 0), (1, -1), 0.5, black),
+        ]),
+        'text_cell': TableStyle([
+            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+            ('VALIGN', (0, 0), (0, 0), 'TOP'),
+            ('BOTTOMPADDING', (0, 0), (0, 0), 3),
+            ('TOPPADDING', (0, 0), (0, 0), 3),
+            ('GRID', (0, 0), (0, 0), 0.5, black),
+        ]),
+        'dental_examiner': TableStyle([
+            ('ALIGN', (0, 0), (3, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (3, -1), 'TOP'),
+            ('FONTSIZE', (0, 0), (3, -1), 9),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (3, -1), 3),
+            ('TOPPADDING', (0, 0), (3, -1), 3),
+        ]),
+        'medical_examiner': TableStyle([
+            ('ALIGN', (0, 0), (4, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (4, -1), 'TOP'),
+            ('FONTSIZE', (0, 0), (4, -1), 9),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (4, 0), (4, -1), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (4, -1), 3),
+            ('TOPPADDING', (0, 0), (4, -1), 3),
+        ]),
+        'certificate_heading': TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 12),
+        ]),
+        'certificate_header': TableStyle([
+            ('ALIGN', (0, 0), (0, 0), 'CENTER'),
+            ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
+            ('ALIGN', (1, 0), (1, 0), 'LEFT'),
+            ('VALIGN', (1, 0), (1, 0), 'MIDDLE'),
+        ]),
+        'certificate_signature': TableStyle([
+            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+            ('VALIGN', (1, 0), (1, -1), 'MIDDLE'),
+            # Line style
+            ('FONTSIZE', (1, 1), (1, 1), 12),
+            ('FONTNAME', (1, 1), (1, 1), 'Helvetica'),
+            # Staff name style (blue and bold, like in viewer)
+            ('FONTSIZE', (1, 2), (1, 2), 10),
+            ('FONTNAME', (1, 2), (1, 2), 'Helvetica-Bold'),
+            ('TEXTCOLOR', (1, 2), (1, 2), colors.blue),
+            # Empty spacing row (row 3)
+            # Position and details style (starting from row 4)
+            ('FONTSIZE', (1, 4), (1, -1), 9),
+            ('FONTNAME', (1, 4), (1, -1), 'Helvetica'),
+        ]),
+    }
+
+
+def _prepared_image(path, size):
+    """Decoded image at `path`, scaled down to IMAGE_DPI for a box of `size` points"""
+    image = PILImage.open(path)
+    box = [max(1, round(points / inch * IMAGE_DPI)) for points in size]
+    if image.width > box[0] or image.height > box[1]:
+        image = image.resize((min(image.width, box[0]), min(image.height, box[1])), PILImage.LANCZOS)
+    else:
+        image.load()
+    reader = ImageReader(image)
+    # ImageReader keeps the pixel data, so later PDFs only compress and embed it
+    reader.getRGBData()
+    return reader
+
+
+def _load_logo():
+    if not os.path.exists(LOGO_PATH):
+        return None
+    return _prepared_image(LOGO_PATH, LOGO_SIZE)
+
+
+_BUILDERS = {
+    'form_styles': _build_form_styles,
+    'certificate_styles': _build_certificate_styles,
+    'table_styles': _build_table_styles,
+    'logo': _load_logo,
+}
+
+
+def _get(name):
+    if name in _registry:
+        return _registry[name]
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = _BUILDERS[name]()
+        return _registry[name]
+
+
+def get_form_styles():
+    return _get('form_styles')
+
+
+def get_certificate_styles():
+    return _get('certificate_styles')
+
+
+def get_table_style(name):
+    return _get('table_styles')[name]
+
+
+def get_logo():
+    """Decoded WMSU logo, or None when logo.png is missing"""
+    return _get('logo')
+
+
+def get_signature(staff_details):
+    """Decoded signature image of a StaffDetails row, or None"""
+    if not staff_details.signature:
+        return None
+    version = (staff_details.updated_at, staff_details.signature.name)
+    cached = _signatures.get(staff_details.pk)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    reader = _prepared_image(staff_details.signature.path, SIGNATURE_SIZE)
+    with _registry_lock:
+        _signatures[staff_details.pk] = (version, reader)
+    return reader
+
+
+def reset_pdf_registry():
+    """Forget every cached style and image; the next PDF rebuilds them"""
+    with _registry_lock:
+        _registry.clear()
+        _signatures.clear()
+
+
+class CachedImage(Flowable):
+    """
+    Draws an already decoded ImageReader. platypus.Image re-reads and decodes
+    its file each time it is created.
+    """
+
+    def __init__(self, reader, width, height):
+        super().__init__()
+        self.reader = reader
+        self.width = width
+        self.height = height
+        self.hAlign = 'CENTER'
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        self.canv.drawImage(self.reader, 0, 0, self.width, self.height, mask='auto')
+
+
+def generate_dental_form_pdf(dental_form_data):
+    """
+    Generate a dental examination form PDF for the given dental form data.
+    Returns a BytesIO buffer containing the PDF data.
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, 
+                          rightMargin=36, leftMargin=36,
+                          topMargin=36, bottomMargin=36)
+    
+    styles = get_form_styles()
+    title_style = styles['title']
+    subtitle_style = styles['subtitle']
+    form_title_style = styles['form_title']
+    section_style = styles['section']
+    body_style = styles['body']
+    
     # Build the PDF content
     story = []
     
@@ -123,25 +484,7 @@ def generate_dental_form_pdf(dental_form_data):
     ]
     
     combined_table = Table(combined_data, colWidths=[1.2*inch, 2.3*inch, 1.2*inch, 2.3*inch])
-    combined_table.setStyle(TableStyle([
-        # Header styling
-        ('SPAN', (0, 0), (1, 0)),  # Span patient info header
-        ('SPAN', (2, 0), (3, 0)),  # Span assessment header
-        ('BACKGROUND', (0, 0), (3, 0), '#f0f0f0'),
-        ('ALIGN', (0, 0), (3, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (3, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (3, 0), 10),
-        
-        # Data styling
-        ('ALIGN', (0, 1), (3, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (3, -1), 'TOP'),
-        ('FONTSIZE', (0, 1), (3, -1), 9),
-        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),  # Left column labels
-        ('FONTNAME', (2, 1), (2, -1), 'Helvetica-Bold'),  # Right column labels
-        ('BOTTOMPADDING', (0, 0), (3, -1), 3),
-        ('TOPPADDING', (0, 0), (3, -1), 3),
-        ('GRID', (0, 0), (3, -1), 0.5, black),
-    ]))
+    combined_table.setStyle(get_table_style('info_grid'))
     
     story.append(combined_table)
     story.append(Spacer(1, 8))
@@ -157,16 +500,7 @@ def generate_dental_form_pdf(dental_form_data):
     ]
     
     findings_table = Table(findings_data, colWidths=[1.2*inch, 2.3*inch, 1.2*inch, 2.3*inch])
-    findings_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (3, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (3, -1), 'TOP'),
-        ('FONTSIZE', (0, 0), (3, -1), 9),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (3, -1), 3),
-        ('TOPPADDING', (0, 0), (3, -1), 3),
-        ('GRID', (0, 0), (3, -1), 0.5, black),
-    ]))
+    findings_table.setStyle(get_table_style('label_grid'))
     
     story.append(findings_table)
     story.append(Spacer(1, 8))
@@ -204,16 +538,7 @@ def generate_dental_form_pdf(dental_form_data):
             
             if len(permanent_data) > 1:  # More than just the header
                 permanent_table = Table(permanent_data, colWidths=[1.5*inch, 2.5*inch, 2*inch, 1*inch])
-                permanent_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (3, -1), 'LEFT'),
-                    ('VALIGN', (0, 0), (3, -1), 'TOP'),
-                    ('FONTSIZE', (0, 0), (3, -1), 8),
-                    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                    ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
-                    ('BOTTOMPADDING', (0, 0), (3, -1), 2),
-                    ('TOPPADDING', (0, 0), (3, -1), 2),
-                    ('GRID', (0, 0), (3, -1), 0.5, black),
-                ]))
+                permanent_table.setStyle(get_table_style('teeth_grid'))
                 story.append(permanent_table)
         
         # Process temporary teeth status
@@ -245,16 +570,7 @@ def generate_dental_form_pdf(dental_form_data):
             
             if len(temporary_data) > 1:  # More than just the header
                 temporary_table = Table(temporary_data, colWidths=[1.5*inch, 2.5*inch, 2*inch, 1*inch])
-                temporary_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (3, -1), 'LEFT'),
-                    ('VALIGN', (0, 0), (3, -1), 'TOP'),
-                    ('FONTSIZE', (0, 0), (3, -1), 8),
-                    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                    ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
-                    ('BOTTOMPADDING', (0, 0), (3, -1), 2),
-                    ('TOPPADDING', (0, 0), (3, -1), 2),
-                    ('GRID', (0, 0), (3, -1), 0.5, black),
-                ]))
+                temporary_table.setStyle(get_table_style('teeth_grid'))
                 story.append(temporary_table)
         
         story.append(Spacer(1, 8))
@@ -284,41 +600,18 @@ def generate_dental_form_pdf(dental_form_data):
                         medicine_table_data.append([name, quantity, unit, notes])
                 
                 medicine_table = Table(medicine_table_data, colWidths=[2.5*inch, 1*inch, 1*inch, 2.5*inch])
-                medicine_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (3, -1), 'LEFT'),
-                    ('VALIGN', (0, 0), (3, -1), 'TOP'),
-                    ('FONTSIZE', (0, 0), (3, -1), 9),
-                    ('FONTNAME', (0, 0), (3, 0), 'Helvetica-Bold'),  # Header row
-                    ('BACKGROUND', (0, 0), (3, 0), '#f0f0f0'),
-                    ('BOTTOMPADDING', (0, 0), (3, -1), 3),
-                    ('TOPPADDING', (0, 0), (3, -1), 3),
-                    ('GRID', (0, 0), (3, -1), 0.5, black),
-                ]))
+                medicine_table.setStyle(get_table_style('medicine_grid'))
                 story.append(medicine_table)
             else:
                 # No medicines or invalid format
                 no_medicine_table = Table([['No medicines used during this appointment']], colWidths=[7*inch])
-                no_medicine_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-                    ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
-                    ('FONTSIZE', (0, 0), (0, 0), 9),
-                    ('BOTTOMPADDING', (0, 0), (0, 0), 3),
-                    ('TOPPADDING', (0, 0), (0, 0), 3),
-                    ('GRID', (0, 0), (0, 0), 0.5, black),
-                ]))
+                no_medicine_table.setStyle(get_table_style('notice_cell'))
                 story.append(no_medicine_table)
                 
         except (json.JSONDecodeError, TypeError, AttributeError):
             # Handle invalid JSON data
             error_table = Table([['Invalid medicine usage data']], colWidths=[7*inch])
-            error_table.setStyle(TableStyle([
-                ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-                ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
-                ('FONTSIZE', (0, 0), (0, 0), 9),
-                ('BOTTOMPADDING', (0, 0), (0, 0), 3),
-                ('TOPPADDING', (0, 0), (0, 0), 3),
-                ('GRID', (0, 0), (0, 0), 0.5, black),
-            ]))
+            error_table.setStyle(get_table_style('notice_cell'))
             story.append(error_table)
         
         story.append(Spacer(1, 8))
@@ -339,13 +632,7 @@ def generate_dental_form_pdf(dental_form_data):
     ]
     
     treatment_table = Table(treatment_data, colWidths=[3.5*inch, 3.5*inch])
-    treatment_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (1, -1), 'TOP'),
-        ('BOTTOMPADDING', (0, 0), (1, -1), 3),
-        ('TOPPADDING', (0, 0), (1, -1), 3),
-        ('GRID', (0, 0), (1, -1), 0.5, black),
-    ]))
+    treatment_table.setStyle(get_table_style('text_grid'))
     
     story.append(treatment_table)
     story.append(Spacer(1, 6))
@@ -354,13 +641,7 @@ def generate_dental_form_pdf(dental_form_data):
     if dental_form_data.remarks:
         story.append(Paragraph("<b>ADDITIONAL REMARKS</b>", section_style))
         remarks_table = Table([[Paragraph(dental_form_data.remarks, body_style)]], colWidths=[7*inch])
-        remarks_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('VALIGN', (0, 0), (0, 0), 'TOP'),
-            ('BOTTOMPADDING', (0, 0), (0, 0), 3),
-            ('TOPPADDING', (0, 0), (0, 0), 3),
-            ('GRID', (0, 0), (0, 0), 0.5, black),
-        ]))
+        remarks_table.setStyle(get_table_style('text_cell'))
         story.append(remarks_table)
         story.append(Spacer(1, 6))
     
@@ -388,15 +669,7 @@ def generate_dental_form_pdf(dental_form_data):
         examiner_data.append(['Contact:', dental_form_data.examiner_phone, '', ''])
     
     examiner_table = Table(examiner_data, colWidths=[1.2*inch, 2.8*inch, 1*inch, 2*inch])
-    examiner_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (3, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (3, -1), 'TOP'),
-        ('FONTSIZE', (0, 0), (3, -1), 9),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (3, -1), 3),
-        ('TOPPADDING', (0, 0), (3, -1), 3),
-    ]))
+    examiner_table.setStyle(get_table_style('dental_examiner'))
     
     story.append(examiner_table)
     
@@ -416,108 +689,23 @@ def generate_medical_certificate_pdf(medical_document):
                           rightMargin=72, leftMargin=72,
                           topMargin=50, bottomMargin=50)
     
-    # Get styles
-    styles = getSampleStyleSheet()
-    
-    # Define custom styles to match the viewer exactly
-    header_style = ParagraphStyle(
-        'HeaderStyle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=2,
-        spaceBefore=0,
-        alignment=TA_CENTER,
-        textColor=colors.red,
-        fontName='Helvetica-Bold'
-    )
-    
-    subheader_style = ParagraphStyle(
-        'SubHeaderStyle',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=2,
-        spaceBefore=0,
-        alignment=TA_CENTER,
-        textColor=colors.black
-    )
-    
-    department_style = ParagraphStyle(
-        'DepartmentStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=4,
-        spaceBefore=0,
-        alignment=TA_CENTER,
-        textColor=colors.black,
-        fontName='Helvetica-Bold'
-    )
-    
-    cert_title_style = ParagraphStyle(
-        'CertTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=20,
-        spaceBefore=16,
-        alignment=TA_CENTER,
-        textColor=colors.black,
-        fontName='Helvetica-Bold'
-    )
-    
-    body_style = ParagraphStyle(
-        'BodyText',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=12,
-        alignment=TA_JUSTIFY,
-        textColor=colors.black,
-        leading=18,
-        leftIndent=0,
-        rightIndent=0
-    )
-    
-    signature_name_style = ParagraphStyle(
-        'SignatureName',
-        parent=styles['Normal'],
-        fontSize=9,
-        alignment=TA_CENTER,
-        textColor=colors.blue,
-        fontName='Helvetica-Bold'
-    )
-    
-    signature_details_style = ParagraphStyle(
-        'SignatureDetails',
-        parent=styles['Normal'],
-        fontSize=8,
-        alignment=TA_CENTER,
-        textColor=colors.black
-    )
-    
-    # Special style for "To Whom It May Concern"
-    opening_style = ParagraphStyle(
-        'OpeningStyle',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=16,
-        alignment=TA_LEFT,
-        textColor=colors.black,
-        leading=18,
-        fontName='Helvetica'
-    )
+    styles = get_certificate_styles()
+    header_style = styles['header']
+    subheader_style = styles['subheader']
+    department_style = styles['department']
+    cert_title_style = styles['cert_title']
+    body_style = styles['body']
+    opening_style = styles['opening']
     
     # Build the PDF content
     story = []
     
     # Header section with logo - matching the viewer layout exactly
-    from reportlab.platypus import Image
-    from reportlab.lib.utils import ImageReader
-    from django.conf import settings
-    
-    # Try to find the logo file
-    logo_path = os.path.join(os.path.dirname(__file__), 'logo.png')
+    logo = get_logo()
     
-    if os.path.exists(logo_path):
+    if logo is not None:
         # Header with logo (side by side layout like in the image)
-        logo_cell = Image(logo_path, width=1*inch, height=1*inch)
+        logo_cell = CachedImage(logo, *LOGO_SIZE)
         
         # Create text cells in a nested table for better alignment
         text_cells = [
@@ -526,23 +714,14 @@ def generate_medical_certificate_pdf(medical_document):
             [Paragraph("UNIVERSITY HEALTH SERVICES CENTER", department_style)]
         ]
         text_table = Table(text_cells, colWidths=[4.5*inch])
-        text_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 12),
-        ]))
+        text_table.setStyle(get_table_style('certificate_heading'))
         
         header_table = Table(
             [[logo_cell, text_table]],
             colWidths=[1.2*inch, 4.5*inch],
             rowHeights=[1*inch]
         )
-        header_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-            ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
-            ('ALIGN', (1, 0), (1, 0), 'LEFT'),
-            ('VALIGN', (1, 0), (1, 0), 'MIDDLE'),
-        ]))
+        header_table.setStyle(get_table_style('certificate_header'))
         story.append(header_table)
     else:
         # Header without logo (fallback)
@@ -631,6 +810,7 @@ def generate_medical_certificate_pdf(medical_document):
     elif medical_document.reviewed_by:
         staff_user = medical_document.reviewed_by
     
+    signature_image = None
     if staff_user:
         try:
             from .models import StaffDetails
@@ -640,19 +820,12 @@ def generate_medical_certificate_pdf(medical_document):
                 staff_position = staff_details.position
                 license_no = staff_details.license_number
                 ptr_no = staff_details.ptr_number
-        except:
-            pass
-    
-    # Try to load signature image if available
-    signature_image = None
-    if staff_user:
-        try:
-            from .models import StaffDetails
-            staff_details = StaffDetails.objects.filter(user=staff_user).first()
-            if staff_details and staff_details.signature:
-                # Try to create signature image
+                
+                # Try to load signature image if available
                 try:
-                    signature_image = Image(staff_details.signature.path, width=1.5*inch, height=0.6*inch)
+                    signature = get_signature(staff_details)
+                    if signature is not None:
+                        signature_image = CachedImage(signature, *SIGNATURE_SIZE)
                 except:
                     signature_image = None
         except:
@@ -690,25 +863,7 @@ def generate_medical_certificate_pdf(medical_document):
         row_heights = [0.3*inch, 0.1*inch, 0.2*inch, 0.1*inch, 0.16*inch, 0.14*inch, 0.14*inch]
     
     signature_table = Table(signature_data, colWidths=[3*inch, 2.5*inch], rowHeights=row_heights)
-    
-    # Style the table
-    table_style = [
-        ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-        ('VALIGN', (1, 0), (1, -1), 'MIDDLE'),
-        # Line style
-        ('FONTSIZE', (1, 1), (1, 1), 12),
-        ('FONTNAME', (1, 1), (1, 1), 'Helvetica'),
-        # Staff name style (blue and bold, like in viewer)
-        ('FONTSIZE', (1, 2), (1, 2), 10),
-        ('FONTNAME', (1, 2), (1, 2), 'Helvetica-Bold'),
-        ('TEXTCOLOR', (1, 2), (1, 2), colors.blue),
-        # Empty spacing row (row 3)
-        # Position and details style (starting from row 4)
-        ('FONTSIZE', (1, 4), (1, -1), 9),
-        ('FONTNAME', (1, 4), (1, -1), 'Helvetica'),
-    ]
-    
-    signature_table.setStyle(TableStyle(table_style))
+    signature_table.setStyle(get_table_style('certificate_signature'))
     story.append(signature_table)
     
     # Build PDF
@@ -752,62 +907,12 @@ def generate_medical_form_pdf(medical_form_data):
                           rightMargin=36, leftMargin=36,
                           topMargin=36, bottomMargin=36)
     
-    # Get styles
-    styles = getSampleStyleSheet()
-    
-    # Define custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=14,
-        spaceAfter=3,
-        alignment=TA_CENTER,
-        textColor=red,
-        fontName='Helvetica-Bold'
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=2,
-        alignment=TA_CENTER,
-        textColor=black,
-        fontName='Helvetica'
-    )
-    
-    form_title_style = ParagraphStyle(
-        'FormTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=8,
-        spaceBefore=8,
-        alignment=TA_CENTER,
-        textColor=black,
-        fontName='Helvetica-Bold'
-    )
-    
-    section_style = ParagraphStyle(
-        'SectionStyle',
-        parent=styles['Heading2'],
-        fontSize=11,
-        spaceAfter=4,
-        spaceBefore=6,
-        alignment=TA_LEFT,
-        textColor=black,
-        fontName='Helvetica-Bold'
-    )
-    
-    body_style = ParagraphStyle(
-        'BodyText',
-        parent=styles['Normal'],
-        fontSize=9,
-        spaceAfter=3,
-        alignment=TA_LEFT,
-        textColor=black,
-        leading=10,
-        fontName='Helvetica'
-    )
+    styles = get_form_styles()
+    title_style = styles['title']
+    subtitle_style = styles['subtitle']
+    form_title_style = styles['form_title']
+    section_style = styles['section']
+    body_style = styles['body']
     
     # Build the PDF content
     story = []
@@ -846,25 +951,7 @@ def generate_medical_form_pdf(medical_form_data):
     ]
     
     combined_table = Table(combined_data, colWidths=[1.2*inch, 2.3*inch, 1.2*inch, 2.3*inch])
-    combined_table.setStyle(TableStyle([
-        # Header styling
-        ('SPAN', (0, 0), (1, 0)),  # Span patient info header
-        ('SPAN', (2, 0), (3, 0)),  # Span vital signs header
-        ('BACKGROUND', (0, 0), (3, 0), '#f0f0f0'),
-        ('ALIGN', (0, 0), (3, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (3, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (3, 0), 10),
-        
-        # Data styling
-        ('ALIGN', (0, 1), (3, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (3, -1), 'TOP'),
-        ('FONTSIZE', (0, 1), (3, -1), 9),
-        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),  # Left column labels
-        ('FONTNAME', (2, 1), (2, -1), 'Helvetica-Bold'),  # Right column labels
-        ('BOTTOMPADDING', (0, 0), (3, -1), 3),
-        ('TOPPADDING', (0, 0), (3, -1), 3),
-        ('GRID', (0, 0), (3, -1), 0.5, black),
-    ]))
+    combined_table.setStyle(get_table_style('info_grid'))
     
     story.append(combined_table)
     story.append(Spacer(1, 6))
@@ -888,13 +975,7 @@ def generate_medical_form_pdf(medical_form_data):
     ]
     
     history_table = Table(history_data, colWidths=[3.5*inch, 3.5*inch])
-    history_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (1, -1), 'TOP'),
-        ('BOTTOMPADDING', (0, 0), (1, -1), 3),
-        ('TOPPADDING', (0, 0), (1, -1), 3),
-        ('GRID', (0, 0), (1, -1), 0.5, black),
-    ]))
+    history_table.setStyle(get_table_style('text_grid'))
     
     story.append(history_table)
     story.append(Spacer(1, 6))
@@ -934,13 +1015,7 @@ def generate_medical_form_pdf(medical_form_data):
             ])
         
         exam_table = Table(exam_data, colWidths=[3.5*inch, 3.5*inch])
-        exam_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (1, -1), 'TOP'),
-            ('BOTTOMPADDING', (0, 0), (1, -1), 3),
-            ('TOPPADDING', (0, 0), (1, -1), 3),
-            ('GRID', (0, 0), (1, -1), 0.5, black),
-        ]))
+        exam_table.setStyle(get_table_style('text_grid'))
         
         story.append(exam_table)
         story.append(Spacer(1, 6))
@@ -960,13 +1035,7 @@ def generate_medical_form_pdf(medical_form_data):
     ]
     
     assessment_table = Table(assessment_data, colWidths=[3.5*inch, 3.5*inch])
-    assessment_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (1, -1), 'TOP'),
-        ('BOTTOMPADDING', (0, 0), (1, -1), 3),
-        ('TOPPADDING', (0, 0), (1, -1), 3),
-        ('GRID', (0, 0), (1, -1), 0.5, black),
-    ]))
+    assessment_table.setStyle(get_table_style('text_grid'))
     
     story.append(assessment_table)
     story.append(Spacer(1, 6))
@@ -981,16 +1050,7 @@ def generate_medical_form_pdf(medical_form_data):
     ]
     
     examiner_table = Table(examiner_data, colWidths=[1*inch, 2*inch, 1.2*inch, 1.8*inch, 1*inch])
-    examiner_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (4, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (4, -1), 'TOP'),
-        ('FONTSIZE', (0, 0), (4, -1), 9),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (4, 0), (4, -1), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (4, -1), 3),
-        ('TOPPADDING', (0, 0), (4, -1), 3),
-    ]))
+    examiner_table.setStyle(get_table_style('medical_examiner'))
     
     story.append(examiner_table)
     
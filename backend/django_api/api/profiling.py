@@ -0,0 +1,281 @@
+"""
+Per-endpoint latency and query profiling.
+
+ProfilingMiddleware measures every API request: total latency, number of
+database queries and time spent in the database. Views using
+ProfiledViewMixin additionally report the time spent serializing (database
+time triggered from inside the serializer is counted as database time, not
+serializer time). Samples are kept in a bounded in-memory ring buffer per
+worker process and summarised per route name and action at the admin-only
+``/api/profiling/`` endpoint.
+
+Configuration (all optional) lives in ``settings.API_PROFILING``::
+
+    API_PROFILING = {
+        'ENABLED': True,
+        'BUFFER_SIZE': 2000,        # samples kept per worker
+        'SERVER_TIMING': False,     # add a Server-Timing response header
+        'DEFAULT_BUDGET': {'queries': 50, 'total_ms': 1000},
+        'BUDGETS': {
+            # keyed by 'route-name:action' or 'route-name'
+            'appointment-list': {'queries': 10, 'total_ms': 300},
+        },
+    }
+
+Requests over budget are logged as warnings on the ``api.profiling`` logger.
+"""
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework import permissions, status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 2000
+BUDGET_METRICS = ('queries', 'total_ms', 'db_ms', 'serializer_ms')
+PROFILING_ROUTE = 'api-profiling'
+
+
+def get_config():
+    config = getattr(settings, 'API_PROFILING', {})
+    return {
+        'ENABLED': config.get('ENABLED', True),
+        'BUFFER_SIZE': config.get('BUFFER_SIZE', DEFAULT_BUFFER_SIZE),
+        'SERVER_TIMING': config.get('SERVER_TIMING', False),
+        'DEFAULT_BUDGET': config.get('DEFAULT_BUDGET', {}),
+        'BUDGETS': config.get('BUDGETS', {}),
+    }
+
+
+class SampleBuffer:
+    """Thread-safe ring buffer holding the most recent request samples"""
+
+    def __init__(self, size=DEFAULT_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+
+    def resize(self, size):
+        with self._lock:
+            if self._samples.maxlen != size:
+                self._samples = deque(self._samples, maxlen=size)
+
+    def append(self, sample):
+        with self._lock:
+            self._samples.append(sample)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._samples)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+samples = SampleBuffer()
+
+
+class RequestProfile:
+    """Counters collected while one request is served"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.action = None
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_ms += (time.perf_counter() - started) * 1000
+
+    def wrap_serializer(self, serializer):
+        """Time serializer.to_representation, excluding the queries it triggers"""
+        to_representation = serializer.to_representation
+
+        def timed_to_representation(instance):
+            started = time.perf_counter()
+            db_before = self.db_ms
+            try:
+                return to_representation(instance)
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                self.serializer_ms += elapsed - (self.db_ms - db_before)
+
+        serializer.to_representation = timed_to_representation
+        return serializer
+
+
+def get_budget(route, action, config=None):
+    config = config or get_config()
+    budgets = config['BUDGETS']
+    for key in (f'{route}:{action}', route):
+        if key in budgets:
+            return budgets[key]
+    return config['DEFAULT_BUDGET']
+
+
+class ProfilingMiddleware:
+    """Records latency, query count and database time of every routed request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            # ViewSet routes map the HTTP method to the action name
+            actions = getattr(view_func, 'actions', None) or {}
+            profile.action = actions.get(request.method.lower())
+
+    def __call__(self, request):
+        config = get_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        request._profile = profile
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile.execute_wrapper))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        route = match.view_name or match.route
+        if route == PROFILING_ROUTE:
+            return response
+
+        sample = {
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'action': profile.action,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'queries': profile.queries,
+            'db_ms': round(profile.db_ms, 2),
+            'serializer_ms': round(profile.serializer_ms, 2),
+        }
+        budget = get_budget(route, profile.action, config)
+        sample['over_budget'] = [
+            metric for metric in BUDGET_METRICS
+            if metric in budget and sample[metric] > budget[metric]
+        ]
+        if sample['over_budget']:
+            logger.warning(
+                'Budget exceeded for %s %s (%s): %s',
+                request.method, route, profile.action or '-',
+                ', '.join(f'{metric}={sample[metric]} > {budget[metric]}' for metric in sample['over_budget'])
+            )
+
+        samples.resize(config['BUFFER_SIZE'])
+        samples.append(sample)
+
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={profile.db_ms:.2f};desc="{profile.queries} queries"',
+                f'serializer;dur={profile.serializer_ms:.2f}',
+                f'total;dur={total_ms:.2f}',
+            ])
+        return response
+
+
+class ProfiledViewMixin:
+    """DRF view mixin reporting serializer time to ProfilingMiddleware"""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        profile = getattr(self.request, '_profile', None)
+        if profile is not None:
+            profile.wrap_serializer(serializer)
+        return serializer
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(sample_list):
+    """Per route/action aggregates of the given samples, slowest p95 first"""
+    groups = {}
+    for sample in sample_list:
+        groups.setdefault((sample['route'], sample['action']), []).append(sample)
+
+    summary = []
+    for (route, action), rows in groups.items():
+        total = [row['total_ms'] for row in rows]
+        queries = [row['queries'] for row in rows]
+        summary.append({
+            'route': route,
+            'action': action,
+            'requests': len(rows),
+            'total_ms_avg': round(statistics.mean(total), 2),
+            'total_ms_p95': _percentile(total, 95),
+            'total_ms_max': max(total),
+            'queries_avg': round(statistics.mean(queries), 1),
+            'queries_max': max(queries),
+            'db_ms_avg': round(statistics.mean(row['db_ms'] for row in rows), 2),
+            'serializer_ms_avg': round(statistics.mean(row['serializer_ms'] for row in rows), 2),
+            'budget': get_budget(route, action),
+            'budget_violations': sum(1 for row in rows if row['over_budget']),
+        })
+    summary.sort(key=lambda row: row['total_ms_p95'], reverse=True)
+    return summary
+
+
+class ProfilingView(APIView):
+    """
+    Admin-only view of the profiling samples of this worker.
+
+    GET     per route/action summary; ?route= filters, ?recent=N adds the last N samples
+    DELETE  clear the buffer
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def check_permissions(self, request):
+        super().check_permissions(request)
+        if not (request.user.is_staff or request.user.user_type == 'admin'):
+            raise PermissionDenied('Only administrators can view profiling data.')
+
+    def get(self, request):
+        sample_list = samples.snapshot()
+        route = request.query_params.get('route')
+        if route:
+            sample_list = [sample for sample in sample_list if sample['route'] == route]
+
+        data = {
+            'enabled': get_config()['ENABLED'],
+            'samples': len(sample_list),
+            'endpoints': summarize(sample_list),
+        }
+        try:
+            recent = int(request.query_params.get('recent', 0))
+        except (TypeError, ValueError):
+            recent = 0
+        if recent > 0:
+            data['recent'] = sample_list[-recent:][::-1]
+        return Response(data)
+
+    def delete(self, request):
+        samples.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,48 @@
+"""
+JSON rendering with orjson.
+
+DRF's ``JSONRenderer`` encodes with the standard library ``json`` module,
+which is most of the CPU time of the large admin payloads (patient and
+appointment lists, dashboard statistics). ``FastJSONRenderer`` encodes with
+orjson when it is installed: strings, numbers, dates and UUIDs natively, and
+everything else (datetimes and times in DRF's format, Decimals, lazy
+translation strings, querysets, ...) through DRF's encoder, so clients get
+the same JSON values. NaN and infinite floats become null instead of an
+error.
+
+It falls back to ``JSONRenderer`` when orjson is not installed, when the
+client asked for indented output, when UNICODE_JSON or COMPACT_JSON are
+turned off and for values orjson rejects (integers beyond 64 bits).
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+# Datetimes and times go through DRF's encoder to keep its millisecond
+# precision and 'Z' suffix
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+# JSONRenderer escapes these so the output is also valid JavaScript
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer encoding with orjson when available"""
+
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self._encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80' in ret:
+            for raw, escaped in LINE_SEPARATORS:
+                ret = ret.replace(raw, escaped)
+        return ret
@@ -0,0 +1,327 @@
+"""
+Staff-capacity-aware scheduling calendar.
+
+Who can see patients when is configured in JSON fields: the working days,
+time ranges, blocked dates and daily limit of every StaffDetails row, the
+per-campus DentistSchedule rows, the CampusSchedule operating days and
+hours and the CampusClosure days. ``get_calendar()`` compiles all of them once into a ScheduleCalendar
+that maps (campus, appointment type, weekday) to the staff on duty in each
+slot of the day grid, so answering "who can take slot X" is a dict lookup
+instead of parsing every staff member's JSON on each request.
+
+The compiled calendar is shared by all requests of the worker for
+``SCHEDULING_CALENDAR_TTL`` seconds (default 300) and dropped as soon as a
+schedule model is saved or deleted in this process (see api/signals.py). The
+TTL bounds how long other workers can serve a stale calendar.
+
+Staff positions decide the appointment type they take (the same lists the
+booking pages use). A campus/type without any configured staff is not
+restricted, so the clinic keeps booking against the plain slot grid until
+staff schedules are set up.
+"""
+import calendar as weekday_names
+import logging
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+from .booking import SlotUnavailable
+from .slot_occupancy import ACTIVE_STATUSES, SLOT_INDEX, SLOT_TIMES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+
+# Positions taking each appointment type (compared case-insensitively)
+MEDICAL_POSITIONS = ('Doctor', 'Nurse', 'Medical Staff', 'Administrator')
+DENTAL_POSITIONS = ('Dentist', 'Dental Staff')
+POSITION_TYPES = {
+    **{position.lower(): 'medical' for position in MEDICAL_POSITIONS},
+    **{position.lower(): 'dental' for position in DENTAL_POSITIONS},
+}
+
+ALL_DAYS = frozenset(range(7))
+# Used for campuses without an active CampusSchedule
+DEFAULT_OPERATING_DAYS = frozenset(range(5))  # Monday to Friday
+ALL_SLOTS = frozenset(range(len(SLOT_TIMES)))
+
+_DAY_NUMBERS = {
+    **{name.lower(): number for number, name in enumerate(weekday_names.day_name)},
+    **{name.lower(): number for number, name in enumerate(weekday_names.day_abbr)},
+}
+
+StaffRule = namedtuple('StaffRule', 'user_id name position type daily_limit blocked_dates')
+
+_lock = threading.Lock()
+_process_entry = None
+# Bumped by invalidate(): a calendar compiled across an invalidation is not stored
+_generation = 0
+
+
+def _ttl():
+    return getattr(settings, 'SCHEDULING_CALENDAR_TTL', DEFAULT_TTL)
+
+
+# ---------------------------------------------------------------------------
+# Parsing of the JSON rules
+# ---------------------------------------------------------------------------
+
+def parse_days(values):
+    """Weekday numbers (Monday=0) of a list like ["Monday", "tue"]; None when the list is empty"""
+    days = {_DAY_NUMBERS.get(str(value).strip().lower()) for value in values or []}
+    days.discard(None)
+    return frozenset(days) if values else None
+
+
+def parse_slots(values):
+    """
+    Slot indices covered by a list of "HH:MM-HH:MM" ranges (or single "HH:MM"
+    slots); None when the list is empty.
+    """
+    if not values:
+        return None
+    slots = set()
+    for value in values:
+        start, _, end = str(value).partition('-')
+        try:
+            start, end = parse_time(start.strip()), parse_time(end.strip()) if end else None
+        except ValueError:
+            start = None
+        if start is None:
+            logger.debug('Ignoring malformed time slot %r', value)
+            continue
+        if end is None:
+            index = SLOT_INDEX.get(start)
+            if index is not None:
+                slots.add(index)
+            continue
+        slots.update(index for index, slot_time in enumerate(SLOT_TIMES) if start <= slot_time < end)
+    return frozenset(slots)
+
+
+def parse_dates(values):
+    dates = set()
+    for value in values or []:
+        try:
+            day = parse_date(str(value)[:10])
+        except ValueError:
+            day = None
+        if day is not None:
+            dates.add(day)
+    return frozenset(dates)
+
+
+def _normalize_name(name):
+    name = ' '.join((name or '').lower().split())
+    return name[4:] if name.startswith('dr. ') else name
+
+
+# ---------------------------------------------------------------------------
+# Compiled calendar
+# ---------------------------------------------------------------------------
+
+class ScheduleCalendar:
+    """Staff on duty per (campus, appointment type, weekday, slot), compiled from the schedule models"""
+
+    def __init__(self):
+        self.staff = {}           # user id -> StaffRule
+        self.open_days = {}       # campus -> weekday numbers
+        self.open_slots = {}      # campus -> slot indices within the opening hours
+        self.roster = {}          # (campus, type, weekday) -> tuple (per slot) of user id tuples
+        self.staffed = set()      # (campus, type) with at least one staff member on the roster
+        self.closed_dates = set() # (campus, date) of unexpected closures
+
+    def is_open(self, campus, day, slot_time=None):
+        """Whether the campus operates on `day` (and at `slot_time` when given)"""
+        if day.weekday() not in self.open_days.get(campus, DEFAULT_OPERATING_DAYS):
+            return False
+        if (campus, day) in self.closed_dates:
+            return False
+        if slot_time is None:
+            return True
+        return SLOT_INDEX.get(slot_time) in self.open_slots.get(campus, ALL_SLOTS)
+
+    def is_staffed(self, campus, type):
+        return (campus, type) in self.staffed
+
+    def on_duty(self, campus, type, day, slot_time):
+        """User ids of the staff working the slot (blocked dates excluded)"""
+        slots = self.roster.get((campus, type, day.weekday()))
+        index = SLOT_INDEX.get(slot_time)
+        if slots is None or index is None:
+            return ()
+        return tuple(user_id for user_id in slots[index] if day not in self.staff[user_id].blocked_dates)
+
+    def with_capacity(self, campus, type, day, slot_time, load):
+        """
+        Staff working the slot who are still under their daily limit, least
+        loaded first. `load` is {user id: active appointments on the day}.
+        """
+        free = [
+            user_id for user_id in self.on_duty(campus, type, day, slot_time)
+            if load.get(user_id, 0) < self.staff[user_id].daily_limit
+        ]
+        return sorted(free, key=lambda user_id: load.get(user_id, 0))
+
+    def has_capacity(self, campus, type, day, slot_time, load):
+        """Whether any staff member working the slot is under their daily limit"""
+        slots = self.roster.get((campus, type, day.weekday()))
+        index = SLOT_INDEX.get(slot_time)
+        if slots is None or index is None:
+            return False
+        staff = self.staff
+        return any(
+            day not in staff[user_id].blocked_dates and load.get(user_id, 0) < staff[user_id].daily_limit
+            for user_id in slots[index]
+        )
+
+    def free_slots(self, campus, type, day, slot_times, load):
+        """The given slot times of a day that the campus is open for and some staff member can take"""
+        slot_times = [slot_time for slot_time in slot_times if self.is_open(campus, day, slot_time)]
+        if not self.is_staffed(campus, type):
+            return slot_times
+        return [slot_time for slot_time in slot_times if self.has_capacity(campus, type, day, slot_time, load)]
+
+
+def compile_calendar():
+    """Build a ScheduleCalendar from the current schedule rows"""
+    from .models import CampusClosure, CampusSchedule, DentistSchedule, StaffDetails
+
+    compiled = ScheduleCalendar()
+    compiled.closed_dates = set(
+        CampusClosure.objects.filter(date__gte=timezone.now().date()).values_list('campus', 'date')
+    )
+    for campus, open_time, close_time, operating_days in CampusSchedule.objects.filter(is_active=True).values_list(
+        'campus', 'open_time', 'close_time', 'operating_days'
+    ):
+        days = parse_days(operating_days)
+        compiled.open_days[campus] = DEFAULT_OPERATING_DAYS if days is None else days
+        compiled.open_slots[campus] = frozenset(
+            index for index, slot_time in enumerate(SLOT_TIMES) if open_time <= slot_time < close_time
+        )
+
+    # DentistSchedule rows replace the days/hours of the dentist with that name on their campus
+    dentist_hours = {
+        (_normalize_name(name), campus): (parse_days(days), parse_slots(slots))
+        for name, campus, days, slots in DentistSchedule.objects.filter(is_active=True).values_list(
+            'dentist_name', 'campus', 'available_days', 'time_slots'
+        )
+    }
+
+    roster = defaultdict(lambda: [[] for _ in SLOT_TIMES])
+    rows = StaffDetails.objects.filter(user__is_active=True).order_by('user_id').values_list(
+        'user_id', 'full_name', 'position', 'assigned_campuses', 'campus_assigned',
+        'available_days', 'time_slots', 'blocked_dates', 'daily_appointment_limit',
+    )
+    for user_id, name, position, assigned, campus_assigned, days, slots, blocked, limit in rows:
+        type_ = POSITION_TYPES.get((position or '').strip().lower())
+        if type_ is None:
+            continue
+        compiled.staff[user_id] = StaffRule(user_id, name, position, type_, limit or 0, parse_dates(blocked))
+        staff_days, staff_slots = parse_days(days), parse_slots(slots)
+        campuses = StaffDetails(assigned_campuses=assigned, campus_assigned=campus_assigned).get_assigned_campuses_list()
+        for campus in campuses:
+            campus_days, campus_slots = staff_days, staff_slots
+            if type_ == 'dental' and (_normalize_name(name), campus) in dentist_hours:
+                campus_days, campus_slots = dentist_hours[(_normalize_name(name), campus)]
+            campus_days = (ALL_DAYS if campus_days is None else campus_days) & compiled.open_days.get(campus, DEFAULT_OPERATING_DAYS)
+            campus_slots = (ALL_SLOTS if campus_slots is None else campus_slots) & compiled.open_slots.get(campus, ALL_SLOTS)
+            if not campus_days or not campus_slots:
+                continue
+            compiled.staffed.add((campus, type_))
+            for weekday in campus_days:
+                slot_staff = roster[(campus, type_, weekday)]
+                for index in campus_slots:
+                    slot_staff[index].append(user_id)
+
+    compiled.roster = {key: tuple(tuple(user_ids) for user_ids in slots) for key, slots in roster.items()}
+    return compiled
+
+
+def get_calendar():
+    """Compiled calendar shared by the worker, recompiled when missing or expired"""
+    global _process_entry
+    entry = _process_entry
+    if entry is not None and entry['expires'] > time.monotonic():
+        return entry['calendar']
+    generation = _generation
+    compiled = compile_calendar()
+    with _lock:
+        if generation == _generation:
+            _process_entry = {'calendar': compiled, 'expires': time.monotonic() + _ttl()}
+    logger.debug('Compiled scheduling calendar for %s staff members', len(compiled.staff))
+    return compiled
+
+
+def invalidate():
+    global _process_entry, _generation
+    with _lock:
+        _process_entry = None
+        _generation += 1
+
+
+def invalidate_on_change(sender, **kwargs):
+    """post_save/post_delete of StaffDetails, DentistSchedule, CampusSchedule and CampusClosure"""
+    invalidate()
+    # A request that compiled the old rows before this transaction commits must
+    # not keep them afterwards
+    transaction.on_commit(invalidate)
+
+
+# ---------------------------------------------------------------------------
+# Staff load and assignment
+# ---------------------------------------------------------------------------
+
+def staff_load(start, end, exclude=None):
+    """{date: {user id: active appointments}} of the staff assigned to appointments in [start, end]"""
+    from .models import Appointment
+    appointments = Appointment.objects.filter(
+        appointment_date__range=(start, end), status__in=ACTIVE_STATUSES, doctor__isnull=False,
+    )
+    if exclude is not None:
+        appointments = appointments.exclude(pk=exclude)
+    load = defaultdict(dict)
+    for day, user_id, n in appointments.values_list('appointment_date', 'doctor_id').annotate(n=Count('id')).order_by():
+        load[day][user_id] = n
+    return load
+
+
+def assign_doctor(campus, type, day, slot_time, exclude=None, prefer=None):
+    """
+    User id of the staff member who takes an appointment in the slot, or None
+    when the campus has no staff configured for the type. Raises
+    SlotUnavailable when nobody on duty has capacity left.
+
+    Call inside the booking transaction: the chosen staff member's row is
+    locked and their load recounted, so concurrent bookings cannot push one
+    person over their daily limit. `exclude` is an appointment that is being
+    moved and must not count against anyone; `prefer` is tried first when
+    they have capacity (the staff member already assigned to it).
+    """
+    from .models import Appointment, StaffDetails
+
+    compiled = get_calendar()
+    if not compiled.is_staffed(campus, type):
+        return None
+    load = staff_load(day, day, exclude=exclude).get(day, {})
+    candidates = compiled.with_capacity(campus, type, day, slot_time, load)
+    if prefer in candidates:
+        candidates.remove(prefer)
+        candidates.insert(0, prefer)
+    for user_id in candidates:
+        # Bookings of the same staff member queue up here
+        list(StaffDetails.objects.select_for_update().filter(user_id=user_id).values_list('pk', flat=True))
+        booked = Appointment.objects.filter(
+            doctor_id=user_id, appointment_date=day, status__in=ACTIVE_STATUSES,
+        ).exclude(pk=exclude).count()
+        if booked < compiled.staff[user_id].daily_limit:
+            return user_id
+    raise SlotUnavailable(
+        f"No {type} staff is available at {slot_time.strftime('%H:%M')} on {day}. Please choose another time."
+    )
@@ -0,0 +1,125 @@
+"""
+Cached lookup of the current AcademicSchoolYear and current semester.
+
+The current school year is needed by profile setup, serializers, model
+save() methods and most appointment views, often several times in one
+request. Lookups go through two layers:
+
+1. a per-request memo (RequestCacheMiddleware), so one request does at most
+   one lookup;
+2. a process-level entry shared by all requests of the worker, kept for
+   ``CURRENT_SCHOOL_YEAR_CACHE_TTL`` seconds (default 60) and dropped as soon
+   as an AcademicSchoolYear is saved or deleted in this process (see
+   api/signals.py). The TTL bounds how long other workers can serve a stale
+   year after it is changed elsewhere.
+
+Hits and misses are counted in ``cache_stats()``.
+"""
+import copy
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .middleware import get_request_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60
+
+_lock = threading.Lock()
+_process_entry = None
+_stats = Counter()
+
+
+def _ttl():
+    return getattr(settings, 'CURRENT_SCHOOL_YEAR_CACHE_TTL', DEFAULT_TTL)
+
+
+def _load_process_entry():
+    """Process-level entry, reloading it from the database when missing or expired"""
+    global _process_entry
+    entry = _process_entry
+    if entry is not None and entry['expires'] > time.monotonic():
+        _stats['process_hits'] += 1
+        return entry
+
+    from .models import AcademicSchoolYear
+    _stats['misses'] += 1
+    school_year = AcademicSchoolYear.objects.filter(is_current=True).first()
+    entry = {
+        'school_year': school_year,
+        'expires': time.monotonic() + _ttl(),
+        'semester_date': None,
+        'semester': None,
+    }
+    with _lock:
+        _process_entry = entry
+    logger.debug('Current school year cache miss: loaded %s', school_year)
+    return entry
+
+
+def current_school_year():
+    """Current AcademicSchoolYear or None; at most one database lookup per request"""
+    memo = get_request_cache()
+    if memo is not None and 'current_school_year' in memo:
+        _stats['request_hits'] += 1
+        return memo['current_school_year']
+
+    school_year = _load_process_entry()['school_year']
+    # Callers get their own copy so attribute changes never leak into the shared entry
+    school_year = copy.copy(school_year)
+    if memo is not None:
+        memo['current_school_year'] = school_year
+    return school_year
+
+
+def current_semester():
+    """Semester of the current school year for today ('1st_semester', ...) or None"""
+    memo = get_request_cache()
+    if memo is not None and 'current_semester' in memo:
+        _stats['request_hits'] += 1
+        return memo['current_semester']
+
+    entry = _load_process_entry()
+    today = timezone.now().date()
+    if entry['semester_date'] != today:
+        school_year = entry['school_year']
+        entry['semester'] = school_year.get_current_semester() if school_year else None
+        entry['semester_date'] = today
+    if memo is not None:
+        memo['current_semester'] = entry['semester']
+    return entry['semester']
+
+
+def invalidate():
+    """Drop the cached current school year (process entry and this request's memo)"""
+    global _process_entry
+    with _lock:
+        _process_entry = None
+    memo = get_request_cache()
+    if memo is not None:
+        memo.pop('current_school_year', None)
+        memo.pop('current_semester', None)
+    _stats['invalidations'] += 1
+
+
+def invalidate_on_change(sender, **kwargs):
+    """post_save/post_delete of AcademicSchoolYear"""
+    invalidate()
+    # A request that read the old row before this transaction commits must not
+    # keep it cached afterwards
+    transaction.on_commit(invalidate)
+
+
+def cache_stats():
+    """Counters of request memo hits, process cache hits, misses and invalidations"""
+    return {key: _stats[key] for key in ('request_hits', 'process_hits', 'misses', 'invalidations')}
+
+
+def reset_cache_stats():
+    _stats.clear()
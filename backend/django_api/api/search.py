@@ -0,0 +1,245 @@
+"""
+Indexed search of patient profiles and user accounts.
+
+The admin lists used to search with ORs of ``icontains`` over names, emails,
+student ids and departments, which cannot use an index and scans the whole
+table on every keystroke. Each searchable row now has SearchToken rows: the
+words of its searchable fields plus the whole value of identifier fields
+(emails, student ids, usernames), lower-cased, each with the weight of its
+field. A search splits the query into words the same way and keeps the rows
+that have a token starting with every word; prefix matches use the
+(kind, token) index on MySQL and SQLite alike.
+
+``search_queryset()`` is the shared backend of the list views: it filters a
+Patient or CustomUser queryset and orders it by rank (the best matching token
+weight per word, doubled for whole-token matches) before the view's own
+ordering.
+
+Tokens follow the Patient and CustomUser signals (see api/signals.py); rows
+written with bulk_create()/update() are picked up by the
+``rebuild_search_index`` command.
+"""
+import re
+
+from django.db import transaction
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce
+
+MAX_TOKEN_LENGTH = 100
+MAX_TERMS = 6
+# Tokens counted per word to pick the word that drives a search
+SELECTIVITY_SAMPLE = 200
+# Ranking weight of each searchable field, by kind
+PATIENT_FIELDS = {'student_id': 4, 'name': 3, 'email': 2, 'user_email': 2, 'department': 1}
+USER_FIELDS = {'username': 4, 'last_name': 3, 'first_name': 3, 'middle_name': 2, 'email': 2}
+# Fields whose whole value is a token too, so a full email or id can be typed
+IDENTIFIER_FIELDS = {'student_id', 'email', 'user_email', 'username'}
+# Model fields whose change requires re-indexing a row
+PATIENT_STATE = ('student_id', 'name', 'email', 'user_id', 'department')
+USER_STATE = tuple(USER_FIELDS)
+
+_WORD_SPLIT = re.compile(r'[\W_]+')
+_MISSING = object()
+
+
+def _models(apps=None):
+    if apps is not None:
+        return (apps.get_model('api', 'Patient'), apps.get_model('api', 'CustomUser'),
+                apps.get_model('api', 'SearchToken'))
+    from .models import CustomUser, Patient, SearchToken
+    return Patient, CustomUser, SearchToken
+
+
+def words(text):
+    """Lower-cased words of a text"""
+    return [word[:MAX_TOKEN_LENGTH] for word in _WORD_SPLIT.split(str(text or '').lower()) if word]
+
+
+def tokens(values, weights):
+    """{token: weight} of a row from {field: value}"""
+    result = {}
+    for field, weight in weights.items():
+        value = values.get(field)
+        if not value:
+            continue
+        found = words(value)
+        if field in IDENTIFIER_FIELDS:
+            found.append(str(value).strip().lower()[:MAX_TOKEN_LENGTH])
+        for token in found:
+            if result.get(token, 0) < weight:
+                result[token] = weight
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Indexing
+# ---------------------------------------------------------------------------
+
+def _patient_values(apps=None, **filters):
+    Patient, _, _ = _models(apps)
+    rows = Patient.objects.filter(**filters).values_list('id', 'student_id', 'name', 'email', 'user__email', 'department')
+    for pk, student_id, name, email, user_email, department in rows.iterator():
+        yield pk, {'student_id': student_id, 'name': name, 'email': email, 'user_email': user_email, 'department': department}
+
+
+def _user_values(apps=None, **filters):
+    _, CustomUser, _ = _models(apps)
+    rows = CustomUser.objects.filter(**filters).values_list('id', *USER_FIELDS)
+    for row in rows.iterator():
+        yield row[0], dict(zip(USER_FIELDS, row[1:]))
+
+
+def _write(kind, rows, apps=None, batch_size=1000):
+    """Replace the tokens of the given (object id, {field: value}) rows; returns tokens written"""
+    _, _, SearchToken = _models(apps)
+    weights = PATIENT_FIELDS if kind == 'patient' else USER_FIELDS
+    rows = list(rows)
+    new_tokens = [
+        SearchToken(kind=kind, object_id=pk, token=token, weight=weight)
+        for pk, values in rows
+        for token, weight in sorted(tokens(values, weights).items())
+    ]
+    with transaction.atomic():
+        SearchToken.objects.filter(kind=kind, object_id__in=[pk for pk, _ in rows]).delete()
+        SearchToken.objects.bulk_create(new_tokens, batch_size=batch_size)
+    return len(new_tokens)
+
+
+def index_patients(ids):
+    return _write('patient', _patient_values(id__in=list(ids)))
+
+
+def index_users(ids):
+    return _write('user', _user_values(id__in=list(ids)))
+
+
+def rebuild_index(apps=None, batch_size=1000):
+    """Recreate every search token; returns the number of tokens written"""
+    _, _, SearchToken = _models(apps)
+    with transaction.atomic():
+        SearchToken.objects.all().delete()
+        written = 0
+        for kind, rows in (('patient', _patient_values(apps)), ('user', _user_values(apps))):
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    written += _write(kind, batch, apps, batch_size)
+                    batch = []
+            written += _write(kind, batch, apps, batch_size)
+    return written
+
+
+# ---------------------------------------------------------------------------
+# Signal handlers
+# ---------------------------------------------------------------------------
+
+def _state(instance, fields):
+    values = tuple(instance.__dict__.get(field, _MISSING) for field in fields)
+    return None if _MISSING in values else values
+
+
+def _fields(instance):
+    from .models import Patient
+    return PATIENT_STATE if isinstance(instance, Patient) else USER_STATE
+
+
+def track_initial_state(sender, instance, **kwargs):
+    """post_init: remember the searchable values the row was loaded with"""
+    instance._search_state = _state(instance, _fields(instance)) if instance.pk else None
+
+
+def update_on_save(sender, instance, created, raw=False, **kwargs):
+    """post_save: re-index a row whose searchable values changed"""
+    from .models import Patient
+    fields = _fields(instance)
+    old_state = None if created else getattr(instance, '_search_state', None)
+    new_state = _state(instance, fields)
+    if old_state is not None and new_state == old_state:
+        return
+    if isinstance(instance, Patient):
+        index_patients([instance.pk])
+    else:
+        index_users([instance.pk])
+        email = USER_STATE.index('email')
+        if not created and (old_state is None or new_state is None or old_state[email] != new_state[email]):
+            # Patient tokens include the account email
+            index_patients(Patient.objects.filter(user_id=instance.pk).values_list('id', flat=True))
+    instance._search_state = new_state
+
+
+def update_on_delete(sender, instance, **kwargs):
+    """post_delete: drop the tokens of a deleted row"""
+    from .models import Patient
+    _, _, SearchToken = _models()
+    kind = 'patient' if isinstance(instance, Patient) else 'user'
+    SearchToken.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+def _kind(queryset):
+    from .models import Patient
+    return 'patient' if queryset.model is Patient else 'user'
+
+
+def terms(text):
+    """Distinct words of a search text, at most MAX_TERMS"""
+    return list(dict.fromkeys(words(text)))[:MAX_TERMS]
+
+
+def _term_tokens(kind, term):
+    """Tokens starting with `term`"""
+    _, _, SearchToken = _models()
+    # LIKE 'term%' only uses the index with some collations; the range always does
+    upper = term[:-1] + chr(ord(term[-1]) + 1)
+    return SearchToken.objects.filter(kind=kind, token__gte=term, token__lt=upper, token__startswith=term)
+
+
+def _by_selectivity(kind, search_terms):
+    """Terms ordered by the number of tokens they match, counting at most SELECTIVITY_SAMPLE each"""
+    if len(search_terms) < 2:
+        return search_terms
+    counts = {
+        term: _term_tokens(kind, term).values('pk')[:SELECTIVITY_SAMPLE].count()
+        for term in search_terms
+    }
+    return sorted(search_terms, key=counts.__getitem__)
+
+
+def search_queryset(queryset, text, rank=True):
+    """
+    Rows of a Patient or CustomUser queryset matching every word of `text`.
+    With rank, they are annotated with ``search_rank`` and ordered by it
+    before the queryset's own ordering.
+    """
+    kind = _kind(queryset)
+    search_terms = terms(text)
+    if not search_terms:
+        return queryset.none()
+    # The rarest word drives the query through the (kind, token) index; the
+    # other words are checked per candidate row through the (kind, object_id)
+    # index, so words shared by most rows ("patient", a common surname) stay cheap
+    rarest, *others = _by_selectivity(kind, search_terms)
+    queryset = queryset.filter(pk__in=_term_tokens(kind, rarest).values('object_id'))
+    for term in others:
+        queryset = queryset.filter(Exists(_term_tokens(kind, term).filter(object_id=OuterRef('pk'))))
+    return order_by_rank(queryset, text) if rank else queryset
+
+
+def order_by_rank(queryset, text):
+    """Annotate ``search_rank`` for `text` and order by it before the queryset's own ordering"""
+    kind = _kind(queryset)
+    rank = None
+    for term in terms(text):
+        best = _term_tokens(kind, term).filter(object_id=OuterRef('pk')).annotate(
+            score=Case(When(token=term, then=F('weight') * 2), default=F('weight'), output_field=IntegerField())
+        ).order_by('-score').values('score')[:1]
+        score = Coalesce(Subquery(best, output_field=IntegerField()), 0)
+        rank = score if rank is None else rank + score
+    if rank is None:
+        return queryset
+    ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+    return queryset.annotate(search_rank=rank).order_by('-search_rank', *ordering)
@@ -0,0 +1,195 @@
+"""
+Pre-creating the patient profiles of a new term.
+
+On the first day of a term every student's first request (profile setup,
+autofill, appointment booking) looked for the previous profile and created
+the new one, a few queries and an 80-field copy each, all at once. The
+rollover creates those profiles ahead of time: for each active student
+account without a profile for the target school year and semester, the
+latest profile (highest id) is copied with ``bulk_create``, leaving out the
+term-specific fields (VOLATILE_FIELDS).
+
+Work is split by user id: ``rollover_users()`` handles one id range in
+chunks, each in its own transaction with the chunk's user rows locked, and
+skips users that already have a profile for the term. Re-running a range,
+resuming after a crash or running overlapping ranges therefore never creates
+a second profile. ``queue_rollover()`` queues one background job per range,
+so several ``run_jobs`` workers share the work; the ``rollover_semester``
+command runs a range inline.
+
+bulk_create() bypasses the Patient signals, so each chunk also moves the
+latest-profile flags, the statistics counters and the search tokens, and
+drops the users' cached authentication entries.
+"""
+import logging
+import time
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Max, Min, Q
+
+from . import authentication, stats_snapshots
+from .jobs import enqueue_jobs, job_handler
+from .search import index_patients
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = 'semester_rollover'
+CHUNK_SIZE = 500
+RANGE_SIZE = 5000
+SEMESTERS = ('1st_semester', '2nd_semester', 'summer')
+# Fields that belong to one term (or to the row) and are not copied
+VOLATILE_FIELDS = {
+    'id', 'user_id', 'school_year_id', 'semester', 'semester_id', 'created_at', 'updated_at', 'is_latest_profile',
+    'age', 'past_conditions_this_year', 'staff_notes', 'record_completion_status', 'uhs_template_compliant',
+}
+
+
+def _copied_fields():
+    from .models import Patient
+    return [field.attname for field in Patient._meta.concrete_fields if field.attname not in VOLATILE_FIELDS]
+
+
+def eligible_users():
+    """Accounts that get a profile for every term"""
+    from .models import CustomUser
+    return CustomUser.objects.filter(is_active=True, user_type='student')
+
+
+def user_ranges(range_size=RANGE_SIZE):
+    """[(first user id, last user id)] covering every eligible user"""
+    bounds = eligible_users().aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return []
+    return [
+        (start, min(start + range_size - 1, bounds['last']))
+        for start in range(bounds['first'], bounds['last'] + 1, range_size)
+    ]
+
+
+def _age(date_of_birth, today):
+    # Same computation as Patient.get_age()
+    return (today - date_of_birth).days // 365 if date_of_birth else None
+
+
+def _rollover_chunk(user_ids, school_year_id, semester, fields, today):
+    from .models import Patient
+
+    result = Counter(users=len(user_ids))
+    done = set(
+        Patient.objects.filter(user_id__in=user_ids, school_year_id=school_year_id, semester=semester)
+        .values_list('user_id', flat=True)
+    )
+    result['existing'] = len(done)
+    todo = [pk for pk in user_ids if pk not in done]
+    if not todo:
+        return result
+
+    latest_ids = (
+        Patient.objects.filter(user_id__in=todo).values('user_id').annotate(latest_id=Max('id'))
+        .order_by().values_list('latest_id', flat=True)
+    )
+    sources = list(
+        Patient.objects.filter(pk__in=list(latest_ids)).select_related('user').only('user__email', *fields)
+        .order_by('user_id')
+    )
+    result['without_profile'] = len(todo) - len(sources)
+    if not sources:
+        return result
+
+    # Latest-profile groups (profile email, else account email) the new rows join
+    keys = [source.email if source.email is not None else source.user.email or '' for source in sources]
+    stale = list(
+        Patient.objects.filter(is_latest_profile=True)
+        .filter(Q(email__in=keys) | Q(email__isnull=True, user__email__in=keys))
+        .values_list('id', flat=True)
+    )
+    # Rows are inserted in list order, so the last row of a group gets its highest id
+    last_of_key = {key: index for index, key in enumerate(keys)}
+
+    profiles = []
+    for index, source in enumerate(sources):
+        values = {field: getattr(source, field) for field in fields}
+        values['age'] = _age(source.date_of_birth, today)
+        profiles.append(Patient(
+            **values, user_id=source.user_id, school_year_id=school_year_id, semester=semester,
+            is_latest_profile=last_of_key[keys[index]] == index,
+        ))
+    Patient.objects.bulk_create(profiles, batch_size=CHUNK_SIZE)
+    result['created'] = len(profiles)
+
+    # MariaDB returns no ids from a bulk insert: read them back
+    created_ids = list(
+        Patient.objects.filter(user_id__in=[source.user_id for source in sources], school_year_id=school_year_id,
+                               semester=semester).values_list('id', flat=True)
+    )
+    if stale:
+        Patient.objects.filter(pk__in=stale).update(is_latest_profile=False)
+    stats_snapshots.apply_deltas(Counter(
+        stats_snapshots.patient_key(school_year_id, semester, profile.user_type) for profile in profiles
+    ))
+    index_patients(created_ids)
+    authentication.invalidate(source.user_id for source in sources)
+    return result
+
+
+def rollover_users(school_year_id, semester, first_user_id=None, last_user_id=None, chunk_size=CHUNK_SIZE,
+                   progress=None):
+    """
+    Create the term's profile of every eligible user in the id range.
+
+    `progress` is called after each chunk with (totals so far, seconds
+    elapsed). Returns a Counter of 'users', 'created', 'existing' (already
+    had a profile for the term) and 'without_profile' (nothing to copy).
+    """
+    from .models import CustomUser
+    from django.utils import timezone
+
+    if semester not in SEMESTERS:
+        raise ValueError(f'Unknown semester {semester!r}')
+    fields = _copied_fields()
+    today = timezone.localdate()
+    users = eligible_users()
+    if last_user_id is not None:
+        users = users.filter(pk__lte=last_user_id)
+    cursor = first_user_id if first_user_id is not None else 0
+    totals = Counter()
+    started = time.monotonic()
+    while True:
+        with transaction.atomic():
+            user_ids = list(users.filter(pk__gte=cursor).order_by('pk').values_list('id', flat=True)[:chunk_size])
+            if not user_ids:
+                break
+            # Concurrent runs over the same users wait here instead of both creating profiles
+            list(CustomUser.objects.select_for_update().filter(pk__in=user_ids).values_list('id', flat=True))
+            totals.update(_rollover_chunk(user_ids, school_year_id, semester, fields, today))
+        cursor = user_ids[-1] + 1
+        if progress is not None:
+            progress(totals, time.monotonic() - started)
+        if len(user_ids) < chunk_size:
+            break
+    logger.info(
+        'Semester rollover to school year %s %s for users %s-%s: %s',
+        school_year_id, semester, first_user_id, last_user_id, dict(totals),
+    )
+    return totals
+
+
+def queue_rollover(school_year_id, semester, user=None, range_size=RANGE_SIZE):
+    """Queue one rollover job per user id range; returns (batch id, number of jobs)"""
+    if semester not in SEMESTERS:
+        raise ValueError(f'Unknown semester {semester!r}')
+    payloads = [
+        {'school_year': school_year_id, 'semester': semester, 'first_user_id': first, 'last_user_id': last}
+        for first, last in user_ranges(range_size)
+    ]
+    return enqueue_jobs(JOB_KIND, payloads, user=user), len(payloads)
+
+
+@job_handler(JOB_KIND)
+def rollover_range(job):
+    payload = job.payload
+    totals = rollover_users(
+        payload['school_year'], payload['semester'], payload['first_user_id'], payload['last_user_id'],
+    )
+    return {**payload, **totals}
@@ -2,12 +2,17 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count, F
+from django.db.models import Count, F
 from django.utils import timezone
 from datetime import date, timedelta
+import uuid
 from .models import AcademicSchoolYear, Patient, Appointment, MedicalDocument, DentalFormData, CustomUser
 from .serializers import AcademicSchoolYearSerializer, PatientSerializer
+from .school_year_cache import current_semester as current_semester_cached
+from .exports import export_response, semester_profile_columns
+from .search import search_queryset
 
 
 class AcademicSemesterViewSet(viewsets.ModelViewSet):
@@ -35,7 +40,7 @@ class AcademicSemesterViewSet(viewsets.ModelViewSet):
     def current(self, request):
         """Get the current active semester"""
         try:
-            current_year = AcademicSchoolYear.objects.get(is_current=True)
+            current_year = AcademicSchoolYear.get_current()
             serializer = self.get_serializer(current_year)
             return Response(serializer.data)
         except AcademicSchoolYear.DoesNotExist:
@@ -75,11 +80,7 @@ class AcademicSemesterViewSet(viewsets.ModelViewSet):
         # Additional filters
         search = request.query_params.get('search')
         if search:
-            patients_queryset = patients_queryset.filter(
-                Q(name__icontains=search) |
-                Q(student_id__icontains=search) |
-                Q(email__icontains=search)
-            )
+            patients_queryset = search_queryset(patients_queryset, search)
         
         serializer = PatientSerializer(patients_queryset, many=True)
         return Response(serializer.data)
@@ -92,41 +93,9 @@ class AcademicSemesterViewSet(viewsets.ModelViewSet):
         # Get semester parameter
         semester = request.query_params.get('semester')
         
-        # Base queryset for patients
-        patients_base = Patient.objects.filter(school_year=school_year)
-        if semester:
-            patients_base = patients_base.filter(semester=semester)
-        
-        # Base queryset for appointments
-        appointments_base = Appointment.objects.filter(school_year=school_year)
-        if semester:
-            appointments_base = appointments_base.filter(semester=semester)
-        
-        # Calculate statistics
-        stats = {
-            'total_patients': patients_base.count(),
-            'patients_by_semester': {
-                '1st_semester': patients_base.filter(semester='1st_semester').count(),
-                '2nd_semester': patients_base.filter(semester='2nd_semester').count(),
-                'summer': patients_base.filter(semester='summer').count(),
-            },
-            'total_appointments': appointments_base.count(),
-            'appointments_by_status': {
-                'pending': appointments_base.filter(status='pending').count(),
-                'confirmed': appointments_base.filter(status='confirmed').count(),
-                'completed': appointments_base.filter(status='completed').count(),
-                'cancelled': appointments_base.filter(status='cancelled').count(),
-            },
-            'appointments_by_type': {
-                'medical': appointments_base.filter(type='medical').count(),
-                'dental': appointments_base.filter(type='dental').count(),
-            },
-            'appointments_by_semester': {
-                '1st_semester': appointments_base.filter(semester='1st_semester').count(),
-                '2nd_semester': appointments_base.filter(semester='2nd_semester').count(),
-                'summer': appointments_base.filter(semester='summer').count(),
-            }
-        }
+        # Counters are read from the materialized statistics snapshots
+        from .stats_snapshots import school_year_statistics
+        stats = school_year_statistics(school_year, semester)
         
         return Response(stats)
     
@@ -145,6 +114,51 @@ class AcademicSemesterViewSet(viewsets.ModelViewSet):
         
         serializer = self.get_serializer(school_year)
         return Response(serializer.data)
+    
+    @action(detail=True, methods=['post'])
+    def rollover(self, request, pk=None):
+        """
+        Queue the creation of this school year's profiles for a semester from
+        every active student's latest profile (staff only); poll rollover_status
+        with the returned batch_id
+        """
+        if not (request.user.is_staff or request.user.user_type in ['staff', 'admin']):
+            raise PermissionDenied("Only staff can roll profiles over to a new semester")
+        
+        from .semester_rollover import SEMESTERS, queue_rollover
+        
+        school_year = self.get_object()
+        semester = request.data.get('semester')
+        if semester not in SEMESTERS:
+            return Response({
+                'detail': f"semester must be one of: {', '.join(SEMESTERS)}."
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        batch_id, jobs = queue_rollover(school_year.pk, semester, user=request.user)
+        return Response({
+            'batch_id': str(batch_id),
+            'jobs': jobs,
+            'school_year': school_year.pk,
+            'semester': semester,
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['get'])
+    def rollover_status(self, request):
+        """Poll the progress of a rollover batch (staff only)"""
+        if not (request.user.is_staff or request.user.user_type in ['staff', 'admin']):
+            raise PermissionDenied("Only staff can view semester rollover progress")
+        
+        batch_id = request.query_params.get('batch_id')
+        try:
+            batch_id = uuid.UUID(str(batch_id))
+        except ValueError:
+            return Response({
+                'detail': 'A valid batch_id is required.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        from .jobs import batch_progress
+        
+        return Response({'batch_id': str(batch_id), **batch_progress(batch_id)})
 
 
 class StudentSemesterProfileViewSet(viewsets.ReadOnlyModelViewSet):
@@ -174,11 +188,8 @@ class StudentSemesterProfileViewSet(viewsets.ReadOnlyModelViewSet):
         # Search functionality
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(student_id__icontains=search) |
-                Q(email__icontains=search)
-            )
+            # Best matches first, newest first among equal matches
+            return search_queryset(queryset.order_by('-created_at'), search)
         
         return queryset.order_by('-created_at')
     
@@ -242,42 +253,21 @@ class StudentSemesterProfileViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'])
     def export_data(self, request):
-        """Export semester profile data for reporting"""
-        school_year_id = request.query_params.get('school_year')
-        semester = request.query_params.get('semester')
-        
-        queryset = self.get_queryset()
-        
-        if school_year_id:
-            queryset = queryset.filter(school_year_id=school_year_id)
-        
-        if semester:
-            queryset = queryset.filter(semester=semester)
-        
-        # Prepare export data
-        export_data = []
-        for patient in queryset:
-            export_data.append({
-                'student_id': patient.student_id,
-                'name': patient.name,
-                'email': patient.email,
-                'semester': patient.get_semester_display(),
-                'school_year': patient.school_year.academic_year if patient.school_year else 'N/A',
-                'gender': patient.gender,
-                'department': patient.department,
-                'contact_number': patient.contact_number,
-                'created_at': patient.created_at.isoformat(),
-            })
-        
-        return Response(export_data)
+        """
+        Export semester profile data for reporting, streamed as JSON (default),
+        CSV or XLSX with ?file_format=
+        """
+        return export_response(
+            request, self.get_queryset(), semester_profile_columns(), 'semester_profiles', default_format='json',
+        )
 
 
 # Additional helper functions for semester management
 def get_current_semester_info():
     """Helper function to get current semester information"""
     try:
-        current_year = AcademicSchoolYear.objects.get(is_current=True)
-        current_semester = current_year.get_current_semester()
+        current_year = AcademicSchoolYear.get_current()
+        current_semester = current_semester_cached()
         
         return {
             'school_year': current_year,
@@ -8,8 +8,9 @@ from .models import (
     CampusSchedule, DentistSchedule, AcademicSchoolYear,
     ComorbidIllness, Vaccination, PastMedicalHistoryItem, FamilyMedicalHistoryItem,
     DentalInformationRecord, DentalMedicineSupply, UserTypeInformation, ContentManagement,
-    Announcement, UserAnnouncementView, Course
+    Announcement, UserAnnouncementView, Course, WaitlistEntry
 )
+from .fieldsets import SparseFieldsetMixin
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -64,7 +65,7 @@ class SignupSerializer(serializers.ModelSerializer):
             # Try to get current school year
             try:
                 from .models import AcademicSchoolYear
-                current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                current_school_year = AcademicSchoolYear.get_current()
             except AcademicSchoolYear.DoesNotExist:
                 current_school_year = None
             
@@ -106,7 +107,7 @@ class EmailVerificationSerializer(serializers.Serializer):
     token = serializers.CharField()
 
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user_email = serializers.CharField(source='user.email', read_only=True)
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     user_first_name = serializers.CharField(source='user.first_name', read_only=True)
@@ -128,7 +129,7 @@ class PatientSerializer(serializers.ModelSerializer):
         # For legacy patients without school_year, return current semester
         from .models import AcademicSchoolYear
         try:
-            current_semester = AcademicSchoolYear.objects.get(is_current=True)
+            current_semester = AcademicSchoolYear.get_current()
             return {
                 'id': current_semester.id,
                 'academic_year': current_semester.academic_year,
@@ -160,6 +161,24 @@ class PatientSerializer(serializers.ModelSerializer):
             # User type fields
             'user_type', 'employee_id', 'position_type', 'course', 'year_level', 'strand'
         ]
+        # Columns read by fields that are not model column paths (see api.fieldsets)
+        field_sources = {
+            'user_name': ['user__first_name', 'user__last_name'],
+            'school_year': ['school_year__id', 'school_year__academic_year', 'school_year__semester_type',
+                            'school_year__is_current'],
+        }
+
+
+class PatientSummarySerializer(PatientSerializer):
+    """Columns of the admin patient tables (?view=summary)"""
+
+    class Meta(PatientSerializer.Meta):
+        fields = [
+            'id', 'user', 'student_id', 'name', 'first_name', 'middle_name', 'suffix', 'photo', 'gender',
+            'date_of_birth', 'age', 'department', 'course', 'year_level', 'strand', 'user_type', 'employee_id',
+            'position_type', 'contact_number', 'email', 'blood_type', 'nationality', 'nationality_specify',
+            'user_email', 'user_name', 'school_year', 'created_at', 'updated_at',
+        ]
 
 
 class MedicalRecordSerializer(serializers.ModelSerializer):
@@ -171,7 +190,24 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentListSerializer(serializers.ListSerializer):
+    """
+    Resolves the per-appointment lookups of AppointmentSerializer in bulk:
+    one query for the issued certificates of every patient in the list and,
+    when the queryset was not annotated, one query per form type.
+    """
+    
+    def to_representation(self, data):
+        from django.db.models.manager import BaseManager
+        appointments = list(data.all() if isinstance(data, BaseManager) else data)
+        self.child.prefetch_lookups(appointments)
+        try:
+            return super().to_representation(appointments)
+        finally:
+            self.child.clear_lookups()
+
+
+class AppointmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.name', read_only=True)
     doctor_name = serializers.CharField(source='doctor.get_full_name', read_only=True)
     rescheduled_by_name = serializers.CharField(source='rescheduled_by.get_full_name', read_only=True)
@@ -187,83 +223,129 @@ class AppointmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Appointment
         fields = '__all__'
+        list_serializer_class = AppointmentListSerializer
+        # Columns read by fields that are not model column paths (see api.fieldsets)
+        field_sources = {
+            'doctor_name': ['doctor__first_name', 'doctor__last_name'],
+            'rescheduled_by_name': ['rescheduled_by__first_name', 'rescheduled_by__last_name'],
+            'was_rescheduled_by_admin': ['is_rescheduled', 'rescheduled_by__is_staff', 'rescheduled_by__user_type'],
+            'was_rescheduled_by_patient': ['is_rescheduled', 'rescheduled_by__id', 'patient__user__id'],
+            'has_form_data': ['type'],
+            'form_type': ['type'],
+            'has_medical_certificate': [],
+            'medical_certificate_url': [],
+            'semester_display': ['semester'],
+        }
     
-    def get_has_form_data(self, obj):
-        """Check if appointment has associated form data"""
+    # Bulk lookups filled in by AppointmentListSerializer
+    _certificates_by_year = None
+    _first_certificate = None
+    _form_data_ids = None
+    
+    def prefetch_lookups(self, appointments):
+        """Load issued certificates (and form data flags if not annotated) for a list of appointments"""
+        patient_ids = {appointment.patient_id for appointment in appointments if appointment.patient_id}
+        self._certificates_by_year = {}
+        self._first_certificate = {}
+        if patient_ids:
+            documents = (
+                MedicalDocument.objects
+                .filter(patient_id__in=patient_ids, status='issued')
+                .only('id', 'patient_id', 'academic_year_id', 'medical_certificate')
+                .order_by('pk')
+            )
+            # Lowest pk first, like the .first() lookups of a single appointment
+            for document in documents:
+                self._certificates_by_year.setdefault((document.patient_id, document.academic_year_id), document)
+                self._first_certificate.setdefault(document.patient_id, document)
+        
+        if appointments and not hasattr(appointments[0], 'has_dental_form_data'):
+            appointment_ids = [appointment.pk for appointment in appointments]
+            self._form_data_ids = {
+                'dental': set(DentalFormData.objects.filter(appointment_id__in=appointment_ids).values_list('appointment_id', flat=True)),
+                'medical': set(MedicalFormData.objects.filter(appointment_id__in=appointment_ids).values_list('appointment_id', flat=True)),
+            }
+    
+    def clear_lookups(self):
+        self._certificates_by_year = None
+        self._first_certificate = None
+        self._form_data_ids = None
+    
+    def _has_form(self, obj):
+        """Whether the appointment has form data of its own type"""
+        if obj.type not in ('dental', 'medical'):
+            return False
+        annotated = getattr(obj, f'has_{obj.type}_form_data', None)
+        if annotated is not None:
+            return annotated
+        if self._form_data_ids is not None:
+            return obj.pk in self._form_data_ids[obj.type]
         if obj.type == 'dental':
             return obj.dental_form_data.exists()
-        elif obj.type == 'medical':
-            return obj.medical_form_data.exists()
-        return False
+        return obj.medical_form_data.exists()
+    
+    def _issued_certificate(self, obj):
+        """
+        Issued medical document of the appointment's patient: the one for the
+        appointment's school year, otherwise any issued one for the patient.
+        """
+        if not obj.patient_id:
+            return None
+        if self._certificates_by_year is not None:
+            medical_doc = None
+            if obj.school_year_id:
+                medical_doc = self._certificates_by_year.get((obj.patient_id, obj.school_year_id))
+            return medical_doc or self._first_certificate.get(obj.patient_id)
+        
+        if not hasattr(obj, '_issued_certificate_cache'):
+            medical_doc = None
+            if obj.school_year_id:
+                medical_doc = MedicalDocument.objects.filter(
+                    patient_id=obj.patient_id,
+                    status='issued',
+                    academic_year_id=obj.school_year_id
+                ).first()
+            if not medical_doc:
+                medical_doc = MedicalDocument.objects.filter(
+                    patient_id=obj.patient_id,
+                    status='issued'
+                ).first()
+            obj._issued_certificate_cache = medical_doc
+        return obj._issued_certificate_cache
+    
+    def get_has_form_data(self, obj):
+        """Check if appointment has associated form data"""
+        return self._has_form(obj)
     
     def get_form_type(self, obj):
         """Get the form type for the appointment"""
-        if obj.type == 'dental' and obj.dental_form_data.exists():
-            return 'dental'
-        elif obj.type == 'medical' and obj.medical_form_data.exists():
-            return 'medical'
-        return None
+        return obj.type if self._has_form(obj) else None
     
     def get_has_medical_certificate(self, obj):
         """Check if appointment has an associated medical certificate"""
-        if obj.patient:
-            # Check if patient has an issued medical certificate for the same academic year
-            from .models import MedicalDocument
-            try:
-                # First, try to find by exact academic year match
-                medical_doc = None
-                if obj.school_year:
-                    medical_doc = MedicalDocument.objects.filter(
-                        patient=obj.patient,
-                        status='issued',
-                        academic_year=obj.school_year
-                    ).first()
-                
-                # If no exact match and school_year is not set, try to find any issued certificate for this patient
-                if not medical_doc:
-                    medical_doc = MedicalDocument.objects.filter(
-                        patient=obj.patient,
-                        status='issued'
-                    ).first()
-                
-                return medical_doc is not None and bool(medical_doc.medical_certificate)
-            except Exception as e:
-                # Log the error for debugging
-                print(f"Error checking medical certificate for appointment {obj.id}: {e}")
-                return False
-        return False
+        medical_doc = self._issued_certificate(obj)
+        return medical_doc is not None and bool(medical_doc.medical_certificate)
     
     def get_medical_certificate_url(self, obj):
         """Get the URL for the medical certificate if available"""
-        if obj.patient:
-            # Check if patient has an issued medical certificate for the same academic year
-            from .models import MedicalDocument
-            try:
-                # First, try to find by exact academic year match
-                medical_doc = None
-                if obj.school_year:
-                    medical_doc = MedicalDocument.objects.filter(
-                        patient=obj.patient,
-                        status='issued',
-                        academic_year=obj.school_year
-                    ).first()
-                
-                # If no exact match and school_year is not set, try to find any issued certificate for this patient
-                if not medical_doc:
-                    medical_doc = MedicalDocument.objects.filter(
-                        patient=obj.patient,
-                        status='issued'
-                    ).first()
-                
-                if medical_doc and medical_doc.medical_certificate:
-                    return medical_doc.medical_certificate.url
-            except Exception as e:
-                # Log the error for debugging
-                print(f"Error getting medical certificate URL for appointment {obj.id}: {e}")
-                pass
+        medical_doc = self._issued_certificate(obj)
+        if medical_doc and medical_doc.medical_certificate:
+            return medical_doc.medical_certificate.url
         return None
 
 
+
+class AppointmentSummarySerializer(AppointmentSerializer):
+    """Columns of the admin consultation tables (?view=summary)"""
+
+    class Meta(AppointmentSerializer.Meta):
+        fields = [
+            'id', 'patient', 'patient_name', 'doctor', 'doctor_name', 'appointment_date', 'appointment_time',
+            'purpose', 'status', 'type', 'campus', 'school_year', 'school_year_display', 'semester',
+            'semester_display', 'is_rescheduled', 'has_form_data', 'form_type', 'created_at', 'updated_at',
+        ]
+
+
 class InventorySerializer(serializers.ModelSerializer):
     last_restocked_by_name = serializers.CharField(source='last_restocked_by.get_full_name', read_only=True)
     
@@ -1162,3 +1244,23 @@ class UserAnnouncementViewSerializer(serializers.ModelSerializer):
         model = UserAnnouncementView
         fields = ['id', 'user', 'announcement', 'announcement_title', 'viewed_at']
         read_only_fields = ['id', 'announcement_title', 'viewed_at']
+
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    """Serializer for WaitlistEntry model"""
+    patient_name = serializers.CharField(source='patient.name', read_only=True)
+    position = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = WaitlistEntry
+        fields = [
+            'id', 'patient', 'patient_name', 'campus', 'date', 'type', 'purpose', 'concern',
+            'priority', 'status', 'position', 'appointment', 'note', 'created_at', 'promoted_at'
+        ]
+        read_only_fields = ['status', 'position', 'appointment', 'note', 'created_at', 'promoted_at']
+        # Patients join with their own profile; only staff pass a patient
+        extra_kwargs = {'patient': {'required': False}}
+    
+    def get_position(self, obj):
+        from .waitlist import position
+        return position(obj)
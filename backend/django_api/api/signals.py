@@ -0,0 +1,87 @@
+"""
+Signal wiring for the api app.
+
+Handlers live next to the feature they maintain; this module only connects
+them and is imported from ApiConfig.ready().
+"""
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+
+from . import (
+    announcements, authentication, booking, content_cache, medicine_usage, patient_profiles, scheduling, school_year_cache,
+    search, slot_occupancy, stats_snapshots, waitlist,
+)
+from .models import (
+    AcademicSchoolYear, Announcement, Appointment, CampusClosure, CampusSchedule, ContentManagement, CustomUser,
+    DentalFormData, DentistSchedule, MedicalDocument, Patient, StaffDetails,
+)
+
+
+# Statistics counters (StatsSnapshot)
+for _model in (Appointment, MedicalDocument, Patient, CustomUser):
+    post_init.connect(stats_snapshots.track_initial_state, sender=_model, dispatch_uid=f'stats_init_{_model.__name__}')
+    pre_save.connect(stats_snapshots.capture_previous_state, sender=_model, dispatch_uid=f'stats_pre_save_{_model.__name__}')
+    post_save.connect(stats_snapshots.update_on_save, sender=_model, dispatch_uid=f'stats_save_{_model.__name__}')
+    post_delete.connect(stats_snapshots.update_on_delete, sender=_model, dispatch_uid=f'stats_delete_{_model.__name__}')
+
+
+# Latest patient profile flag (Patient.is_latest_profile)
+post_init.connect(patient_profiles.track_profile_email, sender=Patient, dispatch_uid='latest_profile_init')
+post_save.connect(patient_profiles.update_on_save, sender=Patient, dispatch_uid='latest_profile_save')
+post_delete.connect(patient_profiles.update_on_delete, sender=Patient, dispatch_uid='latest_profile_delete')
+
+
+# Cached request users (CachedJWTAuthentication)
+for _model in (CustomUser, StaffDetails, Patient):
+    post_save.connect(authentication.invalidate_on_change, sender=_model, dispatch_uid=f'auth_cache_save_{_model.__name__}')
+    post_delete.connect(authentication.invalidate_on_change, sender=_model, dispatch_uid=f'auth_cache_delete_{_model.__name__}')
+
+
+# Current school year cache
+post_save.connect(school_year_cache.invalidate_on_change, sender=AcademicSchoolYear, dispatch_uid='school_year_cache_save')
+post_delete.connect(school_year_cache.invalidate_on_change, sender=AcademicSchoolYear, dispatch_uid='school_year_cache_delete')
+
+
+# Rendered public content payloads
+post_save.connect(content_cache.invalidate_on_change, sender=ContentManagement, dispatch_uid='content_cache_save')
+post_delete.connect(content_cache.invalidate_on_change, sender=ContentManagement, dispatch_uid='content_cache_delete')
+
+
+# Compiled staff scheduling calendar
+for _model in (StaffDetails, DentistSchedule, CampusSchedule, CampusClosure):
+    post_save.connect(scheduling.invalidate_on_change, sender=_model, dispatch_uid=f'scheduling_save_{_model.__name__}')
+    post_delete.connect(scheduling.invalidate_on_change, sender=_model, dispatch_uid=f'scheduling_delete_{_model.__name__}')
+
+
+# Slot reservations and daily booking counters; connected before the
+# occupancy index so a rejected booking fails before the index is touched
+post_init.connect(booking.track_initial_state, sender=Appointment, dispatch_uid='booking_init')
+pre_save.connect(booking.capture_previous_state, sender=Appointment, dispatch_uid='booking_pre_save')
+post_save.connect(booking.update_on_save, sender=Appointment, dispatch_uid='booking_save')
+post_delete.connect(booking.update_on_delete, sender=Appointment, dispatch_uid='booking_delete')
+
+
+# Appointment slot occupancy index (SlotOccupancy)
+post_init.connect(slot_occupancy.track_initial_state, sender=Appointment, dispatch_uid='slot_occupancy_init')
+pre_save.connect(slot_occupancy.capture_previous_state, sender=Appointment, dispatch_uid='slot_occupancy_pre_save')
+post_save.connect(slot_occupancy.update_on_save, sender=Appointment, dispatch_uid='slot_occupancy_save')
+post_delete.connect(slot_occupancy.update_on_delete, sender=Appointment, dispatch_uid='slot_occupancy_delete')
+
+
+# Waitlist backfill of released slots
+booking.slot_released.connect(waitlist.queue_backfill_on_release, dispatch_uid='waitlist_backfill_on_release')
+
+
+# Normalized announcement targeting (AnnouncementTarget)
+post_save.connect(announcements.update_on_save, sender=Announcement, dispatch_uid='announcement_targets_save')
+
+
+# Search index (SearchToken)
+for _model in (Patient, CustomUser):
+    post_init.connect(search.track_initial_state, sender=_model, dispatch_uid=f'search_init_{_model.__name__}')
+    post_save.connect(search.update_on_save, sender=_model, dispatch_uid=f'search_save_{_model.__name__}')
+    post_delete.connect(search.update_on_delete, sender=_model, dispatch_uid=f'search_delete_{_model.__name__}')
+
+
+# Dental medicine usage line items (DentalMedicineUsage)
+post_init.connect(medicine_usage.track_initial_state, sender=DentalFormData, dispatch_uid='medicine_usage_init')
+post_save.connect(medicine_usage.update_on_save, sender=DentalFormData, dispatch_uid='medicine_usage_save')
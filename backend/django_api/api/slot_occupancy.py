@@ -0,0 +1,269 @@
+"""
+Appointment slot occupancy index (SlotOccupancy).
+
+The booking page asks for the free slots of many dates while a student
+browses the calendar. Instead of generating the slot grid and querying the
+appointments of every date, each (campus, date, appointment type) has one row
+holding the number of active appointments per slot of the day grid. Rows are
+adjusted from the Appointment signals (see api/signals.py) when an appointment
+is booked, moved or cancelled, and can be rebuilt or checked for drift with
+the ``rebuild_slot_occupancy`` management command.
+
+Slots are booked per appointment type while the daily limit is shared by all
+types of a campus, so reads take the slot counts of one type and the booked
+total of all of them.
+"""
+import logging
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.utils.dateparse import parse_date, parse_time
+
+logger = logging.getLogger(__name__)
+
+MAX_APPOINTMENTS_PER_DAY = 20
+SLOT_MINUTES = 20
+WORKING_HOURS_START = time(8, 0)   # 8:00 AM
+WORKING_HOURS_END = time(17, 0)    # 5:00 PM
+LUNCH_BREAK_START = time(12, 0)    # 12:00 PM
+LUNCH_BREAK_END = time(13, 0)      # 1:00 PM
+
+# Appointment statuses that hold their slot
+ACTIVE_STATUSES = ('pending', 'confirmed', 'scheduled')
+
+TRACKED_FIELDS = ('campus', 'appointment_date', 'type', 'appointment_time', 'status')
+
+_MISSING = object()
+
+
+def _generate_slot_times():
+    slots = []
+    current = datetime.combine(date.min, WORKING_HOURS_START)
+    while current.time() < WORKING_HOURS_END:
+        if not (LUNCH_BREAK_START <= current.time() < LUNCH_BREAK_END):
+            slots.append(current.time())
+        current += timedelta(minutes=SLOT_MINUTES)
+    return tuple(slots)
+
+
+# The 20-minute slots of a working day, and the position of each in a row
+SLOT_TIMES = _generate_slot_times()
+SLOT_INDEX = {slot: index for index, slot in enumerate(SLOT_TIMES)}
+
+
+def _model(apps=None):
+    if apps is not None:
+        return apps.get_model('api', 'SlotOccupancy')
+    from .models import SlotOccupancy
+    return SlotOccupancy
+
+
+def _grid(slots):
+    """Stored slot counts padded/truncated to the current grid"""
+    slots = list(slots or [])[:len(SLOT_TIMES)]
+    return slots + [0] * (len(SLOT_TIMES) - len(slots))
+
+
+def as_date(value):
+    return parse_date(value) if isinstance(value, str) else value
+
+
+def as_time(value):
+    return parse_time(value) if isinstance(value, str) else value
+
+
+def slot_entry(campus, appointment_date, type, appointment_time, status):
+    """
+    ((campus, date, type), slot index) held by an appointment, or None when it
+    holds no slot. The index is None for times outside the slot grid.
+    """
+    if status not in ACTIVE_STATUSES or not appointment_date:
+        return None
+    key = (campus or '', as_date(appointment_date), type or '')
+    return key, SLOT_INDEX.get(as_time(appointment_time))
+
+
+# ---------------------------------------------------------------------------
+# Incremental maintenance
+# ---------------------------------------------------------------------------
+
+def _state(instance):
+    """Tracked field values of an appointment, or None when some are deferred"""
+    values = tuple(instance.__dict__.get(field, _MISSING) for field in TRACKED_FIELDS)
+    return None if _MISSING in values else values
+
+
+def apply_deltas(deltas):
+    """
+    Apply {(campus, date, type): {slot index: delta}} to the occupancy rows,
+    creating missing rows. Rows are locked in key order.
+    """
+    SlotOccupancy = _model()
+    for (campus, day, type_), changes in sorted(deltas.items()):
+        changes = {index: delta for index, delta in changes.items() if delta}
+        if not changes:
+            continue
+        with transaction.atomic():
+            row = _locked_row(SlotOccupancy, campus, day, type_)
+            counts = _grid(row.slots)
+            for index, delta in changes.items():
+                if index is None:
+                    row.off_grid += delta
+                else:
+                    counts[index] += delta
+            row.slots = counts
+            row.booked = sum(counts) + row.off_grid
+            row.save(update_fields=['slots', 'off_grid', 'booked', 'updated_at'])
+
+
+def _locked_row(SlotOccupancy, campus, day, type_):
+    fields = {'campus': campus, 'date': day, 'type': type_}
+    row = SlotOccupancy.objects.select_for_update().filter(**fields).first()
+    if row is not None:
+        return row
+    try:
+        with transaction.atomic():
+            return SlotOccupancy.objects.create(slots=_grid([]), **fields)
+    except IntegrityError:
+        # Created concurrently by another writer
+        return SlotOccupancy.objects.select_for_update().get(**fields)
+
+
+def moves(old_state, new_state):
+    """Occupancy deltas of an appointment going from old_state to new_state (either may be None)"""
+    deltas = {}
+    for state, delta in ((old_state, -1), (new_state, 1)):
+        entry = slot_entry(*state) if state else None
+        if entry is not None:
+            key, index = entry
+            deltas.setdefault(key, Counter())[index] += delta
+    return deltas
+
+
+def track_initial_state(sender, instance, **kwargs):
+    """post_init: remember the slot the appointment was loaded with"""
+    instance._slot_state = _state(instance) if instance.pk else None
+
+
+def capture_previous_state(sender, instance, raw=False, **kwargs):
+    """pre_save: load the stored values when the appointment was loaded with deferred fields"""
+    if instance.pk and not instance._state.adding and getattr(instance, '_slot_state', None) is None:
+        row = sender._base_manager.filter(pk=instance.pk).values_list(*TRACKED_FIELDS).first()
+        instance._slot_state = tuple(row) if row else None
+
+
+def update_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """post_save: move the appointment between slots when it was booked, moved or cancelled"""
+    old_state = None if created else getattr(instance, '_slot_state', None)
+    if not created and old_state is None:
+        logger.debug('Skipping slot occupancy update for appointment %s: unknown previous state', instance.pk)
+        return
+    if created:
+        new_state = _state(instance)
+    else:
+        # Only columns written by this save can have changed
+        new_state = tuple(
+            instance.__dict__.get(field, old_value)
+            if update_fields is None or field in update_fields
+            else old_value
+            for field, old_value in zip(TRACKED_FIELDS, old_state)
+        )
+        if new_state == old_state:
+            return
+    apply_deltas(moves(old_state, new_state))
+    instance._slot_state = new_state
+
+
+def update_on_delete(sender, instance, **kwargs):
+    """post_delete: free the slot of a deleted appointment"""
+    state = getattr(instance, '_slot_state', None) or _state(instance)
+    if state is not None:
+        apply_deltas(moves(state, None))
+
+
+# ---------------------------------------------------------------------------
+# Rebuild / drift check
+# ---------------------------------------------------------------------------
+
+def compute_expected(apps=None):
+    """{(campus, date, type): (slot counts, off grid)} recounted from the appointments"""
+    if apps is not None:
+        Appointment = apps.get_model('api', 'Appointment')
+    else:
+        from .models import Appointment
+    rows = (
+        Appointment.objects.filter(status__in=ACTIVE_STATUSES)
+        .values_list('campus', 'appointment_date', 'type', 'appointment_time')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    expected = {}
+    for campus, day, type_, slot_time, n in rows:
+        counts, off_grid = expected.setdefault((campus or '', day, type_ or ''), (_grid([]), [0]))
+        index = SLOT_INDEX.get(slot_time)
+        if index is None:
+            off_grid[0] += n
+        else:
+            counts[index] += n
+    return {key: (counts, off_grid[0]) for key, (counts, off_grid) in expected.items()}
+
+
+def find_drift(apps=None):
+    """Return {key: (stored booked, expected booked)} for every row that disagrees with the appointments"""
+    expected = compute_expected(apps)
+    stored = {
+        (campus, day, type_): (_grid(slots), off_grid)
+        for campus, day, type_, slots, off_grid in _model(apps).objects.values_list(
+            'campus', 'date', 'type', 'slots', 'off_grid'
+        )
+    }
+    empty = (_grid([]), 0)
+    drift = {}
+    for key in set(expected) | set(stored):
+        current, wanted = stored.get(key, empty), expected.get(key, empty)
+        if current != wanted:
+            drift[key] = (sum(current[0]) + current[1], sum(wanted[0]) + wanted[1])
+    return drift
+
+
+def rebuild_occupancy(apps=None, batch_size=1000):
+    """Replace all occupancy rows with a fresh recount; returns the number of rows written"""
+    SlotOccupancy = _model(apps)
+    expected = compute_expected(apps)
+    with transaction.atomic():
+        SlotOccupancy.objects.all().delete()
+        SlotOccupancy.objects.bulk_create([
+            SlotOccupancy(campus=campus, date=day, type=type_, slots=counts, off_grid=off_grid,
+                          booked=sum(counts) + off_grid)
+            for (campus, day, type_), (counts, off_grid) in expected.items()
+        ], batch_size=batch_size)
+    return len(expected)
+
+
+# ---------------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------------
+
+def occupancy(campus, start, end, type=None):
+    """
+    {date: (slot counts, booked)} of a campus for dates in [start, end]. Slot
+    counts are those of `type` (all types when None); booked always counts
+    every type since the daily limit is shared.
+    """
+    days = {}
+    rows = _model().objects.filter(campus=campus, date__range=(start, end)).values_list('date', 'type', 'slots', 'booked')
+    for day, row_type, slots, booked in rows:
+        counts, total = days.get(day, (_grid([]), 0))
+        if type is None or row_type == type:
+            counts = [a + b for a, b in zip(counts, _grid(slots))]
+        days[day] = (counts, total + booked)
+    return days
+
+
+def free_slots(counts, booked, daily_limit=MAX_APPOINTMENTS_PER_DAY):
+    """Slot times still open on a day with the given occupancy"""
+    if booked >= daily_limit:
+        return []
+    return [slot for slot, count in zip(SLOT_TIMES, counts) if count <= 0]
@@ -0,0 +1,395 @@
+"""
+Materialized statistics counters (StatsSnapshot).
+
+Appointments, medical documents, patient profiles and user accounts are
+counted per school year, semester, campus, type/category, patient user type,
+status and month. The counters are adjusted incrementally from model signals
+(see api/signals.py) and can be rebuilt or checked for drift with the
+``rebuild_stats_snapshots`` management command. Statistics endpoints read a
+handful of rows from this table instead of scanning the source tables.
+"""
+import logging
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KEY_FIELDS = ('metric', 'school_year_key', 'semester', 'campus', 'category', 'user_type', 'status', 'period')
+
+# Source fields each metric depends on; a save that leaves them untouched is free
+TRACKED_FIELDS = {
+    'Appointment': ('patient_id', 'school_year_id', 'semester', 'campus', 'type', 'status', 'appointment_date'),
+    'MedicalDocument': ('patient_id', 'academic_year_id', 'status', 'uploaded_at'),
+    'Patient': ('school_year_id', 'semester', 'user_type'),
+    'CustomUser': ('user_type', 'is_active', 'is_blocked', 'is_email_verified'),
+}
+
+_MISSING = object()
+
+
+def _period(value):
+    """YYYY-MM bucket of a date/datetime"""
+    if not value:
+        return ''
+    if isinstance(value, str):
+        # Unsaved ISO date string assigned directly to the field
+        return value[:7]
+    if hasattr(value, 'hour') and timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return f'{value.year:04d}-{value.month:02d}'
+
+
+def user_flags(is_active, is_blocked, is_email_verified):
+    """Compact account flag code stored in the status column of user counters"""
+    return f'a{int(bool(is_active))}b{int(bool(is_blocked))}v{int(bool(is_email_verified))}'
+
+
+def appointment_key(school_year_id, semester, campus, type, user_type, status, appointment_date):
+    return ('appointment', school_year_id or 0, semester or '', campus or '', type or '',
+            user_type or '', status or '', _period(appointment_date))
+
+
+def document_key(academic_year_id, user_type, status, uploaded_at):
+    return ('document', academic_year_id or 0, '', '', '', user_type or '', status or '', _period(uploaded_at))
+
+
+def patient_key(school_year_id, semester, user_type):
+    return ('patient', school_year_id or 0, semester or '', '', '', user_type or '', '', '')
+
+
+def user_key(user_type, is_active, is_blocked, is_email_verified):
+    return ('user', 0, '', '', user_type or '', '', user_flags(is_active, is_blocked, is_email_verified), '')
+
+
+# ---------------------------------------------------------------------------
+# Incremental maintenance
+# ---------------------------------------------------------------------------
+
+def _state(instance):
+    """Tracked field values of an instance, or None when some are deferred"""
+    values = tuple(instance.__dict__.get(field, _MISSING) for field in TRACKED_FIELDS[type(instance).__name__])
+    return None if _MISSING in values else values
+
+
+def _patient_user_types(patient_ids):
+    from .models import Patient
+    patient_ids = {pk for pk in patient_ids if pk}
+    if not patient_ids:
+        return {}
+    return dict(Patient.objects.filter(pk__in=patient_ids).values_list('pk', 'user_type'))
+
+
+def _instance_key(model_name, state, user_types):
+    if model_name == 'Appointment':
+        patient_id, school_year_id, semester, campus, type_, status, appointment_date = state
+        return appointment_key(school_year_id, semester, campus, type_, user_types.get(patient_id),
+                               status, appointment_date)
+    if model_name == 'MedicalDocument':
+        patient_id, academic_year_id, status, uploaded_at = state
+        return document_key(academic_year_id, user_types.get(patient_id), status, uploaded_at)
+    if model_name == 'Patient':
+        return patient_key(*state)
+    return user_key(*state)
+
+
+def apply_deltas(deltas):
+    """Add each delta to its counter row, creating missing rows"""
+    from .models import StatsSnapshot
+    now = timezone.now()
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        fields = dict(zip(KEY_FIELDS, key))
+        if StatsSnapshot.objects.filter(**fields).update(count=F('count') + delta, updated_at=now):
+            continue
+        try:
+            with transaction.atomic():
+                StatsSnapshot.objects.create(count=delta, **fields)
+        except IntegrityError:
+            # Created concurrently by another writer
+            StatsSnapshot.objects.filter(**fields).update(count=F('count') + delta, updated_at=now)
+
+
+def _cached_patient_user_type(instance):
+    """User type of the instance's patient without a query when it is already loaded"""
+    patient = instance._state.fields_cache.get('patient')
+    if patient is not None and patient.pk == instance.patient_id:
+        return {patient.pk: patient.user_type}
+    return {}
+
+
+def track_initial_state(sender, instance, **kwargs):
+    """post_init: remember the tracked values the instance was loaded with"""
+    instance._stats_state = _state(instance) if instance.pk else None
+
+
+def capture_previous_state(sender, instance, raw=False, **kwargs):
+    """pre_save: load the stored values when the instance was loaded with deferred fields"""
+    if instance.pk and not instance._state.adding and getattr(instance, '_stats_state', None) is None:
+        row = sender._base_manager.filter(pk=instance.pk).values_list(*TRACKED_FIELDS[sender.__name__]).first()
+        instance._stats_state = tuple(row) if row else None
+
+
+def update_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """post_save: move the instance between counters when tracked fields changed"""
+    model_name = sender.__name__
+    old_state = getattr(instance, '_stats_state', None)
+
+    if created:
+        new_state = _state(instance)
+    elif old_state is None:
+        logger.debug('Skipping stats update for %s %s: unknown previous state', model_name, instance.pk)
+        return
+    else:
+        # Only columns written by this save can have changed
+        new_state = tuple(
+            instance.__dict__.get(attname, old_value)
+            if update_fields is None or sender._meta.get_field(attname).name in update_fields
+            else old_value
+            for attname, old_value in zip(TRACKED_FIELDS[model_name], old_state)
+        )
+        if new_state == old_state:
+            return
+
+    deltas = Counter()
+    user_types = {}
+    if model_name in ('Appointment', 'MedicalDocument'):
+        user_types = _cached_patient_user_type(instance)
+        missing = {new_state[0]} | ({old_state[0]} if old_state else set())
+        user_types.update(_patient_user_types(missing - set(user_types)))
+
+    deltas[_instance_key(model_name, new_state, user_types)] += 1
+    if not created:
+        deltas[_instance_key(model_name, old_state, user_types)] -= 1
+
+    if model_name == 'Patient' and not created and old_state[2] != new_state[2]:
+        deltas.update(_patient_user_type_moves(instance.pk, old_state[2], new_state[2]))
+
+    apply_deltas(deltas)
+    instance._stats_state = new_state
+
+
+def update_on_delete(sender, instance, **kwargs):
+    """post_delete: remove the instance from its counter"""
+    model_name = sender.__name__
+    state = getattr(instance, '_stats_state', None) or _state(instance)
+    if state is None:
+        logger.debug('Skipping stats update for deleted %s %s: unknown state', model_name, instance.pk)
+        return
+    user_types = {}
+    if model_name in ('Appointment', 'MedicalDocument'):
+        user_types = _cached_patient_user_type(instance) or _patient_user_types([state[0]])
+    apply_deltas({_instance_key(model_name, state, user_types): -1})
+
+
+def document_status_deltas(rows, new_status):
+    """
+    Counter moves for a bulk status change of medical documents done with
+    update(); rows are (patient_id, academic_year_id, status, uploaded_at).
+    """
+    user_types = _patient_user_types({row[0] for row in rows})
+    deltas = Counter()
+    for patient_id, academic_year_id, status, uploaded_at in rows:
+        user_type = user_types.get(patient_id)
+        deltas[document_key(academic_year_id, user_type, status, uploaded_at)] -= 1
+        deltas[document_key(academic_year_id, user_type, new_status, uploaded_at)] += 1
+    return deltas
+
+
+def appointment_state_deltas(moves):
+    """
+    Counter moves for appointments changed with bulk_update()/update(); moves
+    are (old state, new state) pairs of TRACKED_FIELDS['Appointment'] values.
+    """
+    user_types = _patient_user_types({state[0] for pair in moves for state in pair})
+    deltas = Counter()
+    for old_state, new_state in moves:
+        if old_state == new_state:
+            continue
+        deltas[_instance_key('Appointment', old_state, user_types)] -= 1
+        deltas[_instance_key('Appointment', new_state, user_types)] += 1
+    return deltas
+
+
+def _patient_user_type_moves(patient_id, old_user_type, new_user_type):
+    """Counter moves for a patient's appointments and documents after a user type change"""
+    from .models import Appointment, MedicalDocument
+    deltas = Counter()
+    appointments = Appointment.objects.filter(patient_id=patient_id).values_list(
+        'school_year_id', 'semester', 'campus', 'type', 'status', 'appointment_date'
+    )
+    for school_year_id, semester, campus, type_, status, appointment_date in appointments:
+        deltas[appointment_key(school_year_id, semester, campus, type_, old_user_type, status, appointment_date)] -= 1
+        deltas[appointment_key(school_year_id, semester, campus, type_, new_user_type, status, appointment_date)] += 1
+    documents = MedicalDocument.objects.filter(patient_id=patient_id).values_list('academic_year_id', 'status', 'uploaded_at')
+    for academic_year_id, status, uploaded_at in documents:
+        deltas[document_key(academic_year_id, old_user_type, status, uploaded_at)] -= 1
+        deltas[document_key(academic_year_id, new_user_type, status, uploaded_at)] += 1
+    return deltas
+
+
+# ---------------------------------------------------------------------------
+# Rebuild / drift check
+# ---------------------------------------------------------------------------
+
+def _model(apps, name):
+    if apps is not None:
+        return apps.get_model('api', name)
+    from django.apps import apps as global_apps
+    return global_apps.get_model('api', name)
+
+
+def compute_expected_counts(apps=None):
+    """Recount every counter from the source tables with grouped queries"""
+    Appointment = _model(apps, 'Appointment')
+    MedicalDocument = _model(apps, 'MedicalDocument')
+    Patient = _model(apps, 'Patient')
+    CustomUser = _model(apps, 'CustomUser')
+    expected = Counter()
+
+    appointment_rows = (
+        Appointment.objects
+        .annotate(year=ExtractYear('appointment_date'), month=ExtractMonth('appointment_date'))
+        .values('school_year_id', 'semester', 'campus', 'type', 'patient__user_type', 'status', 'year', 'month')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row in appointment_rows:
+        key = appointment_key(row['school_year_id'], row['semester'], row['campus'], row['type'],
+                              row['patient__user_type'], row['status'], None)
+        expected[key[:-1] + (f"{row['year']:04d}-{row['month']:02d}" if row['year'] else '',)] += row['n']
+
+    document_rows = (
+        MedicalDocument.objects
+        .annotate(year=ExtractYear('uploaded_at'), month=ExtractMonth('uploaded_at'))
+        .values('academic_year_id', 'patient__user_type', 'status', 'year', 'month')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row in document_rows:
+        key = document_key(row['academic_year_id'], row['patient__user_type'], row['status'], None)
+        expected[key[:-1] + (f"{row['year']:04d}-{row['month']:02d}" if row['year'] else '',)] += row['n']
+
+    patient_rows = Patient.objects.values('school_year_id', 'semester', 'user_type').annotate(n=Count('id')).order_by()
+    for row in patient_rows:
+        expected[patient_key(row['school_year_id'], row['semester'], row['user_type'])] += row['n']
+
+    user_rows = (
+        CustomUser.objects
+        .values('user_type', 'is_active', 'is_blocked', 'is_email_verified')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row in user_rows:
+        expected[user_key(row['user_type'], row['is_active'], row['is_blocked'], row['is_email_verified'])] += row['n']
+
+    return +expected
+
+
+def current_counts(apps=None):
+    StatsSnapshot = _model(apps, 'StatsSnapshot')
+    current = Counter()
+    for row in StatsSnapshot.objects.values_list(*KEY_FIELDS, 'count'):
+        current[row[:-1]] += row[-1]
+    return +current
+
+
+def find_drift(apps=None):
+    """Return {key: (stored, expected)} for every counter that disagrees with the source tables"""
+    expected = compute_expected_counts(apps)
+    current = current_counts(apps)
+    return {
+        key: (current.get(key, 0), expected.get(key, 0))
+        for key in set(expected) | set(current)
+        if current.get(key, 0) != expected.get(key, 0)
+    }
+
+
+def rebuild_snapshots(apps=None, batch_size=1000):
+    """Replace all counters with a fresh recount; returns the number of rows written"""
+    StatsSnapshot = _model(apps, 'StatsSnapshot')
+    expected = compute_expected_counts(apps)
+    with transaction.atomic():
+        StatsSnapshot.objects.all().delete()
+        StatsSnapshot.objects.bulk_create(
+            [StatsSnapshot(count=count, **dict(zip(KEY_FIELDS, key))) for key, count in expected.items()],
+            batch_size=batch_size,
+        )
+    return len(expected)
+
+
+# ---------------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------------
+
+def snapshot_totals(metric, group_by=(), **filters):
+    """Summed counters for a metric, optionally grouped by snapshot dimensions"""
+    from .models import StatsSnapshot
+    queryset = StatsSnapshot.objects.filter(metric=metric, **filters)
+    if not group_by:
+        return queryset.aggregate(total=Sum('count'))['total'] or 0
+    return list(queryset.values(*group_by).annotate(total=Sum('count')).order_by())
+
+
+def user_statistics():
+    """Account counters for UserManagementViewSet.get_user_statistics"""
+    statistics = {
+        'total_users': 0,
+        'active_users': 0,
+        'blocked_users': 0,
+        'verified_users': 0,
+        'user_type_counts': {'student': 0, 'staff': 0, 'admin': 0},
+    }
+    for row in snapshot_totals('user', group_by=('category', 'status')):
+        flags, total = row['status'], row['total']
+        statistics['total_users'] += total
+        if 'a1' in flags:
+            statistics['active_users'] += total
+        if 'b1' in flags:
+            statistics['blocked_users'] += total
+        if 'v1' in flags:
+            statistics['verified_users'] += total
+        user_type_counts = statistics['user_type_counts']
+        user_type_counts[row['category']] = user_type_counts.get(row['category'], 0) + total
+    return statistics
+
+
+def school_year_statistics(school_year, semester=None):
+    """Patient and appointment counters for AcademicSemesterViewSet.statistics"""
+    filters = {'school_year_key': school_year.pk}
+    if semester:
+        filters['semester'] = semester
+
+    patients_by_semester = {'1st_semester': 0, '2nd_semester': 0, 'summer': 0}
+    total_patients = 0
+    for row in snapshot_totals('patient', group_by=('semester',), **filters):
+        total_patients += row['total']
+        if row['semester'] in patients_by_semester:
+            patients_by_semester[row['semester']] += row['total']
+
+    appointments_by_status = {'pending': 0, 'confirmed': 0, 'completed': 0, 'cancelled': 0}
+    appointments_by_type = {'medical': 0, 'dental': 0}
+    appointments_by_semester = {'1st_semester': 0, '2nd_semester': 0, 'summer': 0}
+    total_appointments = 0
+    for row in snapshot_totals('appointment', group_by=('semester', 'status', 'category'), **filters):
+        total = row['total']
+        total_appointments += total
+        if row['status'] in appointments_by_status:
+            appointments_by_status[row['status']] += total
+        if row['category'] in appointments_by_type:
+            appointments_by_type[row['category']] += total
+        if row['semester'] in appointments_by_semester:
+            appointments_by_semester[row['semester']] += total
+
+    return {
+        'total_patients': total_patients,
+        'patients_by_semester': patients_by_semester,
+        'total_appointments': total_appointments,
+        'appointments_by_status': appointments_by_status,
+        'appointments_by_type': appointments_by_type,
+        'appointments_by_semester': appointments_by_semester,
+    }
@@ -1,10 +1,12 @@
 """
 Django test for user blocking functionality
 """
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.core.mail.backends.base import BaseEmailBackend
 from rest_framework.test import APIClient
 from rest_framework import status
+from api.jobs import job_handler
 from api.models import CustomUser, AcademicSchoolYear
 
 User = get_user_model()
@@ -121,3 +123,2034 @@ class UserBlockingTestCase(TestCase):
         
         self.assertFalse(serializer.is_valid())
         self.assertIn('user_id', serializer.errors)
+
+
+class DashboardStatisticsTestCase(TestCase):
+    """Dashboard statistics must be computed with a constant number of queries"""
+
+    url = '/api/admin-controls/system_configuration/dashboard_statistics/'
+
+    def setUp(self):
+        self.admin_user = CustomUser.objects.create_user(
+            username='dash_admin',
+            email='dash_admin@test.com',
+            password='testpass123',
+            user_type='admin',
+            is_staff=True,
+            is_email_verified=True
+        )
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025',
+            start_date='2024-08-01',
+            end_date='2025-07-31',
+            is_current=True,
+            status='active'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin_user)
+        self._counter = 0
+
+    def _create_patients(self, user_type, count, **patient_fields):
+        from api.models import Patient, Appointment
+        for _ in range(count):
+            self._counter += 1
+            user = CustomUser.objects.create_user(
+                username=f'dash_user_{self._counter}',
+                email=f'dash_user_{self._counter}@test.com',
+                password='testpass123',
+                is_email_verified=self._counter % 2 == 0
+            )
+            patient = Patient.objects.create(
+                user=user,
+                student_id=f'S{self._counter}',
+                name=f'Patient {self._counter}',
+                user_type=user_type,
+                school_year=self.school_year,
+                **patient_fields
+            )
+            Appointment.objects.create(
+                patient=patient, appointment_date='2025-01-10', appointment_time='09:00',
+                purpose='Checkup', type='medical', status='completed'
+            )
+            Appointment.objects.create(
+                patient=patient, appointment_date='2025-01-11', appointment_time='09:00',
+                purpose='Cleaning', type='dental', status='pending'
+            )
+
+    def _fetch(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data, len(ctx.captured_queries)
+
+    def test_statistics_payload(self):
+        """Counters and breakdowns match the stored rows"""
+        self._create_patients('College', 3, year_level='1st Year', course='BSCS', department='CCS')
+        self._create_patients('Faculty', 2, position_type='Instructor', department='CCS')
+
+        data, _ = self._fetch()
+
+        self.assertEqual(data['medical'], {'total': 5, 'completed': 5, 'pending': 0, 'rejected': 0})
+        self.assertEqual(data['dental'], {'total': 5, 'completed': 0, 'pending': 5, 'rejected': 0})
+        self.assertEqual(data['patients']['total'], 5)
+        self.assertEqual(data['completion_rates']['medical'], 100.0)
+
+        college = data['user_type_breakdown']['College']
+        self.assertEqual(college['patients']['total'], 3)
+        self.assertEqual(college['medical']['completed'], 3)
+        employee = data['user_type_breakdown']['Employee']
+        self.assertEqual(employee['dental']['pending'], 2)
+        self.assertEqual(employee['detailed_breakdown']['sub_types']['Faculty']['total'], 2)
+
+        demographics = data['detailed_demographics']['College']
+        self.assertEqual(demographics['total'], 3)
+        self.assertEqual(demographics['details']['by_year_and_course'], {'1st Year - BSCS': 3})
+        self.assertNotIn('Employee', data['detailed_demographics'])
+
+    def test_query_count_is_constant(self):
+        """Adding user types and rows does not add queries"""
+        self._create_patients('College', 2, course='BSCS')
+        _, small_queries = self._fetch()
+
+        self._create_patients('College', 5, course='BSIT')
+        self._create_patients('Elementary', 3, year_level='Grade 3')
+        self._create_patients('Employee', 3, position_type='Nurse')
+        self._create_patients('Grade 11', 2)
+        _, large_queries = self._fetch()
+
+        self.assertEqual(small_queries, large_queries)
+
+
+class StatsSnapshotTestCase(TestCase):
+    """Snapshot counters follow inserts, updates and deletes without drifting"""
+
+    def setUp(self):
+        from api.models import Patient
+        self.admin_user = CustomUser.objects.create_user(
+            username='snap_admin',
+            email='snap_admin@test.com',
+            password='testpass123',
+            user_type='admin',
+            is_staff=True,
+            is_email_verified=True
+        )
+        self.student_user = CustomUser.objects.create_user(
+            username='snap_student',
+            email='snap_student@test.com',
+            password='testpass123',
+            user_type='student'
+        )
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025',
+            start_date='2024-08-01',
+            end_date='2025-07-31',
+            is_current=True,
+            status='active'
+        )
+        self.patient = Patient.objects.create(
+            user=self.student_user,
+            student_id='S-1',
+            name='Snapshot Patient',
+            user_type='College',
+            school_year=self.school_year,
+            semester='1st_semester'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin_user)
+
+    def _create_appointment(self, **fields):
+        from api.models import Appointment
+        defaults = {
+            'patient': self.patient,
+            'appointment_date': '2024-09-10',
+            'appointment_time': '09:00',
+            'purpose': 'Checkup',
+            'type': 'medical',
+            'school_year': self.school_year,
+        }
+        defaults.update(fields)
+        return Appointment.objects.create(**defaults)
+
+    def test_counters_track_changes(self):
+        from api.models import Appointment, Patient
+        from api.stats_snapshots import find_drift
+
+        first = self._create_appointment()
+        second = self._create_appointment(type='dental', campus='b')
+        self.assertEqual(find_drift(), {})
+
+        first.status = 'completed'
+        first.save()
+        Appointment.objects.get(pk=second.pk).delete()
+        self.patient.user_type = 'Employee'
+        self.patient.save()
+        Patient.objects.only('id', 'name').get(pk=self.patient.pk).save()
+        self.student_user.block_user(blocked_by=self.admin_user, reason='Test')
+        self.assertEqual(find_drift(), {})
+
+    def test_statistics_endpoints_read_snapshots(self):
+        self._create_appointment(status='completed')
+        self._create_appointment(type='dental', status='pending')
+
+        response = self.client.get(f'/api/semesters/{self.school_year.pk}/statistics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_patients'], 1)
+        self.assertEqual(response.data['total_appointments'], 2)
+        self.assertEqual(response.data['appointments_by_type'], {'medical': 1, 'dental': 1})
+        self.assertEqual(response.data['appointments_by_status']['completed'], 1)
+
+        response = self.client.get('/api/user-management/get_user_statistics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_users'], 2)
+        self.assertEqual(response.data['verified_users'], 1)
+        self.assertEqual(response.data['user_type_counts'], {'student': 1, 'staff': 0, 'admin': 1})
+
+    def test_rebuild_matches_incremental_counters(self):
+        from api.stats_snapshots import current_counts, rebuild_snapshots
+        self._create_appointment()
+        self._create_appointment(status='cancelled')
+        incremental = current_counts()
+        rebuild_snapshots()
+        self.assertEqual(current_counts(), incremental)
+
+
+class AppointmentListQueryCountTestCase(TestCase):
+    """Listing appointments must not run per-row queries in AppointmentSerializer"""
+
+    def setUp(self):
+        self.staff_user = CustomUser.objects.create_user(
+            username='list_staff',
+            email='list_staff@test.com',
+            password='testpass123',
+            user_type='staff',
+            is_staff=True
+        )
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025',
+            start_date='2024-08-01',
+            end_date='2025-07-31',
+            is_current=True,
+            status='active'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff_user)
+        self._counter = 0
+
+    def _create_appointments(self, count):
+        from api.models import Appointment, DentalFormData, MedicalDocument, Patient
+        for _ in range(count):
+            self._counter += 1
+            user = CustomUser.objects.create_user(
+                username=f'list_user_{self._counter}',
+                email=f'list_user_{self._counter}@test.com',
+                password='testpass123'
+            )
+            patient = Patient.objects.create(
+                user=user, student_id=f'L{self._counter}', name=f'List Patient {self._counter}',
+                school_year=self.school_year
+            )
+            appointment = Appointment.objects.create(
+                patient=patient, appointment_date='2024-09-10', appointment_time='09:00',
+                purpose='Cleaning', type='dental', school_year=self.school_year,
+                doctor=self.staff_user, rescheduled_by=user, is_rescheduled=True
+            )
+            DentalFormData.objects.create(appointment=appointment, patient=patient)
+            MedicalDocument.objects.create(
+                patient=patient, academic_year=self.school_year, status='issued',
+                medical_certificate=f'medical_certificates/cert_{self._counter}.pdf'
+            )
+
+    def _list(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/appointments/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, len(ctx.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        self._create_appointments(2)
+        self._list()  # warm up per-user caches (e.g. staff_details lookup)
+        data, small_queries = self._list()
+        self.assertEqual(len(data), 2)
+        self.assertTrue(all(row['has_form_data'] and row['form_type'] == 'dental' for row in data))
+        self.assertTrue(all(row['has_medical_certificate'] for row in data))
+        self.assertTrue(all(row['was_rescheduled_by_patient'] for row in data))
+
+        self._create_appointments(6)
+        data, large_queries = self._list()
+        self.assertEqual(len(data), 8)
+        self.assertEqual(small_queries, large_queries)
+
+
+class KeysetPaginationTestCase(TestCase):
+    """Opt-in keyset pagination walks every row exactly once without OFFSET"""
+
+    def setUp(self):
+        from api.models import Appointment, Patient
+        self.staff_user = CustomUser.objects.create_user(
+            username='page_staff',
+            email='page_staff@test.com',
+            password='testpass123',
+            user_type='staff',
+            is_staff=True
+        )
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025',
+            start_date='2024-08-01',
+            end_date='2025-07-31',
+            is_current=True,
+            status='active'
+        )
+        patient = Patient.objects.create(
+            user=self.staff_user, student_id='P-1', name='Paged Patient', school_year=self.school_year
+        )
+        # Duplicate dates and times force the id tie-breaker to matter
+        for day, hour in [(10, 9), (10, 9), (10, 10), (11, 9), (11, 9), (12, 8), (12, 9)]:
+            Appointment.objects.create(
+                patient=patient, appointment_date=f'2024-09-{day}', appointment_time=f'{hour}:00',
+                purpose='Checkup', school_year=self.school_year
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff_user)
+
+    def _walk(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        ids, pages = [], []
+        with CaptureQueriesContext(connection) as ctx:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                pages.append(response.data)
+                ids.extend(row['id'] for row in response.data['results'])
+                url = response.data['next']
+        self.assertFalse(any('OFFSET' in query['sql'].upper() for query in ctx.captured_queries))
+        return ids, pages
+
+    def test_appointment_pages_follow_list_order(self):
+        from api.models import Appointment
+        full = list(Appointment.objects.order_by(
+            '-appointment_date', '-appointment_time', '-id').values_list('id', flat=True))
+        ids, pages = self._walk('/api/appointments/?page_size=3')
+        self.assertEqual(ids, full)
+        self.assertEqual(len(pages), 3)
+
+        previous = self.client.get(pages[1]['previous'])
+        self.assertEqual([row['id'] for row in previous.data['results']], full[:3])
+
+        ids, _ = self._walk('/api/appointments/?page_size=2&ordering=time')
+        self.assertEqual(ids, list(Appointment.objects.order_by(
+            'appointment_date', 'appointment_time', 'id').values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/appointments/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_user_management_pages(self):
+        for index in range(4):
+            CustomUser.objects.create_user(
+                username=f'page_user_{index}', email=f'page_user_{index}@test.com', password='testpass123'
+            )
+        full = list(CustomUser.objects.order_by('-date_joined', '-id').values_list('id', flat=True))
+        ids, _ = self._walk('/api/user-management/?page_size=2')
+        self.assertEqual(ids, full)
+
+
+class LatestPatientProfileTestCase(TestCase):
+    """Patient.is_latest_profile marks the newest profile version per email"""
+
+    def setUp(self):
+        from api.models import Patient
+        self.staff_user = CustomUser.objects.create_user(
+            username='latest_staff',
+            email='latest_staff@test.com',
+            password='testpass123',
+            user_type='staff',
+            is_staff=True
+        )
+        self.student = CustomUser.objects.create_user(
+            username='latest_student',
+            email='latest_student@test.com',
+            password='testpass123',
+            user_type='student'
+        )
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025',
+            start_date='2024-08-01',
+            end_date='2025-07-31',
+            is_current=True,
+            status='active'
+        )
+        self.versions = [
+            Patient.objects.create(
+                user=self.student, student_id='L-1', name=f'Version {i}', school_year=self.school_year
+            )
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff_user)
+
+    def _latest_ids(self):
+        from api.models import Patient
+        return set(Patient.objects.filter(is_latest_profile=True).values_list('id', flat=True))
+
+    def test_only_newest_version_is_flagged(self):
+        self.assertEqual(self._latest_ids(), {self.versions[-1].id})
+        self.assertTrue(self.versions[-1].is_latest_profile)
+
+    def test_email_change_and_delete_move_the_flag(self):
+        newest = self.versions[-1]
+        newest.email = 'moved@test.com'
+        newest.save()
+        self.assertEqual(self._latest_ids(), {self.versions[1].id, newest.id})
+
+        newest.delete()
+        self.assertEqual(self._latest_ids(), {self.versions[1].id})
+
+    def test_patient_list_matches_grouped_query(self):
+        from api.models import Patient
+        from api.patient_profiles import latest_per_email, rebuild_latest_profiles
+
+        response = self.client.get('/api/patients/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        listed = {row['id'] for row in response.data}
+        self.assertEqual(listed, set(latest_per_email(Patient.objects.all()).values_list('id', flat=True)))
+
+        Patient.objects.update(is_latest_profile=True)
+        rebuild_latest_profiles()
+        self.assertEqual(self._latest_ids(), listed)
+
+
+class CurrentSchoolYearCacheTestCase(TestCase):
+    """The current school year is looked up at most once per request and invalidated on save"""
+
+    def setUp(self):
+        from api import school_year_cache
+        self.cache = school_year_cache
+        self.addCleanup(school_year_cache.invalidate)
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025',
+            start_date='2024-08-01',
+            end_date='2025-07-31',
+            is_current=True,
+            status='active'
+        )
+        self.user = CustomUser.objects.create_user(
+            username='cache_user',
+            email='cache_user@test.com',
+            password='testpass123',
+            user_type='student'
+        )
+        self.cache.invalidate()
+        self.cache.reset_cache_stats()
+
+    def test_process_cache_and_invalidation(self):
+        self.assertEqual(AcademicSchoolYear.get_current().pk, self.school_year.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(AcademicSchoolYear.get_current().pk, self.school_year.pk)
+        self.assertEqual(self.cache.cache_stats()['misses'], 1)
+        self.assertEqual(self.cache.cache_stats()['process_hits'], 1)
+
+        next_year = AcademicSchoolYear.objects.create(
+            academic_year='2025-2026',
+            start_date='2025-08-01',
+            end_date='2026-07-31',
+            is_current=True,
+            status='active'
+        )
+        self.assertEqual(AcademicSchoolYear.get_current().pk, next_year.pk)
+
+        next_year.delete()
+        with self.assertRaises(AcademicSchoolYear.DoesNotExist):
+            AcademicSchoolYear.get_current()
+
+    def test_request_memo(self):
+        from api.middleware import RequestCacheMiddleware
+
+        def view(request):
+            for _ in range(3):
+                AcademicSchoolYear.get_current()
+                self.user.get_current_patient_profile()
+            return self.cache.cache_stats()
+
+        stats = RequestCacheMiddleware(view)(None)
+        self.assertEqual(stats['misses'], 1)
+        self.assertGreaterEqual(stats['request_hits'], 5)
+
+
+class ProfilingMiddlewareTestCase(TestCase):
+    """Request samples are recorded per route/action and summarised for admins"""
+
+    def setUp(self):
+        from api.profiling import samples
+        samples.clear()
+        self.addCleanup(samples.clear)
+        self.staff_user = CustomUser.objects.create_user(
+            username='profiling_staff',
+            email='profiling_staff@test.com',
+            password='testpass123',
+            user_type='staff',
+            is_staff=True
+        )
+        self.student = CustomUser.objects.create_user(
+            username='profiling_student',
+            email='profiling_student@test.com',
+            password='testpass123',
+            user_type='student'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff_user)
+
+    def test_summary_per_route_and_action(self):
+        self.assertEqual(self.client.get('/api/appointments/').status_code, status.HTTP_200_OK)
+
+        response = self.client.get('/api/profiling/?recent=5')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        endpoint = response.data['endpoints'][0]
+        self.assertEqual((endpoint['route'], endpoint['action']), ('appointment-list', 'list'))
+        self.assertEqual(endpoint['requests'], 1)
+        self.assertGreater(endpoint['queries_max'], 0)
+        self.assertEqual(response.data['recent'][0]['status'], 200)
+
+        self.client.force_authenticate(user=self.student)
+        self.assertEqual(self.client.get('/api/profiling/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_budget_violation_and_server_timing(self):
+        from django.test import override_settings
+        config = {'SERVER_TIMING': True, 'BUDGETS': {'appointment-list': {'queries': 0}}}
+        with override_settings(API_PROFILING=config), self.assertLogs('api.profiling', level='WARNING') as logs:
+            response = self.client.get('/api/appointments/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('appointment-list', logs.output[0])
+
+        summary = self.client.get('/api/profiling/').data['endpoints'][0]
+        self.assertEqual(summary['budget_violations'], 1)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    """Email backend whose SMTP server rejects every message"""
+
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTP server unavailable')
+
+
+class EmailOutboxTestCase(TestCase):
+    """Emails are only queued on the request path and delivered by the worker"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='outbox_user',
+            email='outbox_user@test.com',
+            password='testpass123',
+            user_type='student'
+        )
+
+    def test_enqueue_dedupes_and_worker_sends(self):
+        from django.core import mail
+        from api.email_outbox import process_outbox
+        from api.models import EmailOutbox
+
+        self.user.send_verification_email()
+        self.user.send_verification_email()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+        self.assertEqual(process_outbox(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['outbox_user@test.com'])
+        self.assertEqual(EmailOutbox.objects.get().status, 'sent')
+
+        # A delivered key is queued again on the next request
+        self.user.send_verification_email()
+        self.assertEqual(process_outbox(), (1, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_sends_back_off_and_give_up(self):
+        from datetime import timedelta
+        from django.test import override_settings
+        from django.utils import timezone
+        from api.email_outbox import enqueue_email, process_outbox
+        from api.models import EmailOutbox
+
+        message = enqueue_email('test:retry', 'Subject', 'Body', ['someone@test.com'])
+        with override_settings(EMAIL_BACKEND='api.tests.FailingEmailBackend'), self.assertLogs('api.email_outbox', level='WARNING'):
+            self.assertEqual(process_outbox(), (0, 1))
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts), ('pending', 1))
+            self.assertGreater(message.next_attempt_at, timezone.now())
+            # Not due yet
+            self.assertEqual(process_outbox(), (0, 0))
+
+            for _ in range(message.max_attempts - 1):
+                EmailOutbox.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+                process_outbox()
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'failed')
+        self.assertIn('SMTP server unavailable', message.last_error)
+
+    def test_appointment_certificate_email_links_certificate(self):
+        from datetime import date
+        from django.conf import settings
+        from api.models import Appointment, EmailOutbox, MedicalDocument, Patient
+
+        school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025', start_date='2024-08-01', end_date='2025-07-31', is_current=True, status='active'
+        )
+        patient = Patient.objects.create(
+            user=self.user, student_id='OB-1', name='Outbox Patient', email=self.user.email, school_year=school_year
+        )
+        appointment = Appointment.objects.create(
+            patient=patient, appointment_date=date(2025, 3, 3), appointment_time='09:00', purpose='Checkup',
+            type='medical', school_year=school_year,
+        )
+        MedicalDocument.objects.create(
+            patient=patient, academic_year=school_year, status='issued',
+            medical_certificate='medical_certificates/outbox.pdf',
+        )
+        staff = CustomUser.objects.create_user(
+            username='outbox_staff', email='outbox_staff@test.com', password='testpass123', user_type='staff', is_staff=True
+        )
+        client = APIClient()
+        client.force_authenticate(user=staff)
+        url = f'/api/appointments/{appointment.pk}/send_email/'
+
+        response = client.post(url, {'email': 'someone@else.com'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(EmailOutbox.objects.exists())
+
+        response = client.post(url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        message = EmailOutbox.objects.get()
+        self.assertEqual(message.recipients, [self.user.email])
+        self.assertEqual(message.from_email, settings.DEFAULT_FROM_EMAIL)
+        self.assertIn('http://testserver/media/medical_certificates/outbox.pdf', message.body)
+        self.assertNotIn('attached', message.body)
+
+
+@job_handler('test_echo')
+def _echo_job(job):
+    if job.payload.get('fail'):
+        raise RuntimeError('job failed')
+    return {'echo': job.payload['value']}
+
+
+class BackgroundJobTestCase(TestCase):
+    """Certificate issuance is queued as a background job and polled"""
+
+    def setUp(self):
+        from api.models import MedicalDocument, Patient
+        self.staff_user = CustomUser.objects.create_user(
+            username='jobs_staff',
+            email='jobs_staff@test.com',
+            password='testpass123',
+            user_type='staff',
+            is_staff=True
+        )
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025',
+            start_date='2024-08-01',
+            end_date='2025-07-31',
+            is_current=True,
+            status='active'
+        )
+        self.documents = []
+        for i in range(3):
+            student = CustomUser.objects.create_user(
+                username=f'jobs_student_{i}',
+                email=f'jobs_student_{i}@test.com',
+                password='testpass123',
+                user_type='student'
+            )
+            patient = Patient.objects.create(
+                user=student, student_id=f'J-{i}', name=f'Job Patient {i}', school_year=self.school_year
+            )
+            self.documents.append(MedicalDocument.objects.create(
+                patient=patient, academic_year=self.school_year, status='verified'
+            ))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff_user)
+
+    def test_worker_runs_and_retries_jobs(self):
+        from api.jobs import enqueue_job, run_pending_jobs
+
+        done = enqueue_job('test_echo', {'value': 42})
+        failing = enqueue_job('test_echo', {'fail': True}, max_attempts=1)
+        with self.assertLogs('api.jobs', level='ERROR'):
+            self.assertEqual(run_pending_jobs(threads=0), (1, 1))
+
+        done.refresh_from_db()
+        failing.refresh_from_db()
+        self.assertEqual((done.status, done.result), ('done', {'echo': 42}))
+        self.assertEqual(failing.status, 'failed')
+        self.assertIn('job failed', failing.error)
+
+    def test_issue_certificate_is_queued(self):
+        doc = self.documents[0]
+        response = self.client.post(f'/api/medical-documents/{doc.id}/issue_certificate/')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'issuing')
+        self.assertEqual(response.data['certificate_job']['status'], 'queued')
+
+        response = self.client.get(f'/api/medical-documents/{doc.id}/certificate_status/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'issuing')
+        self.assertEqual(response.data['job']['kind'], 'issue_certificate')
+
+        # Issuing again does not queue a second job
+        self.client.post(f'/api/medical-documents/{doc.id}/issue_certificate/')
+        from api.models import BackgroundJob
+        self.assertEqual(BackgroundJob.objects.filter(kind='issue_certificate').count(), 1)
+
+    def test_bulk_issue_for_semester(self):
+        from api.models import MedicalDocument
+        from api.stats_snapshots import find_drift
+
+        response = self.client.post(
+            '/api/medical-documents/bulk_issue_certificates/', {'academic_year': self.school_year.id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['queued'], 3)
+        self.assertEqual(MedicalDocument.objects.filter(status='issuing').count(), 3)
+        self.assertEqual(find_drift(), {})
+
+        response = self.client.get(
+            '/api/medical-documents/bulk_issue_status/', {'batch_id': response.data['batch_id']}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['total'], response.data['queued'], response.data['finished']), (3, 3, False))
+
+    def test_latest_job_is_found_by_object_id(self):
+        from api.certificates import JOB_KIND, backfill_object_ids, latest_certificate_job, queue_certificates
+        from api.models import BackgroundJob
+
+        queue_certificates(self.documents, self.staff_user)
+        for doc in self.documents:
+            self.assertEqual(latest_certificate_job(doc).payload['document_id'], doc.pk)
+
+        # Jobs queued before object_id existed are found after the migration's backfill
+        BackgroundJob.objects.filter(kind=JOB_KIND).update(object_id=None)
+        self.assertIsNone(latest_certificate_job(self.documents[0]))
+        backfill_object_ids(batch_size=2)
+        self.assertEqual(latest_certificate_job(self.documents[0]).payload['document_id'], self.documents[0].pk)
+
+
+class PdfAssetRegistryTestCase(TestCase):
+    """PDF styles and images are built once and signatures follow StaffDetails edits"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+        from api import pdf_utils
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        pdf_utils.reset_pdf_registry()
+        self.addCleanup(pdf_utils.reset_pdf_registry)
+
+        self.staff_user = CustomUser.objects.create_user(
+            username='pdf_staff',
+            email='pdf_staff@test.com',
+            password='testpass123',
+            user_type='staff',
+            is_staff=True
+        )
+
+    def signature_file(self, color):
+        import io
+        from django.core.files.base import ContentFile
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (900, 360), color).save(buffer, format='PNG')
+        return ContentFile(buffer.getvalue(), name='signature.png')
+
+    def test_styles_and_logo_are_shared(self):
+        from api import pdf_utils
+        self.assertIs(pdf_utils.get_form_styles(), pdf_utils.get_form_styles())
+        self.assertIs(pdf_utils.get_table_style('text_grid'), pdf_utils.get_table_style('text_grid'))
+        logo = pdf_utils.get_logo()
+        self.assertIs(logo, pdf_utils.get_logo())
+        # Scaled down to print resolution for its one inch box
+        self.assertLessEqual(max(logo.getSize()), pdf_utils.IMAGE_DPI)
+
+    def test_signature_reloaded_after_staff_details_change(self):
+        from api import pdf_utils
+        from api.models import MedicalDocument, Patient, StaffDetails
+
+        details = StaffDetails.objects.create(
+            user=self.staff_user, full_name='Dr. Test', position='Physician',
+            signature=self.signature_file('black')
+        )
+        first = pdf_utils.get_signature(details)
+        self.assertIs(pdf_utils.get_signature(StaffDetails.objects.get(pk=details.pk)), first)
+
+        details.signature = self.signature_file('blue')
+        details.save()
+        self.assertIsNot(pdf_utils.get_signature(details), first)
+
+        patient = Patient.objects.create(
+            user=self.staff_user, student_id='P-1', name='Pdf Patient', first_name='Pdf'
+        )
+        document = MedicalDocument.objects.create(patient=patient, status='verified', reviewed_by=self.staff_user)
+        self.assertTrue(pdf_utils.generate_medical_certificate_pdf(document).getvalue().startswith(b'%PDF'))
+
+
+class SlotOccupancyTestCase(TestCase):
+    """The slot occupancy index follows bookings and serves the availability endpoints"""
+
+    def setUp(self):
+        from datetime import date, timedelta
+        from api.models import Patient
+        self.student_user = CustomUser.objects.create_user(
+            username='slot_student',
+            email='slot_student@test.com',
+            password='testpass123',
+            user_type='student'
+        )
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025',
+            start_date='2024-08-01',
+            end_date='2025-07-31',
+            is_current=True,
+            status='active'
+        )
+        self.patient = Patient.objects.create(
+            user=self.student_user, student_id='SL-1', name='Slot Patient', school_year=self.school_year
+        )
+        # Next Monday is always bookable
+        today = date.today()
+        self.day = today + timedelta(days=7 - today.weekday())
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.student_user)
+
+    def _create_appointment(self, **fields):
+        from api.models import Appointment
+        defaults = {
+            'patient': self.patient,
+            'appointment_date': self.day,
+            'appointment_time': '09:00',
+            'purpose': 'Checkup',
+            'type': 'medical',
+            'campus': 'a',
+            'school_year': self.school_year,
+        }
+        defaults.update(fields)
+        return Appointment.objects.create(**defaults)
+
+    def test_index_follows_bookings(self):
+        from datetime import time, timedelta
+        from api.slot_occupancy import SLOT_INDEX, find_drift, occupancy
+
+        first = self._create_appointment()
+        self._create_appointment(type='dental', appointment_time='10:20')
+        self._create_appointment(appointment_time='09:05')  # off the slot grid
+        counts, booked = occupancy('a', self.day, self.day)[self.day]
+        self.assertEqual(booked, 3)
+        self.assertEqual((counts[SLOT_INDEX[time(9, 0)]], counts[SLOT_INDEX[time(10, 20)]]), (1, 1))
+
+        first.reschedule_appointment(self.day + timedelta(days=1), time(8, 0), rescheduled_by=self.student_user)
+        self.assertEqual(occupancy('a', self.day, self.day)[self.day][1], 2)
+        self.assertEqual(occupancy('a', self.day, self.day + timedelta(days=1))[self.day + timedelta(days=1)][1], 1)
+
+        first.status = 'cancelled'
+        first.save(update_fields=['status'])
+        self.assertEqual(occupancy('a', self.day + timedelta(days=1), self.day + timedelta(days=1))[self.day + timedelta(days=1)][1], 0)
+        self.assertEqual(find_drift(), {})
+
+    def test_availability_endpoints(self):
+        from api.slot_occupancy import MAX_APPOINTMENTS_PER_DAY, SLOT_TIMES
+
+        self._create_appointment()
+        response = self.client.get('/api/appointments-v2/available_slots/', {'date': self.day.isoformat(), 'campus': 'a'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['booked_slots'], 1)
+        self.assertNotIn('09:00', [slot['time'] for slot in response.data['available_slots']])
+        self.assertEqual(len(response.data['available_slots']), len(SLOT_TIMES) - 1)
+
+        response = self.client.get('/api/appointments-v2/availability_range/', {'campus': 'a'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['dates']), 30)
+        day = next(entry for entry in response.data['dates'] if entry['date'] == self.day.isoformat())
+        self.assertTrue(day['bookable'])
+        self.assertEqual((day['booked_slots'], day['remaining_slots']), (1, MAX_APPOINTMENTS_PER_DAY - 1))
+        self.assertNotIn('09:00', day['available_slots'])
+        weekend = [entry for entry in response.data['dates'] if entry['weekday'] in ('Saturday', 'Sunday')]
+        self.assertTrue(weekend and not any(entry['available_slots'] for entry in weekend))
+
+        response = self.client.get('/api/appointments-v2/availability_range/', {'days': 90})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SlotReservationTestCase(TestCase):
+    """Slot reservations and day counters reject double bookings and full days"""
+
+    def setUp(self):
+        from datetime import date
+        from api.models import Patient
+        self.user = CustomUser.objects.create_user(
+            username='booking_student',
+            email='booking_student@test.com',
+            password='testpass123',
+            user_type='student'
+        )
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025',
+            start_date='2024-08-01',
+            end_date='2025-07-31',
+            is_current=True,
+            status='active'
+        )
+        self.patient = Patient.objects.create(
+            user=self.user, student_id='BK-1', name='Booking Patient', school_year=self.school_year
+        )
+        self.day = date(2099, 9, 7)
+
+    def _book(self, appointment_time='09:00', type='medical', daily_limit=20):
+        from api import booking
+        from api.models import Appointment
+        with booking.enforce_limits(daily_limit):
+            return Appointment.objects.create(
+                patient=self.patient, appointment_date=self.day, appointment_time=appointment_time,
+                purpose='Checkup', type=type, campus='a', school_year=self.school_year,
+            )
+
+    def test_booking_rejects_taken_slot_and_full_day(self):
+        from api import booking
+        from api.models import Appointment, DailyBookingCounter
+
+        first = self._book()
+        self._book(type='dental')  # same time, other appointment type
+        with self.assertRaises(booking.SlotUnavailable):
+            self._book()
+        self._book('09:20', daily_limit=3)
+        with self.assertRaisesMessage(booking.SlotUnavailable, 'Maximum 3 appointments per day'):
+            self._book('09:40', daily_limit=3)
+        self.assertEqual(Appointment.objects.count(), 3)
+        self.assertEqual(DailyBookingCounter.objects.get(campus='a', date=self.day).booked, 3)
+
+        # Cancelling frees the slot and a place on the day
+        first.status = 'cancelled'
+        first.save(update_fields=['status'])
+        self._book(daily_limit=3)
+        self.assertEqual(booking.find_counter_drift(), {})
+
+    def test_reschedule_moves_reservation(self):
+        from datetime import time, timedelta
+        from api import booking
+        from api.models import DailyBookingCounter, SlotReservation
+
+        appointment = self._book()
+        with booking.enforce_limits():
+            appointment.reschedule_appointment(self.day + timedelta(days=1), time(10, 0), rescheduled_by=self.user)
+        reservation = SlotReservation.objects.get(appointment=appointment)
+        self.assertEqual((reservation.date, reservation.time), (self.day + timedelta(days=1), time(10, 0)))
+        self.assertEqual(DailyBookingCounter.objects.get(campus='a', date=self.day).booked, 0)
+        self._book()
+
+        appointment.delete()
+        self.assertEqual(booking.find_counter_drift(), {})
+        self.assertEqual(booking.rebuild_reservations(), (1, 1))
+
+
+class BookingStressTestCase(TransactionTestCase):
+    """
+    Concurrent bookings never double book a slot or overrun the daily limit.
+
+    SQLite serializes writers with its database lock, so this only checks the
+    stress_booking command and the invariants it verifies; the race itself is
+    exercised by running the command (10k attempts by default) against MariaDB.
+    """
+
+    def test_parallel_bookings(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.db.models import Count
+        from api import booking
+        from api.management.commands.stress_booking import STRESS_CAMPUS
+        from api.models import Appointment, DailyBookingCounter
+        from api.slot_occupancy import ACTIVE_STATUSES, MAX_APPOINTMENTS_PER_DAY
+
+        call_command('stress_booking', attempts=300, threads=4, days=2, patients=10, seed=1, keep=True, stdout=StringIO())
+
+        active = Appointment.objects.filter(campus=STRESS_CAMPUS, status__in=ACTIVE_STATUSES)
+        self.assertTrue(active.exists())
+        self.assertFalse(
+            active.values('appointment_date', 'appointment_time', 'type').annotate(n=Count('id')).filter(n__gt=1).exists()
+        )
+        per_day = dict(active.values_list('appointment_date').annotate(n=Count('id')).order_by())
+        self.assertLessEqual(max(per_day.values()), MAX_APPOINTMENTS_PER_DAY)
+        counters = dict(DailyBookingCounter.objects.filter(campus=STRESS_CAMPUS).values_list('date', 'booked'))
+        self.assertEqual(counters, per_day)
+        self.assertEqual(booking.find_counter_drift(), {})
+
+
+class SchedulingCalendarTestCase(TestCase):
+    """The compiled staff calendar follows the schedule models and assigns staff with capacity"""
+
+    def setUp(self):
+        from datetime import date, time
+        from api.models import CampusSchedule, Patient, StaffDetails
+        self.monday = date(2099, 9, 7)
+        CampusSchedule.objects.create(
+            campus='a', open_time=time(8, 0), close_time=time(15, 0),
+            operating_days=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'],
+        )
+        self.staff = {}
+        for username, position, fields in (
+            ('doctor', 'Doctor', {'available_days': ['Monday'], 'time_slots': ['08:00-10:00'], 'daily_appointment_limit': 1}),
+            ('nurse', 'Nurse', {'blocked_dates': ['2099-09-08'], 'daily_appointment_limit': 2}),
+            ('dentist', 'Dentist', {'assigned_campuses': 'a,b'}),
+        ):
+            user = CustomUser.objects.create_user(
+                username=username, email=f'{username}@test.com', password='testpass123', user_type='staff'
+            )
+            StaffDetails.objects.create(user=user, full_name=f'Staff {username}', position=position, **fields)
+            self.staff[username] = user.pk
+        school_year = AcademicSchoolYear.objects.create(
+            academic_year='2099-2100', start_date='2099-08-01', end_date='2100-07-31', status='upcoming'
+        )
+        self.patient = Patient.objects.create(
+            user=CustomUser.objects.create_user(username='sched_student', email='sched@test.com', password='testpass123'),
+            student_id='SC-1', name='Scheduling Patient', school_year=school_year,
+        )
+
+    def tearDown(self):
+        from api import scheduling
+        # The rolled back schedule rows never signal; don't leak their calendar
+        scheduling.invalidate()
+
+    def test_calendar_compiles_schedule_rules(self):
+        from datetime import time, timedelta
+        from api import scheduling
+        from api.models import DentistSchedule
+
+        calendar = scheduling.get_calendar()
+        doctor, nurse, dentist = self.staff['doctor'], self.staff['nurse'], self.staff['dentist']
+        self.assertEqual(calendar.on_duty('a', 'medical', self.monday, time(9, 0)), (doctor, nurse))
+        self.assertEqual(calendar.on_duty('a', 'medical', self.monday, time(10, 0)), (nurse,))
+        # Closed after 15:00, blocked date, closed on Sunday
+        self.assertEqual(calendar.on_duty('a', 'medical', self.monday, time(15, 0)), ())
+        self.assertEqual(calendar.on_duty('a', 'medical', self.monday + timedelta(days=1), time(9, 0)), ())
+        self.assertFalse(calendar.is_open('a', self.monday + timedelta(days=6)))
+        self.assertTrue(calendar.is_open('a', self.monday + timedelta(days=5)))
+        # Campus b has no schedule: Monday to Friday, whole slot grid
+        self.assertEqual(calendar.on_duty('b', 'dental', self.monday, time(16, 0)), (dentist,))
+        self.assertFalse(calendar.is_staffed('b', 'medical'))
+
+        # Saving a schedule drops the compiled calendar
+        DentistSchedule.objects.create(dentist_name='Dr. Staff Dentist', campus='a', available_days=['Tuesday'], time_slots=['13:00-14:00'])
+        calendar = scheduling.get_calendar()
+        self.assertEqual(calendar.on_duty('a', 'dental', self.monday, time(13, 0)), ())
+        self.assertEqual(calendar.on_duty('a', 'dental', self.monday + timedelta(days=1), time(13, 20)), (dentist,))
+
+    def test_invalidation_during_compilation_is_not_lost(self):
+        from unittest import mock
+        from api import scheduling
+
+        compile_calendar = scheduling.compile_calendar
+
+        def compile_then_invalidate():
+            # A schedule saved in another thread while this calendar is compiled
+            compiled = compile_calendar()
+            scheduling.invalidate()
+            return compiled
+
+        scheduling.invalidate()
+        with mock.patch.object(scheduling, 'compile_calendar', compile_then_invalidate):
+            stale = scheduling.get_calendar()
+        fresh = scheduling.get_calendar()
+        self.assertIsNot(fresh, stale)
+        self.assertIs(scheduling.get_calendar(), fresh)
+
+    def test_assign_doctor_respects_daily_limits(self):
+        from datetime import time
+        from api import booking, scheduling
+        from api.models import Appointment
+
+        def book(slot_time):
+            with booking.enforce_limits():
+                doctor_id = scheduling.assign_doctor('a', 'medical', self.monday, slot_time)
+                return Appointment.objects.create(
+                    patient=self.patient, doctor_id=doctor_id, appointment_date=self.monday,
+                    appointment_time=slot_time, purpose='Checkup', type='medical', campus='a',
+                )
+
+        self.assertEqual(book(time(8, 0)).doctor_id, self.staff['doctor'])
+        self.assertEqual(book(time(8, 20)).doctor_id, self.staff['nurse'])
+        self.assertEqual(book(time(8, 40)).doctor_id, self.staff['nurse'])
+        with self.assertRaises(booking.SlotUnavailable):
+            book(time(9, 0))
+        self.assertEqual(scheduling.staff_load(self.monday, self.monday)[self.monday],
+                         {self.staff['doctor']: 1, self.staff['nurse']: 2})
+
+    def test_available_staff_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(user=self.patient.user)
+        response = client.get('/api/appointments-v2/available_staff/', {
+            'date': self.monday.isoformat(), 'time': '09:00', 'campus': 'a', 'type': 'medical',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_open'])
+        self.assertEqual([staff['id'] for staff in response.data['available_staff']],
+                         [self.staff['doctor'], self.staff['nurse']])
+
+
+class WaitlistTestCase(TestCase):
+    """Released slots of a full day are backfilled from the waitlist off the request path"""
+
+    def setUp(self):
+        from datetime import date, time, timedelta
+        from api.models import Appointment, Patient
+        from api.slot_occupancy import MAX_APPOINTMENTS_PER_DAY, SLOT_TIMES
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025', start_date='2024-08-01', end_date='2025-07-31', is_current=True, status='active'
+        )
+        self.patients = {}
+        for name in ('booked', 'first', 'urgent'):
+            user = CustomUser.objects.create_user(
+                username=f'wait_{name}', email=f'wait_{name}@test.com', password='testpass123', user_type='student'
+            )
+            self.patients[name] = Patient.objects.create(
+                user=user, student_id=f'WL-{name}', name=f'Wait {name}', email=user.email, school_year=self.school_year
+            )
+        self.staff = CustomUser.objects.create_user(
+            username='wait_staff', email='wait_staff@test.com', password='testpass123', user_type='staff', is_staff=True
+        )
+        today = date.today()
+        self.day = today + timedelta(days=7 - today.weekday())
+        self.appointments = [
+            Appointment.objects.create(
+                patient=self.patients['booked'], appointment_date=self.day, appointment_time=slot_time,
+                purpose='Checkup', type='medical', campus='a', school_year=self.school_year,
+            )
+            for slot_time in SLOT_TIMES[:MAX_APPOINTMENTS_PER_DAY]
+        ]
+
+    def _join(self, user, **data):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.post('/api/appointment-waitlist/', {'date': self.day.isoformat(), 'campus': 'a', 'type': 'medical', **data})
+
+    def _cancel(self, appointment):
+        appointment.status = 'cancelled'
+        appointment.save()
+
+    def test_cancellation_promotes_waiting_patients_in_order(self):
+        from api.jobs import run_pending_jobs
+        from api.models import BackgroundJob, EmailOutbox, WaitlistEntry
+
+        response = self._join(self.patients['first'].user, purpose='Fever')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['position'], 1)
+        response = self._join(self.staff, patient=self.patients['urgent'].pk, priority=5)
+        self.assertEqual(response.data['position'], 1)
+
+        # A burst of cancellations queues one backfill job for the day
+        freed = self.appointments[3]
+        self._cancel(freed)
+        self._cancel(self.appointments[4])
+        self.assertEqual(BackgroundJob.objects.filter(kind='waitlist_backfill', status='queued').count(), 1)
+
+        self.assertEqual(run_pending_jobs(threads=0), (1, 0))
+        urgent = WaitlistEntry.objects.get(patient=self.patients['urgent'])
+        first = WaitlistEntry.objects.get(patient=self.patients['first'])
+        self.assertEqual((urgent.status, first.status), ('promoted', 'promoted'))
+        self.assertEqual(urgent.appointment.appointment_time, freed.appointment_time)
+        self.assertEqual(first.appointment.purpose, 'Fever')
+        self.assertTrue(EmailOutbox.objects.filter(idempotency_key=f'waitlist-promoted:{urgent.pk}').exists())
+
+        # The day is full again: another waiter stays waiting
+        self._join(self.staff, patient=self.patients['booked'].pk)
+        self.assertEqual(WaitlistEntry.objects.get(patient=self.patients['booked']).status, 'waiting')
+
+    def test_ineligible_entries_expire_and_free_days_reject_joining(self):
+        from api import waitlist
+        from api.models import WaitlistEntry
+
+        self.assertEqual(self._join(self.staff, patient=self.patients['booked'].pk).status_code, status.HTTP_201_CREATED)
+        self._join(self.patients['first'].user)
+        self._cancel(self.appointments[0])
+        # The patient already booked on the day is skipped
+        promoted = waitlist.promote_next('a', self.day, 'medical')
+        self.assertEqual(promoted.patient, self.patients['first'])
+        self.assertEqual(WaitlistEntry.objects.get(patient=self.patients['booked']).status, 'expired')
+
+        self._cancel(self.appointments[1])
+        response = self._join(self.patients['urgent'].user)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DayClosureTestCase(TestCase):
+    """Closing a campus day moves its appointments to the earliest free slots in one transaction"""
+
+    def setUp(self):
+        from datetime import date, timedelta
+        from api.models import Appointment, Patient
+        from api.slot_occupancy import SLOT_TIMES
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025', start_date='2024-08-01', end_date='2025-07-31', is_current=True, status='active'
+        )
+        self.patients = []
+        for i in range(3):
+            user = CustomUser.objects.create_user(
+                username=f'closure_{i}', email=f'closure_{i}@test.com', password='testpass123', user_type='student'
+            )
+            self.patients.append(Patient.objects.create(
+                user=user, student_id=f'CL-{i}', name=f'Closure {i}', email=user.email, school_year=self.school_year
+            ))
+        self.staff = CustomUser.objects.create_user(
+            username='closure_staff', email='closure_staff@test.com', password='testpass123', user_type='staff', is_staff=True
+        )
+        today = date.today()
+        self.day = today + timedelta(days=7 - today.weekday())  # next Monday
+        self.next_day = self.day + timedelta(days=1)
+        self.booked = [
+            Appointment.objects.create(
+                patient=patient, appointment_date=self.day, appointment_time=SLOT_TIMES[i], purpose='Checkup',
+                type=appointment_type, campus='a', school_year=self.school_year,
+            )
+            for i, (patient, appointment_type) in enumerate(zip(self.patients, ('medical', 'dental', 'medical')))
+        ]
+        # The last patient already has a medical appointment the next day
+        Appointment.objects.create(
+            patient=self.patients[2], appointment_date=self.next_day, appointment_time=SLOT_TIMES[0],
+            purpose='Follow-up', type='medical', campus='a', school_year=self.school_year,
+        )
+
+    def tearDown(self):
+        from api import scheduling
+        scheduling.invalidate()
+
+    def _close(self, user, **data):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.post('/api/appointments-v2/close_day/', {'campus': 'a', 'date': self.day.isoformat(), **data})
+
+    def test_appointments_move_to_earliest_free_slots(self):
+        from datetime import timedelta
+        from api import booking, slot_occupancy, stats_snapshots
+        from api.models import Appointment, CampusClosure, EmailOutbox
+        from api.slot_occupancy import SLOT_TIMES
+
+        response = self._close(self.staff, reason='Water outage')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['unplaced'], [])
+        moves = {row['id']: (row['to_date'], row['to_time']) for row in response.data['moved']}
+        medical, dental, busy_patient = [Appointment.objects.get(pk=a.pk) for a in self.booked]
+        self.assertEqual(moves[medical.pk], (self.next_day.isoformat(), SLOT_TIMES[1].strftime('%H:%M')))
+        self.assertEqual(moves[dental.pk], (self.next_day.isoformat(), SLOT_TIMES[0].strftime('%H:%M')))
+        # Not booked twice on a day it already has an appointment
+        self.assertEqual(busy_patient.appointment_date, self.next_day + timedelta(days=1))
+        self.assertEqual(busy_patient.appointment_time, SLOT_TIMES[0])
+        self.assertTrue(medical.is_rescheduled)
+        self.assertEqual((medical.original_date, medical.original_time), (self.day, SLOT_TIMES[0]))
+        self.assertEqual(medical.rescheduled_by, self.staff)
+        self.assertIn('Reason: Water outage', medical.notes)
+
+        closure = CampusClosure.objects.get(campus='a', date=self.day)
+        self.assertEqual((closure.moved_appointments, closure.unplaced_appointments), (3, 0))
+        self.assertEqual(EmailOutbox.objects.filter(idempotency_key__startswith='appointment-closure:').count(), 3)
+        # The bulk writes keep every index in step with the appointments
+        self.assertEqual(slot_occupancy.find_drift(), {})
+        self.assertEqual(booking.find_counter_drift(), {})
+        self.assertEqual(stats_snapshots.find_drift(), {})
+        self.assertEqual(medical.slot_reservation.time, SLOT_TIMES[1])
+
+        client = APIClient()
+        client.force_authenticate(user=self.staff)
+        response = client.get('/api/appointments-v2/availability_range/', {
+            'campus': 'a', 'start': self.day.isoformat(), 'days': 1,
+        })
+        self.assertFalse(response.data['dates'][0]['bookable'])
+
+    def test_dry_run_and_permissions(self):
+        from api import scheduling
+        from api.models import Appointment, CampusClosure
+
+        self.assertEqual(self._close(self.patients[0].user).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(scheduling.get_calendar().is_open('a', self.day))
+        response = self._close(self.staff, dry_run='true')
+        self.assertEqual(len(response.data['moved']), 3)
+        self.assertFalse(CampusClosure.objects.exists())
+        self.assertEqual(Appointment.objects.filter(appointment_date=self.day).count(), 3)
+        # The calendar compiled from the rolled back closure is not kept
+        self.assertTrue(scheduling.get_calendar().is_open('a', self.day))
+
+    def test_bookings_check_closures_made_by_other_workers(self):
+        from datetime import timedelta
+        from api import booking, scheduling, waitlist
+        from api.models import Appointment, CampusClosure, WaitlistEntry
+        from api.slot_occupancy import SLOT_TIMES
+
+        day = self.day + timedelta(days=2)
+        self.assertTrue(scheduling.get_calendar().is_open('a', day))
+        # Closed in another process: this worker's compiled calendar still shows the day as open
+        CampusClosure.objects.bulk_create([CampusClosure(campus='a', date=day, reason='Power outage')])
+        self.assertTrue(scheduling.get_calendar().is_open('a', day))
+
+        with self.assertRaises(booking.DayClosed):
+            with booking.enforce_limits():
+                Appointment.objects.create(
+                    patient=self.patients[0], appointment_date=day, appointment_time=SLOT_TIMES[0],
+                    purpose='Checkup', type='medical', campus='a', school_year=self.school_year,
+                )
+        entry, _ = waitlist.join(self.patients[0], 'a', day, 'medical')
+        self.assertIsNone(waitlist.promote_next('a', day, 'medical'))
+        self.assertEqual(WaitlistEntry.objects.get(pk=entry.pk).status, 'waiting')
+        self.assertFalse(Appointment.objects.filter(appointment_date=day).exists())
+
+
+class AnnouncementTargetingTestCase(TestCase):
+    """Login announcements are selected with one query through the normalized targeting table"""
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from api.models import Announcement
+        self.user = CustomUser.objects.create_user(
+            username='announce_student', email='announce_student@test.com', password='testpass123',
+            user_type='student', grade_level='College - 1st Year',
+        )
+        self.admin = CustomUser.objects.create_user(
+            username='announce_admin', email='announce_admin@test.com', password='testpass123', user_type='admin', is_staff=True
+        )
+        common = {'message': 'Message', 'created_by': self.admin}
+        self.everyone = Announcement.objects.create(title='Everyone', **common)
+        self.by_type = Announcement.objects.create(title='Students', target_all_users=False, target_user_types=['student'], **common)
+        self.by_grade = Announcement.objects.create(title='College', target_all_users=False, target_grade_levels=['college'], **common)
+        self.other_grade = Announcement.objects.create(title='Seniors', target_all_users=False, target_grade_levels=['Senior High'], **common)
+        self.expired = Announcement.objects.create(title='Expired', expires_at=timezone.now() - timedelta(days=1), **common)
+        self.inactive = Announcement.objects.create(title='Inactive', is_active=False, **common)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_unviewed_matches_targeting_in_one_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from api.models import Announcement
+
+        expected = {self.everyone.pk, self.by_type.pk, self.by_grade.pk}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/announcements/unviewed/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({row['id'] for row in response.data}, expected)
+        self.assertLessEqual(len([q for q in ctx.captured_queries if 'api_announcement' in q['sql']]), 1)
+
+        # Targeting edits are mirrored into the targeting table
+        self.other_grade.target_grade_levels = ['1st year']
+        self.other_grade.save()
+        self.by_type.target_user_types = ['staff']
+        self.by_type.save()
+        response = self.client.get('/api/announcements/')
+        self.assertEqual(
+            {row['id'] for row in response.data},
+            {self.everyone.pk, self.by_grade.pk, self.other_grade.pk},
+        )
+        self.assertEqual(Announcement.objects.get(pk=self.other_grade.pk).targets.get().value, '1st year')
+
+    def test_batch_mark_viewed(self):
+        response = self.client.post('/api/announcements/mark_viewed_batch/', {
+            'ids': [self.everyone.pk, self.by_grade.pk, self.other_grade.pk],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['marked'], sorted([self.everyone.pk, self.by_grade.pk]))
+        self.assertEqual(response.data['not_found'], [self.other_grade.pk])
+
+        response = self.client.post('/api/announcements/mark_viewed_batch/', {'ids': [self.everyone.pk]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['already_viewed'], [self.everyone.pk])
+        response = self.client.get('/api/announcements/unviewed/')
+        self.assertEqual([row['id'] for row in response.data], [self.by_type.pk])
+        self.assertEqual(self.client.post('/api/announcements/mark_viewed_batch/', {'ids': 'x'}, format='json').status_code, 400)
+
+
+class ContentCacheTestCase(TestCase):
+    """Public content endpoints serve cached payloads with conditional request support"""
+
+    def setUp(self):
+        from api import content_cache
+        from api.models import ContentManagement
+        content_cache.invalidate()
+        ContentManagement.get_content()
+        self.admin = CustomUser.objects.create_user(
+            username='content_admin', email='content_admin@test.com', password='testpass123', user_type='admin', is_staff=True
+        )
+        self.client = APIClient()
+
+    def tearDown(self):
+        from api import content_cache
+        content_cache.invalidate()
+
+    def test_etag_revalidation_and_update(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        response = self.client.get('/api/content-management/get_content/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['services']), 6)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/content-management/get_content/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        admin = APIClient()
+        admin.force_authenticate(user=self.admin)
+        self.assertEqual(
+            admin.post('/api/content-management/update_content/', {'hero_main_title': 'New title'}, format='json').status_code,
+            status.HTTP_200_OK,
+        )
+        response = self.client.get('/api/content-management/get_content/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['hero_main_title'], 'New title')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_post_login_options_per_grade_level(self):
+        anonymous = self.client.get('/api/content-management/post_login_options/').json()
+        self.assertEqual(len(anonymous['options']), 2)
+        self.assertIsNone(anonymous['user_grade_level'])
+
+        freshman = CustomUser.objects.create_user(
+            username='content_freshman', email='content_freshman@test.com', password='testpass123',
+            user_type='student', grade_level='College 1st Year',
+        )
+        self.client.force_authenticate(user=freshman)
+        response = self.client.get('/api/content-management/post_login_options/')
+        self.assertEqual([option['key'] for option in response.json()['options']][-1], 'Request Medical Certificate')
+        self.assertEqual(response.json()['user_grade_level'], 'College 1st Year')
+        self.assertIn('Authorization', response['Vary'])
+
+
+class SearchIndexTestCase(TestCase):
+    """Patient and user searches go through the maintained token index"""
+
+    def setUp(self):
+        from api.models import Patient
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025', start_date='2024-08-01', end_date='2025-07-31', is_current=True, status='active'
+        )
+        self.admin = CustomUser.objects.create_user(
+            username='search_admin', email='search_admin@test.com', password='testpass123', user_type='admin', is_staff=True
+        )
+        self.maria = CustomUser.objects.create_user(
+            username='mdelacruz', email='maria.delacruz@wmsu.edu.ph', password='testpass123', user_type='student',
+            first_name='Maria', last_name='Dela Cruz',
+        )
+        self.mario = CustomUser.objects.create_user(
+            username='msantos', email='mario.santos@wmsu.edu.ph', password='testpass123', user_type='student',
+            first_name='Mario', last_name='Santos',
+        )
+        self.patient = Patient.objects.create(
+            user=self.maria, student_id='2021-01234', name='Maria Dela Cruz', email='maria.personal@test.com',
+            department='College of Nursing', school_year=self.school_year,
+        )
+        Patient.objects.create(
+            user=self.mario, student_id='2022-00077', name='Mario Santos', email='mario.santos@wmsu.edu.ph',
+            department='College of Computing Studies', school_year=self.school_year,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def _users(self, search):
+        return [row['username'] for row in self.client.get('/api/user-management/', {'search': search}).data]
+
+    def _profiles(self, search):
+        return [row['student_id'] for row in self.client.get('/api/semester-profiles/', {'search': search}).data]
+
+    def test_prefix_search_is_ranked(self):
+        self.assertEqual(set(self._users('mari')), {'mdelacruz', 'msantos'})
+        self.assertEqual(self._users('maria dela'), ['mdelacruz'])
+        # A whole-word match ranks above a prefix match
+        self.assertEqual(self._users('mario')[0], 'msantos')
+        self.assertEqual(self._users('santosx'), [])
+        self.assertEqual(self._profiles('2021-01234'), ['2021-01234'])
+        self.assertEqual(self._profiles('nursing'), ['2021-01234'])
+        self.assertEqual(self._profiles('college computing'), ['2022-00077'])
+        self.assertEqual(self._profiles('???'), [])
+
+    def test_index_follows_saves(self):
+        from django.utils import timezone
+        from api import search
+        from api.models import Patient, SearchToken
+
+        # Patient tokens include the account email
+        self.assertEqual(self._profiles('delacruz'), ['2021-01234'])
+        self.maria.email = 'maria.reyes@wmsu.edu.ph'
+        self.maria.save()
+        self.assertEqual(self._profiles('delacruz'), [])
+        self.assertEqual(self._profiles('reyes'), ['2021-01234'])
+
+        self.patient.name = 'Maria Reyes'
+        self.patient.save()
+        self.assertEqual(self._profiles('dela'), [])
+        self.maria.last_login = timezone.now()
+        with self.assertNumQueries(1):
+            self.maria.save(update_fields=['last_login'])
+
+        Patient.objects.filter(pk=self.patient.pk).update(name='Maria Lim')
+        self.assertEqual(self._profiles('lim'), [])
+        search.rebuild_index()
+        self.assertEqual(self._profiles('lim'), ['2021-01234'])
+        self.patient.delete()
+        self.assertFalse(SearchToken.objects.filter(kind='patient', object_id=self.patient.pk).exists())
+
+
+class StreamingExportTestCase(TestCase):
+    """Exports are streamed in keyset chunks as JSON, CSV or XLSX"""
+
+    def setUp(self):
+        from api.models import Patient
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025', start_date='2024-08-01', end_date='2025-07-31', is_current=True, status='active'
+        )
+        self.admin = CustomUser.objects.create_user(
+            username='export_admin', email='export_admin@test.com', password='testpass123', user_type='admin', is_staff=True
+        )
+        self.student = CustomUser.objects.create_user(
+            username='export_student', email='export_student@test.com', password='testpass123', user_type='student'
+        )
+        for index in range(5):
+            Patient.objects.create(
+                student_id=f'2024-{index:05d}', name=f'Export Patient {index}', email=f'export{index}@test.com',
+                department='College of <Nursing> & Allied', school_year=self.school_year, semester='1st_semester',
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def _body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_chunks_cover_every_row_once(self):
+        from api.exports import export_chunks, semester_profile_columns
+        from api.models import Patient
+
+        queryset = Patient.objects.order_by('-created_at')
+        chunks = list(export_chunks(queryset, semester_profile_columns(), chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(
+            [row[0] for chunk in chunks for row in chunk],
+            list(queryset.values_list('student_id', flat=True)),
+        )
+
+    def test_semester_export_formats(self):
+        import csv
+        import io
+        import json
+        import zipfile
+        from xml.etree import ElementTree
+
+        from api.models import Patient
+
+        Patient.objects.filter(student_id='2024-00004').update(semester=None)
+        response = self.client.get('/api/semester-profiles/export_data/', {'school_year': self.school_year.id})
+        self.assertEqual(response.status_code, 200)
+        rows = json.loads(self._body(response))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['school_year'], '2024-2025')
+        semesters = {row['student_id']: row['semester'] for row in rows}
+        self.assertEqual(semesters['2024-00000'], 'First Semester')
+        # Like get_semester_display(), profiles without a semester are 'Unassigned'
+        self.assertEqual(semesters['2024-00004'], 'Unassigned')
+
+        response = self.client.get('/api/semester-profiles/export_data/', {'file_format': 'csv'})
+        self.assertIn('attachment; filename="semester_profiles_', response['Content-Disposition'])
+        table = list(csv.reader(io.StringIO(self._body(response).decode('utf-8-sig'))))
+        self.assertEqual(table[0][:2], ['Student ID', 'Name'])
+        self.assertEqual(len(table), 6)
+
+        response = self.client.get('/api/semester-profiles/export_data/', {'file_format': 'xlsx'})
+        archive = zipfile.ZipFile(io.BytesIO(self._body(response)))
+        self.assertIsNone(archive.testzip())
+        sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        cells = [[cell.findtext('.//s:t', namespaces=namespace) for cell in row] for row in sheet.iterfind('.//s:row', namespace)]
+        self.assertEqual(len(cells), 6)
+        self.assertEqual(cells[1][6], 'College of <Nursing> & Allied')
+
+        response = self.client.get('/api/semester-profiles/export_data/', {'file_format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_exports(self):
+        response = self.client.get('/api/user-management/export/', {'user_type': 'student'})
+        self.assertEqual(response.status_code, 200)
+        lines = self._body(response).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('export_student', lines[1])
+        self.assertEqual(self.client.get('/api/appointments/export/').status_code, 200)
+        self.assertEqual(self.client.get('/api/medical-documents/export/').status_code, 200)
+
+        self.client.force_authenticate(user=self.student)
+        self.assertEqual(self.client.get('/api/user-management/export/').status_code, 403)
+        self.assertEqual(self.client.get('/api/appointments/export/').status_code, 403)
+
+
+class MedicineUsageTestCase(TestCase):
+    """Dental medicine usage is kept as line items and reported with one grouped query"""
+
+    def setUp(self):
+        from api.models import DentalMedicineSupply, Patient
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025', start_date='2024-08-01', end_date='2025-07-31', is_current=True, status='active'
+        )
+        self.admin = CustomUser.objects.create_user(
+            username='usage_admin', email='usage_admin@test.com', password='testpass123', user_type='admin', is_staff=True
+        )
+        self.patient = Patient.objects.create(student_id='U1', name='Usage Patient', school_year=self.school_year)
+        self.lidocaine = DentalMedicineSupply.objects.create(name='Lidocaine', type='anesthetic', unit='ml')
+
+    def _form(self, day, used_medicines):
+        from api.models import Appointment, DentalFormData
+        appointment = Appointment.objects.create(
+            patient=self.patient, appointment_date=day, appointment_time='09:00', purpose='Extraction',
+            type='dental', school_year=self.school_year,
+        )
+        return DentalFormData.objects.create(
+            appointment=appointment, patient=self.patient, date=day, used_medicines=used_medicines,
+        )
+
+    def test_line_items_follow_saves(self):
+        from api.models import DentalMedicineUsage
+
+        form = self._form('2024-09-10', [
+            {'id': str(self.lidocaine.id), 'name': 'Lidocaine', 'quantity': '2', 'unit': 'ml', 'cost': '12.50'},
+            {'id': 999, 'name': 'Gauze', 'quantity': 3, 'unit': 'pcs'},
+            'Cotton',
+            {'name': 'Broken', 'quantity': 'two'},
+            42,
+        ])
+        lines = {usage.name: usage for usage in DentalMedicineUsage.objects.filter(dental_form=form)}
+        self.assertEqual(set(lines), {'Lidocaine', 'Gauze', 'Cotton'})
+        self.assertEqual(lines['Lidocaine'].supply, self.lidocaine)
+        self.assertEqual(lines['Lidocaine'].quantity, 2)
+        self.assertIsNone(lines['Gauze'].supply)
+
+        form.used_medicines.append({'name': 'Floss', 'quantity': 1})
+        form.save()
+        self.assertEqual(DentalMedicineUsage.objects.filter(dental_form=form).count(), 4)
+
+        form.remarks = 'No change to the medicines'
+        form.save()
+        self.assertEqual(DentalMedicineUsage.objects.filter(dental_form=form).count(), 4)
+
+        form.used_medicines = '[]'
+        form.save()
+        self.assertFalse(DentalMedicineUsage.objects.filter(dental_form=form).exists())
+
+    def test_backfill_and_report(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from api.models import DentalFormData, DentalMedicineUsage
+
+        self._form('2024-09-10', [{'name': 'Lidocaine', 'quantity': 2, 'unit': 'ml', 'cost': 10}])
+        self._form('2024-09-20', [{'name': 'Lidocaine', 'quantity': 1, 'unit': 'ml', 'cost': 5}, {'name': 'Gauze', 'quantity': 5}])
+        self._form('2024-10-02', '[{"name": "Gauze", "quantity": 1}]')
+        # Rows written around the signals are picked up by the backfill
+        DentalFormData.objects.filter(date='2024-10-02').update(used_medicines=[{'name': 'Gauze', 'quantity': 4}])
+        DentalMedicineUsage.objects.filter(name='Lidocaine').delete()
+        call_command('backfill_medicine_usage', stdout=StringIO())
+        self.assertEqual(DentalMedicineUsage.objects.count(), 4)
+
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        url = '/api/admin-controls/system_configuration/dental_inventory_usage/'
+        with self.assertNumQueries(1):
+            response = client.get(url, {'type': 'monthly', 'start_date': '2024-09-01', 'end_date': '2024-10-31'})
+        self.assertEqual(response.status_code, 200)
+        usage = {item['item_name']: item for item in response.data['inventory_usage']}
+        self.assertEqual(usage['Gauze']['quantity_used'], 9)
+        self.assertEqual(usage['Lidocaine']['quantity_used'], 3)
+        self.assertEqual(usage['Lidocaine']['total_cost'], 15.0)
+        self.assertEqual(usage['Lidocaine']['usage_count'], 2)
+        self.assertEqual(response.data['summary']['total_usage_events'], 4)
+        periods = [(row['period'], row['item_name'], row['quantity_used']) for row in response.data['usage_by_period']]
+        self.assertEqual(periods, [
+            ('2024-09-01', 'Gauze', 5), ('2024-09-01', 'Lidocaine', 3), ('2024-10-01', 'Gauze', 4),
+        ])
+
+
+class SemesterBackfillTestCase(TestCase):
+    """update_appointment_semesters assigns semesters in chunks without per-row saves"""
+
+    def setUp(self):
+        from datetime import date
+        from api.models import Appointment, Patient
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025', start_date=date(2024, 8, 1), end_date=date(2025, 7, 31), is_current=True,
+            status='active', first_sem_start=date(2024, 8, 1), first_sem_end=date(2024, 12, 20),
+            second_sem_start=date(2025, 1, 6), second_sem_end=date(2025, 5, 30),
+            summer_start=date(2025, 6, 9), summer_end=date(2025, 7, 25),
+        )
+        patient = Patient.objects.create(student_id='S1', name='Semester Patient', school_year=self.school_year)
+        for day in [date(2024, 9, 2), date(2024, 12, 2), date(2025, 2, 3), date(2025, 6, 16), date(2025, 12, 30),
+                    date(2025, 1, 2)]:
+            Appointment.objects.create(
+                patient=patient, appointment_date=day, appointment_time='09:00', purpose='Checkup',
+                school_year=self.school_year,
+            )
+        # Appointments imported without semesters
+        Appointment.objects.update(semester=None)
+
+    def test_backfill_matches_determine_semester(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from api.models import Appointment
+        from api.stats_snapshots import find_drift, rebuild_snapshots
+
+        rebuild_snapshots()
+        expected = {
+            appointment.pk: appointment.determine_semester()
+            for appointment in Appointment.objects.select_related('school_year')
+        }
+
+        out = StringIO()
+        call_command('update_appointment_semesters', '--dry-run', stdout=out)
+        self.assertIn('Successfully updated: 4', out.getvalue())
+        self.assertEqual(Appointment.objects.filter(semester__isnull=True).count(), 6)
+
+        out = StringIO()
+        call_command('update_appointment_semesters', '--chunk-size', '4', stdout=out)
+        self.assertIn('6/6 appointments processed', out.getvalue())
+        self.assertIn('Outside every semester period: 2', out.getvalue())
+        self.assertEqual(dict(Appointment.objects.values_list('pk', 'semester')), expected)
+        self.assertEqual(find_drift(), {})
+
+
+class SemesterRolloverTestCase(TestCase):
+    """rollover_semester copies each active student's latest profile into the new term once"""
+
+    def setUp(self):
+        from datetime import date
+        from api.models import Patient
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025', start_date=date(2024, 8, 1), end_date=date(2025, 7, 31), is_current=True,
+            status='active',
+        )
+        self.students = [
+            CustomUser.objects.create_user(
+                username=f'rollover_{i}', email=f'rollover_{i}@test.com', password='testpass123', user_type='student',
+            )
+            for i in range(4)
+        ]
+        inactive = CustomUser.objects.create_user(
+            username='rollover_inactive', email='rollover_inactive@test.com', password='testpass123',
+            user_type='student', is_active=False,
+        )
+        self.staff_user = CustomUser.objects.create_user(
+            username='rollover_staff', email='rollover_staff@test.com', password='testpass123', user_type='staff',
+            is_staff=True,
+        )
+        # The first student has two versions; the last one has no profile yet
+        for user, name in [(self.students[0], 'Old Version'), (self.students[0], 'New Version'),
+                           (self.students[1], 'Second Student'), (self.students[2], 'Third Student'),
+                           (inactive, 'Inactive Student'), (self.staff_user, 'Staff Member')]:
+            Patient.objects.create(
+                user=user, student_id=f'R-{user.pk}', name=name, school_year=self.school_year,
+                semester='1st_semester', date_of_birth=date(2004, 5, 1), blood_type='O+', staff_notes='Seen in August',
+            )
+
+    def test_rollover_is_idempotent_and_maintains_derived_state(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from api.models import Patient
+        from api.patient_profiles import latest_per_email
+        from api.search import search_queryset
+        from api.stats_snapshots import find_drift, rebuild_snapshots
+
+        rebuild_snapshots()
+        out = StringIO()
+        call_command(
+            'rollover_semester', '--school-year', str(self.school_year.pk), '--semester', '2nd_semester',
+            '--chunk-size', '2', stdout=out,
+        )
+        self.assertIn('Profiles created: 3', out.getvalue())
+        self.assertIn('No profile to copy: 1', out.getvalue())
+
+        new_profiles = Patient.objects.filter(school_year=self.school_year, semester='2nd_semester')
+        self.assertEqual(
+            sorted(new_profiles.values_list('name', flat=True)), ['New Version', 'Second Student', 'Third Student'],
+        )
+        for profile in new_profiles:
+            self.assertEqual(profile.blood_type, 'O+')
+            self.assertIsNone(profile.staff_notes)
+            self.assertEqual(profile.age, profile.get_age())
+        # The new profiles are the latest versions, counted and searchable
+        self.assertEqual(
+            set(Patient.objects.filter(is_latest_profile=True).values_list('id', flat=True)),
+            set(latest_per_email(Patient.objects.all()).values_list('id', flat=True)),
+        )
+        self.assertTrue(all(profile.is_latest_profile for profile in new_profiles))
+        self.assertEqual(find_drift(), {})
+        self.assertIn(
+            new_profiles.get(name='Third Student').pk,
+            set(search_queryset(Patient.objects.all(), 'third student').values_list('id', flat=True)),
+        )
+
+        # Running again, or over an overlapping range, creates nothing
+        out = StringIO()
+        call_command(
+            'rollover_semester', '--school-year', str(self.school_year.pk), '--semester', '2nd_semester',
+            '--from-user', str(self.students[1].pk), stdout=out,
+        )
+        self.assertIn('Profiles created: 0', out.getvalue())
+        self.assertIn('Already had a profile: 2', out.getvalue())
+        self.assertEqual(new_profiles.count(), 3)
+
+    def test_rollover_endpoint_queues_one_job_per_user_range(self):
+        from api.jobs import run_pending_jobs
+        from api.models import Patient
+        from api.semester_rollover import user_ranges
+
+        ranges = user_ranges(range_size=2)
+        self.assertEqual(ranges[0][0], self.students[0].pk)
+        self.assertEqual(ranges[-1][1], self.students[-1].pk)
+
+        client = APIClient()
+        client.force_authenticate(user=self.students[0])
+        response = client.post(f'/api/semesters/{self.school_year.pk}/rollover/', {'semester': 'summer'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        client.force_authenticate(user=self.staff_user)
+        response = client.post(f'/api/semesters/{self.school_year.pk}/rollover/', {'semester': 'winter'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = client.post(f'/api/semesters/{self.school_year.pk}/rollover/', {'semester': 'summer'})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['jobs'], len(user_ranges()))
+
+        self.assertEqual(run_pending_jobs(threads=0), (response.data['jobs'], 0))
+        progress = client.get('/api/semesters/rollover_status/', {'batch_id': response.data['batch_id']})
+        self.assertEqual(progress.status_code, status.HTTP_200_OK)
+        self.assertEqual(progress.data['done'], response.data['jobs'])
+        self.assertEqual(Patient.objects.filter(semester='summer').count(), 3)
+
+
+@override_settings(AUTH_USER_CACHE_TTL=30)
+class CachedAuthenticationTestCase(TestCase):
+    """CachedJWTAuthentication reuses the resolved user until the user, staff details or profiles change"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework_simplejwt.tokens import RefreshToken
+        from api.models import StaffDetails
+        cache.clear()
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025', start_date='2024-08-01', end_date='2025-07-31', is_current=True,
+            status='active',
+        )
+        self.student = CustomUser.objects.create_user(
+            username='auth_student', email='auth_student@test.com', password='testpass123', user_type='student',
+        )
+        self.staff_user = CustomUser.objects.create_user(
+            username='auth_staff', email='auth_staff@test.com', password='testpass123', user_type='staff',
+            is_staff=True,
+        )
+        StaffDetails.objects.create(user=self.staff_user, full_name='Auth Staff', position='Nurse')
+        self.client = APIClient()
+        self.tokens = {
+            user.pk: str(RefreshToken.for_user(user).access_token) for user in (self.student, self.staff_user)
+        }
+
+    def _get(self, user, path='/api/users/me/'):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.tokens[user.pk]}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        return response, len(queries)
+
+    def test_cached_user_skips_lookups_until_invalidated(self):
+        from api.authentication import cache_stats, reset_cache_stats
+        reset_cache_stats()
+        first, cold = self._get(self.staff_user)
+        second, warm = self._get(self.staff_user)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data, first.data)
+        self.assertLess(warm, cold)
+        self.assertEqual(cache_stats()['hits'], 1)
+
+        # Blocking, staff detail edits and password changes are seen on the next request
+        self.staff_user.block_user(self.student, 'Testing')
+        response, _ = self._get(self.staff_user)
+        self.assertTrue(response.data['is_blocked'])
+        self.staff_user.staff_details.position = 'Doctor'
+        self.staff_user.staff_details.save()
+        self.assertEqual(self._get(self.staff_user)[1], cold)
+        self.staff_user.is_active = False
+        self.staff_user.save()
+        response, _ = self._get(self.staff_user)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_process_local_cache_is_opt_in(self):
+        from api.authentication import cache_stats, reset_cache_stats
+        reset_cache_stats()
+        # Unset with the per-process default cache, blocking a user in one worker would not reach the others
+        with override_settings(AUTH_USER_CACHE_TTL=None):
+            self._get(self.staff_user)
+            self._get(self.staff_user)
+        self.assertEqual(cache_stats()['hits'], 0)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'auth_cache'}}
+        with override_settings(AUTH_USER_CACHE_TTL=None, CACHES=shared):
+            from api.authentication import _ttl
+            self.assertEqual(_ttl(), 30)
+
+    def test_current_profile_id_follows_new_profiles(self):
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from api.authentication import CachedJWTAuthentication
+        from api.models import Patient
+
+        def authenticate():
+            request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.tokens[self.student.pk]}')
+            return CachedJWTAuthentication().authenticate(Request(request))[0]
+
+        user = authenticate()
+        self.assertIsNone(user.get_current_patient_profile())
+        profile = Patient.objects.create(user=self.student, student_id='A-1', name='Auth Student',
+                                         school_year=self.school_year)
+        # The instance resolved before the profile existed notices the change
+        self.assertEqual(user.get_current_patient_profile(), profile)
+        self.assertEqual(authenticate().get_current_patient_profile(), profile)
+
+
+class SparseFieldsetTestCase(TestCase):
+    """?fields=, ?omit= and ?view=summary trim list responses and the columns they load"""
+
+    def setUp(self):
+        from api.models import Appointment, Patient
+        self.staff_user = CustomUser.objects.create_user(
+            username='fields_staff', email='fields_staff@test.com', password='testpass123', user_type='staff',
+            is_staff=True,
+        )
+        self.school_year = AcademicSchoolYear.objects.create(
+            academic_year='2024-2025', start_date='2024-08-01', end_date='2025-07-31', is_current=True,
+            status='active',
+        )
+        for i in range(3):
+            user = CustomUser.objects.create_user(
+                username=f'fields_{i}', email=f'fields_{i}@test.com', password='testpass123', user_type='student',
+                first_name='Field', last_name=f'Student {i}',
+            )
+            patient = Patient.objects.create(
+                user=user, student_id=f'F-{i}', name=f'Student {i}, Field', school_year=self.school_year,
+                vaccination_history={'covid': 'complete'},
+            )
+            Appointment.objects.create(
+                patient=patient, appointment_date='2025-01-10', appointment_time='09:00', purpose='Checkup',
+                type='medical', school_year=self.school_year,
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff_user)
+
+    def _get(self, path):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        return response, ' '.join(query['sql'] for query in queries.captured_queries)
+
+    def test_fields_and_omit(self):
+        full, full_sql = self._get('/api/patients/')
+        self.assertIn('vaccination_history', full_sql)
+
+        response, sql = self._get('/api/patients/?fields=id,name,user_name')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([set(row) for row in response.data], [{'id', 'name', 'user_name'}] * 3)
+        self.assertEqual(
+            [(row['id'], row['name'], row['user_name']) for row in response.data],
+            [(row['id'], row['name'], row['user_name']) for row in full.data],
+        )
+        self.assertNotIn('vaccination_history', sql)
+
+        response, _ = self._get('/api/patients/?omit=vaccination_history,family_medical_history')
+        self.assertEqual(set(response.data[0]), set(full.data[0]) - {'vaccination_history', 'family_medical_history'})
+
+        response, _ = self._get('/api/patients/?fields=id,no_such_field')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('no_such_field', str(response.data['fields']))
+
+    def test_summary_views_match_full_rows(self):
+        from api.serializers import AppointmentSummarySerializer, PatientSummarySerializer
+
+        for path, serializer_class in [('/api/patients/', PatientSummarySerializer),
+                                       ('/api/appointments/', AppointmentSummarySerializer)]:
+            full, _ = self._get(path)
+            summary, sql = self._get(f'{path}?view=summary')
+            self.assertEqual(summary.status_code, status.HTTP_200_OK)
+            # Same values as the full rows (fields that render nothing, e.g. doctor_name without a doctor, are skipped by both)
+            self.assertEqual(
+                [dict(row) for row in summary.data],
+                [{key: row[key] for key in serializer_class.Meta.fields if key in row} for row in full.data],
+            )
+            self.assertIn('patient_name' if 'appointments' in path else 'user_name', summary.data[0])
+            self.assertNotIn('vaccination_history', sql)
+            self.assertNotIn('"notes"', sql)
+
+
+class ResponseEncodingTestCase(TestCase):
+    """FastJSONRenderer matches JSONRenderer and CompressionMiddleware compresses large responses"""
+
+    def test_renderer_matches_json_renderer(self):
+        import datetime
+        import uuid
+        from decimal import Decimal
+        from django.utils import timezone
+        from django.utils.translation import gettext_lazy
+        from rest_framework.renderers import JSONRenderer
+        from api.renderers import FastJSONRenderer
+
+        data = {
+            'created_at': datetime.datetime(2025, 1, 6, 8, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'local': timezone.localtime(timezone.now()),
+            'date': datetime.date(2025, 1, 6),
+            'time': datetime.time(9, 15, 30, 250000),
+            'cost': Decimal('12.50'),
+            'token': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'label': gettext_lazy('Pending'),
+            'counts': {1: 'first', 2: [True, None, 3.5]},
+            'text': '\u00d1 line\u2028separator',
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4'),
+        )
+
+    def test_choose_encoding(self):
+        from api.compression import choose_encoding, get_config
+        config = dict(get_config(), ENCODINGS=['gzip'])
+        self.assertEqual(choose_encoding('gzip, deflate', config), 'gzip')
+        self.assertEqual(choose_encoding('br;q=1.0, gzip;q=0', config), None)
+        self.assertEqual(choose_encoding('*', config), 'gzip')
+        self.assertEqual(choose_encoding('', config), None)
+
+    def test_middleware_compresses_large_json(self):
+        import gzip
+        from api.models import Patient
+        staff = CustomUser.objects.create_user(
+            username='encoding_staff', email='encoding_staff@test.com', password='testpass123', user_type='staff',
+            is_staff=True,
+        )
+        for i in range(20):
+            Patient.objects.create(student_id=f'E-{i}', name=f'Encoding Patient {i}', email=f'encoding_{i}@test.com')
+        client = APIClient()
+        client.force_authenticate(user=staff)
+
+        plain = client.get('/api/patients/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        compressed = client.get('/api/patients/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertLess(int(compressed['Content-Length']), len(plain.content))
+
+        # Bodies under MIN_SIZE are sent as they are
+        small = client.get('/api/patients/?fields=id&page_size=1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
@@ -12,9 +12,10 @@ from .views import (
     UserTypeInformationViewSet, AnnouncementViewSet, CourseViewSet
 )
 from .views1 import MedicalFormDataViewSet, PatientViewSet as GeneralPatientViewSet, DentalInformationRecordViewSet
-from .views2 import AppointmentSchedulingViewSet, DentalMedicineSupplyViewSet
+from .views2 import AppointmentSchedulingViewSet, DentalMedicineSupplyViewSet, WaitlistViewSet
 from .semester_views import AcademicSemesterViewSet, StudentSemesterProfileViewSet
 from .content_views import ContentManagementViewSet
+from .profiling import ProfilingView
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -23,6 +24,7 @@ router.register(r'patients', GeneralPatientViewSet)  # General patient endpoints
 router.register(r'medical-records', MedicalRecordViewSet)
 router.register(r'appointments', AppointmentViewSet)
 router.register(r'appointments-v2', AppointmentSchedulingViewSet, basename='appointments-v2')  # New enhanced scheduling
+router.register(r'appointment-waitlist', WaitlistViewSet, basename='appointment-waitlist')  # Waitlist for fully booked days
 router.register(r'dental-medicines', DentalMedicineSupplyViewSet, basename='dental-medicines')  # Dental medicines and supplies
 router.register(r'academic-school-years', AcademicSchoolYearViewSet)
 router.register(r'semesters', AcademicSemesterViewSet, basename='semesters')  # Semester management
@@ -73,6 +75,9 @@ urlpatterns = [
     path('patients/update_my_profile/', ProfilePatientViewSet.as_view({'put': 'update_my_profile', 'patch': 'update_my_profile'}), name='profile-setup-update-my-profile'),
     path('patients/create_or_update_profile/', ProfilePatientViewSet.as_view({'post': 'create_or_update_profile'}), name='profile-setup-create-or-update-profile'),
     
+    # Request profiling summary (admin only)
+    path('profiling/', ProfilingView.as_view(), name='api-profiling'),
+    
     # Semester specific endpoints
     path('current-semester/', AcademicSemesterViewSet.as_view({'get': 'current'}), name='current-semester'),
     
@@ -2,7 +2,7 @@
 from rest_framework.response import Response
 from rest_framework.decorators import action, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from django.shortcuts import get_object_or_404
@@ -19,7 +19,7 @@ from .models import (
 )
 from .serializers import (
     UserSerializer, PatientSerializer, MedicalRecordSerializer, 
-    AppointmentSerializer, InventorySerializer, SignupSerializer,
+    AppointmentSerializer, AppointmentSummarySerializer, InventorySerializer, SignupSerializer,
     LoginSerializer, EmailVerificationSerializer, WaiverSerializer, DentalWaiverSerializer,
     PatientProfileUpdateSerializer, MedicalDocumentSerializer, 
     DentalFormDataSerializer, MedicalFormDataSerializer, StaffDetailsSerializer,
@@ -30,6 +30,14 @@ from .serializers import (
     FamilyMedicalHistoryItemSerializer, DentalInformationRecordSerializer, ContentManagementSerializer,
     AnnouncementSerializer, UserAnnouncementViewSerializer, CourseSerializer
 )
+from . import announcements
+from .exports import appointment_columns, export_response, medical_document_columns, user_columns
+from .fieldsets import SparseFieldsetViewMixin
+from .pagination import KeysetPagination
+from .patient_profiles import latest_per_email
+from .profiling import ProfiledViewMixin
+from .school_year_cache import current_school_year
+from .search import order_by_rank, search_queryset
 from rest_framework.views import APIView
 from django.db.models import Q, Count
 from django.db import transaction
@@ -413,21 +421,11 @@ class PatientViewSet(viewsets.ModelViewSet):
         # Return only the latest profile per email (deduplicate by email)
         # For admin view, show only the most recent profile per person
         # Use email as the unique identifier since it's more reliable than user_id
-        from django.db.models import Max, Case, When, Value, CharField, F
-        from django.db.models.functions import Coalesce
-        
-        # Get the email to use for each patient (prefer patient.email, fallback to user.email)
-        queryset = queryset.annotate(
-            dedupe_email=Coalesce('email', 'user__email', Value(''))
-        )
-        
-        # Find the latest profile ID for each unique email
-        latest_per_email = queryset.values('dedupe_email').annotate(
-            latest_id=Max('id')
-        ).values_list('latest_id', flat=True)
-        
-        # Filter to only include the latest profiles
-        queryset = queryset.filter(id__in=latest_per_email)
+        if school_year_id:
+            # Latest profile within the selected school year
+            queryset = latest_per_email(queryset)
+        else:
+            queryset = queryset.filter(is_latest_profile=True)
         
         return queryset
 
@@ -438,7 +436,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         school_year_id = self.request.data.get('school_year')
         if not school_year_id:
             try:
-                current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                current_school_year = AcademicSchoolYear.get_current()
                 school_year_id = current_school_year.id
             except AcademicSchoolYear.DoesNotExist:
                 raise serializers.ValidationError("No active school year found.")
@@ -528,7 +526,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         else:
             # Get current school year
             try:
-                school_year = AcademicSchoolYear.objects.get(is_current=True)
+                school_year = AcademicSchoolYear.get_current()
             except AcademicSchoolYear.DoesNotExist:
                 return Response({'detail': 'No active school year found.'}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -610,7 +608,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         else:
             # Get current school year
             try:
-                school_year = AcademicSchoolYear.objects.get(is_current=True)
+                school_year = AcademicSchoolYear.get_current()
             except AcademicSchoolYear.DoesNotExist:
                 return Response({'detail': 'No active school year found.'}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -741,7 +739,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         
         # Get current school year
         try:
-            current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+            current_school_year = AcademicSchoolYear.get_current()
         except AcademicSchoolYear.DoesNotExist:
             current_school_year = None
         
@@ -905,7 +903,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             else:
                 # No profile, try to get or create one
                 try:
-                    current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                    current_school_year = AcademicSchoolYear.get_current()
                     patient_profile, created = user.patient_profiles.get_or_create(
                         school_year=current_school_year,
                         defaults={
@@ -1022,7 +1020,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         else:
             # If no patient profile exists, we need to create one first
             try:
-                current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                current_school_year = AcademicSchoolYear.get_current()
                 # Create a patient profile automatically
                 patient_profile = Patient.objects.create(
                     user=user,
@@ -1536,7 +1534,7 @@ class AcademicSchoolYearViewSet(viewsets.ModelViewSet):
     def current(self, request):
         """Get current academic year"""
         try:
-            current_year = AcademicSchoolYear.objects.filter(is_current=True).first()
+            current_year = current_school_year()
             if current_year:
                 serializer = self.get_serializer(current_year)
                 return Response(serializer.data)
@@ -2783,7 +2781,7 @@ class SystemConfigurationViewSet(viewsets.ModelViewSet):
             
             # Get current school year/semester
             try:
-                current_semester = AcademicSchoolYear.objects.get(is_current=True)
+                current_semester = AcademicSchoolYear.get_current()
             except AcademicSchoolYear.DoesNotExist:
                 current_semester = None
             
@@ -3695,7 +3693,7 @@ class AppointmentViewSetDuplicate(viewsets.ModelViewSet):
             else:
                 # No profile, try to get or create one
                 try:
-                    current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                    current_school_year = AcademicSchoolYear.get_current()
                     patient_profile, created = user.patient_profiles.get_or_create(
                         school_year=current_school_year,
                         defaults={
@@ -3812,7 +3810,7 @@ class AppointmentViewSetDuplicate(viewsets.ModelViewSet):
         else:
             # If no patient profile exists, we need to create one first
             try:
-                current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                current_school_year = AcademicSchoolYear.get_current()
                 # Create a patient profile automatically
                 patient_profile = Patient.objects.create(
                     user=user,
@@ -4062,7 +4060,7 @@ class AuthViewSet(viewsets.ViewSet):
         }, status=status.HTTP_200_OK)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ProfiledViewMixin, viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -4109,12 +4107,41 @@ class UserManagementViewSet(viewsets.ViewSet):
     
     def get_permissions(self):
         """Only allow staff/admin users to access user management"""
-        if self.action in ['list', 'get_user_statistics', 'block_user', 'unblock_user']:
+        if self.action in ['list', 'export', 'get_user_statistics', 'block_user', 'unblock_user']:
             permission_classes = [permissions.IsAuthenticated]
         else:
             permission_classes = [permissions.IsAdminUser]
         return [permission() for permission in permission_classes]
     
+    @staticmethod
+    def filtered_users(request):
+        """Users matching the list filters of the request"""
+        # Get all users with related data
+        users = CustomUser.objects.select_related('blocked_by').order_by('-date_joined')
+        
+        # Apply filters if provided
+        user_type = request.query_params.get('user_type')
+        if user_type and user_type != 'all':
+            users = users.filter(user_type=user_type)
+        
+        is_active = request.query_params.get('is_active')
+        if is_active is not None:
+            users = users.filter(is_active=is_active.lower() == 'true')
+        
+        is_blocked = request.query_params.get('is_blocked')
+        if is_blocked is not None:
+            users = users.filter(is_blocked=is_blocked.lower() == 'true')
+        
+        is_verified = request.query_params.get('is_verified')
+        if is_verified is not None:
+            users = users.filter(is_email_verified=is_verified.lower() == 'true')
+        
+        search = request.query_params.get('search')
+        if search:
+            # Indexed token search, best matches first
+            users = search_queryset(users, search)
+        return users
+    
     def list(self, request):
         """Get list of all users for admin management"""
         user = request.user
@@ -4124,45 +4151,37 @@ class UserManagementViewSet(viewsets.ViewSet):
             raise PermissionDenied("You don't have permission to view user management.")
         
         try:
-            # Get all users with related data
-            users = CustomUser.objects.select_related('blocked_by').order_by('-date_joined')
-            
-            # Apply filters if provided
-            user_type = request.query_params.get('user_type')
-            if user_type and user_type != 'all':
-                users = users.filter(user_type=user_type)
-            
-            is_active = request.query_params.get('is_active')
-            if is_active is not None:
-                users = users.filter(is_active=is_active.lower() == 'true')
-            
-            is_blocked = request.query_params.get('is_blocked')
-            if is_blocked is not None:
-                users = users.filter(is_blocked=is_blocked.lower() == 'true')
-            
-            is_verified = request.query_params.get('is_verified')
-            if is_verified is not None:
-                users = users.filter(is_email_verified=is_verified.lower() == 'true')
+            users = self.filtered_users(request)
             
-            search = request.query_params.get('search')
-            if search:
-                users = users.filter(
-                    Q(first_name__icontains=search) |
-                    Q(last_name__icontains=search) |
-                    Q(middle_name__icontains=search) |
-                    Q(email__icontains=search) |
-                    Q(username__icontains=search)
-                )
+            # Keyset pagination when requested with ?page_size= / ?cursor=
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(users, request, view=self)
+            if page is not None:
+                serializer = UserManagementSerializer(page, many=True)
+                return paginator.get_paginated_response(serializer.data)
             
             # Serialize the data
             serializer = UserManagementSerializer(users, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
             
+        except NotFound:
+            raise
         except Exception as e:
             return Response({
                 'error': f'Failed to fetch users: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the filtered user list as CSV (default) or XLSX with ?file_format="""
+        user = request.user
+        
+        # Check if user has admin permissions
+        if not (user.is_staff or user.user_type in ['staff', 'admin']):
+            raise PermissionDenied("You don't have permission to export users.")
+        
+        return export_response(request, self.filtered_users(request), user_columns(), 'users')
+    
     @action(detail=False, methods=['get'])
     def get_user_statistics(self, request):
         """Get user statistics for admin dashboard"""
@@ -4173,34 +4192,9 @@ class UserManagementViewSet(viewsets.ViewSet):
             raise PermissionDenied("You don't have permission to view user statistics.")
         
         try:
-            # Get user counts
-            total_users = CustomUser.objects.count()
-            active_users = CustomUser.objects.filter(is_active=True).count()
-            blocked_users = CustomUser.objects.filter(is_blocked=True).count()
-            verified_users = CustomUser.objects.filter(is_email_verified=True).count()
-            
-            # Get user type counts
-            user_type_counts = CustomUser.objects.values('user_type').annotate(
-                count=Count('id')
-            ).order_by('user_type')
-            
-            # Transform user type counts to dict
-            user_type_dict = {
-                'student': 0,
-                'staff': 0,
-                'admin': 0
-            }
-            
-            for item in user_type_counts:
-                user_type_dict[item['user_type']] = item['count']
-            
-            statistics = {
-                'total_users': total_users,
-                'active_users': active_users,
-                'blocked_users': blocked_users,
-                'verified_users': verified_users,
-                'user_type_counts': user_type_dict
-            }
+            # Counters are read from the materialized statistics snapshots
+            from .stats_snapshots import user_statistics
+            statistics = user_statistics()
             
             return Response(statistics, status=status.HTTP_200_OK)
             
@@ -4309,32 +4303,20 @@ class PatientViewSet(viewsets.ModelViewSet):
         if user_id:
             queryset = queryset.filter(user_id=user_id)
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(email__icontains=search) |
-                Q(user__email__icontains=search) |
-                Q(student_id__icontains=search) |
-                Q(department__icontains=search)
-            )
+            # Indexed token search; ranked once the profiles are deduplicated
+            queryset = search_queryset(queryset, search, rank=False)
         
         # Return only the latest profile per email (deduplicate by email)
         # For admin view, show only the most recent profile per person
         # Use email as the unique identifier since it's more reliable than user_id
-        from django.db.models import Max, Case, When, Value, CharField, F
-        from django.db.models.functions import Coalesce
-        
-        # Get the email to use for each patient (prefer patient.email, fallback to user.email)
-        queryset = queryset.annotate(
-            dedupe_email=Coalesce('email', 'user__email', Value(''))
-        )
-        
-        # Find the latest profile ID for each unique email
-        latest_per_email = queryset.values('dedupe_email').annotate(
-            latest_id=Max('id')
-        ).values_list('latest_id', flat=True)
+        if school_year_id:
+            # Latest profile within the selected school year
+            queryset = latest_per_email(queryset)
+        else:
+            queryset = queryset.filter(is_latest_profile=True)
         
-        # Filter to only include the latest profiles
-        queryset = queryset.filter(id__in=latest_per_email)
+        if search:
+            queryset = order_by_rank(queryset, search)
         
         return queryset
 
@@ -4345,7 +4327,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         school_year_id = self.request.data.get('school_year')
         if not school_year_id:
             try:
-                current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                current_school_year = AcademicSchoolYear.get_current()
                 school_year_id = current_school_year.id
             except AcademicSchoolYear.DoesNotExist:
                 raise serializers.ValidationError("No active school year found.")
@@ -4435,7 +4417,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         else:
             # Get current school year
             try:
-                school_year = AcademicSchoolYear.objects.get(is_current=True)
+                school_year = AcademicSchoolYear.get_current()
             except AcademicSchoolYear.DoesNotExist:
                 return Response({'detail': 'No active school year found.'}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -4517,7 +4499,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         else:
             # Get current school year
             try:
-                school_year = AcademicSchoolYear.objects.get(is_current=True)
+                school_year = AcademicSchoolYear.get_current()
             except AcademicSchoolYear.DoesNotExist:
                 return Response({'detail': 'No active school year found.'}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -4648,7 +4630,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         
         # Get current school year
         try:
-            current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+            current_school_year = AcademicSchoolYear.get_current()
         except AcademicSchoolYear.DoesNotExist:
             current_school_year = None
         
@@ -4795,10 +4777,23 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(SparseFieldsetViewMixin, ProfiledViewMixin, viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
+    summary_serializer_class = AppointmentSummarySerializer  # ?view=summary
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination  # opt-in: only used when ?page_size= or ?cursor= is sent
+    
+    @staticmethod
+    def with_serializer_lookups(queryset):
+        """Join the relations and annotate the form-data flags AppointmentSerializer renders"""
+        from django.db.models import Exists, OuterRef
+        return queryset.select_related(
+            'patient', 'patient__user', 'doctor', 'rescheduled_by', 'school_year'
+        ).annotate(
+            has_dental_form_data=Exists(DentalFormData.objects.filter(appointment=OuterRef('pk'))),
+            has_medical_form_data=Exists(MedicalFormData.objects.filter(appointment=OuterRef('pk'))),
+        )
     
     def get_queryset(self):
         user = self.request.user
@@ -4820,7 +4815,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             else:
                 # No profile, try to get or create one
                 try:
-                    current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                    current_school_year = AcademicSchoolYear.get_current()
                     patient_profile, created = user.patient_profiles.get_or_create(
                         school_year=current_school_year,
                         defaults={
@@ -4907,7 +4902,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             elif ordering == '-appointment_date':
                 order_by_fields = ['-appointment_date', '-appointment_time']
 
-            return queryset.order_by(*order_by_fields)
+            return self.with_serializer_lookups(queryset).order_by(*order_by_fields)
             
         except Exception as e:
             # Log the error and return an empty queryset to prevent 500 errors
@@ -4916,6 +4911,14 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             logger.error(f"Error in AppointmentViewSet.get_queryset: {str(e)}")
             return Appointment.objects.none()
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the filtered appointment list as CSV (default) or XLSX with ?file_format= (staff only)"""
+        user = request.user
+        if not (user.is_staff or user.user_type in ['staff', 'admin']):
+            raise PermissionDenied("Only staff can export appointments.")
+        return export_response(request, self.get_queryset(), appointment_columns(), 'appointments')
+
     def perform_create(self, serializer):
         user = self.request.user
         
@@ -4937,7 +4940,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         else:
             # If no patient profile exists, we need to create one first
             try:
-                current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                current_school_year = AcademicSchoolYear.get_current()
                 # Create a patient profile automatically
                 patient_profile = Patient.objects.create(
                     user=user,
@@ -5263,52 +5266,61 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         if not (request.user.is_staff or getattr(request.user, 'user_type', None) in ['staff', 'admin']):
             raise PermissionDenied("Only staff can send certificates via email")
 
-        doc = self.get_object()
+        appointment = self.get_object()
         
-        # Check if medical certificate exists
-        if not hasattr(doc, 'medical_certificate') or not doc.medical_certificate:
+        # The certificate is the one issued on the patient's medical documents for the appointment's year
+        from .models import MedicalDocument
+        doc = MedicalDocument.objects.filter(
+            patient=appointment.patient,
+            status='issued',
+            academic_year=appointment.school_year
+        ).first()
+        if not doc or not doc.medical_certificate:
             return Response({
                 'detail': 'No medical certificate available to send.'
             }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Check if document is approved/issued
-        if doc.status != 'approved':
-            return Response({
-                'detail': 'Document must be approved before sending certificate.'
-            }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # Get recipient email from request or use patient's email
-            recipient_email = request.data.get('email')
-            if not recipient_email and hasattr(doc, 'patient') and hasattr(doc.patient, 'user'):
-                recipient_email = doc.patient.user.email
+            from .email_outbox import enqueue_email
+            from django.conf import settings
             
+            # Only the patient's own addresses may receive the certificate link
+            patient_emails = [email for email in (appointment.patient.email, appointment.patient.user.email) if email]
+            recipient_email = request.data.get('email') or (patient_emails[0] if patient_emails else None)
             if not recipient_email:
                 return Response({
                     'detail': 'No email address provided or found for patient.'
                 }, status=status.HTTP_400_BAD_REQUEST)
+            if recipient_email.lower() not in {email.lower() for email in patient_emails}:
+                return Response({
+                    'detail': "The certificate can only be sent to the patient's email address."
+                }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Here you would implement your email sending logic
-            # For example, using Django's send_mail or your custom email service
-            # from django.core.mail import send_mail
-            # send_mail(
-            #     subject='Your Medical Certificate',
-            #     message='Please find your medical certificate attached.',
-            #     from_email='noreply@wmsu.edu.ph',
-            #     recipient_list=[recipient_email],
-            #     fail_silently=False,
-            # )
-            
-            # For now, we'll just log the action and return success
-            # You can implement the actual email sending based on your email service
+            certificate_url = request.build_absolute_uri(doc.medical_certificate.url)
+            message = f'''
+Dear {appointment.patient.name},
+
+Your medical certificate has been issued. You can download it here:
+
+{certificate_url}
+
+Appointment Date: {appointment.appointment_date.strftime('%B %d, %Y')}
+
+Best regards,
+WMSU Health Services
+            '''
             
-            # Update document to track email sent
-            doc.certificate_emailed_at = timezone.now()
-            doc.certificate_emailed_by = request.user
-            doc.save()
+            # Queue the email; the process_email_outbox worker delivers it
+            enqueue_email(
+                idempotency_key=f'appointment-certificate:{doc.pk}:{recipient_email}',
+                subject='Your Medical Certificate',
+                message=message,
+                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@wmsu.edu.ph'),
+                recipient_list=[recipient_email],
+            )
             
             return Response({
-                'detail': f'Medical certificate sent successfully to {recipient_email}'
+                'detail': f'Medical certificate queued for delivery to {recipient_email}'
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -5451,7 +5463,7 @@ class AcademicSchoolYearViewSet(viewsets.ModelViewSet):
     def current(self, request):
         """Get current academic year"""
         try:
-            current_year = AcademicSchoolYear.objects.filter(is_current=True).first()
+            current_year = current_school_year()
             if current_year:
                 serializer = self.get_serializer(current_year)
                 return Response(serializer.data)
@@ -5641,7 +5653,7 @@ class DentalWaiverViewSet(viewsets.ModelViewSet):
                 'waiver': None
             })
 
-class DentalFormDataViewSet(viewsets.ModelViewSet):
+class DentalFormDataViewSet(ProfiledViewMixin, viewsets.ModelViewSet):
     """ViewSet for managing dental form data"""
     queryset = DentalFormData.objects.all()
     serializer_class = DentalFormDataSerializer
@@ -5903,7 +5915,7 @@ class MedicalFormDataViewSet(viewsets.ModelViewSet):
         return queryset.select_related('patient', 'appointment').order_by('-created_at')
 
 
-class StaffManagementViewSet(viewsets.ModelViewSet):
+class StaffManagementViewSet(ProfiledViewMixin, viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
     
@@ -5917,10 +5929,14 @@ class StaffManagementViewSet(viewsets.ModelViewSet):
     
     def list(self, request):
         """List all staff members with their details"""
-        queryset = self.get_queryset()
+        queryset = self.get_queryset().select_related('staff_details')
+        
+        # Keyset pagination when requested with ?page_size= / ?cursor=
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
         staff_data = []
         
-        for user in queryset:
+        for user in (page if page is not None else queryset):
             staff_info = {
                 'id': user.id,
                 'username': user.username,
@@ -5945,6 +5961,8 @@ class StaffManagementViewSet(viewsets.ModelViewSet):
             
             staff_data.append(staff_info)
         
+        if page is not None:
+            return paginator.get_paginated_response(staff_data)
         return Response(staff_data)
     
     def get_department_from_position(self, position):
@@ -6579,466 +6597,9 @@ class SystemConfigurationViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("You don't have permission to view dashboard statistics.")
         
         try:
-            from .models import (
-                Appointment, MedicalDocument, Patient,
-                CustomUser, AcademicSchoolYear
-            )
-            from django.db.models import Count, Q
-            from datetime import datetime, timedelta
-            
-            # Get current academic year
-            current_semester = None
-            try:
-                current_semester = AcademicSchoolYear.objects.filter(is_current=True).first()
-            except:
-                pass
-            
-            # Define comprehensive user type mapping for proper categorization
-            user_type_mapping = {
-                'employee': 'Employee',
-                'staff': 'Employee',
-                'college': 'College',
-                'high_school': 'High School',
-                'senior_high_school': 'Senior High School',
-                'senior high school': 'Senior High School',
-                'elementary': 'Elementary',
-                'kindergarten': 'Kindergarten',
-                'incoming_freshman': 'Incoming Freshman',
-                'incoming freshman': 'Incoming Freshman',
-                'student': 'College',  # Default fallback
-            }
-            
-            # Define all possible user types that should be tracked
-            all_user_types = [
-                'Kindergarten',
-                'Elementary', 
-                'High School',
-                'Senior High School',
-                'College',
-                'Incoming Freshman',
-                'Employee'
-            ]
-            
-            # Medical consultations statistics (using Appointment with type='medical')
-            medical_total = Appointment.objects.filter(type='medical').count()
-            medical_completed = Appointment.objects.filter(type='medical', status='completed').count()
-            medical_pending = Appointment.objects.filter(type='medical', status='pending').count()
-            medical_rejected = Appointment.objects.filter(type='medical', status='cancelled').count()
-            
-            # Dental consultations statistics (using Appointment with type='dental')
-            dental_total = Appointment.objects.filter(type='dental').count()
-            dental_completed = Appointment.objects.filter(type='dental', status='completed').count()
-            dental_pending = Appointment.objects.filter(type='dental', status='pending').count()
-            dental_rejected = Appointment.objects.filter(type='dental', status='cancelled').count()
-            
-            # Medical documents statistics
-            documents_total = MedicalDocument.objects.count()
-            documents_issued = MedicalDocument.objects.filter(status='issued').count()
-            documents_pending = MedicalDocument.objects.filter(status='pending').count()
-            
-            # Patient statistics
-            patients_total = CustomUser.objects.filter(user_type='student').count()
-            patients_verified = CustomUser.objects.filter(user_type='student', is_email_verified=True).count()
-            patients_unverified = CustomUser.objects.filter(user_type='student', is_email_verified=False).count()
-            
-            # Enhanced User Type Breakdown with Detailed Demographics
-            user_type_breakdown = {}
-            
-            # Get detailed patient demographics with comprehensive breakdown
-            def get_comprehensive_demographics():
-                """Get detailed breakdown of demographics by user type with specific fields"""
-                detailed_demographics = {}
-                
-                # For each user type, get detailed breakdown
-                for user_type in all_user_types:
-                    # Get patients of this user type
-                    patients_of_type = Patient.objects.filter(user_type=user_type).select_related('user')
-                    
-                    if not patients_of_type.exists():
-                        continue
-                    
-                    breakdown = {
-                        'total': patients_of_type.count(),
-                        'details': {}
-                    }
-                    
-                    if user_type == 'College':
-                        # College: Group by year level and course
-                        breakdown['details'] = {
-                            'by_year_level': {},
-                            'by_course': {},
-                            'by_department': {},
-                            'by_year_and_course': {}
-                        }
-                        
-                        for patient in patients_of_type:
-                            # Extract year level
-                            year_level = patient.year_level
-                            if not year_level and patient.user and hasattr(patient.user, 'education_year'):
-                                year_level = f"{patient.user.education_year} Year" if patient.user.education_year else None
-                            
-                            # Extract course
-                            course = patient.course
-                            if not course and patient.user and hasattr(patient.user, 'education_program'):
-                                course = patient.user.education_program
-                            
-                            # Extract department
-                            department = patient.department
-                            if not department and patient.user and hasattr(patient.user, 'department_college'):
-                                department = patient.user.department_college
-                            
-                            # Only count if we have valid data (exclude None, empty strings, and "Unknown")
-                            if year_level and year_level.strip() and year_level.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_year_level'][year_level] = breakdown['details']['by_year_level'].get(year_level, 0) + 1
-                            
-                            if course and course.strip() and course.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_course'][course] = breakdown['details']['by_course'].get(course, 0) + 1
-                            
-                            if department and department.strip() and department.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_department'][department] = breakdown['details']['by_department'].get(department, 0) + 1
-                            
-                            # Combined year and course only if both are valid
-                            if (year_level and year_level.strip() and year_level.lower() not in ['unknown', 'none', ''] and 
-                                course and course.strip() and course.lower() not in ['unknown', 'none', '']):
-                                breakdown['details']['by_year_and_course'][f"{year_level} - {course}"] = breakdown['details']['by_year_and_course'].get(f"{year_level} - {course}", 0) + 1
-                    
-                    elif user_type in ['High School', 'Senior High School']:
-                        # High School: Group by grade level and strand (for Senior High)
-                        breakdown['details'] = {
-                            'by_grade_level': {},
-                            'by_strand': {},
-                            'by_department': {}
-                        }
-                        
-                        for patient in patients_of_type:
-                            # Extract grade level
-                            grade_level = patient.year_level
-                            if not grade_level and patient.user and hasattr(patient.user, 'grade_level'):
-                                grade_level = patient.user.grade_level
-                            
-                            # Extract strand (for Senior High School)
-                            strand = patient.strand
-                            
-                            # Extract department/school
-                            department = patient.department
-                            
-                            # Only count if we have valid data (exclude None, empty strings, and "Unknown")
-                            if grade_level and grade_level.strip() and grade_level.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_grade_level'][grade_level] = breakdown['details']['by_grade_level'].get(grade_level, 0) + 1
-                            
-                            if strand and strand.strip() and strand.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_strand'][strand] = breakdown['details']['by_strand'].get(strand, 0) + 1
-                            
-                            if department and department.strip() and department.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_department'][department] = breakdown['details']['by_department'].get(department, 0) + 1
-                    
-                    elif user_type == 'Elementary':
-                        # Elementary: Group by grade level
-                        breakdown['details'] = {
-                            'by_grade_level': {},
-                            'by_department': {}
-                        }
-                        
-                        for patient in patients_of_type:
-                            grade_level = patient.year_level
-                            if not grade_level and patient.user and hasattr(patient.user, 'grade_level'):
-                                grade_level = patient.user.grade_level
-                            
-                            department = patient.department
-                            
-                            # Only count if we have valid data (exclude None, empty strings, and "Unknown")
-                            if grade_level and grade_level.strip() and grade_level.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_grade_level'][grade_level] = breakdown['details']['by_grade_level'].get(grade_level, 0) + 1
-                            
-                            if department and department.strip() and department.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_department'][department] = breakdown['details']['by_department'].get(department, 0) + 1
-                    
-                    elif user_type == 'Kindergarten':
-                        # Kindergarten: Group by section/class
-                        breakdown['details'] = {
-                            'by_section': {},
-                            'by_department': {}
-                        }
-                        
-                        for patient in patients_of_type:
-                            section = patient.year_level  # Using year_level as section
-                            department = patient.department
-                            
-                            # Only count if we have valid data (exclude None, empty strings, and "Unknown")
-                            if section and section.strip() and section.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_section'][section] = breakdown['details']['by_section'].get(section, 0) + 1
-                            
-                            if department and department.strip() and department.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_department'][department] = breakdown['details']['by_department'].get(department, 0) + 1
-                    
-                    elif user_type == 'Employee':
-                        # Employee: Group by position type, department, and teaching/non-teaching classification
-                        breakdown['details'] = {
-                            'by_position_type': {},
-                            'by_department': {},
-                            'by_teaching_status': {'Teaching Staff': 0, 'Non-Teaching Staff': 0},
-                            'by_position_and_department': {}
-                        }
-                        
-                        for patient in patients_of_type:
-                            # Extract position type
-                            position_type = patient.position_type
-                            if not position_type and patient.user and hasattr(patient.user, 'employee_position'):
-                                position_type = patient.user.employee_position
-                            
-                            # Extract department
-                            department = patient.department
-                            if not department and patient.user and hasattr(patient.user, 'department_college'):
-                                department = patient.user.department_college
-                            
-                            # Determine if teaching or non-teaching staff
-                            teaching_keywords = ['teacher', 'instructor', 'professor', 'faculty', 'lecturer', 'aide']
-                            is_teaching = False
-                            if position_type:
-                                is_teaching = any(keyword in position_type.lower() for keyword in teaching_keywords)
-                            
-                            # Only count if we have valid data (exclude None, empty strings, and "Unknown")
-                            if position_type and position_type.strip() and position_type.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_position_type'][position_type] = breakdown['details']['by_position_type'].get(position_type, 0) + 1
-                            
-                            if department and department.strip() and department.lower() not in ['unknown', 'none', '']:
-                                breakdown['details']['by_department'][department] = breakdown['details']['by_department'].get(department, 0) + 1
-                            
-                            # Count teaching vs non-teaching
-                            if is_teaching:
-                                breakdown['details']['by_teaching_status']['Teaching Staff'] += 1
-                            else:
-                                breakdown['details']['by_teaching_status']['Non-Teaching Staff'] += 1
-                            
-                            # Combined position and department only if both are valid
-                            if (position_type and position_type.strip() and position_type.lower() not in ['unknown', 'none', ''] and 
-                                department and department.strip() and department.lower() not in ['unknown', 'none', '']):
-                                breakdown['details']['by_position_and_department'][f"{position_type} - {department}"] = breakdown['details']['by_position_and_department'].get(f"{position_type} - {department}", 0) + 1
-                    
-                    elif user_type == 'Incoming Freshman':
-                        # Incoming Freshman: Group by intended course/program
-                        breakdown['details'] = {
-                            'by_intended_course': {},
-                            'by_department': {}
-                        }
-                        
-                        for patient in patients_of_type:
-                            intended_course = patient.course or 'Unknown'
-                            if not intended_course or intended_course == 'Unknown':
-                                if patient.user and hasattr(patient.user, 'education_program'):
-                                    intended_course = patient.user.education_program or 'Unknown'
-                            
-                            department = patient.department or 'Unknown'
-                            
-                            breakdown['details']['by_intended_course'][intended_course] = breakdown['details']['by_intended_course'].get(intended_course, 0) + 1
-                            breakdown['details']['by_department'][department] = breakdown['details']['by_department'].get(department, 0) + 1
-                    
-                    detailed_demographics[user_type] = breakdown
-                
-                return detailed_demographics
-            
-            # Get comprehensive demographics
-            detailed_demographics = get_comprehensive_demographics()
-            
-            # Now create user_type_breakdown for all user types
-            # First, let's get all existing user types from the database
-            existing_user_types = Patient.objects.values_list('user_type', flat=True).distinct().exclude(user_type__isnull=True).exclude(user_type='')
-            
-            # Enhanced user type mapping and organization
-            user_type_remapping = {
-                'Faculty': 'Employee',
-                'Postgraduate': 'College', 
-                'Undergraduate': 'College',
-                'Doctoral': 'College',
-                'Graduate': 'College',
-                'Grade 1': 'Elementary',
-                'Grade 2': 'Elementary', 
-                'Grade 3': 'Elementary',
-                'Grade 4': 'Elementary',
-                'Grade 5': 'Elementary', 
-                'Grade 6': 'Elementary',
-                'Grade 7': 'High School',
-                'Grade 8': 'High School',
-                'Grade 9': 'High School', 
-                'Grade 10': 'High School',
-                'Grade 11': 'Senior High School',
-                'Grade 12': 'Senior High School',
-            }
-            
-            # Create a consolidated user type breakdown
-            consolidated_breakdown = {}
-            
-            for user_type in all_user_types:
-                consolidated_breakdown[user_type] = {
-                    'medical': {'total': 0, 'completed': 0, 'pending': 0, 'rejected': 0},
-                    'dental': {'total': 0, 'completed': 0, 'pending': 0, 'rejected': 0},
-                    'documents': {'total': 0, 'issued': 0, 'pending': 0},
-                    'patients': {'total': 0, 'verified': 0, 'unverified': 0},
-                    'detailed_breakdown': {}
-                }
-            
-            # Process each existing user type in the database
-            for existing_type in existing_user_types:
-                # Map to standardized user type
-                standardized_type = user_type_remapping.get(existing_type, existing_type)
-                
-                # If the standardized type is not in our all_user_types, add it to College by default
-                if standardized_type not in all_user_types:
-                    standardized_type = 'College'
-                
-                # Get patients of this existing type
-                patients_of_type = Patient.objects.filter(user_type=existing_type)
-                
-                if patients_of_type.exists():
-                    # Medical stats for this user type
-                    user_medical_appointments = Appointment.objects.filter(
-                        type='medical',
-                        patient__in=patients_of_type
-                    )
-                    medical_stats = {
-                        'total': user_medical_appointments.count(),
-                        'completed': user_medical_appointments.filter(status='completed').count(),
-                        'pending': user_medical_appointments.filter(status='pending').count(),
-                        'rejected': user_medical_appointments.filter(status='cancelled').count()
-                    }
-                    
-                    # Dental stats for this user type
-                    user_dental_appointments = Appointment.objects.filter(
-                        type='dental',
-                        patient__in=patients_of_type
-                    )
-                    dental_stats = {
-                        'total': user_dental_appointments.count(),
-                        'completed': user_dental_appointments.filter(status='completed').count(),
-                        'pending': user_dental_appointments.filter(status='pending').count(),
-                        'rejected': user_dental_appointments.filter(status='cancelled').count()
-                    }
-                    
-                    # Document stats for this user type
-                    user_documents = MedicalDocument.objects.filter(
-                        patient__in=patients_of_type
-                    )
-                    documents_stats = {
-                        'total': user_documents.count(),
-                        'issued': user_documents.filter(status='issued').count(),
-                        'pending': user_documents.filter(status='pending').count()
-                    }
-                    
-                    # Patient stats for this user type
-                    patient_count = patients_of_type.count()
-                    verified_count = patients_of_type.filter(user__is_email_verified=True).count()
-                    unverified_count = patient_count - verified_count
-                    
-                    # Aggregate into consolidated breakdown
-                    consolidated_breakdown[standardized_type]['medical']['total'] += medical_stats['total']
-                    consolidated_breakdown[standardized_type]['medical']['completed'] += medical_stats['completed']
-                    consolidated_breakdown[standardized_type]['medical']['pending'] += medical_stats['pending']
-                    consolidated_breakdown[standardized_type]['medical']['rejected'] += medical_stats['rejected']
-                    
-                    consolidated_breakdown[standardized_type]['dental']['total'] += dental_stats['total']
-                    consolidated_breakdown[standardized_type]['dental']['completed'] += dental_stats['completed']
-                    consolidated_breakdown[standardized_type]['dental']['pending'] += dental_stats['pending']
-                    consolidated_breakdown[standardized_type]['dental']['rejected'] += dental_stats['rejected']
-                    
-                    consolidated_breakdown[standardized_type]['documents']['total'] += documents_stats['total']
-                    consolidated_breakdown[standardized_type]['documents']['issued'] += documents_stats['issued']
-                    consolidated_breakdown[standardized_type]['documents']['pending'] += documents_stats['pending']
-                    
-                    consolidated_breakdown[standardized_type]['patients']['total'] += patient_count
-                    consolidated_breakdown[standardized_type]['patients']['verified'] += verified_count
-                    consolidated_breakdown[standardized_type]['patients']['unverified'] += unverified_count
-                    
-                    # Add detailed breakdown info
-                    if 'sub_types' not in consolidated_breakdown[standardized_type]['detailed_breakdown']:
-                        consolidated_breakdown[standardized_type]['detailed_breakdown']['sub_types'] = {}
-                    
-                    consolidated_breakdown[standardized_type]['detailed_breakdown']['sub_types'][existing_type] = {
-                        'total': patient_count,
-                        'medical': medical_stats,
-                        'dental': dental_stats,
-                        'documents': documents_stats
-                    }
-            
-            user_type_breakdown = consolidated_breakdown
-            
-            # Monthly trends (last 6 months)
-            monthly_trends = []
-            current_date = datetime.now()
-            
-            for i in range(5, -1, -1):  # Last 6 months
-                month_date = current_date - timedelta(days=30 * i)
-                month_name = month_date.strftime('%b')
-                
-                # Get appointments for this month
-                month_medical = Appointment.objects.filter(
-                    type='medical',
-                    appointment_date__year=month_date.year,
-                    appointment_date__month=month_date.month
-                ).count()
-                
-                month_dental = Appointment.objects.filter(
-                    type='dental',
-                    appointment_date__year=month_date.year,
-                    appointment_date__month=month_date.month
-                ).count()
-                
-                month_documents = MedicalDocument.objects.filter(
-                    uploaded_at__year=month_date.year,
-                    uploaded_at__month=month_date.month
-                ).count()
-                
-                monthly_trends.append({
-                    'month': month_name,
-                    'medical': month_medical,
-                    'dental': month_dental,
-                    'documents': month_documents
-                })
-            
-            # Calculate completion rates
-            medical_rate = (medical_completed / medical_total * 100) if medical_total > 0 else 0
-            dental_rate = (dental_completed / dental_total * 100) if dental_total > 0 else 0
-            documents_rate = (documents_issued / documents_total * 100) if documents_total > 0 else 0
-            overall_rate = ((medical_completed + dental_completed + documents_issued) / 
-                          (medical_total + dental_total + documents_total) * 100) if (medical_total + dental_total + documents_total) > 0 else 0
-            
-            statistics = {
-                'semester': {
-                    'id': current_semester.id if current_semester else None,
-                    'name': current_semester.academic_year if current_semester else 'Not Set'
-                },
-                'medical': {
-                    'total': medical_total,
-                    'completed': medical_completed,
-                    'pending': medical_pending,
-                    'rejected': medical_rejected
-                },
-                'dental': {
-                    'total': dental_total,
-                    'completed': dental_completed,
-                    'pending': dental_pending,
-                    'rejected': dental_rejected
-                },
-                'documents': {
-                    'total': documents_total,
-                    'issued': documents_issued,
-                    'pending': documents_pending
-                },
-                'patients': {
-                    'total': patients_total,
-                    'verified': patients_verified,
-                    'unverified': patients_unverified
-                },
-                'user_type_breakdown': user_type_breakdown,
-                'detailed_demographics': detailed_demographics,
-                'monthly_trends': monthly_trends,
-                'completion_rates': {
-                    'medical': round(medical_rate, 1),
-                    'dental': round(dental_rate, 1),
-                    'documents': round(documents_rate, 1),
-                    'overall': round(overall_rate, 1)
-                }
-            }
+            from .dashboard_stats import build_dashboard_statistics
             
+            statistics = build_dashboard_statistics()
             return Response(statistics, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -7058,10 +6619,8 @@ class SystemConfigurationViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("You don't have permission to view inventory data.")
         
         try:
-            from .models import DentalFormData, AcademicSchoolYear
-            from django.db.models import Q
+            from .medicine_usage import usage_report
             from datetime import datetime, timedelta
-            import json
             
             # Get parameters
             report_type = request.GET.get('type', 'monthly')  # weekly, monthly, yearly
@@ -7089,72 +6648,18 @@ class SystemConfigurationViewSet(viewsets.ModelViewSet):
             if end_date:
                 end = datetime.strptime(end_date, '%Y-%m-%d')
             
-            # Get dental form data with used medicines in the date range
-            dental_forms = DentalFormData.objects.filter(
-                date__range=[start.date(), end.date()],
-                used_medicines__isnull=False
-            ).exclude(used_medicines='[]').exclude(used_medicines='')
-            
-            # Aggregate medication usage
-            medication_usage = {}
-            total_usage_count = 0
-            
-            for form in dental_forms:
-                try:
-                    if form.used_medicines:
-                        # Parse JSON if it's a string, otherwise use directly
-                        if isinstance(form.used_medicines, str):
-                            medicines = json.loads(form.used_medicines)
-                        else:
-                            medicines = form.used_medicines
-                        
-                        # Process each medicine entry
-                        for medicine in medicines:
-                            # Handle different JSON structures
-                            if isinstance(medicine, dict):
-                                name = medicine.get('name', medicine.get('medicine_name', 'Unknown'))
-                                quantity = medicine.get('quantity', medicine.get('quantity_used', 1))
-                                unit = medicine.get('unit', 'pcs')
-                                cost = medicine.get('cost', medicine.get('total_cost', 0))
-                            elif isinstance(medicine, str):
-                                # Simple string format
-                                name = medicine
-                                quantity = 1
-                                unit = 'pcs'
-                                cost = 0
-                            else:
-                                continue
-                            
-                            # Aggregate usage
-                            if name not in medication_usage:
-                                medication_usage[name] = {
-                                    'item_name': name,
-                                    'quantity_used': 0,
-                                    'unit': unit,
-                                    'total_cost': 0,
-                                    'usage_count': 0  # Number of times used
-                                }
-                            
-                            medication_usage[name]['quantity_used'] += int(quantity) if quantity else 1
-                            medication_usage[name]['total_cost'] += float(cost) if cost else 0
-                            medication_usage[name]['usage_count'] += 1
-                            total_usage_count += 1
-                            
-                except (json.JSONDecodeError, ValueError, TypeError) as e:
-                    # Skip malformed data
-                    continue
-            
-            # Convert to list and sort by usage
-            inventory_data = list(medication_usage.values())
-            inventory_data.sort(key=lambda x: x['quantity_used'], reverse=True)
+            # One grouped query over the medicine line items, bucketed by period in the database
+            inventory_data, usage_by_period = usage_report(start.date(), end.date(), report_type)
             
             # Add summary statistics
             total_items = len(inventory_data)
             total_quantity = sum(item['quantity_used'] for item in inventory_data)
             total_cost = sum(item['total_cost'] for item in inventory_data)
+            total_usage_count = sum(item['usage_count'] for item in inventory_data)
             
             response_data = {
                 'inventory_usage': inventory_data,
+                'usage_by_period': usage_by_period,
                 'summary': {
                     'report_type': report_type,
                     'date_range': {
@@ -7940,7 +7445,7 @@ class StaffDetailsViewSet(viewsets.ModelViewSet):
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class MedicalDocumentViewSet(viewsets.ModelViewSet):
+class MedicalDocumentViewSet(ProfiledViewMixin, viewsets.ModelViewSet):
     """ViewSet for managing medical documents"""
     queryset = MedicalDocument.objects.all()
     serializer_class = MedicalDocumentSerializer
@@ -7969,6 +7474,14 @@ class MedicalDocumentViewSet(viewsets.ModelViewSet):
             
         return queryset.select_related('patient', 'reviewed_by').order_by('-updated_at')
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the filtered document list as CSV (default) or XLSX with ?file_format= (staff only)"""
+        user = request.user
+        if not (user.is_staff or user.user_type in ['staff', 'admin']):
+            raise PermissionDenied("Only staff can export medical documents.")
+        return export_response(request, self.get_queryset(), medical_document_columns(), 'medical_documents')
+
     def perform_create(self, serializer):
         user = self.request.user
         
@@ -7998,7 +7511,7 @@ class MedicalDocumentViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            from django.core.mail import send_mail
+            from .email_outbox import enqueue_email
             from django.conf import settings
             
             # Get patient email
@@ -8023,17 +7536,17 @@ Best regards,
 WMSU Health Services
             '''
             
-            # Send email
-            send_mail(
+            # Queue the email; the process_email_outbox worker delivers it
+            enqueue_email(
+                idempotency_key=f'medical-certificate:{doc.pk}:{patient_email}',
                 subject=subject,
                 message=message,
                 from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@wmsu.edu.ph'),
                 recipient_list=[patient_email],
-                fail_silently=False,
             )
             
             return Response(
-                {'message': 'Medical certificate sent via email successfully!'}, 
+                {'message': 'Medical certificate queued for email delivery!'}, 
                 status=status.HTTP_200_OK
             )
             
@@ -8221,41 +7734,101 @@ WMSU Health Services
 
     @action(detail=True, methods=['post'])
     def issue_certificate(self, request, pk=None):
-        """Issue medical certificate (staff only) - Generate PDF automatically"""
+        """Issue medical certificate (staff only) - PDF is generated by the background job worker"""
         if not (request.user.is_staff or request.user.user_type in ['staff', 'admin']):
             raise PermissionDenied("Only staff can issue medical certificates")
             
         doc = self.get_object()
         
         # More robust status checking - allow issuing if verified or already issued
-        if doc.status not in ['verified', 'issued']:
+        if doc.status not in ['verified', 'issuing', 'issued']:
             return Response({
                 'detail': f'Documents must be verified before certificate can be issued. Current status: {doc.status}. Please verify the documents first.'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Only update status if not already issued
-        if doc.status != 'issued':
-            doc.status = 'issued'
-            doc.certificate_issued_at = timezone.now()
-            
-            # Generate and save the medical certificate PDF automatically
-            try:
-                from .pdf_utils import save_medical_certificate_pdf
-                # Pass the current user as the issuing user
-                doc._issuing_user = request.user
-                save_medical_certificate_pdf(doc, save_to_model=True)
-            except Exception as e:
-                # Log the error but don't fail the certificate issuance
-                print(f"Warning: Failed to generate PDF for medical certificate: {e}")
-            
-            doc.save()
+        from .certificates import latest_certificate_job, queue_certificate
+        from .jobs import job_summary
+        
+        # Only queue the PDF job if not already issued or being issued
+        if doc.status == 'verified':
+            job = queue_certificate(doc, request.user)
+        else:
+            job = latest_certificate_job(doc)
         
         serializer = self.get_serializer(doc)
         response_data = serializer.data
         response_data['is_complete'] = getattr(doc, 'is_complete', False)
         response_data['completion_percentage'] = getattr(doc, 'completion_percentage', 0)
+        response_data['certificate_job'] = job_summary(job)
         
-        return Response(response_data, status=status.HTTP_200_OK)
+        # 202 while the certificate is still being generated; poll certificate_status
+        response_status = status.HTTP_202_ACCEPTED if doc.status == 'issuing' else status.HTTP_200_OK
+        return Response(response_data, status=response_status)
+
+    @action(detail=True, methods=['get'])
+    def certificate_status(self, request, pk=None):
+        """Poll the certificate issuance of a document"""
+        doc = self.get_object()
+        
+        if not (request.user.is_staff or request.user.user_type in ['staff', 'admin'] or 
+                (hasattr(doc, 'patient') and hasattr(doc.patient, 'user') and doc.patient.user == request.user)):
+            raise PermissionDenied("You don't have permission to view this certificate.")
+        
+        from .certificates import latest_certificate_job
+        from .jobs import job_summary
+        
+        return Response({
+            'id': doc.id,
+            'status': doc.status,
+            'certificate_issued_at': doc.certificate_issued_at,
+            'has_certificate': bool(doc.medical_certificate),
+            'job': job_summary(latest_certificate_job(doc)),
+        })
+
+    @action(detail=False, methods=['post'])
+    def bulk_issue_certificates(self, request):
+        """Queue certificate issuance for every verified document of a semester (staff only)"""
+        if not (request.user.is_staff or request.user.user_type in ['staff', 'admin']):
+            raise PermissionDenied("Only staff can issue medical certificates")
+        
+        academic_year_id = request.data.get('academic_year')
+        if not academic_year_id:
+            return Response({
+                'detail': 'academic_year is required.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        from .certificates import queue_certificates
+        
+        documents = MedicalDocument.objects.filter(academic_year_id=academic_year_id, status='verified').only('id')
+        batch_id, queued = queue_certificates(list(documents), request.user)
+        if not queued:
+            return Response({
+                'detail': 'No verified documents to issue for this semester.',
+                'queued': 0,
+            }, status=status.HTTP_200_OK)
+        
+        return Response({
+            'batch_id': str(batch_id),
+            'queued': queued,
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'])
+    def bulk_issue_status(self, request):
+        """Poll the progress of a bulk_issue_certificates batch (staff only)"""
+        if not (request.user.is_staff or request.user.user_type in ['staff', 'admin']):
+            raise PermissionDenied("Only staff can view certificate issuance progress")
+        
+        batch_id = request.query_params.get('batch_id')
+        try:
+            batch_id = uuid.UUID(str(batch_id))
+        except ValueError:
+            return Response({
+                'detail': 'A valid batch_id is required.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        from .jobs import batch_progress
+        
+        return Response({'batch_id': str(batch_id), **batch_progress(batch_id)})
 
     @action(detail=True, methods=['post'])
     def advise_for_consultation(self, request, pk=None):
@@ -8389,7 +7962,7 @@ class AppointmentViewSetDuplicate(viewsets.ModelViewSet):
             else:
                 # No profile, try to get or create one
                 try:
-                    current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                    current_school_year = AcademicSchoolYear.get_current()
                     patient_profile, created = user.patient_profiles.get_or_create(
                         school_year=current_school_year,
                         defaults={
@@ -8506,7 +8079,7 @@ class AppointmentViewSetDuplicate(viewsets.ModelViewSet):
         else:
             # If no patient profile exists, we need to create one first
             try:
-                current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                current_school_year = AcademicSchoolYear.get_current()
                 # Create a patient profile automatically
                 patient_profile = Patient.objects.create(
                     user=user,
@@ -8606,7 +8179,7 @@ class AppointmentViewSetDuplicate(viewsets.ModelViewSet):
         )
 
 
-class AnnouncementViewSet(viewsets.ModelViewSet):
+class AnnouncementViewSet(ProfiledViewMixin, viewsets.ModelViewSet):
     """ViewSet for managing announcements"""
     queryset = Announcement.objects.all()
     serializer_class = AnnouncementSerializer
@@ -8620,22 +8193,8 @@ class AnnouncementViewSet(viewsets.ModelViewSet):
         if user.is_staff or user.user_type in ['staff', 'admin']:
             return Announcement.objects.all().order_by('-created_at')
         
-        # Regular users can only see active, non-expired announcements that target them
-        queryset = Announcement.objects.filter(
-            is_active=True
-        ).order_by('-created_at')
-        
-        # Filter out expired announcements
-        active_announcements = [
-            announcement for announcement in queryset
-            if not announcement.is_expired()
-        ]
-        
-        # Return only announcements that should show to this user
-        return [
-            announcement for announcement in active_announcements
-            if announcement.should_show_to_user(user)
-        ]
+        # Regular users can only see active, non-expired, unviewed announcements that target them
+        return announcements.visible_to(user).order_by('-created_at')
     
     def get_permissions(self):
         """Staff/admin only for create, update, delete"""
@@ -8648,24 +8207,10 @@ class AnnouncementViewSet(viewsets.ModelViewSet):
         """Get all unviewed announcements for the current user that should show on login"""
         user = request.user
         
-        # Get all active, non-expired announcements that target this user and show on login
-        active_announcements = Announcement.objects.filter(
-            is_active=True,
+        # Active, non-expired announcements that target this user, show on login and haven't been viewed
+        unviewed = announcements.visible_to(user).filter(
             show_on_login=True
-        ).order_by('-priority', '-created_at')
-        
-        # Filter to only those that should show to this user and haven't been viewed
-        unviewed = []
-        for announcement in active_announcements:
-            if not announcement.is_expired() and announcement.should_show_to_user(user):
-                # Check if user has already viewed this announcement
-                has_viewed = UserAnnouncementView.objects.filter(
-                    user=user,
-                    announcement=announcement
-                ).exists()
-                
-                if not has_viewed:
-                    unviewed.append(announcement)
+        ).select_related('created_by').order_by('-priority', '-created_at')
         
         serializer = self.get_serializer(unviewed, many=True)
         return Response(serializer.data)
@@ -8692,3 +8237,28 @@ class AnnouncementViewSet(viewsets.ModelViewSet):
                 'message': 'Announcement was already viewed',
                 'viewed_at': view_record.viewed_at
             }, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['post'])
+    def mark_viewed_batch(self, request):
+        """Mark many announcements as viewed by the current user at once"""
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            return Response(
+                {'error': 'ids must be a non-empty list of announcement ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'ids must be a non-empty list of announcement ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        marked, already_viewed = announcements.mark_viewed(request.user, ids)
+        return Response({
+            'message': f'{len(marked)} announcement(s) marked as viewed',
+            'marked': marked,
+            'already_viewed': already_viewed,
+            'not_found': sorted(set(ids) - set(marked) - set(already_viewed)),
+        }, status=status.HTTP_201_CREATED if marked else status.HTTP_200_OK)
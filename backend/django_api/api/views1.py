@@ -5,10 +5,17 @@ from rest_framework.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from .models import MedicalFormData, Appointment, Patient, AcademicSchoolYear, StaffDetails, DentalInformationRecord
-from .serializers import MedicalFormDataSerializer, PatientSerializer, PatientProfileUpdateSerializer, DentalInformationRecordSerializer
+from .serializers import (
+    MedicalFormDataSerializer, PatientSerializer, PatientProfileUpdateSerializer, PatientSummarySerializer,
+    DentalInformationRecordSerializer,
+)
+from .fieldsets import SparseFieldsetViewMixin
+from .pagination import KeysetPagination
+from .patient_profiles import latest_per_email
+from .profiling import ProfiledViewMixin
 
 
-class MedicalFormDataViewSet(viewsets.ModelViewSet):
+class MedicalFormDataViewSet(ProfiledViewMixin, viewsets.ModelViewSet):
     """ViewSet for managing medical form data"""
     queryset = MedicalFormData.objects.all()
     serializer_class = MedicalFormDataSerializer
@@ -193,11 +200,13 @@ class MedicalFormDataViewSet(viewsets.ModelViewSet):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(SparseFieldsetViewMixin, ProfiledViewMixin, viewsets.ModelViewSet):
     """ViewSet for managing patient profiles"""
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
+    summary_serializer_class = PatientSummarySerializer  # ?view=summary
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination  # opt-in: only used when ?page_size= or ?cursor= is sent
 
     def get_queryset(self):
         user = self.request.user
@@ -217,23 +226,11 @@ class PatientViewSet(viewsets.ModelViewSet):
         
         # Apply deduplication for admin/staff view - show only latest profile per email
         if user.is_staff or user.user_type in ['staff', 'admin']:
-            from django.db.models import Max
-            from django.db.models.functions import Coalesce
-            from django.db.models import Value
-            
-            # Get the email to use for each patient (prefer patient.email, fallback to user.email)
-            queryset = queryset.annotate(
-                dedupe_email=Coalesce('email', 'user__email', Value(''))
-            )
-            
-            # Find the latest profile ID for each unique email
-            # Use both created_at and id to ensure we get the most recent
-            latest_per_email = queryset.values('dedupe_email').annotate(
-                latest_id=Max('id')
-            ).values_list('latest_id', flat=True)
-            
-            # Filter to only include the latest profiles
-            queryset = queryset.filter(id__in=latest_per_email)
+            if school_year_param:
+                # Latest profile within the selected school year
+                queryset = latest_per_email(queryset)
+            else:
+                queryset = queryset.filter(is_latest_profile=True)
         
         return queryset.select_related('user', 'school_year').order_by('-created_at', '-id')
 
@@ -287,7 +284,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         
         try:
             # Get current school year
-            current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+            current_school_year = AcademicSchoolYear.get_current()
             
             # Get or create patient profile for current school year
             patient_profile, created = user.get_or_create_patient_profile(current_school_year)
@@ -315,7 +312,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         
         try:
             # Get current school year
-            current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+            current_school_year = AcademicSchoolYear.get_current()
             
             # Check if profile already exists for current school year
             existing_profile = Patient.objects.filter(
@@ -358,7 +355,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class DentalInformationRecordViewSet(viewsets.ModelViewSet):
+class DentalInformationRecordViewSet(ProfiledViewMixin, viewsets.ModelViewSet):
     """ViewSet for managing dental patient information records"""
     queryset = DentalInformationRecord.objects.all()
     serializer_class = DentalInformationRecordSerializer
@@ -447,7 +444,7 @@ class DentalInformationRecordViewSet(viewsets.ModelViewSet):
         
         try:
             # Get current school year
-            current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+            current_school_year = AcademicSchoolYear.get_current()
             current_semester = request.query_params.get('semester', '1st_semester')
             
             # Get current patient profile
@@ -503,7 +500,7 @@ class DentalInformationRecordViewSet(viewsets.ModelViewSet):
         
         try:
             # Get current school year
-            current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+            current_school_year = AcademicSchoolYear.get_current()
             current_semester = request.query_params.get('semester', '1st_semester')
             
             # Get current patient profile
@@ -544,7 +541,7 @@ class DentalInformationRecordViewSet(viewsets.ModelViewSet):
         
         try:
             # Get current school year
-            current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+            current_school_year = AcademicSchoolYear.get_current()
             current_semester = request.data.get('semester', '1st_semester')
             
             # Get current patient profile
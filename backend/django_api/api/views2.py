@@ -2,16 +2,19 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError, PermissionDenied
+from django.db import IntegrityError, OperationalError
 from django.db.models import Q, Count
 from django.utils import timezone
 from datetime import datetime, timedelta, time
-from .models import Appointment, Patient, AcademicSchoolYear, CustomUser, DentalMedicineSupply
-from .serializers import AppointmentSerializer
+from .models import Appointment, Patient, AcademicSchoolYear, CustomUser, DentalMedicineSupply, WaitlistEntry
+from .serializers import AppointmentSerializer, WaitlistEntrySerializer
+from .profiling import ProfiledViewMixin
+from . import booking, day_closure, scheduling, slot_occupancy, waitlist
 import logging
 
 logger = logging.getLogger(__name__)
 
-class AppointmentSchedulingViewSet(viewsets.ModelViewSet):
+class AppointmentSchedulingViewSet(ProfiledViewMixin, viewsets.ModelViewSet):
     """
     Enhanced appointment scheduling with 20 appointments per day limit and 20-minute intervals
     """
@@ -19,13 +22,15 @@ class AppointmentSchedulingViewSet(viewsets.ModelViewSet):
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
     
-    # Configuration constants
-    MAX_APPOINTMENTS_PER_DAY = 20
-    APPOINTMENT_DURATION_MINUTES = 20
-    WORKING_HOURS_START = time(8, 0)  # 8:00 AM
-    WORKING_HOURS_END = time(17, 0)   # 5:00 PM
-    LUNCH_BREAK_START = time(12, 0)   # 12:00 PM
-    LUNCH_BREAK_END = time(13, 0)     # 1:00 PM
+    # Configuration constants (shared with the slot occupancy index)
+    MAX_APPOINTMENTS_PER_DAY = slot_occupancy.MAX_APPOINTMENTS_PER_DAY
+    APPOINTMENT_DURATION_MINUTES = slot_occupancy.SLOT_MINUTES
+    WORKING_HOURS_START = slot_occupancy.WORKING_HOURS_START
+    WORKING_HOURS_END = slot_occupancy.WORKING_HOURS_END
+    LUNCH_BREAK_START = slot_occupancy.LUNCH_BREAK_START
+    LUNCH_BREAK_END = slot_occupancy.LUNCH_BREAK_END
+    # Furthest date that can be booked, in days from today
+    BOOKING_WINDOW_DAYS = 30
     
     def get_queryset(self):
         """Filter appointments based on user permissions"""
@@ -47,7 +52,7 @@ class AppointmentSchedulingViewSet(viewsets.ModelViewSet):
             else:
                 # No profile, try to get or create one
                 try:
-                    current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                    current_school_year = AcademicSchoolYear.get_current()
                     patient_profile, created = user.patient_profiles.get_or_create(
                         school_year=current_school_year,
                         defaults={
@@ -101,19 +106,33 @@ class AppointmentSchedulingViewSet(viewsets.ModelViewSet):
         # Validate appointment scheduling rules
         self._validate_appointment_scheduling(appointment_date, appointment_time, appointment_type, campus)
         
+        # The slot reservation and daily counter are taken together with the insert
+        try:
+            with booking.enforce_limits(self.MAX_APPOINTMENTS_PER_DAY):
+                fields = {}
+                if serializer.validated_data.get('doctor') is None:
+                    # Assign a staff member on duty in the slot with capacity left
+                    doctor_id = scheduling.assign_doctor(campus, appointment_type, appointment_date, appointment_time)
+                    if doctor_id is not None:
+                        fields['doctor'] = CustomUser.objects.get(pk=doctor_id)
+                self._save_appointment(serializer, user, **fields)
+        except booking.SlotUnavailable as e:
+            raise ValidationError(str(e))
+
+    def _save_appointment(self, serializer, user, **fields):
         # Handle staff vs patient creation
         if user.is_staff or user.user_type in ['staff', 'admin']:
             # Staff can create appointments for any patient
-            serializer.save()
+            serializer.save(**fields)
         else:
             # Patient creating their own appointment
             current_patient_profile = user.get_current_patient_profile()
             if current_patient_profile:
-                serializer.save(patient=current_patient_profile)
+                serializer.save(patient=current_patient_profile, **fields)
             else:
                 # Create patient profile if it doesn't exist
                 try:
-                    current_school_year = AcademicSchoolYear.objects.get(is_current=True)
+                    current_school_year = AcademicSchoolYear.get_current()
                     patient_profile = Patient.objects.create(
                         user=user,
                         school_year=current_school_year,
@@ -122,7 +141,7 @@ class AppointmentSchedulingViewSet(viewsets.ModelViewSet):
                         last_name=user.last_name or '',
                         email=user.email,
                     )
-                    serializer.save(patient=patient_profile)
+                    serializer.save(patient=patient_profile, **fields)
                 except AcademicSchoolYear.DoesNotExist:
                     raise ValidationError("No active school year found. Please contact administration.")
 
@@ -135,13 +154,14 @@ class AppointmentSchedulingViewSet(viewsets.ModelViewSet):
             raise ValidationError("Appointments must be scheduled for future dates (at least tomorrow).")
         
         # 2. Check if date is not too far in the future (max 30 days)
-        max_future_date = today + timedelta(days=30)
+        max_future_date = today + timedelta(days=self.BOOKING_WINDOW_DAYS)
         if appointment_date > max_future_date:
-            raise ValidationError("Appointments cannot be scheduled more than 30 days in advance.")
+            raise ValidationError(f"Appointments cannot be scheduled more than {self.BOOKING_WINDOW_DAYS} days in advance.")
         
-        # 3. Check if it's a weekday (Monday to Friday)
-        if appointment_date.weekday() >= 5:  # 5 = Saturday, 6 = Sunday
-            raise ValidationError("Appointments can only be scheduled on weekdays (Monday to Friday).")
+        # 3. Check the campus operating days (Monday to Friday unless the campus schedule says otherwise)
+        calendar = scheduling.get_calendar()
+        if not calendar.is_open(campus, appointment_date):
+            raise ValidationError(f"The clinic is closed on {appointment_date.strftime('%A')}s at this campus.")
         
         # 4. Check working hours
         if not (self.WORKING_HOURS_START <= appointment_time <= self.WORKING_HOURS_END):
@@ -155,26 +175,13 @@ class AppointmentSchedulingViewSet(viewsets.ModelViewSet):
         if not self._is_valid_time_slot(appointment_time):
             raise ValidationError("Appointments must be scheduled in 20-minute intervals starting from 8:00 AM.")
         
-        # 7. Check daily appointment limit
-        daily_appointments_count = Appointment.objects.filter(
-            appointment_date=appointment_date,
-            campus=campus,
-            status__in=['pending', 'confirmed', 'scheduled']
-        ).count()
-        
-        if daily_appointments_count >= self.MAX_APPOINTMENTS_PER_DAY:
-            raise ValidationError(f"Maximum {self.MAX_APPOINTMENTS_PER_DAY} appointments per day has been reached for {appointment_date}.")
-        
-        # 8. Check if specific time slot is available
-        existing_appointment = Appointment.objects.filter(
-            appointment_date=appointment_date,
-            appointment_time=appointment_time,
-            campus=campus,
-            status__in=['pending', 'confirmed', 'scheduled']
-        ).exists()
+        # 7. Check the campus opening hours
+        if not calendar.is_open(campus, appointment_date, appointment_time):
+            raise ValidationError(f"The clinic is closed at {appointment_time.strftime('%H:%M')} at this campus.")
         
-        if existing_appointment:
-            raise ValidationError(f"Time slot {appointment_time.strftime('%H:%M')} is already booked for {appointment_date}.")
+        # 8./9. The daily limit, the time slot itself and staff capacity are
+        # checked atomically when the appointment is saved inside
+        # booking.enforce_limits()
     
     def _is_valid_time_slot(self, appointment_time):
         """Check if the time is a valid 20-minute interval slot"""
@@ -229,53 +236,142 @@ class AppointmentSchedulingViewSet(viewsets.ModelViewSet):
         # Get all possible time slots
         all_slots = self._generate_time_slots()
         
-        # Get booked slots for the date
-        booked_slots = set(
-            Appointment.objects.filter(
-                appointment_date=appointment_date,
-                campus=campus,
-                status__in=['pending', 'confirmed', 'scheduled']
-            ).values_list('appointment_time', flat=True)
+        # Booked slots of the date from the occupancy index
+        counts, booked = slot_occupancy.occupancy(campus, appointment_date, appointment_date, appointment_type).get(
+            appointment_date, ([0] * len(all_slots), 0)
         )
         
-        # Filter available slots
-        available_slots = []
-        for slot_time in all_slots:
-            if slot_time not in booked_slots:
-                # Check if we haven't reached daily limit
-                daily_count = len(booked_slots)
-                if daily_count < self.MAX_APPOINTMENTS_PER_DAY:
-                    available_slots.append({
-                        'time': slot_time.strftime('%H:%M'),
-                        'display': slot_time.strftime('%I:%M %p')
-                    })
+        # Filter available slots (none once the daily limit is reached), keeping
+        # those the campus is open for and some staff member can take
+        calendar = scheduling.get_calendar()
+        load = scheduling.staff_load(appointment_date, appointment_date) if calendar.is_staffed(campus, appointment_type) else {}
+        free = calendar.free_slots(
+            campus, appointment_type, appointment_date,
+            slot_occupancy.free_slots(counts, booked, self.MAX_APPOINTMENTS_PER_DAY),
+            load.get(appointment_date, {}),
+        )
+        available_slots = [
+            {
+                'time': slot_time.strftime('%H:%M'),
+                'display': slot_time.strftime('%I:%M %p')
+            }
+            for slot_time in free
+        ]
         
         return Response({
             'date': date_str,
             'campus': campus,
             'available_slots': available_slots,
             'total_slots': len(all_slots),
-            'booked_slots': len(booked_slots),
+            'booked_slots': booked,
             'remaining_slots': len(available_slots),
             'daily_limit': self.MAX_APPOINTMENTS_PER_DAY
         })
 
     def _generate_time_slots(self):
-        """Generate all possible 20-minute time slots within working hours"""
-        slots = []
-        current_time = datetime.combine(datetime.today(), self.WORKING_HOURS_START)
-        end_time = datetime.combine(datetime.today(), self.WORKING_HOURS_END)
-        lunch_start = datetime.combine(datetime.today(), self.LUNCH_BREAK_START)
-        lunch_end = datetime.combine(datetime.today(), self.LUNCH_BREAK_END)
-        
-        while current_time.time() < end_time.time():
-            # Skip lunch break
-            if not (lunch_start.time() <= current_time.time() < lunch_end.time()):
-                slots.append(current_time.time())
-            
-            current_time += timedelta(minutes=self.APPOINTMENT_DURATION_MINUTES)
+        """All 20-minute time slots within working hours (generated once per process)"""
+        return list(slot_occupancy.SLOT_TIMES)
+
+    @action(detail=False, methods=['get'])
+    def availability_range(self, request):
+        """
+        Available time slots of one appointment type for every date in a window
+        (default: the 30 bookable days from tomorrow), read from the slot
+        occupancy index and the compiled staff calendar.
+        """
+        campus = request.query_params.get('campus', 'a')
+        appointment_type = request.query_params.get('type', 'medical')
+        today = timezone.now().date()
+        
+        start_str = request.query_params.get('start')
+        try:
+            start = datetime.strptime(start_str, '%Y-%m-%d').date() if start_str else today + timedelta(days=1)
+            days = int(request.query_params.get('days', self.BOOKING_WINDOW_DAYS))
+        except ValueError:
+            return Response(
+                {'error': 'Invalid parameters. Use start=YYYY-MM-DD and a numeric days value'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 1 <= days <= self.BOOKING_WINDOW_DAYS + 1:
+            return Response(
+                {'error': f'days must be between 1 and {self.BOOKING_WINDOW_DAYS + 1}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        end = start + timedelta(days=days - 1)
+        
+        first_bookable = today + timedelta(days=1)
+        last_bookable = today + timedelta(days=self.BOOKING_WINDOW_DAYS)
+        empty = ([0] * len(slot_occupancy.SLOT_TIMES), 0)
+        occupancy = slot_occupancy.occupancy(campus, start, end, appointment_type)
+        calendar = scheduling.get_calendar()
+        load = scheduling.staff_load(start, end) if calendar.is_staffed(campus, appointment_type) else {}
+        
+        dates = []
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            counts, booked = occupancy.get(day, empty)
+            bookable = first_bookable <= day <= last_bookable and calendar.is_open(campus, day)
+            free = calendar.free_slots(
+                campus, appointment_type, day,
+                slot_occupancy.free_slots(counts, booked, self.MAX_APPOINTMENTS_PER_DAY),
+                load.get(day, {}),
+            ) if bookable else []
+            dates.append({
+                'date': day.strftime('%Y-%m-%d'),
+                'weekday': day.strftime('%A'),
+                'bookable': bookable,
+                'booked_slots': booked,
+                'remaining_slots': max(0, min(len(free), self.MAX_APPOINTMENTS_PER_DAY - booked)),
+                'available_slots': [slot.strftime('%H:%M') for slot in free],
+            })
         
-        return slots
+        return Response({
+            'campus': campus,
+            'type': appointment_type,
+            'start': start.strftime('%Y-%m-%d'),
+            'end': end.strftime('%Y-%m-%d'),
+            'daily_limit': self.MAX_APPOINTMENTS_PER_DAY,
+            'total_slots': len(slot_occupancy.SLOT_TIMES),
+            'dates': dates,
+        })
+
+    @action(detail=False, methods=['get'])
+    def available_staff(self, request):
+        """Staff on duty in a slot who can still take appointments that day"""
+        campus = request.query_params.get('campus', 'a')
+        appointment_type = request.query_params.get('type', 'medical')
+        
+        try:
+            appointment_date = datetime.strptime(request.query_params.get('date', ''), '%Y-%m-%d').date()
+            appointment_time = datetime.strptime(request.query_params.get('time', ''), '%H:%M').time()
+        except ValueError:
+            return Response(
+                {'error': 'date (YYYY-MM-DD) and time (HH:MM) parameters are required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        calendar = scheduling.get_calendar()
+        load = scheduling.staff_load(appointment_date, appointment_date).get(appointment_date, {})
+        staff = [
+            {
+                'id': user_id,
+                'name': calendar.staff[user_id].name,
+                'position': calendar.staff[user_id].position,
+                'booked': load.get(user_id, 0),
+                'daily_limit': calendar.staff[user_id].daily_limit,
+            }
+            for user_id in calendar.with_capacity(campus, appointment_type, appointment_date, appointment_time, load)
+        ]
+        
+        return Response({
+            'date': appointment_date.strftime('%Y-%m-%d'),
+            'time': appointment_time.strftime('%H:%M'),
+            'campus': campus,
+            'type': appointment_type,
+            'is_open': calendar.is_open(campus, appointment_date, appointment_time),
+            'staff_scheduling': calendar.is_staffed(campus, appointment_type),
+            'available_staff': staff,
+        })
 
     @action(detail=False, methods=['get'])
     def daily_schedule(self, request):
@@ -384,24 +480,38 @@ class AppointmentSchedulingViewSet(viewsets.ModelViewSet):
             finally:
                 appointment.id = temp_appointment_id  # Restore ID
             
-            # Use the model method to reschedule
-            appointment.reschedule_appointment(
-                new_date=new_date_obj,
-                new_time=new_time_obj,
-                rescheduled_by=user,
-                reason=reason
-            )
-            
-            # If rescheduled by patient, set status to pending for admin approval
-            if appointment.patient.user == user:
-                appointment.status = 'pending'
-                appointment.save()
+            with booking.enforce_limits(self.MAX_APPOINTMENTS_PER_DAY):
+                # Keep the assigned staff member when they can take the new slot
+                doctor_id = scheduling.assign_doctor(
+                    appointment.campus, appointment.type, new_date_obj, new_time_obj,
+                    exclude=appointment.pk, prefer=appointment.doctor_id,
+                )
+                if doctor_id is not None:
+                    appointment.doctor_id = doctor_id
+                
+                # Use the model method to reschedule
+                appointment.reschedule_appointment(
+                    new_date=new_date_obj,
+                    new_time=new_time_obj,
+                    rescheduled_by=user,
+                    reason=reason
+                )
+                
+                # If rescheduled by patient, set status to pending for admin approval
+                if appointment.patient.user == user:
+                    appointment.status = 'pending'
+                    appointment.save()
             
             return Response(
                 AppointmentSerializer(appointment).data,
                 status=status.HTTP_200_OK
             )
             
+        except booking.SlotUnavailable as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except ValueError as e:
             return Response(
                 {'error': f'Invalid date or time format: {str(e)}'}, 
@@ -413,6 +523,90 @@ class AppointmentSchedulingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['post'])
+    def close_day(self, request):
+        """
+        Close a campus on a day (or through `until`) and move its appointments
+        to the earliest free slots between `start` and `end` (default: the
+        week after the closure). Staff only; `dry_run` previews the moves.
+        """
+        user = request.user
+        if not (user.is_staff or user.user_type in ['staff', 'admin']):
+            raise PermissionDenied("Only staff can close a campus.")
+        
+        campus = request.data.get('campus')
+        if campus not in dict(Appointment.CAMPUS_CHOICES):
+            return Response(
+                {'error': 'A valid campus is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        def parse(name, default=None):
+            value = request.data.get(name)
+            return datetime.strptime(value, '%Y-%m-%d').date() if value else default
+        
+        try:
+            closed_from = parse('date')
+            if closed_from is None:
+                raise ValueError('date is required')
+            closed_until = parse('until', closed_from)
+            start = parse('start', closed_until + timedelta(days=1))
+            end = parse('end', start + timedelta(days=6))
+        except ValueError:
+            return Response(
+                {'error': 'Invalid parameters. Use date, until, start and end as YYYY-MM-DD'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        today = timezone.now().date()
+        if closed_from < today or closed_until < closed_from:
+            return Response(
+                {'error': 'The closure must be a range of days from today on'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if start <= today or end < start or (end - start).days > self.BOOKING_WINDOW_DAYS:
+            return Response(
+                {'error': f'The target window must start after today and span at most {self.BOOKING_WINDOW_DAYS + 1} days'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+        try:
+            result = day_closure.close_days(
+                campus,
+                [closed_from + timedelta(days=offset) for offset in range((closed_until - closed_from).days + 1)],
+                start, end,
+                user=user,
+                reason=request.data.get('reason', ''),
+                daily_limit=self.MAX_APPOINTMENTS_PER_DAY,
+                dry_run=dry_run,
+            )
+        except (IntegrityError, OperationalError) as e:
+            # A booking raced the closure for one of the target slots; nothing was saved
+            logger.warning(f"Closing campus {campus} failed: {e}")
+            return Response(
+                {'error': 'Appointments changed while closing the campus. Please try again.'}, 
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        return Response({
+            'campus': campus,
+            'closed_dates': [day.strftime('%Y-%m-%d') for day in result['closed']],
+            'window': {'start': start.strftime('%Y-%m-%d'), 'end': end.strftime('%Y-%m-%d')},
+            'dry_run': dry_run,
+            'moved': [
+                {
+                    'id': row['id'],
+                    'from_date': row['from_date'].strftime('%Y-%m-%d'),
+                    'from_time': row['from_time'].strftime('%H:%M'),
+                    'to_date': row['to_date'].strftime('%Y-%m-%d'),
+                    'to_time': row['to_time'].strftime('%H:%M'),
+                }
+                for row in result['moved']
+            ],
+            'unplaced': result['unplaced'],
+        })
+
     @action(detail=False, methods=['get'])
     def booking_stats(self, request):
         """Get booking statistics for dashboard"""
@@ -650,4 +844,95 @@ class DentalMedicineSupplyViewSet(viewsets.ModelViewSet):
             'created_count': created_count,
             'existing_count': existing_count,
             'total_samples': len(sample_items)
-        })
\ No newline at end of file
+        })
+
+
+class WaitlistViewSet(viewsets.ModelViewSet):
+    """
+    Waitlist for fully booked appointment days. Patients join and withdraw
+    their own entries; staff see all entries and can change priorities.
+    Waiting entries are booked automatically when a slot of their day is
+    released (see api/waitlist.py).
+    """
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get', 'post', 'patch', 'head', 'options']
+    
+    def _is_staff(self):
+        user = self.request.user
+        return user.is_staff or user.user_type in ['staff', 'admin']
+    
+    def get_queryset(self):
+        queryset = WaitlistEntry.objects.select_related('patient')
+        if not self._is_staff():
+            queryset = queryset.filter(patient__user=self.request.user)
+        
+        for param in ('campus', 'date', 'type', 'status'):
+            value = self.request.query_params.get(param)
+            if value:
+                queryset = queryset.filter(**{param: value})
+        return queryset
+    
+    def create(self, request, *args, **kwargs):
+        """Join the waitlist of a fully booked day"""
+        user = request.user
+        if user.is_blocked:
+            raise PermissionDenied(f"Your account has been blocked from booking consultations. Reason: {user.block_reason or 'No reason provided'}")
+        
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        if self._is_staff():
+            patient = data.get('patient')
+            if patient is None:
+                raise ValidationError("patient is required.")
+        else:
+            patient = user.get_current_patient_profile()
+            if patient is None:
+                raise ValidationError("Patient profile not found. Please complete your profile setup first.")
+        
+        day, campus, appointment_type = data['date'], data.get('campus', 'a'), data.get('type', 'medical')
+        today = timezone.now().date()
+        if not today < day <= today + timedelta(days=AppointmentSchedulingViewSet.BOOKING_WINDOW_DAYS):
+            raise ValidationError(f"You can only wait for days between tomorrow and {AppointmentSchedulingViewSet.BOOKING_WINDOW_DAYS} days from now.")
+        if not scheduling.get_calendar().is_open(campus, day):
+            raise ValidationError(f"The clinic is closed on {day.strftime('%A')}s at this campus.")
+        if waitlist.bookable_slots(campus, day, appointment_type, AppointmentSchedulingViewSet.MAX_APPOINTMENTS_PER_DAY):
+            raise ValidationError("There are still free slots on this day; please book one of them instead.")
+        
+        entry, created = waitlist.join(
+            patient, campus, day, appointment_type,
+            purpose=data.get('purpose', ''),
+            concern=data.get('concern'),
+            priority=data.get('priority', 0) if self._is_staff() else 0,
+            user=user,
+        )
+        return Response(
+            self.get_serializer(entry).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+    
+    def partial_update(self, request, *args, **kwargs):
+        """Staff can change the priority of a waiting entry"""
+        if not self._is_staff():
+            raise PermissionDenied("Only staff can change waitlist priorities.")
+        entry = self.get_object()
+        if entry.status != 'waiting':
+            raise ValidationError("Only waiting entries can be changed.")
+        try:
+            entry.priority = int(request.data.get('priority'))
+        except (TypeError, ValueError):
+            raise ValidationError("priority must be an integer.")
+        entry.save(update_fields=['priority'])
+        return Response(self.get_serializer(entry).data)
+    
+    @action(detail=True, methods=['post'])
+    def withdraw(self, request, pk=None):
+        """Leave the waitlist"""
+        entry = self.get_object()
+        if entry.status != 'waiting':
+            raise ValidationError("Only waiting entries can be withdrawn.")
+        entry.status = 'withdrawn'
+        entry.save(update_fields=['status'])
+        return Response(self.get_serializer(entry).data)
@@ -0,0 +1,236 @@
+"""
+Appointment waitlist and backfill of cancelled slots.
+
+Patients can wait for a fully booked (campus, date, type) with a
+WaitlistEntry. Cancelling stays cheap: when an appointment releases its slot
+(``booking.slot_released``) and somebody is waiting for that day, a
+``waitlist_backfill`` job is queued for it unless one is already queued, so a
+burst of cancellations on one day is handled by a single job.
+
+The run_jobs worker promotes the waiting entries of the day in order (highest
+priority first, then first come first served). Each promotion is one
+transaction that books the appointment through ``booking.enforce_limits()``
+and the staff calendar, exactly like the booking endpoint, marks the entry
+promoted and queues the notification email. Promotion stops when the day is
+full again or nobody eligible is left. The ``backfill_waitlist`` command
+sweeps all waiting days, for slots released while no worker was running, and
+expires the entries of past days.
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import booking, scheduling, slot_occupancy
+from .jobs import enqueue_job, job_handler
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = 'waitlist_backfill'
+
+# Promotion order of waiting entries
+WAITING_ORDER = ('-priority', 'created_at', 'id')
+
+
+def join(patient, campus, day, type, purpose='', concern=None, priority=0, user=None):
+    """Put a patient on the waitlist of a day; returns (entry, created)"""
+    from .models import WaitlistEntry
+    with transaction.atomic():
+        existing = WaitlistEntry.objects.select_for_update().filter(
+            patient=patient, campus=campus, date=day, type=type, status='waiting'
+        ).first()
+        if existing is not None:
+            return existing, False
+        entry = WaitlistEntry.objects.create(
+            patient=patient, campus=campus, date=day, type=type, purpose=purpose, concern=concern,
+            priority=priority, created_by=user if user is not None and user.is_authenticated else None,
+        )
+    return entry, True
+
+
+def position(entry):
+    """1-based place of a waiting entry in its day's queue, or None"""
+    from django.db.models import Q
+    from .models import WaitlistEntry
+    if entry.status != 'waiting':
+        return None
+    ahead = WaitlistEntry.objects.filter(
+        campus=entry.campus, date=entry.date, type=entry.type, status='waiting',
+    ).filter(
+        Q(priority__gt=entry.priority)
+        | Q(priority=entry.priority, created_at__lt=entry.created_at)
+        | Q(priority=entry.priority, created_at=entry.created_at, id__lt=entry.id)
+    )
+    return ahead.count() + 1
+
+
+# ---------------------------------------------------------------------------
+# Queueing backfills
+# ---------------------------------------------------------------------------
+
+def queue_backfill(campus, day, type):
+    """Queue a backfill job for a day unless one is already waiting to run; returns the job or None"""
+    from .models import BackgroundJob
+    day = day.isoformat()
+    already_queued = BackgroundJob.objects.filter(
+        kind=JOB_KIND, status='queued', payload__campus=campus, payload__date=day, payload__type=type,
+    ).exists()
+    if already_queued:
+        return None
+    return enqueue_job(JOB_KIND, {'campus': campus, 'date': day, 'type': type})
+
+
+def queue_backfill_on_release(sender, campus, date, time, type, **kwargs):
+    """booking.slot_released: queue a backfill when somebody waits for the day"""
+    from .models import WaitlistEntry
+    if date <= timezone.now().date():
+        return
+    # The daily limit is shared by all types, so waiters of every type may now fit
+    waiting_types = set(
+        WaitlistEntry.objects.filter(campus=campus, date=date, status='waiting').values_list('type', flat=True)
+    )
+    for waiting_type in sorted(waiting_types):
+        queue_backfill(campus, date, waiting_type)
+
+
+# ---------------------------------------------------------------------------
+# Promotion
+# ---------------------------------------------------------------------------
+
+def _ineligible(entry):
+    """Reason why a waiting entry can no longer be booked, or None"""
+    from .models import Appointment, CustomUser
+    if entry.date <= timezone.now().date():
+        return 'The day is no longer bookable'
+    user = CustomUser.objects.filter(patient_profiles=entry.patient_id).only('is_blocked').first()
+    if user is not None and user.is_blocked:
+        return 'The patient is blocked from booking consultations'
+    already_booked = Appointment.objects.filter(
+        patient_id=entry.patient_id, appointment_date=entry.date, type=entry.type,
+        status__in=slot_occupancy.ACTIVE_STATUSES,
+    ).exists()
+    if already_booked:
+        return 'The patient already has an appointment on this day'
+    return None
+
+
+def bookable_slots(campus, day, type, daily_limit=slot_occupancy.MAX_APPOINTMENTS_PER_DAY):
+    """Slot times of a day a new appointment of the type could still be booked into"""
+    counts, booked = slot_occupancy.occupancy(campus, day, day, type).get(
+        day, ([0] * len(slot_occupancy.SLOT_TIMES), 0)
+    )
+    free = slot_occupancy.free_slots(counts, booked, daily_limit)
+    calendar = scheduling.get_calendar()
+    load = scheduling.staff_load(day, day).get(day, {}) if calendar.is_staffed(campus, type) else {}
+    return calendar.free_slots(campus, type, day, free, load)
+
+
+def _notify(entry, appointment):
+    from .email_outbox import enqueue_email
+    from .models import Patient
+    patient = Patient.objects.select_related('user').get(pk=entry.patient_id)
+    email = patient.email or (patient.user.email if patient.user_id else '')
+    if not email:
+        return
+    enqueue_email(
+        idempotency_key=f'waitlist-promoted:{entry.pk}',
+        subject='Your appointment has been booked from the waitlist',
+        message=(
+            f'Good news! A slot opened up and your {appointment.type} appointment at '
+            f'{appointment.get_campus_display()} has been booked for {appointment.appointment_date} '
+            f"at {appointment.appointment_time.strftime('%I:%M %p')}.\n\n"
+            'Please log in to the WMSU Health Services portal to view or cancel it.'
+        ),
+        recipient_list=[email],
+    )
+
+
+def promote_next(campus, day, type, daily_limit=slot_occupancy.MAX_APPOINTMENTS_PER_DAY):
+    """
+    Book the next eligible waiting entry of a day into the earliest free slot.
+    Returns the promoted entry, or None when nobody is waiting or the day has
+    no bookable slot left. Entries that can no longer be booked are expired
+    on the way.
+    """
+    from .models import Appointment, WaitlistEntry
+    while True:
+        with transaction.atomic():
+            # Concurrent workers take different entries
+            entry = (
+                WaitlistEntry.objects.select_for_update(skip_locked=True)
+                .filter(campus=campus, date=day, type=type, status='waiting')
+                .order_by(*WAITING_ORDER).first()
+            )
+            if entry is None:
+                return None
+            reason = _ineligible(entry)
+            if reason:
+                entry.status = 'expired'
+                entry.note = reason
+                entry.save(update_fields=['status', 'note'])
+                logger.info('Expired waitlist entry %s: %s', entry.pk, reason)
+                continue
+
+            for slot_time in bookable_slots(campus, day, type, daily_limit):
+                try:
+                    with booking.enforce_limits(daily_limit):
+                        doctor_id = scheduling.assign_doctor(campus, type, day, slot_time)
+                        appointment = Appointment.objects.create(
+                            patient_id=entry.patient_id,
+                            doctor_id=doctor_id,
+                            appointment_date=day,
+                            appointment_time=slot_time,
+                            purpose=entry.purpose or 'Booked from the waitlist',
+                            concern=entry.concern,
+                            type=type,
+                            campus=campus,
+                        )
+                except (booking.DayFull, booking.DayClosed):
+                    return None
+                except booking.SlotUnavailable:
+                    # Taken concurrently or nobody on duty can take it; try the next slot
+                    continue
+                entry.status = 'promoted'
+                entry.appointment = appointment
+                entry.promoted_at = timezone.now()
+                entry.save(update_fields=['status', 'appointment', 'promoted_at'])
+                _notify(entry, appointment)
+                logger.info('Promoted waitlist entry %s to appointment %s', entry.pk, appointment.pk)
+                return entry
+            return None
+
+
+def backfill(campus, day, type, limit=None):
+    """Promote waiting entries of a day until it is full or nobody is left; returns the number promoted"""
+    promoted = 0
+    while limit is None or promoted < limit:
+        if promote_next(campus, day, type) is None:
+            break
+        promoted += 1
+    return promoted
+
+
+def expire_past_entries(today=None):
+    """Expire waiting entries of days that can no longer be booked; returns how many"""
+    from .models import WaitlistEntry
+    today = today or timezone.now().date()
+    return WaitlistEntry.objects.filter(status='waiting', date__lte=today).update(
+        status='expired', note='The day is no longer bookable'
+    )
+
+
+def waiting_days():
+    """(campus, date, type) of every future day somebody is waiting for"""
+    from .models import WaitlistEntry
+    return list(
+        WaitlistEntry.objects.filter(status='waiting', date__gt=timezone.now().date())
+        .values_list('campus', 'date', 'type').distinct().order_by('date', 'campus', 'type')
+    )
+
+
+@job_handler(JOB_KIND)
+def backfill_day(job):
+    campus, day, type_ = job.payload['campus'], parse_date(job.payload['date']), job.payload['type']
+    promoted = backfill(campus, day, type_)
+    return {'campus': campus, 'date': job.payload['date'], 'type': type_, 'promoted': promoted}
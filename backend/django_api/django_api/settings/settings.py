@@ -42,11 +42,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.compression.CompressionMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.RequestCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -135,11 +138,24 @@ CORS_ALLOW_CREDENTIALS = True
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson when installed, falling back to JSONRenderer (api.renderers)
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Read by api.compression.CompressionMiddleware; brotli needs the Brotli package
+    'RESPONSE_COMPRESSION': {
+        'ENABLED': True,
+        'MIN_SIZE': 1024,
+        'ENCODINGS': ['br', 'gzip'],
+        'GZIP_LEVEL': 6,
+        'BROTLI_QUALITY': 5,
+    },
 }
 
 # Email Configuration
@@ -161,3 +177,30 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
 }
+
+# Seconds a worker keeps the current school year cached (api.school_year_cache);
+# saves in the same worker invalidate it immediately
+CURRENT_SCHOOL_YEAR_CACHE_TTL = int(os.getenv('CURRENT_SCHOOL_YEAR_CACHE_TTL', 60))
+
+# Seconds an authenticated user (with staff details and current profile id) is
+# cached by api.authentication. Unset: 30 with a shared CACHES backend (database,
+# Redis, memcached) and off with the default per-process one, where blocking a
+# user would not reach the other workers; a value opts in with any backend
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL')) if os.getenv('AUTH_USER_CACHE_TTL') else None
+
+# Request profiling (api.profiling): per-endpoint latency/query samples kept in
+# memory and shown at /api/profiling/; budgets are keyed by 'route-name:action'
+# or 'route-name' and log a warning when exceeded
+API_PROFILING = {
+    'ENABLED': os.getenv('API_PROFILING_ENABLED', 'True').lower() == 'true',
+    'BUFFER_SIZE': 2000,
+    'SERVER_TIMING': DEBUG,
+    'DEFAULT_BUDGET': {'queries': 50, 'total_ms': 1000},
+    'BUDGETS': {
+        'appointment-list': {'queries': 10, 'total_ms': 500},
+        'patient-list': {'queries': 10, 'total_ms': 500},
+        'user-management-list': {'queries': 10, 'total_ms': 500},
+        'staff-management-list': {'queries': 10, 'total_ms': 500},
+        'admin-controls-system-configuration-dashboard-statistics': {'queries': 20, 'total_ms': 500},
+    },
+}